@@ -0,0 +1 @@
+"""Local benchmarks and replay harnesses for performance work."""
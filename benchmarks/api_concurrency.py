@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+Compare the CrewAI API served by the WSGI app and by the ASGI app under load.
+
+    python -m GS.benchmarks.api_concurrency --concurrency 16 64 256 --duration 5
+
+Both servers run as subprocesses on the configured database (a temporary
+SQLite file when SQLALCHEMY_DATABASE_URI is not set), seeded with completed
+tasks. The WSGI server is `app.run()` as in `core/wsgi.py`, a thread per
+connection; the ASGI server is uvicorn on `core/asgi.py`. At every
+concurrency level a local load generator keeps that many connections busy
+with `get_result` requests for `--duration` seconds. The report has requests
+per second, latency percentiles, failed requests and the threads and memory
+the server needed to hold the connections.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# The app logs at DEBUG, both servers are quieted the same way so logging does not skew the comparison
+WSGI_SERVER = (
+    "import logging, os\n"
+    "from GS.core.app import app\n"
+    "logging.getLogger().setLevel(logging.WARNING)\n"
+    "app.run(host='127.0.0.1', port=int(os.environ['BENCHMARK_PORT']), threaded=True)\n"
+)
+ASGI_SERVER = (
+    "import logging, os, uvicorn\n"
+    "from GS.core.asgi import application\n"
+    "logging.getLogger().setLevel(logging.WARNING)\n"
+    "uvicorn.run(application, host='127.0.0.1', port=int(os.environ['BENCHMARK_PORT']),\n"
+    "            access_log=False, log_level='warning', log_config=None)\n"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(tasks: int, result_bytes: int) -> List[str]:
+    """Insert completed tasks with results of about `result_bytes` bytes."""
+    from GS.core.app import app, db
+    from GS.core.app.models.task_result import TaskResult
+
+    task_ids = [f'benchmark-{i}' for i in range(tasks)]
+    words = ['revenue', 'churn', 'region', 'growth', 'segment', 'forecast', 'margin', 'cohort']
+    rng = random.Random(1)
+    with app.app_context():
+        db.session.query(TaskResult).filter(TaskResult.task_id.like('benchmark-%')).delete(synchronize_session=False)
+        for task_id in task_ids:
+            content = ' '.join(rng.choice(words) for _ in range(result_bytes // 7))
+            task = TaskResult(task_id=task_id, status='completed')
+            task.set_result(json.dumps({'content': content}))
+            db.session.add(task)
+        db.session.commit()
+    return task_ids
+
+
+def start_server(kind: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, BENCHMARK_PORT=str(port))
+    command = [sys.executable, '-c', WSGI_SERVER if kind == 'wsgi' else ASGI_SERVER]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The {kind} server exited with status {process.returncode}")
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return process
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"The {kind} server did not start")
+
+
+def process_usage(pid: int) -> Dict[str, int]:
+    """Threads and resident memory of a process, from /proc."""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('Threads:'):
+                    usage['threads'] = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    usage['rss_kib'] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+async def load(port: int, task_ids: List[str], concurrency: int, duration: float, pid: int) -> Dict:
+    import httpx
+
+    latencies, failures = [], 0
+    peak = {'threads': 0, 'rss_kib': 0}
+    # A client per connection, a large shared pool costs the load generator more
+    # than the servers. They are created before the clock starts.
+    clients = [httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=30, verify=False,
+                                 limits=httpx.Limits(max_connections=1),
+                                 headers={'Accept-Encoding': 'identity'}) for _ in range(concurrency)]
+    stop = None
+
+    async def worker(client, rng):
+        nonlocal failures
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                response = await client.get(f'/api/v1/crewai/get_result/{rng.choice(task_ids)}')
+                if response.status_code != 200:
+                    failures += 1
+                    continue
+            except httpx.HTTPError:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    async def sample():
+        while time.monotonic() < stop:
+            usage = process_usage(pid)
+            for key in peak:
+                peak[key] = max(peak[key], usage.get(key, 0))
+            await asyncio.sleep(0.1)
+
+    try:
+        stop = time.monotonic() + duration
+        started = time.perf_counter()
+        await asyncio.gather(sample(), *(worker(client, random.Random(i)) for i, client in enumerate(clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2) if latencies else None
+    return {
+        'concurrency': concurrency,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': pct(0.5),
+        'p99_ms': pct(0.99),
+        'failed': failures,
+        'server_threads': peak['threads'],
+        'server_rss_mib': round(peak['rss_kib'] / 1024, 1),
+    }
+
+
+def main(argv=None):
+    """Main entry point for the API concurrency benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--result-bytes', type=int, default=8000)
+    parser.add_argument('--servers', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    args = parser.parse_args(argv)
+
+    if not os.environ.get('SQLALCHEMY_DATABASE_URI'):
+        database = os.path.join(tempfile.mkdtemp(prefix='api_benchmark_'), 'tasks.db')
+        os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    task_ids = seed(args.tasks, args.result_bytes)
+
+    report = {'database': os.environ['SQLALCHEMY_DATABASE_URI'].split('://')[0], 'servers': {}}
+    for kind in args.servers:
+        port = free_port()
+        server = start_server(kind, port)
+        try:
+            report['servers'][kind] = [
+                asyncio.run(load(port, task_ids, concurrency, args.duration, server.pid))
+                for concurrency in args.concurrency
+            ]
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
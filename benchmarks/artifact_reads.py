@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Measure what reading an artifact through the block cache fetches and costs.
+
+    python -m GS.benchmarks.artifact_reads --rows 2000000 --latency-ms 20 --mbps 400
+
+A Parquet and an Arrow IPC file of `--rows` rows and `--numeric-columns`
+double columns are served by a stand-in object store, a local directory
+whose reads wait `--latency-ms` per request plus the transfer time at
+`--mbps` megabytes per second. The same columns are read in each setup:
+
+    download: one GET of the whole object, as a plain download would do,
+        then the file is read
+    cold: an empty cache, the Parquet footer and then the chunks of the
+        `--columns` columns are fetched as parallel ranged GETs, the whole
+        Arrow file likewise
+    warm: the object is in the cache, it is read through mmap
+
+The report has, per format and setup, the seconds to the table, the bytes
+and requests fetched from the store and the rows read.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+
+def write_artifacts(directory: str, rows: int, numeric_columns: int):
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rng = np.random.default_rng(7)
+    table = pa.table({f'c{index}': rng.random(rows) for index in range(numeric_columns)})
+    bucket = os.path.join(directory, 'bucket')
+    os.makedirs(bucket, exist_ok=True)
+    pq.write_table(table, os.path.join(bucket, 'table.parquet'), row_group_size=1000000)
+    with pa.OSFile(os.path.join(bucket, 'table.arrow'), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def slow_cache(directory: str, cache_dir: str, latency: float, bytes_per_second: float, block_bytes: int,
+               concurrency: int):
+    """An ArtifactCache over a directory answering like a remote store."""
+    from GS.workflow_engine.helper_classes.artifact_cache import ArtifactCache, DirectorySource
+
+    counters = {'requests': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    class SlowSource(DirectorySource):
+        def read(self, start: int, end: int) -> bytes:
+            data = super().read(start, end)
+            time.sleep(latency + len(data) / bytes_per_second)
+            with lock:
+                counters['requests'] += 1
+                counters['bytes'] += len(data)
+            return data
+
+    class SlowCache(ArtifactCache):
+        def source(self, bucket: str, key: str):
+            return SlowSource(directory, bucket, key)
+
+    return SlowCache(cache_dir, block_bytes=block_bytes, concurrency=concurrency), counters
+
+
+def measure(setup: str, reference, cache, counters: Dict[str, int], download_dir: str) -> Dict[str, Any]:
+    from GS.workflow_engine.helper_classes.artifact_cache import LocalArtifact, read_table
+
+    counters.update(requests=0, bytes=0)
+    started = time.perf_counter()
+    if setup == 'download':
+        source = cache.source(reference.bucket, reference.key)
+        _, size = source.stat()
+        path = os.path.join(download_dir, os.path.basename(reference.key))
+        with open(path, 'wb') as f:
+            f.write(source.read(0, size))
+        table = read_table(LocalArtifact(path), reference)
+    else:
+        with cache.open(reference) as artifact:
+            table = read_table(artifact, reference)
+    return {
+        'setup': setup,
+        'seconds': round(time.perf_counter() - started, 3),
+        'fetched_mb': round(counters['bytes'] / 1e6, 2),
+        'requests': counters['requests'],
+        'rows': table.num_rows,
+    }
+
+
+def main(argv=None):
+    """Main entry point for the artifact reads benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--numeric-columns', type=int, default=8)
+    parser.add_argument('--columns', type=int, default=2, help="Columns the analysis reads")
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--mbps', type=float, default=400, help="Transfer rate of one request, MB/s")
+    parser.add_argument('--block-mb', type=float, default=4)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    from GS.workflow_engine.helper_classes.artifact_cache import parse_reference
+
+    root = tempfile.mkdtemp(prefix='artifact_reads_')
+    try:
+        store, cache_dir, download_dir = (os.path.join(root, name) for name in ('store', 'cache', 'download'))
+        os.makedirs(download_dir)
+        write_artifacts(store, args.rows, args.numeric_columns)
+        cache, counters = slow_cache(store, cache_dir, args.latency_ms / 1000, args.mbps * 1e6,
+                                     int(args.block_mb * 1024 * 1024), args.concurrency)
+        columns = [f'c{index}' for index in range(min(args.columns, args.numeric_columns))]
+        formats = {}
+        for name in ('table.parquet', 'table.arrow'):
+            reference = parse_reference({'artifact': f's3://bucket/{name}', 'columns': columns},
+                                        allowed_buckets=['bucket'])
+            size = os.path.getsize(os.path.join(store, 'bucket', name))
+            formats[reference.format] = {
+                'object_mb': round(size / 1e6, 2),
+                'setups': [measure(setup, reference, cache, counters, download_dir)
+                           for setup in ('download', 'cold', 'warm')],
+            }
+        report = {
+            'rows': args.rows,
+            'columns_read': f'{len(columns)} of {args.numeric_columns}',
+            'latency_ms': args.latency_ms,
+            'mbps': args.mbps,
+            'block_mb': args.block_mb,
+            'concurrency': args.concurrency,
+            'formats': formats,
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Measure how quickly a cancelled crew run stops and what it spends after the cancel.
+
+    python -m GS.benchmarks.cancellation_latency --runs 5 --call-seconds 2
+
+A data analysis crew runs against a stand-in provider that answers every
+request after `--call-seconds`, give or take `--jitter`. Each run is
+cancelled at a random point of its expected duration, the same points in
+both setups:
+
+    uncancellable: the run is not cancellable, as before, and goes on until
+        the crew has finished
+    cooperative: the run's cancellation token is fired, the request in
+        flight is aborted and the crew stops
+
+The report has, per setup, how long after the cancel the worker was free
+again, the provider seconds spent after it (the remaining time of the
+request in flight plus every later request) and the requests started
+after it. No database is needed, the token is not polled.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List
+
+
+class SlowProvider:
+    """Stand-in for `litellm.completion` and `litellm.acompletion` with a fixed latency."""
+
+    ANSWER = "Thought: I now know the final answer\nFinal Answer: Nothing to report."
+
+    def __init__(self, seconds: float, jitter: float, seed: int):
+        self.seconds = seconds
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: List[Dict[str, float]] = []
+
+    def _latency(self) -> float:
+        with self._lock:
+            return max(self.seconds + self._rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    def _response(self, params: Dict[str, Any]):
+        from litellm import ModelResponse
+        return ModelResponse(
+            model=params['model'],
+            choices=[{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': self.ANSWER}}],
+            usage={'prompt_tokens': 100, 'completion_tokens': 10, 'total_tokens': 110},
+        )
+
+    def completion(self, **params):
+        call = {'started': time.monotonic()}
+        self.calls.append(call)
+        time.sleep(self._latency())
+        call['ended'] = time.monotonic()
+        return self._response(params)
+
+    async def acompletion(self, **params):
+        call = {'started': time.monotonic()}
+        self.calls.append(call)
+        try:
+            await asyncio.sleep(self._latency())
+        finally:
+            # Cancelling the request closes the connection, the provider stops working on it
+            call['ended'] = time.monotonic()
+        return self._response(params)
+
+
+def run(setup: str, cancel_points: List[float], args) -> Dict:
+    import litellm
+    from GS.crew_ai.crews.crew_templates import CrewTemplateRegistry, load_crew_config
+    from GS.crew_ai.crews.data_analysis_crew import DataAnalysisCrew
+    from GS.workflow_engine.helper_classes.artifact_cache import with_artifacts
+    from GS.workflow_engine.helper_classes.cancellation import TaskCancelled, cancellable_run
+    from GS.workflow_engine.helper_classes.document_ingestion import with_documents
+    from GS.workflow_engine.helper_classes.table_profiler import with_profiles
+
+    agents_config, tasks_config = load_crew_config('data_analysis')
+    template = CrewTemplateRegistry().get('data_analysis', DataAnalysisCrew, agents_config, tasks_config)
+    inputs = with_profiles({}, with_artifacts(with_documents({})))
+
+    stop_latencies, provider_seconds, late_calls = [], [], []
+    for index, cancel_after in enumerate(cancel_points):
+        provider = SlowProvider(args.call_seconds, args.jitter, args.seed + index)
+        litellm.completion, litellm.acompletion = provider.completion, provider.acompletion
+        crew = template.instantiate()
+        tokens = []
+
+        def work():
+            try:
+                if setup == 'cooperative':
+                    with cancellable_run(f'benchmark-{index}', poll=None) as token:
+                        tokens.append(token)
+                        crew.kickoff(inputs=dict(inputs))
+                else:
+                    crew.kickoff(inputs=dict(inputs))
+            except TaskCancelled:
+                pass
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        time.sleep(cancel_after)
+        cancelled_at = time.monotonic()
+        if tokens:
+            tokens[0].cancel()
+        worker.join()
+        stop_latencies.append(time.monotonic() - cancelled_at)
+        provider_seconds.append(sum(max(call.get('ended', cancelled_at) - max(call['started'], cancelled_at), 0.0)
+                                    for call in provider.calls))
+        late_calls.append(sum(call['started'] > cancelled_at for call in provider.calls))
+
+    def mean(values):
+        return round(sum(values) / len(values), 3)
+
+    return {
+        'setup': setup,
+        'stop_latency_mean_s': mean(stop_latencies),
+        'stop_latency_max_s': round(max(stop_latencies), 3),
+        'provider_seconds_after_cancel': mean(provider_seconds),
+        'requests_after_cancel': mean(late_calls),
+    }
+
+
+def main(argv=None):
+    """Main entry point for the cancellation latency benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--call-seconds', type=float, default=2.0)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    from GS.workflow_engine.configs import LLMHedging
+    # The stand-in provider does not stream, hedging needs streamed responses
+    LLMHedging.ENABLED = False
+    # Three tasks of one request each, cancelled somewhere within them
+    rng = random.Random(args.seed)
+    cancel_points = [rng.uniform(0.1, 0.9) * 3 * args.call_seconds for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'call_seconds': args.call_seconds,
+        'setups': [run(setup, cancel_points, args) for setup in ('uncancellable', 'cooperative')],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
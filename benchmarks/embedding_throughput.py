@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Measure embeddings per second of the embedding service against naive use.
+
+    python -m GS.benchmarks.embedding_throughput --texts 2000 --threads 16
+    python -m GS.benchmarks.embedding_throughput --fake --processes 4
+
+`--fake` swaps in a hashing model with a fixed per-call overhead so the
+batching and caching effects can be measured without downloading a model.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from GS.workflow_engine.helper_classes.embedding_service import EmbeddingService, load_sentence_transformer
+
+
+class FakeModel:
+    """Deterministic stand-in with a per-call and a per-text cost."""
+
+    def __init__(self, dimension: int = 384, call_overhead: float = 0.01, per_text: float = 0.0005):
+        self.dimension = dimension
+        self.call_overhead = call_overhead
+        self.per_text = per_text
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        time.sleep(self.call_overhead + self.per_text * len(texts))
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:4], 'little')
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_fake_model(model_name: str):
+    return FakeModel()
+
+
+def _texts(count: int) -> List[str]:
+    return [f"Table test.table_{i} with columns id, name_{i % 97}, value_{i % 13}" for i in range(count)]
+
+
+def bench_naive(model, texts: List[str]) -> float:
+    """One encode call per text, as a straightforward tool would do."""
+    started = time.perf_counter()
+    for text in texts:
+        model.encode([text])
+    return len(texts) / (time.perf_counter() - started)
+
+
+def bench_service(service: EmbeddingService, texts: List[str], threads: int) -> float:
+    """Many concurrent single-text callers sharing the service."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda text: service.encode([text]), texts))
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point for the embedding benchmark"""
+    parser = argparse.ArgumentParser(description='Embedding service throughput benchmark')
+    parser.add_argument('--texts', type=int, default=1000, help='Number of distinct texts')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent callers')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--processes', type=int, default=0, help='Encoding process pool size')
+    parser.add_argument('--model', type=str, default='all-MiniLM-L6-v2')
+    parser.add_argument('--fake', action='store_true', help='Use the hashing stand-in model')
+    args = parser.parse_args(argv)
+
+    loader = load_fake_model if args.fake else load_sentence_transformer
+    texts = _texts(args.texts)
+    report = {'texts': args.texts, 'threads': args.threads, 'processes': args.processes}
+
+    naive_texts = texts[:min(len(texts), 200)]
+    report['naive_per_s'] = round(bench_naive(loader(args.model), naive_texts), 1)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        service = EmbeddingService(
+            model_name=args.model,
+            max_batch=args.max_batch,
+            max_wait_ms=args.max_wait_ms,
+            cache_dir=cache_dir,
+            processes=args.processes,
+            model_loader=loader,
+        )
+        try:
+            report['batched_per_s'] = round(bench_service(service, texts, args.threads), 1)
+            report['batches'] = service.batches
+            report['cached_per_s'] = round(bench_service(service, texts, args.threads), 1)
+            report['cache_file_mb'] = round(
+                os.path.getsize(os.path.join(cache_dir, service._cache_namespace(), 'vectors.f32')) / 2 ** 20, 2
+            )
+        finally:
+            service.close()
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
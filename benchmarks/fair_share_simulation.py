@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Simulate crew runs of several tenants on the task executor, FIFO against fair sharing.
+
+    python -m GS.benchmarks.fair_share_simulation --workers 8 --batch-jobs 500 --interactive-users 4
+
+One tenant submits `--batch-jobs` analyses at once while the other tenants
+submit interactive analyses at random, one every `--interactive-interval`
+seconds on average. Run times are log-normal around `--run-seconds`. The
+same arrivals are replayed in a discrete-event simulation against:
+
+    fifo: the executor's own queue, runs start in submission order
+    fair: `FairQueue` with the default lane weights and no quotas
+    fair_capped: `FairQueue` with at most `--max-concurrent` runs per tenant
+        (and `--tokens-per-hour` when given)
+
+The batch tenant's runs go to the batch lane with `--batch-lane`, otherwise
+they share the interactive lane and only the per-tenant fairness applies.
+No crew is run. The report has per tenant percentiles of the time spent
+queued and of the total latency, and when the batch finished.
+"""
+
+import argparse
+import collections
+import heapq
+import json
+import os
+import random
+from typing import Dict, List
+
+BATCH_TENANT = 'batch-tenant'
+
+
+def percentile(values: List[float], p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * p), len(values) - 1)], 1)
+
+
+def arrivals(args) -> List[tuple]:
+    """(time, tenant, lane, run seconds, tokens) of every submitted run."""
+    rng = random.Random(args.seed)
+
+    def run():
+        seconds = rng.lognormvariate(0, 0.5) * args.run_seconds
+        return seconds, int(seconds * args.tokens_per_second)
+
+    lane = 'batch' if args.batch_lane else 'interactive'
+    jobs = [(0.0, BATCH_TENANT, lane, *run()) for _ in range(args.batch_jobs)]
+    for user in range(args.interactive_users):
+        at = 0.0
+        while True:
+            at += rng.expovariate(1.0 / args.interactive_interval)
+            if at > args.duration:
+                break
+            jobs.append((at, f'tenant-{user}', 'interactive', *run()))
+    jobs.sort(key=lambda job: job[0])
+    return jobs
+
+
+def simulate(setup: str, jobs: List[tuple], args) -> Dict:
+    from GS.core.app.helper.fair_scheduler import FairQueue, Job
+
+    now = 0.0
+    if setup == 'fifo':
+        queue = None
+        fifo = collections.deque()
+    else:
+        capped = setup == 'fair_capped'
+        queue = FairQueue({'interactive': 4, 'batch': 1},
+                          max_concurrent=args.max_concurrent if capped else 0,
+                          tokens_per_hour=args.tokens_per_hour if capped else 0,
+                          clock=lambda: now)
+
+    running = []  # (finish time, sequence, job)
+    idle = args.workers
+    waits = collections.defaultdict(list)
+    latencies = collections.defaultdict(list)
+    batch_done = 0.0
+    sequence = 0
+    next_job = 0
+
+    def take():
+        if queue is None:
+            return fifo.popleft() if fifo else None
+        return queue.pop()
+
+    while next_job < len(jobs) or running or (fifo if queue is None else len(queue)):
+        candidates = []
+        if next_job < len(jobs):
+            candidates.append(jobs[next_job][0])
+        if running:
+            candidates.append(running[0][0])
+        if queue is not None and len(queue) and idle:
+            # Runs held back by the token quota become eligible later
+            waits_for_quota = [queue.quota_retry_after(user) for users in queue.users.values()
+                               for user, flow in users.items() if flow.jobs]
+            waits_for_quota = [wait for wait in waits_for_quota if wait]
+            if waits_for_quota:
+                candidates.append(now + min(waits_for_quota))
+        if not candidates:
+            break
+        now = max(now, min(candidates))
+
+        while running and running[0][0] <= now:
+            _, _, job = heapq.heappop(running)
+            idle += 1
+            latencies[job.user].append(now - job.submitted_at)
+            if job.user == BATCH_TENANT:
+                batch_done = now
+            if queue is not None:
+                queue.done(job, job.args[1])
+        while next_job < len(jobs) and jobs[next_job][0] <= now:
+            at, user, lane, seconds, tokens = jobs[next_job]
+            job = Job(f'sim-{next_job}', user, lane, None, (seconds, tokens), submitted_at=at)
+            if queue is None:
+                fifo.append(job)
+            else:
+                queue.push(job)
+            next_job += 1
+        while idle:
+            job = take()
+            if job is None:
+                break
+            idle -= 1
+            waits[job.user].append(now - job.submitted_at)
+            sequence += 1
+            heapq.heappush(running, (now + job.args[0], sequence, job))
+
+    tenants = sorted(latencies, key=lambda user: (user != BATCH_TENANT, user))
+    return {
+        'setup': setup,
+        'batch_finished_s': round(batch_done, 1),
+        'tenants': {
+            user: {
+                'runs': len(latencies[user]),
+                'wait_p50_s': percentile(waits[user], 0.5),
+                'wait_p95_s': percentile(waits[user], 0.95),
+                'wait_p99_s': percentile(waits[user], 0.99),
+                'latency_p50_s': percentile(latencies[user], 0.5),
+                'latency_p99_s': percentile(latencies[user], 0.99),
+            }
+            for user in tenants
+        },
+    }
+
+
+def main(argv=None):
+    """Main entry point for the fair-share simulation benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-jobs', type=int, default=500)
+    parser.add_argument('--batch-lane', action='store_true', help='Submit the batch tenant\'s runs as batch')
+    parser.add_argument('--interactive-users', type=int, default=4)
+    parser.add_argument('--interactive-interval', type=float, default=300)
+    parser.add_argument('--run-seconds', type=float, default=60)
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--duration', type=float, default=3600, help='Seconds interactive tenants submit for')
+    parser.add_argument('--max-concurrent', type=int, default=4)
+    parser.add_argument('--tokens-per-hour', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    # The scheduler lives in the app package, which sets up the app on import
+    os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    jobs = arrivals(args)
+    report = {
+        'workers': args.workers,
+        'runs': len(jobs),
+        'setups': [simulate(setup, jobs, args) for setup in ('fifo', 'fair', 'fair_capped')],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Measure throughput and peak memory of HTML-to-text extraction.
+
+    python -m GS.benchmarks.html_extraction --corpus /path/to/saved/pages
+    python -m GS.benchmarks.html_extraction --pages 200 --page-kb 2000 --processes 4
+
+Without `--corpus` a synthetic corpus of pages with navigation, scripts,
+tables and long articles is generated. Every mode runs in a fresh
+interpreter so its peak RSS is its own:
+
+- `dom`: whole page read into memory and parsed into a BeautifulSoup tree
+  (skipped when bs4 is not installed)
+- `streaming`: chunked incremental extraction in one process
+- `pool`: the same extraction spread over a process pool
+"""
+
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from GS.workflow_engine.activities.html_extraction import extract_many, iter_file_blocks
+
+MODES = ('dom', 'streaming', 'pool')
+
+
+def generate_corpus(directory: str, pages: int, page_kb: int) -> List[str]:
+    """Write synthetic pages of roughly `page_kb` KiB each."""
+    nav = '<nav><ul>' + ''.join(f'<li><a href="/c/{i}">Category {i}</a></li>' for i in range(60)) + '</ul></nav>'
+    script = '<script>' + 'window.dataLayer.push({"event": "view"});' * 200 + '</script>'
+    table = '<table>' + ''.join(f'<tr><td>Item {i}</td><td>{i * 3.5}</td><td>in stock</td></tr>' for i in range(40)) \
+        + '</table>'
+    paragraph = '<p>The product ships in <b>two</b> days and includes a <a href="#">warranty</a> ' \
+                'covering parts and labour for the first year of use.</p>'
+    section = f'<h2>Details</h2>{paragraph * 20}{table}'
+    paths = []
+    for index in range(pages):
+        body = []
+        size = 0
+        while size < page_kb * 1024:
+            body.append(section)
+            size += len(section)
+        html = f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Page {index}</title>{script}</head>' \
+               f'<body>{nav}<div class="cookie-banner">We use cookies</div><main><h1>Product {index}</h1>' \
+               f'{"".join(body)}</main><footer>Footer links</footer></body></html>'
+        path = os.path.join(directory, f'page_{index:05d}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        paths.append(path)
+    return paths
+
+
+def _peak_rss_mb(include_children: bool = False) -> float:
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / 1024, 1)
+
+
+def run_mode(mode: str, paths: List[str], processes: int) -> dict:
+    """Run one extraction mode in this process and measure it."""
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    started = time.perf_counter()
+    blocks = 0
+    if mode == 'dom':
+        from bs4 import BeautifulSoup
+        for path in paths:
+            with open(path, 'rb') as f:
+                soup = BeautifulSoup(f.read(), 'html.parser')
+            for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'aside']):
+                tag.decompose()
+            blocks += len([line for line in soup.get_text('\n').splitlines() if line.strip()])
+    elif mode == 'streaming':
+        for path in paths:
+            blocks += sum(1 for _ in iter_file_blocks(path))
+    else:
+        blocks = sum(len(page) for page in extract_many(paths, processes))
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': mode,
+        'pages_per_s': round(len(paths) / elapsed, 2),
+        'mb_per_s': round(total_bytes / 2 ** 20 / elapsed, 2),
+        'blocks': blocks,
+        'peak_rss_mb': _peak_rss_mb(include_children=mode == 'pool'),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point for the extraction benchmark"""
+    parser = argparse.ArgumentParser(description='HTML extraction benchmark')
+    parser.add_argument('--corpus', type=str, help='Directory of saved .html pages')
+    parser.add_argument('--pages', type=int, default=100, help='Synthetic pages when no corpus is given')
+    parser.add_argument('--page-kb', type=int, default=300, help='Size of each synthetic page')
+    parser.add_argument('--processes', type=int, default=0, help='Pool size, 0 uses every CPU')
+    parser.add_argument('--mode', choices=MODES, help='Run a single mode in this process')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.corpus:
+            paths = sorted(glob.glob(os.path.join(args.corpus, '**', '*.htm*'), recursive=True))
+        else:
+            paths = generate_corpus(scratch, args.pages, args.page_kb)
+
+        if args.mode:
+            result = run_mode(args.mode, paths, args.processes)
+            print(json.dumps(result))
+            return result
+
+        corpus_dir = args.corpus or scratch
+        report = {
+            'pages': len(paths),
+            'corpus_mb': round(sum(os.path.getsize(path) for path in paths) / 2 ** 20, 1),
+            'modes': [],
+        }
+        for mode in MODES:
+            if mode == 'dom':
+                try:
+                    import bs4  # noqa: F401
+                except ImportError:
+                    report['modes'].append({'mode': 'dom', 'skipped': 'bs4 is not installed'})
+                    continue
+            command = [sys.executable, '-m', __spec__.name, '--corpus', corpus_dir,
+                       '--processes', str(args.processes), '--mode', mode]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            report['modes'].append(json.loads(output.strip().splitlines()[-1]))
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
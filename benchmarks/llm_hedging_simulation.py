@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Compare LLM call latency with and without hedging against a stand-in
+provider whose first token occasionally stalls.
+
+    python -m GS.benchmarks.llm_hedging_simulation --requests 400 --stall-rate 0.03
+    python -m GS.benchmarks.llm_hedging_simulation --deadline 1.0
+
+Calls go through the crews' LLM (`PrefixCachingLLM.call`) with
+`litellm.acompletion` replaced by the stand-in, which streams a short answer
+after a lognormal first-token delay, or after `--stall` seconds for a share
+of the requests. Without hedging the same streaming path is used with a zero
+hedge budget, so only the duplicate requests differ. The report has the
+latency percentiles, how many requests were hedged and how many losing
+streams were cancelled.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from typing import Dict
+
+
+class StandInStream:
+    """Async stream of chunks that notices when it is cancelled."""
+
+    def __init__(self, provider: 'StandInProvider', model: str, first_token: float):
+        self.provider = provider
+        self.model = model
+        self.first_token = first_token
+        self.sent = 0
+        self.completion_stream = self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        from litellm.types.utils import ModelResponseStream
+
+        if self.sent >= self.provider.chunks:
+            raise StopAsyncIteration
+        try:
+            await asyncio.sleep(self.first_token if self.sent == 0 else self.provider.chunk_seconds)
+        except asyncio.CancelledError:
+            self.provider.count('cancelled')
+            raise
+        self.sent += 1
+        last = self.sent == self.provider.chunks
+        return ModelResponseStream(model=self.model, choices=[{
+            'index': 0,
+            'delta': {'role': 'assistant', 'content': 'Final Answer: done' if last else 'Thought: working. '},
+            'finish_reason': 'stop' if last else None,
+        }])
+
+    async def aclose(self):
+        if self.sent < self.provider.chunks:
+            self.provider.count('closed')
+
+
+class StandInProvider:
+    def __init__(self, rng: random.Random, median: float, stall_rate: float, stall: float,
+                 chunks: int = 5, chunk_seconds: float = 0.005):
+        self.rng = rng
+        self.median = median
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.chunks = chunks
+        self.chunk_seconds = chunk_seconds
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    async def acompletion(self, **params):
+        self.count('requests')
+        with self._lock:
+            stalled = self.rng.random() < self.stall_rate
+            first_token = self.stall if stalled else self.median * self.rng.lognormvariate(0, 0.4)
+        return StandInStream(self, params['model'], first_token)
+
+
+def run(mode: str, args) -> Dict:
+    import litellm
+    from GS.crew_ai.llm import hedging
+    from GS.crew_ai.llm.prefix_cache import PrefixCachingLLM
+
+    provider = StandInProvider(random.Random(args.seed), args.median, args.stall_rate, args.stall)
+    original = litellm.acompletion
+    litellm.acompletion = provider.acompletion
+    hedging.first_token_latency = hedging.FirstTokenLatency(initial=args.initial_delay, minimum=args.median)
+    hedging.hedge_budget = hedging.HedgeBudget(ratio=args.max_ratio if mode == 'hedged' else 0, burst=0)
+    llm = PrefixCachingLLM(model='gpt-4o-mini', temperature=0)
+    messages = [{'role': 'system', 'content': 'You are a benchmark.'}, {'role': 'user', 'content': 'Go.'}]
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            with hedging.llm_deadline(args.deadline):
+                llm.call(messages)
+            return time.perf_counter() - started, None
+        except hedging.LLMDeadlineExceeded:
+            return time.perf_counter() - started, 'deadline'
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(one, range(args.requests)))
+    finally:
+        litellm.acompletion = original
+
+    latencies = sorted(latency for latency, _ in results)
+
+    def pct(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1)
+    return {
+        'mode': mode,
+        'p50_ms': pct(0.5),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'max_ms': round(latencies[-1] * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+        'hedged': hedging.hedge_budget.hedges,
+        'deadline_exceeded': sum(1 for _, error in results if error),
+        'provider': provider.counters,
+        'final_threshold_ms': round(hedging.first_token_latency.threshold('gpt-4o-mini') * 1000, 1),
+    }
+
+
+def main(argv=None):
+    """Main entry point for the LLM hedging benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--median', type=float, default=0.05, help='Median first-token time in seconds')
+    parser.add_argument('--stall-rate', type=float, default=0.03)
+    parser.add_argument('--stall', type=float, default=2.0, help='First-token time of a stalled request')
+    parser.add_argument('--initial-delay', type=float, default=0.5, help='Hedging delay before enough samples')
+    parser.add_argument('--max-ratio', type=float, default=0.1)
+    parser.add_argument('--deadline', type=float, default=0, help='Deadline per call in seconds, 0 for none')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    # The clients only insist on a key, nothing leaves the process
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    report = {
+        'requests': args.requests,
+        'stall_rate': args.stall_rate,
+        'runs': [run('unhedged', args), run('hedged', args)],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
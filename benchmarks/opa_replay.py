@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+Replay captured Trino access-control requests against a local OPA server and
+compare single-resource evaluation with batched evaluation.
+
+The requests file holds one OPA request body per line, as logged by Trino with
+`opa.log-requests=true` ({"input": {"context": ..., "action": ...}}).
+
+    python -m GS.benchmarks.opa_replay --requests captured.ndjson
+    python -m GS.benchmarks.opa_replay --synthetic 500 --opa-binary ./opa
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+POLICY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trino_new', 'good_sell')
+ALLOW_PATH = '/v1/data/trino/allow'
+BATCH_PATH = '/v1/data/trino/batch'
+
+
+def load_requests(path: str) -> List[Dict[str, Any]]:
+    """Load captured requests, one JSON document per line."""
+    requests = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            body = json.loads(line)
+            requests.append(body['input'] if 'input' in body else body)
+    return requests
+
+
+def synthetic_requests(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate a mix of check and filter requests resembling a Trino workload."""
+    rng = random.Random(seed)
+    catalogs = ['datahub_test', 'iceberg', 'system']
+    group_sets = [['human'], ['human'], ['human'], ['admins'], ['guest']]
+    requests = []
+    for _ in range(count):
+        identity = {'user': 'replay', 'groups': rng.choice(group_sets)}
+        catalog = rng.choice(catalogs)
+        kind = rng.random()
+        if kind < 0.3:
+            action = {'operation': 'AccessCatalog', 'resource': {'catalog': {'name': catalog}}}
+        elif kind < 0.5:
+            action = {
+                'operation': 'SelectFromColumns',
+                'resource': {'table': {'catalogName': catalog, 'schemaName': 'test', 'tableName': 'orders',
+                                       'columns': ['orderkey', 'custkey']}},
+            }
+        elif kind < 0.8:
+            action = {
+                'operation': 'FilterTables',
+                'filterResources': [
+                    {'table': {'catalogName': catalog, 'schemaName': 'test', 'tableName': f'table_{i}'}}
+                    for i in range(rng.randint(5, 60))
+                ],
+            }
+        else:
+            action = {
+                'operation': 'FilterColumns',
+                'filterResources': [{
+                    'table': {'catalogName': catalog, 'schemaName': 'test', 'tableName': 'lineitem',
+                              'columns': [f'column_{i}' for i in range(rng.randint(5, 40))]},
+                }],
+            }
+        requests.append({'context': {'identity': identity, 'softwareStack': {'trinoVersion': '440'}},
+                         'action': action})
+    return requests
+
+
+def expand_single(request: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a request into the single-resource requests Trino sends without a batch URI."""
+    action = request['action']
+    resources = action.get('filterResources')
+    if not resources:
+        return [request]
+    if action['operation'] == 'FilterColumns':
+        table = resources[0]['table']
+        resources = [{'table': dict(table, columns=[column])} for column in table.get('columns', [])]
+    return [
+        {'context': request['context'], 'action': {'operation': action['operation'], 'resource': resource}}
+        for resource in resources
+    ]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_opa(opa_binary: str, policy_dir: str, debug: bool = False) -> Tuple[subprocess.Popen, str]:
+    """Start a local OPA server on a free port and wait until it is healthy."""
+    port = _free_port()
+    command = [opa_binary, 'run', '--server', '--addr', f'127.0.0.1:{port}', '--log-level', 'error']
+    if not debug:
+        command += ['--ignore', 'debug']
+    command.append(policy_dir)
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/health', timeout=0.5).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"OPA did not become healthy: {' '.join(command)}")
+
+
+def _query(client: httpx.Client, path: str, request: Dict[str, Any]):
+    started = time.perf_counter()
+    response = client.post(path, json={'input': request})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    return response.json().get('result'), elapsed
+
+
+def run_single(client: httpx.Client, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Evaluate every resource with its own round-trip to the allow rule."""
+    latencies, decisions = [], []
+    started = time.perf_counter()
+    for request in requests:
+        allowed = set()
+        for index, single in enumerate(expand_single(request)):
+            result, elapsed = _query(client, ALLOW_PATH, single)
+            latencies.append(elapsed)
+            if result:
+                allowed.add(index)
+        decisions.append(allowed)
+    return {'elapsed': time.perf_counter() - started, 'latencies': latencies, 'decisions': decisions}
+
+
+def run_batched(client: httpx.Client, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Evaluate filter requests with one round-trip to the batch rule."""
+    latencies, decisions = [], []
+    started = time.perf_counter()
+    for request in requests:
+        if not request['action'].get('filterResources'):
+            result, elapsed = _query(client, ALLOW_PATH, request)
+            latencies.append(elapsed)
+            decisions.append({0} if result else set())
+            continue
+        result, elapsed = _query(client, BATCH_PATH, request)
+        size = len(expand_single(request)) or 1
+        # Spread the round-trip over the decisions it produced
+        latencies.extend([elapsed / size] * size)
+        decisions.append(set(result or []))
+    return {'elapsed': time.perf_counter() - started, 'latencies': latencies, 'decisions': decisions}
+
+
+def summarize(name: str, run: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute throughput and per-decision latency percentiles for a run."""
+    latencies = sorted(run['latencies'])
+    count = len(latencies)
+
+    def percentile(p):
+        return latencies[min(count - 1, int(p * count))] * 1000 if count else 0.0
+
+    return {
+        'mode': name,
+        'decisions': count,
+        'elapsed_s': round(run['elapsed'], 3),
+        'decisions_per_s': round(count / run['elapsed'], 1) if run['elapsed'] else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+    }
+
+
+def replay(requests: List[Dict[str, Any]], base_url: str, warmup: int = 20) -> Dict[str, Any]:
+    """Run both modes against an OPA server and check that their decisions agree."""
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        run_single(client, requests[:warmup])
+        run_batched(client, requests[:warmup])
+        single = run_single(client, requests)
+        batched = run_batched(client, requests)
+    mismatches = [
+        index for index, (a, b) in enumerate(zip(single['decisions'], batched['decisions'])) if a != b
+    ]
+    return {
+        'requests': len(requests),
+        'single': summarize('single', single),
+        'batched': summarize('batched', batched),
+        'mismatched_requests': mismatches,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point for the replay benchmark"""
+    parser = argparse.ArgumentParser(description='Replay Trino access-control requests against OPA')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--requests', type=str, help='File with captured OPA request bodies, one per line')
+    source.add_argument('--synthetic', type=int, help='Generate this many synthetic requests instead')
+    parser.add_argument('--opa-url', type=str, default=None,
+                        help='Use an already running OPA server instead of starting one')
+    parser.add_argument('--opa-binary', type=str, default='opa', help='Path to the OPA binary')
+    parser.add_argument('--policy-dir', type=str, default=POLICY_DIR, help='Directory with the Rego policies')
+    parser.add_argument('--debug-policies', action='store_true',
+                        help='Also load the print-based debug rules to measure their cost')
+    args = parser.parse_args(argv)
+
+    requests = load_requests(args.requests) if args.requests else synthetic_requests(args.synthetic)
+
+    process = None
+    base_url = args.opa_url
+    if not base_url:
+        process, base_url = start_opa(args.opa_binary, args.policy_dir, debug=args.debug_policies)
+    try:
+        report = replay(requests, base_url)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps(report, indent=2))
+    single, batched = report['single'], report['batched']
+    if single['decisions_per_s']:
+        print(f"Batched throughput: {batched['decisions_per_s'] / single['decisions_per_s']:.1f}x single")
+    if report['mismatched_requests']:
+        print(f"WARNING: {len(report['mismatched_requests'])} requests got different decisions")
+    return report
+
+
+if __name__ == '__main__':
+    main()
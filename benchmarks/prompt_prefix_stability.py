@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Check that the static prompt prefix of every agent call is byte-stable
+across runs, so provider prompt caches can hit.
+
+    python -m GS.benchmarks.prompt_prefix_stability
+    python -m GS.benchmarks.prompt_prefix_stability --crew-type data_summary --runs 3
+
+The crews run against a fake provider that replaces `litellm.completion`:
+it records each request, answers immediately and, like the real providers,
+reports the prefix as cached when it has seen the same bytes before. Runs
+use different inputs. The check fails, with exit status 1, when the prefix
+of a call differs between runs or when an Anthropic request lacks its cache
+breakpoint.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+
+class FakeProvider:
+    """Stand-in for `litellm.completion` with an exact-prefix cache."""
+
+    ANSWER = "Thought: I now know the final answer\nFinal Answer: Nothing to report."
+
+    def __init__(self):
+        from GS.crew_ai.llm import static_prefix
+        self._static_prefix = static_prefix
+        self.requests: List[Dict[str, Any]] = []
+        self._seen = set()
+
+    @staticmethod
+    def _tokens(text: str) -> int:
+        try:
+            import tiktoken
+            return len(tiktoken.get_encoding('cl100k_base').encode(text))
+        except ImportError:
+            return len(text) // 4
+
+    def prefix_bytes(self, params: Dict[str, Any]) -> bytes:
+        """Tools and static messages, in the order the provider sees them."""
+        prefix = {'tools': params.get('tools'), 'messages': self._static_prefix(params['messages'])}
+        return json.dumps(prefix, sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+    def __call__(self, **params):
+        from litellm import ModelResponse
+
+        self.requests.append(copy.deepcopy(params))
+        prefix = self.prefix_bytes(params)
+        prompt_tokens = self._tokens(json.dumps(params['messages'], ensure_ascii=False))
+        cached = self._tokens(prefix.decode('utf-8')) if prefix in self._seen else 0
+        self._seen.add(prefix)
+        return ModelResponse(
+            model=params['model'],
+            choices=[{'index': 0, 'finish_reason': 'stop',
+                      'message': {'role': 'assistant', 'content': self.ANSWER}}],
+            usage={
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': self._tokens(self.ANSWER),
+                'total_tokens': prompt_tokens + self._tokens(self.ANSWER),
+                'prompt_tokens_details': {'cached_tokens': min(cached, prompt_tokens)},
+            },
+        )
+
+
+def _has_breakpoint(params: Dict[str, Any], static_prefix) -> bool:
+    prefix = static_prefix(params['messages'])
+    if not prefix or isinstance(prefix[-1]['content'], str):
+        return False
+    return 'cache_control' in prefix[-1]['content'][-1]
+
+
+def _agents_config_for(agents_config: Dict[str, Any], provider: str, model_name: str) -> Dict[str, Any]:
+    config = copy.deepcopy(agents_config)
+    for section in config.values():
+        if isinstance(section, dict):
+            llm = section.get('llm') if 'llm' in section else section if 'provider' in section else None
+            if llm is not None:
+                llm.update(provider=provider, model_name=model_name)
+    return config
+
+
+def check(crew_type: str, provider: str, model_name: str, runs: int) -> Dict[str, Any]:
+    """Run a crew `runs` times on the fake provider and compare the call prefixes."""
+    import litellm
+    from GS.crew_ai.crews.crew_templates import CrewTemplateRegistry, load_crew_config
+    from GS.crew_ai.llm import static_prefix
+    from GS.benchmarks.crew_setup import _crew_class
+    from GS.workflow_engine.configs import LLMHedging
+
+    agents_config, tasks_config = load_crew_config(crew_type)
+    agents_config = _agents_config_for(agents_config, provider, model_name)
+    template = CrewTemplateRegistry().get(crew_type, _crew_class(crew_type), agents_config, tasks_config)
+
+    fake = FakeProvider()
+    # Hedged requests are streamed, the check only needs the plain completion call
+    LLMHedging.ENABLED = False
+    original = litellm.completion
+    litellm.completion = fake
+    digests, usage = [], []
+    try:
+        for run in range(runs):
+            start = len(fake.requests)
+            inputs = {
+                'data_profile': f'profile of run {run}', 'documents': f'documents of run {run}',
+                'artifacts': f'artifacts of run {run}', 'previous_report': '',
+                'analysis_report': f'report {run}', 'additional_context': '', 'audience': 'executive',
+            }
+            result = template.instantiate().kickoff(inputs=inputs)
+            digests.append([hashlib.sha256(fake.prefix_bytes(params)).hexdigest()[:16]
+                            for params in fake.requests[start:]])
+            usage.append({
+                'prompt_tokens': result.token_usage.prompt_tokens,
+                'cached_prompt_tokens': result.token_usage.cached_prompt_tokens,
+            })
+    finally:
+        litellm.completion = original
+
+    stable = all(run == digests[0] for run in digests[1:])
+    marked = all(_has_breakpoint(params, static_prefix) for params in fake.requests)
+    return {
+        'provider': provider,
+        'calls_per_run': len(digests[0]),
+        'prefix_bytes': sorted({len(fake.prefix_bytes(params)) for params in fake.requests}),
+        'stable': stable,
+        'cache_breakpoints': marked if provider == 'anthropic' else None,
+        'token_usage': usage,
+        'ok': stable and (marked or provider != 'anthropic'),
+    }
+
+
+def main(argv=None):
+    """Main entry point for the prompt prefix stability check."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--crew-type', default='data_analysis', choices=['data_analysis', 'data_summary'])
+    parser.add_argument('--runs', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    # Nothing reaches a provider, the clients only insist on a key
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+    reports = [
+        check(args.crew_type, 'openai', 'gpt-4-turbo', args.runs),
+        check(args.crew_type, 'anthropic', 'claude-3-5-sonnet-20241022', args.runs),
+    ]
+    print(json.dumps({'crew_type': args.crew_type, 'runs': args.runs, 'providers': reports}, indent=2))
+    return 0 if all(report['ok'] for report in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
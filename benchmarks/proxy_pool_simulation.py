@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Simulate scraping through a set of stand-in proxies and compare blind
+rotation with the health-scored proxy pool.
+
+    python -m GS.benchmarks.proxy_pool_simulation --requests 20000 --proxies 50
+    python -m GS.benchmarks.proxy_pool_simulation --redis
+
+The stand-in proxies have their own latency, some are flaky, some are burned
+(banned) on particular sites, and every site throttles a proxy that sends it
+too many requests per window. Time is simulated, so the run is deterministic
+and fast; only the selection cost is measured in wall-clock time. `--redis`
+runs the pool on the configured Redis instead of the in-memory store.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from GS.workflow_engine.activities.proxy_pool import InMemoryProxyStore, ProxyPool, SUCCESS, classify
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StandInProxy:
+    """A proxy with a latency, an error rate and per-site bans."""
+
+    def __init__(self, name: str, rng: random.Random, sites: List[str], flaky: bool, burned_share: float):
+        self.name = name
+        self.latency = rng.uniform(0.1, 1.5)
+        self.error_rate = 0.4 if flaky else 0.02
+        self.burned = {site for site in sites if rng.random() < burned_share}
+
+
+class StandInNetwork:
+    """Decide the response of a site to a request sent through a proxy."""
+
+    def __init__(self, proxies: Dict[str, StandInProxy], rng: random.Random,
+                 throttle_requests: int, throttle_window: float):
+        self.proxies = proxies
+        self.rng = rng
+        self.throttle_requests = throttle_requests
+        self.throttle_window = throttle_window
+        self._recent = defaultdict(deque)
+
+    def request(self, site: str, proxy_name: str, now: float):
+        """Return (status_code or None on a network error, latency)."""
+        proxy = self.proxies[proxy_name]
+        latency = proxy.latency * self.rng.lognormvariate(0, 0.3)
+        if self.rng.random() < proxy.error_rate:
+            return None, latency * 3
+        if site in proxy.burned:
+            return 403, latency
+        recent = self._recent[(site, proxy_name)]
+        while recent and recent[0] < now - self.throttle_window:
+            recent.popleft()
+        recent.append(now)
+        if len(recent) > self.throttle_requests:
+            return 429, latency
+        return 200, latency
+
+
+def _setup(args):
+    rng = random.Random(args.seed)
+    sites = [f'site-{i}' for i in range(args.sites)]
+    proxies = {}
+    for i in range(args.proxies):
+        name = f'http://127.0.0.1:{9000 + i}'
+        proxies[name] = StandInProxy(name, rng, sites, flaky=rng.random() < args.flaky_share,
+                                     burned_share=args.burned_share)
+    network = StandInNetwork(proxies, random.Random(args.seed + 1), args.throttle_requests, args.throttle_window)
+    return sites, proxies, network
+
+
+def run_round_robin(args) -> Dict:
+    """Rotate through the proxies regardless of their outcomes."""
+    sites, proxies, network = _setup(args)
+    rotation = itertools.cycle(list(proxies))
+    now, successes, outcomes = 0.0, 0, defaultdict(int)
+    for i in range(args.requests):
+        site = sites[i % len(sites)]
+        status, latency = network.request(site, next(rotation), now)
+        now += latency / args.workers
+        outcomes[classify(status)] += 1
+        successes += status == 200
+    return _report(successes, now, outcomes, args.requests)
+
+
+def run_pool(args, store=None) -> Dict:
+    """Select through the health-scored pool and report every outcome."""
+    sites, proxies, network = _setup(args)
+    clock = SimulatedClock()
+    pool = ProxyPool(list(proxies), store=store or InMemoryProxyStore(), clock=clock,
+                     cooldown_seconds=args.cooldown, ban_seconds=args.ban)
+    successes, outcomes, idle = 0, defaultdict(int), 0
+    select_time = 0.0
+    for i in range(args.requests):
+        site = sites[i % len(sites)]
+        started = time.perf_counter()
+        proxy = pool.get_next_proxy(site)
+        select_time += time.perf_counter() - started
+        if proxy is None:
+            # Everything is parked for this site, wait for the next release
+            idle += 1
+            clock.now += 1.0
+            continue
+        status, latency = network.request(site, proxy, clock.now)
+        clock.now += latency / args.workers
+        event = pool.report(site, proxy, status, latency, error=status is None)
+        outcomes[event] += 1
+        successes += event == SUCCESS
+    report = _report(successes, clock.now, outcomes, args.requests)
+    report['idle_selections'] = idle
+    report['select_us'] = round(select_time / args.requests * 1e6, 2)
+    return report
+
+
+def _report(successes: int, elapsed: float, outcomes: Dict, requests: int) -> Dict:
+    return {
+        'success_rate': round(successes / requests, 3),
+        'successes_per_sim_s': round(successes / elapsed, 2) if elapsed else 0.0,
+        'outcomes': dict(outcomes),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point for the proxy pool simulation"""
+    parser = argparse.ArgumentParser(description='Proxy pool simulation')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--proxies', type=int, default=50)
+    parser.add_argument('--sites', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent scrapers sharing the clock')
+    parser.add_argument('--flaky-share', type=float, default=0.2)
+    parser.add_argument('--burned-share', type=float, default=0.3, help='Chance a proxy is banned on a site')
+    parser.add_argument('--throttle-requests', type=int, default=20)
+    parser.add_argument('--throttle-window', type=float, default=60)
+    parser.add_argument('--cooldown', type=float, default=30)
+    parser.add_argument('--ban', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--redis', action='store_true', help='Use the configured Redis as the store')
+    args = parser.parse_args(argv)
+
+    store = None
+    if args.redis:
+        from GS.workflow_engine.activities.proxy_pool import RedisProxyStore
+        store = RedisProxyStore(prefix=f'proxy_pool_sim_{int(time.time())}')
+
+    report = {
+        'requests': args.requests,
+        'proxies': args.proxies,
+        'sites': args.sites,
+        'round_robin': run_round_robin(args),
+        'health_scored': run_pool(args, store),
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,9 @@ from flask_cors import CORS
 
 from GS.core.app.config import ACCEPTED_ORIGINS
 from GS.core.app.models.task_result import TaskResult
+from GS.core.app.models.analysis_schedule import AnalysisSchedule
+from GS.core.app.models.archived_task_result import ArchivedTaskResult
+from GS.core.app.helper.result_partitions import ensure_partitions
 
 """
  Logging configuration
@@ -27,3 +30,5 @@ from GS.core.app.apis.crewai_api import CrewAIApi
 appbuilder.add_api(CrewAIApi)
 
 db.create_all()
+# A partitioned task_result table needs the partition of the current month before the first insert
+ensure_partitions(db.engine)
@@ -1,71 +1,265 @@
 from flask_appbuilder.api import BaseApi
 from flask_appbuilder.api import expose
-from flask import request, send_file
+from flask import Response, request, send_file, stream_with_context
+from datetime import datetime, timedelta
 import threading
 import json
 import os
-from GS.crew_ai.runners.crew_runner import run_data_analysis_crew
+import tempfile
+from typing import Union
 from uuid import uuid4
+from sqlalchemy.orm import Query
 from GS.core.app import db
 from GS.core.app.models.task_result import TaskResult
+from GS.core.app.models.analysis_schedule import AnalysisSchedule
+from GS.core.app.helper.compression import result_envelope
+from GS.core.app.helper.db_routing import get_read_router, read_session
+from GS.core.app.helper.fair_scheduler import ANONYMOUS, QuotaExceeded, get_fair_scheduler, request_lane, request_user
+from GS.core.app.helper.task_dispatch import DATA_ANALYSIS, FLOW, check_quota, submit_run
+from GS.core.app.helper.result_archive import archived_task
+from GS.workflow_engine.helper_classes.cancellation import CANCELLED, TIMED_OUT, request_deadline
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_UNAUTHORIZED = "Sign in to export the results of your tasks"
+# get_result wraps stored results as {"result": ...}
+RESULT_ENVELOPE = (b'{"result": ', b'}')
+# Tasks in these states can still be cancelled
+ACTIVE_STATUSES = ('pending', 'in_progress')
+STOPPED_MESSAGES = {
+    CANCELLED: "Task was cancelled",
+    TIMED_OUT: "Task did not finish before its deadline",
+}
+
+
+def find_task(task_id: str):
+    """Look a task up for polling, on a read replica when there are any.
+
+    Tasks moved out of the table by the retention compactor are read back
+    from the result archive.
+    """
+    with read_session() as session:
+        task = session.query(TaskResult).filter_by(task_id=task_id).first()
+    if task is None and get_read_router().replica_uris:
+        # A lagging replica may not have a task that was created a moment ago
+        task = db.session.query(TaskResult).filter_by(task_id=task_id).first()
+    if task is None:
+        task = archived_task(task_id)
+    return task
+
+
+def cancel_forbidden(owned: Union[TaskResult, AnalysisSchedule], user: str) -> bool:
+    """Whether `user` may not cancel a task or delete a schedule, only its creator may unless it was anonymous."""
+    return bool(owned.user) and owned.user != ANONYMOUS and owned.user != user
+
+
+def export_line(task: TaskResult) -> str:
+    """One NDJSON line of the export."""
+    header = json.dumps({
+        'task_id': task.task_id,
+        'status': task.status,
+        'created_at': task.created_at.isoformat() if task.created_at else None,
+    })
+    # The stored result already is JSON, splice it in instead of re-parsing it
+    result = task.get_result_text() or 'null'
+    return f'{header[:-1]}, "result": {result}}}\n'
+
+
+def export_row(task: TaskResult) -> dict:
+    """One row of the Parquet export."""
+    return {
+        'task_id': task.task_id,
+        'status': task.status,
+        'created_at': task.created_at,
+        'result': task.get_result_text(),
+    }
+
+
+def export_schema():
+    """Arrow schema of the Parquet export."""
+    import pyarrow as pa
+    return pa.schema([
+        ('task_id', pa.string()),
+        ('status', pa.string()),
+        ('created_at', pa.timestamp('us')),
+        ('result', pa.string()),
+    ])
+
 
 class CrewAIApi(BaseApi):
     resource_name = 'crewai'
 
-    @expose('/start_task', methods=['POST'])
-    def start_task(self):
-        session = db.session
-        """Start a CrewAI task in the background."""
+    def _start(self, kind, message):
+        """Record a pending task of the requesting user and queue its run.
+
+        Runs are queued fairly in this process, or published to the workers
+        when TASK_BROKER_URL is set, see `task_dispatch`. The `priority`
+        field of the body picks the 'interactive' (default) or 'batch' lane
+        and `deadline_seconds` the time the task has from now until it is
+        stopped as 'timed_out'. Crew inputs may reference large inputs on
+        S3 or local disk instead of holding them, see `artifact_cache`, a
+        malformed reference gets a 400. A user over their token quota gets a 429.
+        """
         data = request.json
+        from GS.workflow_engine.helper_classes.artifact_cache import request_artifacts
+        try:
+            lane = request_lane(data)
+            deadline = request_deadline(data)
+            request_artifacts(data)
+        except ValueError as e:
+            return self.response(400, message=str(e))
+        user = request_user()
+        try:
+            check_quota(user)
+        except QuotaExceeded as e:
+            response = self.response(429, message=str(e))
+            response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+            return response
+        session = db.session
         task_id = str(uuid4())  # Generate a unique task ID
         # Save initial task status
-        task = TaskResult(task_id=task_id, status='pending')
+        task = TaskResult(task_id=task_id, status='pending', user=user, lane=lane,
+                          deadline_at=datetime.utcnow() + timedelta(seconds=deadline) if deadline else None)
         session.add(task)
         session.commit()
-        # Run CrewAI task in a separate thread
-        thread = threading.Thread(target=run_data_analysis_crew, args=(task_id, data))
-        thread.start()
-        return self.response(202, task_id=task_id, message="Task started")
+        # Run on the shared executor in turn with the runs of other users, or on a worker
+        submit_run(task_id, user, lane, kind, task_id, data)
+        return self.response(202, task_id=task_id, message=message)
+
+    @expose('/start_task', methods=['POST'])
+    def start_task(self):
+        """Start a CrewAI task in the background.
+
+        A `deadline_seconds` field in the body bounds the run, time spent
+        queued included.
+        """
+        return self._start(DATA_ANALYSIS, "Task started")
     
     @expose('/start_data_analysis', methods=['POST'])
     def start_data_analysis(self):
-        session = db.session
         """Start a data analysis task in the background using the newer crew structure."""
-        data = request.json
-        task_id = str(uuid4())  # Generate a unique task ID
-        # Save initial task status
-        task = TaskResult(task_id=task_id, status='pending')
-        session.add(task)
-        session.commit()
-        # Run CrewAI task in a separate thread
-        thread = threading.Thread(target=run_data_analysis_crew, args=(task_id, data))
-        thread.start()
-        return self.response(202, task_id=task_id, message="Data analysis task started")
+        return self._start(DATA_ANALYSIS, "Data analysis task started")
 
     @expose('/start_comprehensive_analysis', methods=['POST'])
     def start_comprehensive_analysis(self):
-        # Import here to avoid circular dependency
-        from GS.crew_ai.flows.data_analysis_flow import run_flow_analysis
-        
-        session = db.session
         """Start a comprehensive analysis flow that combines data analysis and summary."""
-        data = request.json
-        task_id = str(uuid4())  # Generate a unique task ID
-        # Save initial task status
-        task = TaskResult(task_id=task_id, status='pending')
-        session.add(task)
+        return self._start(FLOW, "Comprehensive analysis started")
+
+    @expose('/cancel/<task_id>', methods=['POST'])
+    def cancel_task(self, task_id):
+        """Cancel a pending or running task.
+
+        A queued task is dropped from the queue. A running one stops at its
+        next check, between flow stages, crew tasks and before each LLM or
+        tool call, and its LLM requests in flight are aborted. The task is
+        marked 'cancelled' right away.
+        """
+        session = db.session
+        task = session.query(TaskResult).filter_by(task_id=task_id).first()
+        if task is None:
+            return self.response(404, message="Task not found")
+        if cancel_forbidden(task, request_user()):
+            return self.response(403, message="Only the user that started the task can cancel it")
+        cancelled = session.query(TaskResult).filter(
+            TaskResult.task_id == task_id, TaskResult.status.in_(ACTIVE_STATUSES)
+        ).update({'status': CANCELLED}, synchronize_session=False)
+        session.commit()
+        if not cancelled:
+            session.refresh(task)
+            return self.response(409, status=task.status, message=f"Task already {task.status}")
+        # Runs in other processes see the status at their next check
+        found = get_fair_scheduler().cancel(task_id)
+        return self.response(202, task_id=task_id, status=CANCELLED, where=found or 'elsewhere',
+                             message="Task cancelled")
+
+    @expose('/scheduler', methods=['GET'])
+    def scheduler_stats(self):
+        """Runs in progress and queued per lane and user in this process."""
+        return self.response(200, **get_fair_scheduler().stats())
+
+    @expose('/schedules', methods=['POST'])
+    def create_schedule(self):
+        """Run a data analysis every `interval_seconds`, analysing only what changed.
+
+        Body:
+            name: Unique name of the schedule
+            interval_seconds: Time between runs
+            sources: Tables to watch, [{"table": ..., "watermark_column": ...}].
+                Rows past the watermark column's last analysed value are
+                analysed, tables without one are compared by version.
+            request: Body of a start_data_analysis request for the runs
+            start_at: ISO timestamp of the first run, defaults to now
+        """
+        data = request.json or {}
+        name = data.get('name')
+        interval = data.get('interval_seconds')
+        sources = data.get('sources')
+        if not name or not isinstance(interval, int) or interval <= 0:
+            return self.response(400, message="A schedule needs a name and a positive interval_seconds")
+        if not sources or not all(isinstance(source, dict) and source.get('table') for source in sources):
+            return self.response(400, message="A schedule needs sources, each with a table")
+        try:
+            start_at = datetime.fromisoformat(data['start_at']) if data.get('start_at') else datetime.utcnow()
+        except ValueError:
+            return self.response(400, message=f"Invalid 'start_at' timestamp: {data['start_at']}")
+        session = db.session
+        if session.query(AnalysisSchedule).filter_by(name=name).first():
+            return self.response(409, message=f"Schedule '{name}' already exists")
+        schedule = AnalysisSchedule(name=name, interval_seconds=interval, next_run_at=start_at, user=request_user(),
+                                    request=json.dumps(data.get('request') or {}), sources=json.dumps(sources))
+        session.add(schedule)
         session.commit()
-        # Run the comprehensive analysis flow in a separate thread
-        thread = threading.Thread(target=run_flow_analysis, args=(task_id, data))
+        return self.response(201, schedule=schedule.to_dict())
+
+    @expose('/schedules', methods=['GET'])
+    def list_schedules(self):
+        """List the recurring analyses with their watermarks and last reports."""
+        schedules = db.session.query(AnalysisSchedule).order_by(AnalysisSchedule.name).all()
+        return self.response(200, schedules=[schedule.to_dict() for schedule in schedules])
+
+    @expose('/schedules/<name>', methods=['DELETE'])
+    def delete_schedule(self, name):
+        """Stop a recurring analysis, the reports of its runs are kept."""
+        session = db.session
+        schedule = session.query(AnalysisSchedule).filter_by(name=name).first()
+        if schedule is None:
+            return self.response(404, message="Schedule not found")
+        if cancel_forbidden(schedule, request_user()):
+            return self.response(403, message="Only the user that created the schedule can delete it")
+        session.delete(schedule)
+        session.commit()
+        return self.response(200, message=f"Schedule '{name}' deleted")
+
+    @expose('/upload_document', methods=['POST'])
+    def upload_document(self):
+        """Upload a PDF or DOCX document for later analysis.
+
+        The file is stored under its content hash and extracted in the
+        background, pass the returned document_id in the `documents` list of
+        a start request to analyse it.
+        """
+        from GS.workflow_engine.helper_classes.document_ingestion import get_document_ingestor
+
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return self.response(400, message="No file uploaded, send it as the 'file' form field")
+        ingestor = get_document_ingestor()
+        try:
+            document = ingestor.save_upload(upload.stream, upload.filename)
+        except ValueError as e:
+            return self.response(400, message=str(e))
+        # Extract now so the first analysis of the document finds it cached
+        thread = threading.Thread(target=ingestor.extract, args=(document['document_id'],))
         thread.start()
-        return self.response(202, task_id=task_id, message="Comprehensive analysis started")
+        return self.response(202, document_id=document['document_id'], name=document['name'],
+                             message="Document uploaded, extraction started")
 
     @expose('/get_result/<task_id>', methods=['GET'])
     def get_result(self, task_id):
         """Retrieve the result of a CrewAI task."""
-        session = db.session
-        task = session.query(TaskResult).filter_by(task_id=task_id).first()
-        if task and task.status == 'completed':
+        task = find_task(task_id)
+        if task and task.status == 'completed' and task.result_data is not None:
+            return self._stored_result_response(task)
+        elif task and task.status == 'completed':
             # Parse the JSON result
             try:
                 result = json.loads(task.result)
@@ -77,9 +271,99 @@ class CrewAIApi(BaseApi):
             return self.response(202, message="Task is still processing")
         elif task and task.status == 'in_progress':
             return self.response(202, message="Task is in progress")
+        elif task and task.status in STOPPED_MESSAGES:
+            return self.response(410, status=task.status, message=STOPPED_MESSAGES[task.status])
         else:
             return self.response(404, message="Task not found or failed")
     
+    def _stored_result_response(self, task):
+        """Return a compressed result without decoding and re-encoding its JSON.
+
+        When the client accepts the stored encoding the bytes are sent as they
+        are with a matching Content-Encoding, otherwise they are only
+        decompressed. Either way the body is the same {"result": ...} envelope.
+        """
+        body, encoding = result_envelope(task.result_data, task.result_encoding,
+                                         request.headers.get('Accept-Encoding'), *RESULT_ENVELOPE)
+        response = Response(body, status=200, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @expose('/export', methods=['GET'])
+    def export_results(self):
+        """Export the requesting user's task results as NDJSON or Parquet for downstream analytics.
+
+        Only signed in users may export, and only the tasks they started.
+
+        Query parameters:
+            format: 'ndjson' (default) or 'parquet'
+            status: Only export tasks with this status, defaults to 'completed'
+            since: Only export tasks created at or after this ISO timestamp
+            limit: Maximum number of tasks to export
+        """
+        export_format = request.args.get('format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'parquet'):
+            return self.response(400, message=f"Unsupported export format: {export_format}")
+        user = request_user()
+        if user == ANONYMOUS:
+            return self.response(401, message=EXPORT_UNAUTHORIZED)
+
+        # Bound to a read session where it runs, exports do not need the primary
+        query = Query(TaskResult).filter_by(user=user, status=request.args.get('status', 'completed'))
+        since = request.args.get('since')
+        if since:
+            try:
+                query = query.filter(TaskResult.created_at >= datetime.fromisoformat(since))
+            except ValueError:
+                return self.response(400, message=f"Invalid 'since' timestamp: {since}")
+        query = query.order_by(TaskResult.id)
+        limit = request.args.get('limit', type=int)
+        if limit:
+            query = query.limit(limit)
+        query = query.yield_per(EXPORT_BATCH_SIZE)
+
+        if export_format == 'parquet':
+            return self._export_parquet(query)
+
+        def generate():
+            with read_session() as session:
+                for task in query.with_session(session):
+                    yield export_line(task)
+
+        return Response(stream_with_context(generate()), status=200, mimetype='application/x-ndjson')
+
+    def _export_parquet(self, query):
+        """Write the exported results to a Parquet file in batches and send it."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            return self.response(500, message="Parquet export requires pyarrow")
+
+        schema = export_schema()
+        export_file = tempfile.NamedTemporaryFile(suffix='.parquet', delete=False)
+        export_file.close()
+        with read_session() as session, pq.ParquetWriter(export_file.name, schema, compression='zstd') as writer:
+            batch = []
+            for task in query.with_session(session):
+                batch.append(export_row(task))
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+        response = send_file(
+            export_file.name,
+            mimetype='application/vnd.apache.parquet',
+            as_attachment=True,
+            download_name=f"task_results_{datetime.utcnow():%Y%m%d%H%M%S}.parquet"
+        )
+        response.call_on_close(lambda: os.remove(export_file.name))
+        return response
+
     @expose('/flow_visualization', methods=['GET'])
     def get_flow_visualization(self):
         """Generate and return a visualization of the comprehensive analysis flow."""
@@ -0,0 +1,267 @@
+"""Async variants of the CrewAI endpoints, served by the ASGI app in `core/asgi.py`.
+
+The routes have the same paths, parameters and responses as `CrewAIApi`, but
+run on the server's event loop: database access goes through the async
+engine, crew runs are queued per user by the fair scheduler or published to
+the workers (see `task_dispatch`) and blocking work such as decompressing
+large results, writing Parquet exports or rendering the flow visualization
+is moved to a worker thread. A slow request therefore only holds a
+coroutine, not a server thread.
+
+Endpoints not listed here, such as document uploads, are still served by the
+Flask app that `core/asgi.py` mounts behind these routes.
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import select, update
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from GS.core.app.apis.crewai_api import (
+    ACTIVE_STATUSES, EXPORT_BATCH_SIZE, EXPORT_UNAUTHORIZED, RESULT_ENVELOPE, STOPPED_MESSAGES, cancel_forbidden,
+    export_line, export_row, export_schema
+)
+from GS.core.app.helper.async_db import async_session
+from GS.core.app.helper.compression import result_envelope
+from GS.core.app.helper.db_routing import get_read_router
+from GS.core.app.helper.fair_scheduler import ANONYMOUS, QuotaExceeded, get_fair_scheduler, request_lane, token_user
+from GS.core.app.helper.result_archive import archived_task
+from GS.core.app.helper.task_dispatch import DATA_ANALYSIS, FLOW, check_quota, submit_run
+from GS.core.app.models.task_result import TaskResult
+from GS.workflow_engine.helper_classes.cancellation import CANCELLED, request_deadline
+
+ROUTE_PREFIX = '/api/v1/crewai'
+
+# Stored results up to this size are unwrapped on the event loop
+INLINE_DECODE_BYTES = 64 * 1024
+
+
+def _response(code: int, **kwargs) -> JSONResponse:
+    """Same body as FAB's `BaseApi.response`."""
+    return JSONResponse(kwargs, status_code=code)
+
+
+async def _start(request: Request, kind: str, message: str) -> JSONResponse:
+    try:
+        data = await request.json()
+    except ValueError:
+        return _response(400, message="The request body must be JSON")
+    from GS.workflow_engine.helper_classes.artifact_cache import request_artifacts
+    try:
+        lane = request_lane(data)
+        deadline = request_deadline(data)
+        request_artifacts(data)
+    except ValueError as e:
+        return _response(400, message=str(e))
+    # Looking the token's user up queries the database
+    user = await run_in_threadpool(token_user, request.headers.get('Authorization'))
+    try:
+        await run_in_threadpool(check_quota, user)
+    except QuotaExceeded as e:
+        response = _response(429, message=str(e))
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response
+    task_id = str(uuid4())
+    async with async_session() as session:
+        session.add(TaskResult(task_id=task_id, status='pending', user=user, lane=lane,
+                               deadline_at=datetime.utcnow() + timedelta(seconds=deadline) if deadline else None))
+        await session.commit()
+    # Publishing to a broker waits for its confirm
+    await run_in_threadpool(submit_run, task_id, user, lane, kind, task_id, data)
+    return _response(202, task_id=task_id, message=message)
+
+
+async def start_task(request: Request) -> JSONResponse:
+    """Start a CrewAI task in the background.
+
+    A `deadline_seconds` field in the body bounds the run, time spent queued
+    included.
+    """
+    return await _start(request, DATA_ANALYSIS, "Task started")
+
+
+async def start_data_analysis(request: Request) -> JSONResponse:
+    """Start a data analysis task in the background using the newer crew structure."""
+    return await _start(request, DATA_ANALYSIS, "Data analysis task started")
+
+
+async def start_comprehensive_analysis(request: Request) -> JSONResponse:
+    """Start a comprehensive analysis flow that combines data analysis and summary."""
+    return await _start(request, FLOW, "Comprehensive analysis started")
+
+
+async def cancel_task(request: Request) -> JSONResponse:
+    """Cancel a pending or running task, see `CrewAIApi.cancel_task`."""
+    task_id = request.path_params['task_id']
+    async with async_session() as session:
+        task = (await session.execute(select(TaskResult).filter_by(task_id=task_id))).scalars().first()
+        if task is None:
+            return _response(404, message="Task not found")
+        user = await run_in_threadpool(token_user, request.headers.get('Authorization'))
+        if cancel_forbidden(task, user):
+            return _response(403, message="Only the user that started the task can cancel it")
+        result = await session.execute(
+            update(TaskResult).where(TaskResult.task_id == task_id, TaskResult.status.in_(ACTIVE_STATUSES))
+            .values(status=CANCELLED).execution_options(synchronize_session=False))
+        await session.commit()
+        if not result.rowcount:
+            await session.refresh(task)
+            return _response(409, status=task.status, message=f"Task already {task.status}")
+    # Takes the scheduler's lock, which runs finishing on workers hold briefly
+    found = await run_in_threadpool(get_fair_scheduler().cancel, task_id)
+    return _response(202, task_id=task_id, status=CANCELLED, where=found or 'elsewhere', message="Task cancelled")
+
+
+async def get_result(request: Request) -> Response:
+    """Retrieve the result of a CrewAI task."""
+    task_id = request.path_params['task_id']
+    query = select(TaskResult).filter_by(task_id=task_id)
+    async with async_session(read=True) as session:
+        task = (await session.execute(query)).scalars().first()
+    if task is None and get_read_router().replica_uris:
+        # A lagging replica may not have a task that was created a moment ago
+        async with async_session() as session:
+            task = (await session.execute(query)).scalars().first()
+    if task is None:
+        # Moved to the result archive by the retention compactor
+        task = await run_in_threadpool(archived_task, task_id)
+
+    if task and task.status == 'completed' and task.result_data is not None:
+        accept_encoding = request.headers.get('Accept-Encoding')
+        if len(task.result_data) > INLINE_DECODE_BYTES:
+            body, encoding = await run_in_threadpool(
+                result_envelope, task.result_data, task.result_encoding, accept_encoding, *RESULT_ENVELOPE)
+        else:
+            body, encoding = result_envelope(task.result_data, task.result_encoding, accept_encoding,
+                                             *RESULT_ENVELOPE)
+        headers = {'Vary': 'Accept-Encoding'}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(body, status_code=200, media_type='application/json', headers=headers)
+    elif task and task.status == 'completed':
+        try:
+            return _response(200, result=json.loads(task.result))
+        except json.JSONDecodeError:
+            return _response(200, result=task.result)
+    elif task and task.status == 'pending':
+        return _response(202, message="Task is still processing")
+    elif task and task.status == 'in_progress':
+        return _response(202, message="Task is in progress")
+    elif task and task.status in STOPPED_MESSAGES:
+        return _response(410, status=task.status, message=STOPPED_MESSAGES[task.status])
+    else:
+        return _response(404, message="Task not found or failed")
+
+
+async def export_results(request: Request) -> Response:
+    """Export many task results as NDJSON or Parquet for downstream analytics.
+
+    Takes the same query parameters as `CrewAIApi.export_results` and
+    likewise only exports the tasks of the token's user.
+    """
+    export_format = request.query_params.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'parquet'):
+        return _response(400, message=f"Unsupported export format: {export_format}")
+    user = await run_in_threadpool(token_user, request.headers.get('Authorization'))
+    if user == ANONYMOUS:
+        return _response(401, message=EXPORT_UNAUTHORIZED)
+
+    query = select(TaskResult).filter_by(user=user, status=request.query_params.get('status', 'completed'))
+    since = request.query_params.get('since')
+    if since:
+        try:
+            query = query.filter(TaskResult.created_at >= datetime.fromisoformat(since))
+        except ValueError:
+            return _response(400, message=f"Invalid 'since' timestamp: {since}")
+    query = query.order_by(TaskResult.id)
+    try:
+        limit = int(request.query_params.get('limit') or 0)
+    except ValueError:
+        limit = 0
+    if limit:
+        query = query.limit(limit)
+    query = query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    if export_format == 'parquet':
+        return await _export_parquet(query)
+
+    async def generate():
+        async with async_session(read=True) as session:
+            result = await session.stream(query)
+            async for batch in result.scalars().partitions(EXPORT_BATCH_SIZE):
+                # Decompressing results is CPU work, keep it off the event loop
+                yield ''.join(await run_in_threadpool(lambda: [export_line(task) for task in batch]))
+
+    return StreamingResponse(generate(), status_code=200, media_type='application/x-ndjson')
+
+
+async def _export_parquet(query) -> Response:
+    """Write the exported results to a Parquet file in batches and send it."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return _response(500, message="Parquet export requires pyarrow")
+
+    schema = export_schema()
+    export_file = tempfile.NamedTemporaryFile(suffix='.parquet', delete=False)
+    export_file.close()
+
+    def write(writer, batch):
+        writer.write_table(pa.Table.from_pylist([export_row(task) for task in batch], schema=schema))
+
+    try:
+        writer = await run_in_threadpool(pq.ParquetWriter, export_file.name, schema, compression='zstd')
+        try:
+            async with async_session(read=True) as session:
+                result = await session.stream(query)
+                async for batch in result.scalars().partitions(EXPORT_BATCH_SIZE):
+                    await run_in_threadpool(write, writer, batch)
+        finally:
+            await run_in_threadpool(writer.close)
+    except BaseException:
+        os.remove(export_file.name)
+        raise
+
+    return FileResponse(
+        export_file.name,
+        media_type='application/vnd.apache.parquet',
+        filename=f"task_results_{datetime.utcnow():%Y%m%d%H%M%S}.parquet",
+        background=BackgroundTask(os.remove, export_file.name),
+    )
+
+
+async def get_flow_visualization(request: Request) -> Response:
+    """Generate and return a visualization of the comprehensive analysis flow."""
+    try:
+        from GS.crew_ai.flows.data_analysis_flow import plot_flow
+
+        filename = f"analysis_flow_{str(uuid4())[:8]}"
+        visualization_path = await run_in_threadpool(plot_flow, output_file=filename)
+
+        if visualization_path.startswith('http'):
+            return _response(302, visualization_url=visualization_path)
+        if os.path.exists(visualization_path):
+            return FileResponse(visualization_path, media_type='text/html', filename=f"{filename}.html")
+        return _response(404, message="Visualization file not found")
+    except Exception as e:
+        return _response(500, message=f"Error generating visualization: {str(e)}")
+
+
+routes = [
+    Route(f'{ROUTE_PREFIX}/start_task', start_task, methods=['POST']),
+    Route(f'{ROUTE_PREFIX}/start_data_analysis', start_data_analysis, methods=['POST']),
+    Route(f'{ROUTE_PREFIX}/start_comprehensive_analysis', start_comprehensive_analysis, methods=['POST']),
+    Route(f'{ROUTE_PREFIX}/cancel/{{task_id}}', cancel_task, methods=['POST']),
+    Route(f'{ROUTE_PREFIX}/get_result/{{task_id}}', get_result, methods=['GET']),
+    Route(f'{ROUTE_PREFIX}/export', export_results, methods=['GET']),
+    Route(f'{ROUTE_PREFIX}/flow_visualization', get_flow_visualization, methods=['GET']),
+]
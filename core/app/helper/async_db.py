@@ -0,0 +1,139 @@
+"""Async access to the application database for the ASGI endpoints.
+
+The Flask app talks to the database through Flask-SQLAlchemy's scoped,
+thread-bound session. The async endpoints run on the server's event loop
+instead and use an `AsyncEngine` on the same database, with the async driver
+that matches the configured one. Its pool belongs to the loop, so engines
+are created on first use from inside that loop. Reads that may be served by
+a replica get engines of their own, see `db_routing`.
+"""
+
+import contextlib
+import os
+import threading
+from typing import AsyncIterator, Dict, Tuple
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Sync driver -> async driver of the same database
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'mssql+pyodbc': 'mssql+aioodbc',
+}
+
+# Per engine, there is one for writes and one for reads, see DB_POOL_SIZE in config.py
+POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", 3))
+MAX_OVERFLOW = int(os.environ.get("ASYNC_DB_MAX_OVERFLOW", 2))
+
+
+def async_database_uri(uri: str) -> str:
+    """Rewrite a SQLAlchemy URI to use the async driver of its database.
+
+    Args:
+        uri: The configured SQLALCHEMY_DATABASE_URI
+
+    Returns:
+        The URI with an async driver, unchanged when it already names one
+
+    Raises:
+        ValueError: When there is no async driver for the database
+    """
+    scheme, separator, rest = uri.partition('://')
+    if not separator:
+        raise ValueError(f"Not a database URI: {uri}")
+    if scheme in ASYNC_DRIVERS.values():
+        return uri
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database URIs of type '{scheme}'")
+    return f'{ASYNC_DRIVERS[scheme]}://{rest}'
+
+
+def _create_engine(uri: str, read: bool = False) -> AsyncEngine:
+    uri = async_database_uri(uri)
+    options = {}
+    if read and uri.startswith('postgresql+asyncpg'):
+        options['connect_args'] = {'server_settings': {'default_transaction_read_only': 'on'}}
+    if uri.startswith('sqlite') and ':memory:' not in uri:
+        # aiosqlite runs each connection on a thread of its own, some SQLAlchemy
+        # versions default to opening one per session, keep them pooled instead
+        return create_async_engine(uri, poolclass=AsyncAdaptedQueuePool,
+                                   pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, **options)
+    if uri.startswith('sqlite'):
+        return create_async_engine(uri)
+    return create_async_engine(uri, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True, **options)
+
+
+# (uri, read) -> (engine, session factory), reads have pools of their own
+_engines: Dict[Tuple[str, bool], Tuple[AsyncEngine, sessionmaker]] = {}
+_engine_lock = threading.Lock()
+
+
+def _factory(uri: str, read: bool = False) -> sessionmaker:
+    entry = _engines.get((uri, read))
+    if entry is None:
+        with _engine_lock:
+            entry = _engines.get((uri, read))
+            if entry is None:
+                engine = _create_engine(uri, read)
+                entry = _engines[(uri, read)] = (
+                    engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    return entry[1]
+
+
+def get_async_engine() -> AsyncEngine:
+    """Get the async engine of the app's database, created on first use."""
+    from GS.core.app import app
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    _factory(uri)
+    return _engines[(uri, False)][0]
+
+
+@contextlib.asynccontextmanager
+async def async_session(read: bool = False) -> AsyncIterator[AsyncSession]:
+    """An async session that is rolled back on errors and always closed.
+
+    Args:
+        read: For reads that tolerate replica lag, the session then goes to
+            the read replicas in turn like `db_routing.read_session`
+    """
+    from GS.core.app import app
+    from GS.core.app.helper.db_routing import get_read_router
+
+    router = get_read_router() if read else None
+    candidates = router.candidates() if read else [app.config['SQLALCHEMY_DATABASE_URI']]
+    for index, uri in enumerate(candidates):
+        session = _factory(uri, read)()
+        if read:
+            try:
+                await session.connection()
+            except (OperationalError, DBAPIError):
+                await session.close()
+                if index == len(candidates) - 1:
+                    raise
+                router.mark_down(uri)
+                continue
+        try:
+            yield session
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+        return
+
+
+async def dispose_async_engine():
+    """Close the pooled connections, called when the ASGI app shuts down."""
+    with _engine_lock:
+        entries = list(_engines.values())
+        _engines.clear()
+    for engine, _ in entries:
+        await engine.dispose()
@@ -0,0 +1,126 @@
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, gzip is always available
+    zstandard = None
+
+ZSTD = 'zstd'
+GZIP = 'gzip'
+IDENTITY = 'identity'
+
+DEFAULT_CODEC = os.environ.get("RESULT_COMPRESSION", ZSTD)
+DEFAULT_LEVEL = int(os.environ.get("RESULT_COMPRESSION_LEVEL", 3))
+
+# Payloads smaller than this are stored as-is, compression would only add overhead
+MIN_COMPRESS_BYTES = int(os.environ.get("RESULT_COMPRESSION_MIN_BYTES", 512))
+
+
+def available_codec(codec: str = None) -> str:
+    """Return the requested codec, falling back to gzip when zstandard is missing."""
+    codec = (codec or DEFAULT_CODEC).lower()
+    if codec == ZSTD and zstandard is None:
+        return GZIP
+    if codec not in (ZSTD, GZIP, IDENTITY):
+        return GZIP
+    return codec
+
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    """Compress bytes with the given codec."""
+    level = DEFAULT_LEVEL if level is None else level
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == GZIP:
+        return gzip.compress(data, compresslevel=min(max(level, 1), 9))
+    return data
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress bytes that were produced by `compress` with the same codec."""
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed results")
+        # Frames written with ZstdCompressor.compress carry their content size,
+        # but concatenated frames (see `wrap_compressed`) need the streaming reader
+        return zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True).read()
+    if codec == GZIP:
+        return gzip.decompress(data)
+    return data
+
+
+def encode_result(payload: str, codec: str = None, level: int = None):
+    """Encode a JSON result string for storage.
+
+    Args:
+        payload: The JSON string to store
+        codec: The codec to use, defaults to RESULT_COMPRESSION
+        level: The compression level, defaults to RESULT_COMPRESSION_LEVEL
+
+    Returns:
+        A tuple of (stored bytes, codec name)
+    """
+    data = payload.encode('utf-8')
+    codec = available_codec(codec)
+    if len(data) < MIN_COMPRESS_BYTES:
+        codec = IDENTITY
+    return compress(data, codec, level), codec
+
+
+def decode_result(data: bytes, codec: str) -> str:
+    """Decode stored result bytes back into the JSON string."""
+    return decompress(data, codec or IDENTITY).decode('utf-8')
+
+
+def accepted_encodings(header: str) -> set:
+    """Parse an Accept-Encoding header into the set of acceptable codings."""
+    encodings = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if quality > 0:
+            encodings.add(token)
+    return encodings
+
+
+def wrap_compressed(data: bytes, codec: str, prefix: bytes, suffix: bytes) -> bytes:
+    """Surround an already compressed payload with a prefix and a suffix.
+
+    Both gzip members and zstd frames may be concatenated and still decode as a
+    single stream, so the stored bytes never have to be decompressed to put
+    them inside a response envelope.
+    """
+    return compress(prefix, codec, 1) + data + compress(suffix, codec, 1)
+
+
+def result_envelope(data: bytes, codec: str, accept_encoding: str, prefix: bytes, suffix: bytes):
+    """Build a response body around stored result bytes.
+
+    The stored bytes are passed through compressed when the client accepts
+    their encoding and are only decompressed otherwise, the JSON is never
+    decoded.
+
+    Args:
+        data: The stored result bytes
+        codec: The codec they were stored with
+        accept_encoding: The client's Accept-Encoding header
+        prefix: Bytes to put before the result
+        suffix: Bytes to put after the result
+
+    Returns:
+        A tuple of (body, Content-Encoding), the encoding is None for plain bodies
+    """
+    codec = codec or IDENTITY
+    if codec != IDENTITY and codec in accepted_encodings(accept_encoding):
+        return wrap_compressed(data, codec, prefix, suffix), codec
+    return prefix + decompress(data, codec) + suffix, None
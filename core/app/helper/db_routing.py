@@ -0,0 +1,210 @@
+"""Connection pool options, read routing and session cleanup for the task database.
+
+Three kinds of work share the database: request threads, background crew
+runs and clients polling `get_result`. With the default pool (5 connections
+plus 10 overflow) a burst of runs and polls makes threads wait for a
+connection, and the polls queue behind the writes of finished runs.
+
+- `engine_options` sizes the primary pool for everything that may hold a
+  connection at once: the request threads and the task executor's workers.
+- Reads that tolerate a little staleness (result polling, exports) go
+  through `read_session`. It uses a pool of its own, on the read replicas
+  when SQLALCHEMY_REPLICA_URIS lists any and on the primary otherwise. The
+  replicas are used in turn. One that fails to connect is skipped for
+  REPLICA_RETRY_SECONDS, and when all of them are down reads go to the
+  primary.
+- `background_task` runs a function in an app context and removes its
+  scoped session afterwards. Without it a thread that ends, or a pooled
+  executor thread that moves on to the next run, keeps its session with an
+  open transaction and connection.
+"""
+
+import contextlib
+import functools
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+logger = logging.getLogger(__name__)
+
+
+def engine_options(uri: str, pool_size: int, max_overflow: int, pool_timeout: float = 30,
+                   pool_recycle: int = 1800, pool_pre_ping: bool = True) -> Dict[str, Any]:
+    """SQLAlchemy engine options for a database URI.
+
+    Args:
+        uri: The database URI
+        pool_size: Connections kept open
+        max_overflow: Connections opened on top of those under load
+        pool_timeout: Seconds to wait for a free connection
+        pool_recycle: Seconds after which connections are replaced, before
+            the server or a proxy drops them
+        pool_pre_ping: Test connections when they are checked out
+
+    Returns:
+        Keyword arguments for `create_engine`, also usable as
+        SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/').endswith('sqlite:')):
+        # An in-memory database only exists within its one connection
+        return {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pool_pre_ping,
+    }
+    if uri.startswith('sqlite'):
+        # Some SQLAlchemy versions default to NullPool for SQLite files, ask for a sized pool
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+
+def _read_only_options(uri: str) -> Dict[str, Any]:
+    """Connection arguments that make the database reject writes, where supported."""
+    if uri.startswith('postgresql'):
+        return {'options': '-c default_transaction_read_only=on'}
+    return {}
+
+
+def _reject_writes(session: Session, flush_context, instances):
+    raise RuntimeError("Read sessions are read-only, use db.session to write")
+
+
+class ReadRouter:
+    """Round-robin over read replicas with a pool of their own, falling back to the primary."""
+
+    def __init__(self, primary_uri: str, replica_uris: List[str], pool_size: int, max_overflow: int,
+                 retry_seconds: float = 30, **options):
+        self.primary_uri = primary_uri
+        self.replica_uris = list(replica_uris)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.retry_seconds = retry_seconds
+        self.options = options
+        self._lock = threading.Lock()
+        self._engines: Dict[str, Engine] = {}
+        self._sessionmakers: Dict[str, sessionmaker] = {}
+        self._down_until: Dict[str, float] = {}
+        self._turn = itertools.count()
+
+    def _sessionmaker(self, uri: str) -> sessionmaker:
+        factory = self._sessionmakers.get(uri)
+        if factory is None:
+            with self._lock:
+                factory = self._sessionmakers.get(uri)
+                if factory is None:
+                    options = engine_options(uri, self.pool_size, self.max_overflow, **self.options)
+                    connect_args = {**options.pop('connect_args', {}), **_read_only_options(uri)}
+                    engine = create_engine(uri, connect_args=connect_args, **options)
+                    factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+                    event.listen(factory, 'before_flush', _reject_writes)
+                    self._engines[uri] = engine
+                    self._sessionmakers[uri] = factory
+        return factory
+
+    def candidates(self) -> List[str]:
+        """URIs to try for the next read, healthy replicas in turn, then the primary."""
+        now = time.monotonic()
+        healthy = [uri for uri in self.replica_uris if self._down_until.get(uri, 0) <= now]
+        if healthy:
+            start = next(self._turn) % len(healthy)
+            healthy = healthy[start:] + healthy[:start]
+        return healthy + [self.primary_uri]
+
+    def mark_down(self, uri: str):
+        if uri != self.primary_uri:
+            logger.warning("Read replica unavailable, skipping it for %ss", self.retry_seconds)
+            self._down_until[uri] = time.monotonic() + self.retry_seconds
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[Session]:
+        """A read-only session on the next available replica, closed afterwards."""
+        candidates = self.candidates()
+        for index, uri in enumerate(candidates):
+            session = self._sessionmaker(uri)()
+            try:
+                # Connect before handing the session out, so a dead replica can be skipped
+                session.connection()
+            except (OperationalError, DBAPIError):
+                session.close()
+                if index == len(candidates) - 1:
+                    raise
+                self.mark_down(uri)
+                continue
+            try:
+                yield session
+            finally:
+                session.close()
+            return
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Pool usage per read target, without credentials."""
+        with self._lock:
+            engines = dict(self._engines)
+        return {
+            ('primary' if uri == self.primary_uri else f'replica_{self.replica_uris.index(uri)}'): {
+                'pool': engine.pool.status(),
+                'down': self._down_until.get(uri, 0) > time.monotonic(),
+            }
+            for uri, engine in engines.items()
+        }
+
+    def dispose(self):
+        with self._lock:
+            engines, self._engines, self._sessionmakers = self._engines, {}, {}
+        for engine in engines.values():
+            engine.dispose()
+
+
+_read_router = None
+_read_router_lock = threading.Lock()
+
+
+def get_read_router() -> ReadRouter:
+    """Get the read router of the app's database, created on first use."""
+    global _read_router
+    if _read_router is None:
+        with _read_router_lock:
+            if _read_router is None:
+                from GS.core.app import app
+                config = app.config
+                _read_router = ReadRouter(
+                    config['SQLALCHEMY_DATABASE_URI'],
+                    config.get('SQLALCHEMY_REPLICA_URIS') or [],
+                    pool_size=config.get('DB_READ_POOL_SIZE', 2),
+                    max_overflow=config.get('DB_READ_MAX_OVERFLOW', 3),
+                    retry_seconds=config.get('REPLICA_RETRY_SECONDS', 30),
+                    pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+                    pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+                )
+    return _read_router
+
+
+def read_session():
+    """A read-only session for status polls and listings, see `ReadRouter.session`."""
+    return get_read_router().session()
+
+
+def background_task(target: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a function run outside of requests so it cleans up its scoped session."""
+    @functools.wraps(target)
+    def run(*args, **kwargs):
+        from GS.core.app import app, db
+        with app.app_context():
+            try:
+                return target(*args, **kwargs)
+            finally:
+                db.session.remove()
+    return run
+
@@ -0,0 +1,410 @@
+"""Fair-share scheduling of crew runs across users and priority lanes.
+
+Crew runs used to start in submission order, so one user's batch of hundreds
+of analyses held every worker until it was done and interactive requests of
+other users waited behind it. Runs now queue here per user and lane and are
+handed to the task executor only when it has a free worker:
+
+- Weighted fair queuing at two levels, implemented as stride scheduling.
+  Lanes (`interactive`, `batch`) share the workers by their weights, and
+  within a lane every user with queued runs gets turns by their weight, no
+  matter how many runs they queued. A user that was idle starts at the
+  current virtual time, so idleness does not build up credit.
+- Per-user quotas. A user never has more than TENANT_MAX_CONCURRENT runs
+  at once, and a user whose runs used TENANT_TOKENS_PER_HOUR LLM tokens
+  within the last hour cannot submit more. Their queued runs wait until
+  the window frees up.
+
+The queue is in memory and per process. Token usage is read back from
+`TaskResult.total_tokens`, so a restarted process starts from the usage
+of the last hour. Cancelled runs are taken out of the queue, or stopped
+through their cancellation token when they already run. With a task broker
+the runs are queued there instead, see `task_dispatch`.
+"""
+
+import collections
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+ANONYMOUS = 'anonymous'
+QUOTA_WINDOW_SECONDS = 3600
+EPOCH = datetime(1970, 1, 1)
+
+
+class QuotaExceeded(Exception):
+    """The user used up their token quota, `retry_after` seconds until runs are accepted again."""
+
+    def __init__(self, user: str, retry_after: float):
+        super().__init__(f"Token quota of user '{user}' is used up for the hour")
+        self.user = user
+        self.retry_after = retry_after
+
+
+class Job:
+    """A queued crew run."""
+    __slots__ = ('task_id', 'user', 'lane', 'target', 'args', 'submitted_at')
+
+    def __init__(self, task_id: str, user: str, lane: str, target: Callable[..., Any], args: Tuple = (),
+                 submitted_at: Optional[float] = None):
+        self.task_id = task_id
+        self.user = user
+        self.lane = lane
+        self.target = target
+        self.args = args
+        self.submitted_at = submitted_at
+
+
+class _Flow:
+    """Queued jobs of one user in a lane with its stride scheduling pass."""
+    __slots__ = ('jobs', 'weight', 'pass_')
+
+    def __init__(self, weight: float):
+        self.jobs: Deque[Job] = collections.deque()
+        self.weight = weight
+        self.pass_ = 0.0
+
+
+class _Lane:
+    __slots__ = ('queued', 'weight', 'pass_')
+
+    def __init__(self, weight: float):
+        self.queued = 0
+        self.weight = weight
+        self.pass_ = 0.0
+
+
+class FairQueue:
+    """Two-level weighted fair queue with per-user concurrency and token quotas.
+
+    Not thread-safe, `FairScheduler` guards it with its lock. The simulation
+    benchmark drives it directly with a simulated clock.
+    """
+
+    def __init__(self, lane_weights: Dict[str, float], user_weights: Optional[Dict[str, float]] = None,
+                 max_concurrent: int = 0, tokens_per_hour: int = 0, clock: Callable[[], float] = time.time):
+        """Initialize the queue.
+
+        Args:
+            lane_weights: Share of the workers of each lane
+            user_weights: Weights of users within a lane, 1 for users not listed
+            max_concurrent: Runs a user may have at once, 0 for no limit
+            tokens_per_hour: LLM tokens a user may use per hour, 0 for no limit
+            clock: Time source in seconds, the token window is kept on it
+        """
+        self.lanes = {lane: _Lane(weight) for lane, weight in lane_weights.items()}
+        self.users: Dict[str, Dict[str, _Flow]] = {lane: {} for lane in lane_weights}
+        self.user_weights = user_weights or {}
+        self.max_concurrent = max_concurrent
+        self.tokens_per_hour = tokens_per_hour
+        self.clock = clock
+        self.running: Dict[str, int] = collections.defaultdict(int)
+        self._usage: Dict[str, Deque[Tuple[float, int]]] = collections.defaultdict(collections.deque)
+        self._lane_time = 0.0
+        self._user_time = {lane: 0.0 for lane in lane_weights}
+        self._queued = 0
+
+    def __len__(self):
+        return self._queued
+
+    def push(self, job: Job):
+        if job.lane not in self.lanes:
+            raise ValueError(f"Unknown lane: {job.lane}")
+        if job.submitted_at is None:
+            job.submitted_at = self.clock()
+        lane = self.lanes[job.lane]
+        users = self.users[job.lane]
+        flow = users.get(job.user)
+        if flow is None:
+            flow = users[job.user] = _Flow(self.user_weights.get(job.user, 1.0))
+        # Flows that were idle join at the current virtual time
+        if not flow.jobs:
+            flow.pass_ = max(flow.pass_, self._user_time[job.lane])
+        if not lane.queued:
+            lane.pass_ = max(lane.pass_, self._lane_time)
+        flow.jobs.append(job)
+        lane.queued += 1
+        self._queued += 1
+
+    def tokens_used(self, user: str) -> int:
+        usage = self._usage.get(user)
+        if not usage:
+            return 0
+        cutoff = self.clock() - QUOTA_WINDOW_SECONDS
+        while usage and usage[0][0] <= cutoff:
+            usage.popleft()
+        return sum(tokens for _, tokens in usage)
+
+    def quota_retry_after(self, user: str) -> float:
+        """Seconds until the user is below their token quota again, 0 when they are."""
+        if not self.tokens_per_hour or self.tokens_used(user) < self.tokens_per_hour:
+            return 0.0
+        usage = self._usage[user]
+        excess = self.tokens_used(user) - self.tokens_per_hour
+        for at, tokens in usage:
+            excess -= tokens
+            if excess < 0:
+                return max(at + QUOTA_WINDOW_SECONDS - self.clock(), 0.0)
+        return QUOTA_WINDOW_SECONDS
+
+    def forget_usage(self, user: str):
+        self._usage.pop(user, None)
+
+    def record_tokens(self, user: str, tokens: int, at: Optional[float] = None):
+        if tokens:
+            usage = self._usage[user]
+            usage.append((self.clock() if at is None else at, tokens))
+            if len(usage) > 1 and usage[-1][0] < usage[-2][0]:
+                self._usage[user] = collections.deque(sorted(usage))
+
+    def _eligible(self, user: str) -> bool:
+        if self.max_concurrent and self.running.get(user, 0) >= self.max_concurrent:
+            return False
+        return not self.tokens_per_hour or self.tokens_used(user) < self.tokens_per_hour
+
+    def pop(self) -> Optional[Job]:
+        """Take the next job to run, None when every queued job has to wait."""
+        eligible: Dict[str, List[_Flow]] = {}
+        for lane_name, lane in self.lanes.items():
+            if lane.queued:
+                flows = [flow for user, flow in self.users[lane_name].items() if flow.jobs and self._eligible(user)]
+                if flows:
+                    eligible[lane_name] = flows
+        if not eligible:
+            return None
+        lane_name = min(eligible, key=lambda name: self.lanes[name].pass_)
+        lane = self.lanes[lane_name]
+        flow = min(eligible[lane_name], key=lambda flow: flow.pass_)
+        job = flow.jobs.popleft()
+        lane.queued -= 1
+        self._lane_time = lane.pass_
+        self._user_time[lane_name] = flow.pass_
+        lane.pass_ += 1.0 / lane.weight
+        flow.pass_ += 1.0 / flow.weight
+        self.running[job.user] += 1
+        self._queued -= 1
+        return job
+
+    def remove(self, task_id: str) -> Optional[Job]:
+        """Take a queued job out of the queue, None when it is not queued."""
+        for lane_name, users in self.users.items():
+            for flow in users.values():
+                for job in flow.jobs:
+                    if job.task_id == task_id:
+                        flow.jobs.remove(job)
+                        self.lanes[lane_name].queued -= 1
+                        self._queued -= 1
+                        return job
+        return None
+
+    def done(self, job: Job, tokens: int = 0):
+        """Mark a job finished and charge the tokens it used to its user."""
+        self.running[job.user] -= 1
+        if not self.running[job.user]:
+            del self.running[job.user]
+        self.record_tokens(job.user, tokens)
+
+    def queued(self) -> Dict[str, Dict[str, int]]:
+        """Queued jobs per lane and user."""
+        return {lane: {user: len(flow.jobs) for user, flow in users.items() if flow.jobs}
+                for lane, users in self.users.items()}
+
+
+def _task_tokens(task_id: str) -> int:
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    tokens = db.session.query(TaskResult.total_tokens).filter_by(task_id=task_id).scalar()
+    return tokens or 0
+
+
+def _recent_usage(user: str) -> List[Tuple[float, int]]:
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    since = datetime.utcnow() - timedelta(seconds=QUOTA_WINDOW_SECONDS)
+    rows = db.session.query(TaskResult.created_at, TaskResult.total_tokens).filter(
+        TaskResult.user == user, TaskResult.created_at >= since, TaskResult.total_tokens > 0).all()
+    # created_at is naive UTC, the queue's clock is seconds since the epoch
+    return [((created_at - EPOCH).total_seconds(), tokens) for created_at, tokens in rows]
+
+
+class FairScheduler:
+    """Feeds queued runs to the task executor, never more than it has workers."""
+
+    def __init__(self, queue: FairQueue, workers: int, dispatch: Optional[Callable[..., Any]] = None):
+        """Initialize the scheduler.
+
+        Args:
+            queue: The queue of runs waiting for a worker
+            workers: Runs handed to the executor at once
+            dispatch: Starts `target(*args)` on a worker, the task executor's `dispatch` when None
+        """
+        self.queue = queue
+        self.workers = workers
+        self._dispatch = dispatch
+        self._lock = threading.Lock()
+        self._active = 0
+        self._known_users = set()
+        self._timer = None
+
+    def _load_usage(self, user: str):
+        if user in self._known_users or not self.queue.tokens_per_hour:
+            return
+        from GS.core.app.helper.db_routing import background_task
+        for at, tokens in background_task(_recent_usage)(user):
+            self.queue.record_tokens(user, tokens, at)
+        self._known_users.add(user)
+
+    def check_quota(self, user: str, reload: bool = False):
+        """Raise QuotaExceeded when the user may not submit runs right now.
+
+        With `reload` the usage is read from the database again, for runs
+        that other processes account.
+        """
+        with self._lock:
+            if reload:
+                self._known_users.discard(user)
+                self.queue.forget_usage(user)
+            self._load_usage(user)
+            retry_after = self.queue.quota_retry_after(user)
+        if retry_after:
+            raise QuotaExceeded(user, retry_after)
+
+    def submit(self, task_id: str, user: str, lane: str, target: Callable[..., Any], *args: Any):
+        """Queue `target(*args)` as a run of `user` in `lane`."""
+        with self._lock:
+            self._load_usage(user)
+            self.queue.push(Job(task_id, user, lane, target, args))
+            self._pump()
+
+    def _pump(self):
+        dispatch = self._dispatch
+        if dispatch is None:
+            from GS.core.app.helper.task_executor import dispatch
+        while self._active < self.workers:
+            job = self.queue.pop()
+            if job is None:
+                break
+            self._active += 1
+            dispatch(self._run, job)
+        if len(self.queue) and self._active < self.workers and self._timer is None:
+            # Runs held back by a quota, look again when the token window moves on
+            waits = [wait for users in self.queue.users.values() for user, flow in users.items()
+                     if flow.jobs and (wait := self.queue.quota_retry_after(user))]
+            if not waits:
+                return
+            self._timer = threading.Timer(min(waits), self._wake)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _wake(self):
+        with self._lock:
+            self._timer = None
+            self._pump()
+
+    def cancel(self, task_id: str) -> Optional[str]:
+        """Cancel a run of this process.
+
+        Returns:
+            'queued' when the run was taken out of the queue, 'running' when
+            its token was fired and None when this process does not have it
+        """
+        from GS.workflow_engine.helper_classes.cancellation import cancel_task
+        with self._lock:
+            if self.queue.remove(task_id) is not None:
+                return 'queued'
+        return 'running' if cancel_task(task_id) else None
+
+    def _run(self, job: Job):
+        from GS.workflow_engine.helper_classes.cancellation import TaskCancelled
+        tokens = 0
+        try:
+            job.target(*job.args)
+        except TaskCancelled as e:
+            # The runner recorded it, a stopped run is not a failure
+            logger.info("Task %s stopped: %s", job.task_id, e)
+        finally:
+            try:
+                from GS.core.app.helper.db_routing import background_task
+                tokens = background_task(_task_tokens)(job.task_id)
+            except Exception:
+                logger.exception("Could not read the token usage of task %s", job.task_id)
+            self._finished(job, tokens)
+
+    def _finished(self, job: Job, tokens: int):
+        """Free the run's worker, charge its tokens and start the next run."""
+        with self._lock:
+            self.queue.done(job, tokens)
+            self._active -= 1
+            self._pump()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'active': self._active, 'workers': self.workers,
+                    'running': dict(self.queue.running), 'queued': self.queue.queued()}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_fair_scheduler() -> FairScheduler:
+    """Get the fair scheduler of this process, created on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from GS.core.app import app
+                from GS.core.app.helper.task_executor import MAX_WORKERS
+                config = app.config
+                queue = FairQueue(
+                    config.get('FAIR_SHARE_LANE_WEIGHTS') or {INTERACTIVE: 4, BATCH: 1},
+                    config.get('TENANT_WEIGHTS') or {},
+                    max_concurrent=config.get('TENANT_MAX_CONCURRENT', 0),
+                    tokens_per_hour=config.get('TENANT_TOKENS_PER_HOUR', 0),
+                )
+                _scheduler = FairScheduler(queue, MAX_WORKERS)
+    return _scheduler
+
+
+def request_lane(data: Optional[Dict[str, Any]]) -> str:
+    """Lane a start request asks for with its `priority` field, interactive by default."""
+    lane = (data or {}).get('priority') or INTERACTIVE
+    if lane not in (INTERACTIVE, BATCH):
+        raise ValueError(f"Unknown priority '{lane}', use '{INTERACTIVE}' or '{BATCH}'")
+    return lane
+
+
+def request_user() -> str:
+    """Username of the Flask request's session or JWT, ANONYMOUS without either."""
+    from flask_jwt_extended import verify_jwt_in_request
+    from GS.core.app import appbuilder
+    try:
+        verify_jwt_in_request(optional=True)
+        user = appbuilder.sm.current_user
+    except Exception:
+        # An invalid token identifies nobody, the endpoints do not require one
+        user = None
+    return user.username if user else ANONYMOUS
+
+
+def token_user(authorization: Optional[str]) -> str:
+    """Username of a `Bearer` JWT issued by the app's security API, for the async endpoints."""
+    if not authorization or not authorization.lower().startswith('bearer '):
+        return ANONYMOUS
+    from flask_jwt_extended import decode_token
+    from GS.core.app import app, appbuilder
+    with app.app_context():
+        try:
+            user = appbuilder.sm.get_user_by_id(int(decode_token(authorization[7:].strip())['sub']))
+        except Exception:
+            return ANONYMOUS
+        finally:
+            from GS.core.app import db
+            db.session.remove()
+        return user.username if user else ANONYMOUS
@@ -0,0 +1,184 @@
+"""Parquet archive of task results moved out of the task_result table.
+
+The retention compactor (see `result_retention`) writes the results it moves
+out of the table to zstd compressed Parquet files, on MinIO/S3 when
+RESULT_ARCHIVE_URI is an s3:// URI and in a local directory otherwise:
+
+    <RESULT_ARCHIVE_URI>/created_month=2026-10/<uuid>.parquet
+
+One file holds one compaction batch of one month of submissions, so expired
+months are dropped as a whole. Rows are sorted by task id and written in
+small row groups: looking one task up reads the file footer and the one row
+group whose task id range holds it, as ranged reads on S3. Where each task
+went is kept in `ArchivedTaskResult`, `archived_task` turns it back into a
+`TaskResult` for `get_result`.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+ROW_GROUP_ROWS = 64
+MONTH_PREFIX = 'created_month='
+
+
+def archive_schema():
+    """Arrow schema of the archive files, the export's columns and the task's accounting."""
+    import pyarrow as pa
+    return pa.schema([
+        ('task_id', pa.string()),
+        ('status', pa.string()),
+        ('user', pa.string()),
+        ('lane', pa.string()),
+        ('created_at', pa.timestamp('us')),
+        ('total_tokens', pa.int64()),
+        ('result', pa.string()),
+    ])
+
+
+def archive_row(task) -> Dict[str, Any]:
+    """One archive row of a TaskResult."""
+    return {
+        'task_id': task.task_id,
+        'status': task.status,
+        'user': task.user,
+        'lane': task.lane,
+        'created_at': task.created_at,
+        'total_tokens': task.total_tokens,
+        'result': task.get_result_text(),
+    }
+
+
+def archive_filesystem(uri: str, s3_endpoint: Optional[str] = None):
+    """The pyarrow filesystem and root path of an archive URI.
+
+    Args:
+        uri: s3://bucket/prefix, any other URI pyarrow supports or a local directory
+        s3_endpoint: MinIO endpoint such as http://minio:9000, AWS when unset.
+            Credentials come from the usual AWS_* environment variables.
+    """
+    from pyarrow import fs
+    if uri.startswith('s3://') and s3_endpoint:
+        endpoint = urlparse(s3_endpoint)
+        filesystem = fs.S3FileSystem(endpoint_override=endpoint.netloc or endpoint.path,
+                                     scheme=endpoint.scheme or 'https')
+        return filesystem, uri[len('s3://'):].rstrip('/')
+    if '://' not in uri:
+        root = os.path.abspath(uri)
+        os.makedirs(root, exist_ok=True)
+        return fs.LocalFileSystem(), root
+    return fs.FileSystem.from_uri(uri)
+
+
+class ResultArchive:
+    """Reads and writes the archive files under one root."""
+
+    def __init__(self, uri: str, s3_endpoint: Optional[str] = None):
+        self.uri = uri
+        self.filesystem, self.root = archive_filesystem(uri, s3_endpoint)
+
+    def write(self, rows: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Write rows as one file per month of `created_at`.
+
+        Returns:
+            The path of each task's file, relative to the root
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        months: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            months.setdefault(f"{row['created_at']:%Y-%m}", []).append(row)
+        paths = {}
+        schema = archive_schema()
+        for month, month_rows in months.items():
+            month_rows.sort(key=lambda row: row['task_id'])
+            path = f'{MONTH_PREFIX}{month}/{uuid.uuid4().hex}.parquet'
+            self.filesystem.create_dir(f'{self.root}/{MONTH_PREFIX}{month}', recursive=True)
+            pq.write_table(pa.Table.from_pylist(month_rows, schema=schema), f'{self.root}/{path}',
+                           filesystem=self.filesystem, compression='zstd', row_group_size=ROW_GROUP_ROWS)
+            paths.update((row['task_id'], path) for row in month_rows)
+        return paths
+
+    def read(self, path: str, task_id: str) -> Optional[Dict[str, Any]]:
+        """The archived row of a task, None when the file does not hold it."""
+        import pyarrow.parquet as pq
+        table = pq.read_table(f'{self.root}/{path}', filesystem=self.filesystem,
+                              filters=[('task_id', '=', task_id)])
+        rows = table.to_pylist()
+        return rows[0] if rows else None
+
+    def months(self) -> List[Tuple[str, str]]:
+        """(month, directory) of every month in the archive."""
+        from pyarrow import fs
+        try:
+            infos = self.filesystem.get_file_info(fs.FileSelector(self.root, allow_not_found=True))
+        except FileNotFoundError:
+            return []
+        return sorted((info.base_name[len(MONTH_PREFIX):], info.path) for info in infos
+                      if info.type == fs.FileType.Directory and info.base_name.startswith(MONTH_PREFIX))
+
+    def expire(self, before: datetime) -> List[str]:
+        """Delete the months that ended before `before`.
+
+        Returns:
+            The deleted months
+        """
+        cutoff = f'{before:%Y-%m}'
+        expired = [(month, directory) for month, directory in self.months() if month < cutoff]
+        for _, directory in expired:
+            self.filesystem.delete_dir(directory)
+        return [month for month, _ in expired]
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_result_archive() -> Optional[ResultArchive]:
+    """Get the archive of the app, None when RESULT_ARCHIVE_URI is not set."""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                from GS.core.app import app
+                uri = app.config.get('RESULT_ARCHIVE_URI')
+                if not uri:
+                    return None
+                _archive = ResultArchive(uri, app.config.get('RESULT_ARCHIVE_S3_ENDPOINT'))
+    return _archive
+
+
+def archived_task(task_id: str):
+    """The archived task as an unsaved TaskResult, None when it was not archived.
+
+    The archive being unreachable is logged and treated like a task that is
+    not there.
+    """
+    from GS.core.app.helper.db_routing import read_session
+    from GS.core.app.models.archived_task_result import ArchivedTaskResult
+    from GS.core.app.models.task_result import TaskResult
+
+    with read_session() as session:
+        entry = session.query(ArchivedTaskResult).filter_by(task_id=task_id).first()
+    archive = get_result_archive() if entry is not None else None
+    if archive is None:
+        return None
+    try:
+        row = archive.read(entry.path, task_id)
+    except (OSError, ValueError):
+        logger.warning("Could not read archived task %s from %s", task_id, entry.path, exc_info=True)
+        return None
+    if row is None:
+        return None
+    task = TaskResult(task_id=task_id, status=row['status'], user=row['user'], lane=row['lane'],
+                      created_at=row['created_at'], total_tokens=row['total_tokens'])
+    if row['result'] is not None:
+        task.set_result(row['result'])
+    return task
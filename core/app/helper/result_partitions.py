@@ -0,0 +1,178 @@
+"""Monthly range partitions of the task_result table on Postgres.
+
+With the table partitioned by `created_at`, each month of tasks has a table
+and indexes of its own: lookups, inserts and the retention scans work on
+small indexes, and a month the compactor has emptied is dropped instead of
+leaving dead rows behind for vacuum. Partitions are named
+task_result_pYYYYMM, rows outside of them land in task_result_pdefault.
+
+- A new database gets a partitioned table when TASK_RESULT_PARTITIONED is
+  set, see `TaskResult`.
+- An existing table is converted once with
+  `python -m GS.core.app.helper.result_retention partition`, preferably
+  after a first compaction, as it copies every row while writes wait.
+- `ensure_partitions` creates the partitions of the next months and is run
+  at startup and by every compaction, `drop_empty_partitions` drops the
+  emptied past months.
+
+Every function is a no-op on other databases and on an unpartitioned table.
+"""
+
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'task_result'
+DEFAULT_PARTITION = f'{TABLE}_pdefault'
+MONTHS_AHEAD = 2
+_PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def month_start(at: datetime, months: int = 0) -> datetime:
+    """First moment of the month `months` after the one of `at`."""
+    index = at.year * 12 + at.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection: Connection, table: str = TABLE) -> bool:
+    """Whether `table` is a partitioned Postgres table."""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return bool(connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': table}).scalar())
+
+
+def partitions(connection: Connection, table: str = TABLE) -> List[str]:
+    """Names of the partitions of `table`."""
+    return list(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits i JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)"
+    ), {'table': table}).scalars())
+
+
+def _create_month(connection: Connection, month: datetime, table: str = TABLE):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month_start(month, 1):%Y-%m-%d}')"
+    ))
+
+
+def ensure_partitions(engine: Engine, now: Optional[datetime] = None, months_ahead: int = MONTHS_AHEAD) -> List[str]:
+    """Create the partitions of this month and the next `months_ahead` ones.
+
+    Returns:
+        The partitions that were missing
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    now = now or datetime.utcnow()
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return []
+        existing = set(partitions(connection))
+        created = []
+        for months in range(months_ahead + 1):
+            month = month_start(now, months)
+            if partition_name(month) not in existing:
+                try:
+                    with connection.begin_nested():
+                        _create_month(connection, month)
+                except Exception:
+                    # Rows of the month already in the default partition keep it from being created
+                    logger.exception("Could not create partition %s", partition_name(month))
+                    continue
+                created.append(partition_name(month))
+        if DEFAULT_PARTITION not in existing:
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+    if created:
+        logger.info("Created task result partitions %s", ", ".join(created))
+    return created
+
+
+def drop_empty_partitions(engine: Engine, now: Optional[datetime] = None) -> List[str]:
+    """Drop the partitions of past months that hold no rows any more.
+
+    Returns:
+        The dropped partitions
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    current = month_start(now or datetime.utcnow())
+    dropped = []
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return []
+        for name in partitions(connection):
+            match = _PARTITION_NAME.match(name)
+            if not match or datetime(int(match.group(1)), int(match.group(2)), 1) >= current:
+                continue
+            if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+                continue
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    if dropped:
+        logger.info("Dropped empty task result partitions %s", ", ".join(dropped))
+    return dropped
+
+
+def partition_table(engine: Engine, now: Optional[datetime] = None, months_ahead: int = MONTHS_AHEAD) -> int:
+    """Convert an unpartitioned task_result table into a partitioned one.
+
+    The rows are copied into a partitioned table with the same columns, which
+    then takes the place of the old one. The old table is kept as
+    task_result_unpartitioned, drop it once the new one has been checked.
+    Writes wait for the copy to finish.
+
+    Returns:
+        The number of rows copied
+
+    Raises:
+        ValueError: When the database is not Postgres or the table already is partitioned
+    """
+    if engine.dialect.name != 'postgresql':
+        raise ValueError("Only Postgres tables can be partitioned")
+    now = now or datetime.utcnow()
+    new_table = f'{TABLE}_partitioned'
+    with engine.begin() as connection:
+        if is_partitioned(connection):
+            raise ValueError(f"{TABLE} already is partitioned")
+        connection.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+        # The copied defaults keep drawing ids from the old table's sequence
+        connection.execute(text(
+            f"CREATE TABLE {new_table} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        ))
+        connection.execute(text(f"UPDATE {TABLE} SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL"))
+        connection.execute(text(f"ALTER TABLE {new_table} ALTER COLUMN created_at SET NOT NULL"))
+        connection.execute(text(f"ALTER TABLE {new_table} ADD CONSTRAINT {new_table}_pkey PRIMARY KEY (id, created_at)"))
+        for column, quoted in (('task_id', 'task_id'), ('created_at', 'created_at'), ('user', '"user"')):
+            connection.execute(text(f"CREATE INDEX ix_{new_table}_{column} ON {new_table} ({quoted})"))
+
+        oldest = connection.execute(text(f"SELECT min(created_at) FROM {TABLE}")).scalar() or now
+        month = month_start(oldest)
+        while month <= month_start(now, months_ahead):
+            _create_month(connection, month, new_table)
+            month = month_start(month, 1)
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {new_table} DEFAULT"))
+
+        copied = connection.execute(text(f"INSERT INTO {new_table} SELECT * FROM {TABLE}")).rowcount
+        connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned"))
+        connection.execute(text(f"ALTER TABLE {new_table} RENAME TO {TABLE}"))
+        sequence = connection.execute(text(f"SELECT pg_get_serial_sequence('{TABLE}_unpartitioned', 'id')")).scalar()
+        if sequence:
+            # Dropping the old table must not drop the sequence with it
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    logger.info("Partitioned %s, %s rows copied", TABLE, copied)
+    return copied
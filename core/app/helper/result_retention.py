@@ -0,0 +1,206 @@
+"""Retention of the task_result table, run by a background compactor.
+
+Rows carry whole results and the table would otherwise grow forever. With
+RESULT_COMPACTION_ENABLED on, every RESULT_COMPACTION_POLL_SECONDS the
+compactor of each app process:
+
+- Moves the rows whose status has a TTL in RESULT_TTL_DAYS and that are
+  older than it out of the table. Rows of RESULT_ARCHIVE_STATUSES are first
+  written to the Parquet archive (see `result_archive`), where `get_result`
+  still finds them. The others are deleted. Without RESULT_ARCHIVE_URI the
+  rows to archive stay in the table. Statuses without a TTL are kept.
+- Stamps the rows without `created_at`, written before the column had a
+  default, with the time it first sees them. Their TTL starts then.
+- Keeps the reports the analysis schedules build on and their running tasks.
+- Deletes the archived months older than RESULT_ARCHIVE_TTL_DAYS, if set.
+- On a partitioned Postgres table creates the coming months' partitions and
+  drops the emptied ones, see `result_partitions`.
+
+Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so
+several processes may compact at once without archiving a row twice. A row
+is only deleted in the transaction that records where it was archived, after
+its file was written.
+
+    python -m GS.core.app.helper.result_retention compact
+    python -m GS.core.app.helper.result_retention partition
+"""
+
+import argparse
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+
+from GS.core.app.helper.result_archive import ResultArchive, archive_row, get_result_archive
+from GS.core.app.helper.result_partitions import drop_empty_partitions, ensure_partitions, month_start, partition_table
+from GS.core.app.models.analysis_schedule import AnalysisSchedule
+from GS.core.app.models.archived_task_result import ArchivedTaskResult
+from GS.core.app.models.task_result import TaskResult
+
+logger = logging.getLogger(__name__)
+
+
+def _kept_task_ids():
+    """Task ids the analysis schedules still need."""
+    return select(AnalysisSchedule.last_task_id).where(AnalysisSchedule.last_task_id.isnot(None)).union(
+        select(AnalysisSchedule.running_task_id).where(AnalysisSchedule.running_task_id.isnot(None)))
+
+
+def compact_batch(session, status: str, cutoff: datetime, archive: Optional[ResultArchive],
+                  batch_size: int) -> int:
+    """Archive or delete one batch of the rows of `status` created before `cutoff`.
+
+    Args:
+        session: Session on the primary, committed when the batch is done
+        status: The status of the rows
+        cutoff: Rows created before it have expired
+        archive: The archive to move the rows to, None deletes them
+        batch_size: Maximum number of rows
+
+    Returns:
+        The number of rows that left the table
+    """
+    query = session.query(TaskResult).filter(
+        TaskResult.status == status, TaskResult.created_at < cutoff, TaskResult.task_id.notin_(_kept_task_ids())
+    ).order_by(TaskResult.created_at).limit(batch_size)
+    if session.get_bind().dialect.name == 'postgresql':
+        # Rows another process is compacting are left to it
+        query = query.with_for_update(skip_locked=True)
+    tasks = query.all()
+    if not tasks:
+        session.commit()
+        return 0
+    if archive is not None:
+        paths = archive.write([archive_row(task) for task in tasks])
+        session.add_all(ArchivedTaskResult(task_id=task.task_id, status=task.status, user=task.user,
+                                           created_at=task.created_at, path=paths[task.task_id])
+                        for task in tasks)
+    session.query(TaskResult).filter(TaskResult.id.in_([task.id for task in tasks])).delete(
+        synchronize_session=False)
+    session.commit()
+    return len(tasks)
+
+
+def compact_results(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Apply the retention settings once.
+
+    Returns:
+        The rows archived and deleted per status, the expired archive months
+        and the partitions created and dropped, for logging
+    """
+    from GS.core.app import app, db
+
+    now = now or datetime.utcnow()
+    config = app.config
+    batch_size = config.get('RESULT_COMPACTION_BATCH', 1000)
+    archive_statuses = set(config.get('RESULT_ARCHIVE_STATUSES') or ())
+    archive = get_result_archive() if archive_statuses else None
+    session = db.session
+    outcome = {'archived': {}, 'deleted': {}}
+
+    outcome['partitions_created'] = ensure_partitions(db.engine, now)
+    # A NULL created_at is never before the cutoff, partition_table stamps them the same way
+    outcome['undated'] = session.query(TaskResult).filter(TaskResult.created_at.is_(None)).update(
+        {TaskResult.created_at: now}, synchronize_session=False)
+    session.commit()
+    for status, days in (config.get('RESULT_TTL_DAYS') or {}).items():
+        archived = status in archive_statuses
+        if archived and archive is None:
+            logger.warning("RESULT_ARCHIVE_URI is not set, keeping the expired '%s' results", status)
+            continue
+        cutoff = now - timedelta(days=days)
+        moved = 0
+        while True:
+            count = compact_batch(session, status, cutoff, archive if archived else None, batch_size)
+            moved += count
+            if count < batch_size:
+                break
+        if moved:
+            outcome['archived' if archived else 'deleted'][status] = moved
+
+    archive_days = config.get('RESULT_ARCHIVE_TTL_DAYS', 0)
+    archive = archive or get_result_archive()
+    if archive_days and archive is not None:
+        # Whole months expire, the rows of a month are archived together
+        cutoff = month_start(now - timedelta(days=archive_days))
+        session.query(ArchivedTaskResult).filter(ArchivedTaskResult.created_at < cutoff).delete(
+            synchronize_session=False)
+        session.commit()
+        outcome['archive_months_expired'] = archive.expire(cutoff)
+    outcome['partitions_dropped'] = drop_empty_partitions(db.engine, now)
+    return outcome
+
+
+class ResultCompactor:
+    """Background thread applying the retention settings every `poll_seconds`."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='result-compactor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        from GS.core.app.helper.db_routing import background_task
+        compact = background_task(compact_results)
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                logger.info("Task result retention %s", compact())
+            except Exception:
+                logger.exception("Compacting the task results failed")
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def start_result_compactor() -> Optional[ResultCompactor]:
+    """Start the compactor of this process when RESULT_COMPACTION_ENABLED is on."""
+    global _compactor
+    from GS.core.app import app
+    if not app.config.get('RESULT_COMPACTION_ENABLED', False):
+        return None
+    with _compactor_lock:
+        if _compactor is None:
+            _compactor = ResultCompactor(app.config.get('RESULT_COMPACTION_POLL_SECONDS', 3600))
+            _compactor.start()
+    return _compactor
+
+
+def stop_result_compactor():
+    global _compactor
+    with _compactor_lock:
+        compactor, _compactor = _compactor, None
+    if compactor is not None:
+        compactor.stop()
+
+
+def main(argv=None):
+    """Main entry point for compacting and partitioning the task results by hand."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('compact', 'partition'))
+    args = parser.parse_args(argv)
+
+    from GS.core.app import app, db
+    with app.app_context():
+        if args.command == 'compact':
+            print(json.dumps(compact_results(), indent=2))
+        else:
+            print(json.dumps({'rows_copied': partition_table(db.engine)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""Message brokers that carry crew runs from the API processes to the workers.
+
+With TASK_BROKER_URL set, the start endpoints publish a message per run
+instead of running it in their own process, and worker processes
+(`python -m GS.core.worker`) consume and run them, see `task_dispatch`.
+
+- `RabbitMQBroker` for amqp:// URLs. Runs go to one durable quorum queue.
+  Interactive runs are published with a high priority, which RabbitMQ 4
+  quorum queues deliver ahead of the batch runs. Messages are persistent
+  and publishing waits for the broker's confirm. Rejected messages, and
+  those delivered more than DELIVERY_LIMIT times, are dead-lettered to the
+  `<queue>.dead` queue, where they stay for inspection or replay.
+- `InMemoryBroker` for memory://. It stands in for RabbitMQ in tests and
+  single-process setups, where the web process runs the worker, see
+  `task_dispatch.start_local_worker`. It has the same prefetch, redelivery
+  and dead-lettering behaviour, and several workers may consume from it.
+
+Consumers get at most `prefetch` unacknowledged messages. A worker
+prefetches as many runs as it can run at once, so the next run goes to a
+worker with a free slot instead of queueing behind a busy one.
+
+A message stays unacknowledged for the whole run. RabbitMQ closes the
+channel of a consumer that holds a message longer than its consumer timeout,
+30 minutes by default, and redelivers everything the channel held. The queue
+is declared with an `x-consumer-timeout` of TASK_BROKER_CONSUMER_TIMEOUT_SECONDS,
+which should be longer than the longest run. Queue arguments cannot change
+once the queue exists, raise the timeout of an existing queue with a
+`consumer-timeout` policy instead. Runs redelivered while their worker is
+still alive wait for it instead of running twice, see the leases in
+`task_dispatch`.
+"""
+
+import collections
+import itertools
+import json
+import logging
+import threading
+from typing import Any, Callable, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'crewai.tasks'
+# Quorum queues deliver priorities of 5 and above before the others
+HIGH_PRIORITY = 5
+NORMAL_PRIORITY = 0
+# A run whose worker died this many times is dead-lettered
+DELIVERY_LIMIT = 3
+# Longest a run may hold its message, RabbitMQ's default of 30 minutes is shorter than long runs
+CONSUMER_TIMEOUT_SECONDS = 24 * 3600
+
+
+class Delivery:
+    """A message handed to a consumer, settled with `ack` or `reject` of its broker."""
+    __slots__ = ('tag', 'message', 'deliveries', 'consumer')
+
+    def __init__(self, tag: Any, message: Dict[str, Any], deliveries: int, consumer: Any = None):
+        self.tag = tag
+        self.message = message
+        self.deliveries = deliveries  # 1 on the first delivery
+        self.consumer = consumer
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message).encode('utf-8')
+
+
+def decode_message(body: bytes) -> Dict[str, Any]:
+    """The message of a body, ValueError when it is not a JSON object."""
+    message = json.loads(body)
+    if not isinstance(message, dict):
+        raise ValueError("A task message must be a JSON object")
+    return message
+
+
+class InMemoryBroker:
+    """In-process queue with prefetch, redelivery and a dead-letter list."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queues: Dict[int, Deque[tuple]] = {HIGH_PRIORITY: collections.deque(),
+                                                 NORMAL_PRIORITY: collections.deque()}
+        self._unacked: Dict[int, tuple] = {}
+        self._in_flight: Dict[int, int] = collections.defaultdict(int)
+        self._tags = itertools.count(1)
+        self._consumers = itertools.count(1)
+        self.dead: List[Dict[str, Any]] = []
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def publish(self, message: Dict[str, Any], priority: int = NORMAL_PRIORITY):
+        # Encoded like on the wire, so what would not survive RabbitMQ fails here too
+        self._enqueue((encode_message(message), 0), priority)
+
+    def _enqueue(self, entry: tuple, priority: int, front: bool = False):
+        queue = self._queues[HIGH_PRIORITY if priority >= HIGH_PRIORITY else NORMAL_PRIORITY]
+        with self._condition:
+            if front:
+                queue.appendleft((*entry, priority))
+            else:
+                queue.append((*entry, priority))
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[tuple]:
+        for priority in (HIGH_PRIORITY, NORMAL_PRIORITY):
+            if self._queues[priority]:
+                return self._queues[priority].popleft()
+        return None
+
+    def consume(self, handler: Callable[[Delivery], None], prefetch: int, stop: threading.Event,
+                busy: Callable[[], bool] = lambda: False):
+        """Hand messages to `handler` until `stop` is set, at most `prefetch` unacknowledged.
+
+        Returns once `busy` is false after that, messages still not settled
+        then go back to the queue.
+        """
+        consumer = next(self._consumers)
+        while not stop.is_set():
+            with self._condition:
+                entry = None
+                if self._in_flight[consumer] < prefetch:
+                    entry = self._next()
+                if entry is None:
+                    self._condition.wait(0.1)
+                    continue
+                body, deliveries, priority = entry
+                tag = next(self._tags)
+                self._unacked[tag] = (body, deliveries + 1, priority, consumer)
+                self._in_flight[consumer] += 1
+            try:
+                message = decode_message(body)
+            except ValueError:
+                message = None
+            handler(Delivery(tag, message, deliveries + 1, consumer))
+        while busy():
+            with self._condition:
+                self._condition.wait(0.1)
+        # Messages the consumer did not settle go back to the queue, as when a connection closes
+        with self._condition:
+            for tag, (body, deliveries, priority, owner) in list(self._unacked.items()):
+                if owner == consumer:
+                    del self._unacked[tag]
+                    self._queues[HIGH_PRIORITY if priority >= HIGH_PRIORITY else NORMAL_PRIORITY].appendleft(
+                        (body, deliveries, priority))
+            self._in_flight.pop(consumer, None)
+            self._condition.notify_all()
+
+    def _settle(self, delivery: Delivery) -> Optional[tuple]:
+        with self._condition:
+            entry = self._unacked.pop(delivery.tag, None)
+            if entry is not None:
+                self._in_flight[entry[3]] -= 1
+                self._condition.notify_all()
+            return entry
+
+    def ack(self, delivery: Delivery):
+        self._settle(delivery)
+
+    def reject(self, delivery: Delivery, requeue: bool = False):
+        entry = self._settle(delivery)
+        if entry is None:
+            return
+        body, deliveries, priority, _ = entry
+        # Like RabbitMQ's x-delivery-limit, which counts the returns
+        if requeue and deliveries <= DELIVERY_LIMIT:
+            self._enqueue((body, deliveries), priority, front=True)
+        else:
+            with self._condition:
+                self.dead.append({'body': body, 'deliveries': deliveries})
+
+    def close(self):
+        pass
+
+
+class RabbitMQBroker:
+    """Publishes to and consumes from a RabbitMQ quorum queue with a dead-letter queue.
+
+    Publishing is thread-safe, over one connection guarded by a lock. Each
+    `consume` opens a connection of its own, and `ack` and `reject` may be
+    called from any thread.
+    """
+
+    def __init__(self, url: str, queue: str = DEFAULT_QUEUE, delivery_limit: int = DELIVERY_LIMIT,
+                 consumer_timeout: float = CONSUMER_TIMEOUT_SECONDS):
+        import pika
+        self.parameters = pika.URLParameters(url)
+        self.queue = queue
+        self.dead_letter_exchange = f'{queue}.dead'
+        self.delivery_limit = delivery_limit
+        self.consumer_timeout = consumer_timeout
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+
+    def declare(self, channel):
+        """Declare the queue, the dead-letter exchange and the dead-letter queue."""
+        channel.exchange_declare(self.dead_letter_exchange, exchange_type='fanout', durable=True)
+        channel.queue_declare(self.dead_letter_exchange, durable=True, arguments={'x-queue-type': 'quorum'})
+        channel.queue_bind(self.dead_letter_exchange, self.dead_letter_exchange)
+        arguments = {
+            'x-queue-type': 'quorum',
+            'x-dead-letter-exchange': self.dead_letter_exchange,
+            # The broker's own backstop, workers dead-letter such runs themselves
+            'x-delivery-limit': self.delivery_limit,
+        }
+        if self.consumer_timeout:
+            # Messages are acknowledged when the run ends, not when it starts
+            arguments['x-consumer-timeout'] = int(self.consumer_timeout * 1000)
+        channel.queue_declare(self.queue, durable=True, arguments=arguments)
+
+    def _publish_channel(self):
+        import pika
+        if self._channel is None or self._channel.is_closed:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+            self._connection = pika.BlockingConnection(self.parameters)
+            self._channel = self._connection.channel()
+            self.declare(self._channel)
+            # basic_publish raises when the broker does not take the message
+            self._channel.confirm_delivery()
+        return self._channel
+
+    def publish(self, message: Dict[str, Any], priority: int = NORMAL_PRIORITY):
+        """Publish a persistent message and wait for the broker to confirm it."""
+        import pika
+        properties = pika.BasicProperties(content_type='application/json', delivery_mode=2, priority=priority)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self._publish_channel().basic_publish(
+                        '', self.queue, encode_message(message), properties=properties, mandatory=True)
+                    return
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+                    # An idle connection may have missed its heartbeats, reconnect once
+                    self._channel = None
+                    if attempt:
+                        raise
+
+    def consume(self, handler: Callable[[Delivery], None], prefetch: int, stop: threading.Event,
+                busy: Callable[[], bool] = lambda: False):
+        """Hand messages to `handler` until `stop` is set, at most `prefetch` unacknowledged.
+
+        The handler is called on this thread and should hand the run off.
+        After `stop` the consumer is cancelled and the connection is kept
+        open for the acks until `busy` is false. Messages still
+        unacknowledged when it closes go back to the queue.
+        """
+        import pika
+        connection = pika.BlockingConnection(self.parameters)
+        channel = connection.channel()
+        self.declare(channel)
+        channel.basic_qos(prefetch_count=prefetch)
+        consumer = (connection, channel)
+
+        def on_message(_, method, properties, body):
+            deliveries = 1 + int((properties.headers or {}).get('x-delivery-count', 0))
+            try:
+                message = decode_message(body)
+            except ValueError:
+                message = None
+            handler(Delivery(method.delivery_tag, message, deliveries, consumer))
+
+        consumer_tag = channel.basic_consume(self.queue, on_message)
+        try:
+            while not stop.is_set():
+                # Also sends the heartbeats and runs the acks of the worker threads
+                connection.process_data_events(time_limit=1)
+            channel.basic_cancel(consumer_tag)
+            while busy():
+                connection.process_data_events(time_limit=1)
+            connection.process_data_events(time_limit=0)
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _settle(self, delivery: Delivery, settle: Callable[[Any], None]):
+        connection, channel = delivery.consumer
+        # Channels belong to the consuming thread
+        try:
+            connection.add_callback_threadsafe(lambda: channel.is_open and settle(channel))
+        except Exception:
+            logger.warning("Could not settle message %s, the broker redelivers it", delivery.tag, exc_info=True)
+
+    def ack(self, delivery: Delivery):
+        self._settle(delivery, lambda channel: channel.basic_ack(delivery.tag))
+
+    def reject(self, delivery: Delivery, requeue: bool = False):
+        self._settle(delivery, lambda channel: channel.basic_reject(delivery.tag, requeue=requeue))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+            self._connection = self._channel = None
+
+
+def create_broker(url: str, queue: str = DEFAULT_QUEUE, consumer_timeout: float = CONSUMER_TIMEOUT_SECONDS):
+    """The broker of a TASK_BROKER_URL, ValueError for an unknown scheme."""
+    scheme = urlparse(url).scheme
+    if scheme in ('amqp', 'amqps'):
+        return RabbitMQBroker(url, queue, consumer_timeout=consumer_timeout)
+    if scheme == 'memory':
+        return InMemoryBroker()
+    raise ValueError(f"Unsupported task broker URL scheme '{scheme}', use amqp:// or memory://")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_task_broker():
+    """Get the broker of the app, None when TASK_BROKER_URL is not set and runs stay in-process."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                from GS.core.app import app
+                url = app.config.get('TASK_BROKER_URL')
+                if not url:
+                    return None
+                consumer_timeout = app.config.get('TASK_BROKER_CONSUMER_TIMEOUT_SECONDS', CONSUMER_TIMEOUT_SECONDS)
+                _broker = create_broker(url, app.config.get('TASK_BROKER_QUEUE', DEFAULT_QUEUE), consumer_timeout)
+    return _broker
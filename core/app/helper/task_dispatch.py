@@ -0,0 +1,308 @@
+"""Where crew runs execute: in this process or on worker nodes behind a broker.
+
+Without TASK_BROKER_URL runs are queued on the process's fair scheduler, as
+before. With it, `submit_run` publishes them to the broker (see
+`task_broker`) and `TaskWorker`s in worker processes run them, so crew
+capacity scales apart from the web servers:
+
+- A worker prefetches as many runs as it has slots, so a busy worker does
+  not hold back runs another one could start.
+- A run is acknowledged once its runner committed a final status to its
+  `TaskResult`, 'completed', 'error', 'cancelled' or 'timed_out'. A worker
+  dying mid-run leaves the message unacknowledged and the broker hands it
+  to another worker.
+- Messages that cannot be run are dead-lettered. These are malformed
+  messages, unknown kinds and tasks without a `TaskResult`, and runs
+  delivered more than DELIVERY_LIMIT times. Their task is marked 'error'
+  so clients stop polling.
+- A message for a task that is no longer pending or in progress is
+  acknowledged without running it. That covers runs cancelled while
+  queued and runs finished on an earlier delivery.
+- A worker claims the lease of a task before running it, and renews it
+  every third of TASK_LEASE_SECONDS while it runs. A message redelivered
+  while another worker's lease holds is left waiting until that worker
+  finishes, or until its lease runs out because the worker died. RabbitMQ
+  redelivers the runs of a worker whose channel it closed, after its
+  consumer timeout, while the worker is still running them.
+
+With a memory:// broker the queue only exists in the web process, which
+runs a `TaskWorker` of its own, see `start_local_worker`.
+
+Fair sharing between users and the concurrency caps only apply to runs in
+the same process. With a broker, interactive runs are delivered ahead of
+batch ones, and token quotas are checked against the usage in the database.
+"""
+
+import concurrent.futures
+import importlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Collection, Dict, Optional
+
+from GS.core.app.helper.task_broker import (
+    DELIVERY_LIMIT, HIGH_PRIORITY, NORMAL_PRIORITY, Delivery, InMemoryBroker, get_task_broker
+)
+
+logger = logging.getLogger(__name__)
+
+DATA_ANALYSIS = 'data_analysis'
+FLOW = 'flow'
+SCHEDULED_ANALYSIS = 'scheduled_analysis'
+
+# Message kind -> runner, imported where the run executes
+RUNNERS = {
+    DATA_ANALYSIS: 'GS.crew_ai.runners.crew_runner:run_data_analysis_crew',
+    FLOW: 'GS.crew_ai.flows.data_analysis_flow:run_flow_analysis',
+    SCHEDULED_ANALYSIS: 'GS.crew_ai.runners.scheduled_analysis:run_scheduled_analysis',
+}
+
+ACTIVE_STATUSES = ('pending', 'in_progress')
+LEASE_SECONDS = 60
+
+
+def runner(kind: str) -> Callable[..., Any]:
+    """The runner of a message kind, KeyError for an unknown one."""
+    module, _, name = RUNNERS[kind].partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def check_quota(user: str):
+    """Raise QuotaExceeded when the user may not submit runs right now."""
+    from GS.core.app.helper.fair_scheduler import get_fair_scheduler
+    # Runs on the workers are not accounted here, read the usage back every time
+    get_fair_scheduler().check_quota(user, reload=get_task_broker() is not None)
+
+
+def submit_run(task_id: str, user: str, lane: str, kind: str, *args: Any):
+    """Run `kind` with `args` for a task whose pending TaskResult is committed."""
+    from GS.core.app.helper.fair_scheduler import INTERACTIVE, get_fair_scheduler
+    broker = get_task_broker()
+    if broker is None:
+        from GS.core.app.helper.db_routing import background_task
+        get_fair_scheduler().submit(task_id, user, lane, background_task(runner(kind)), *args)
+        return
+    broker.publish({'task_id': task_id, 'user': user, 'lane': lane, 'kind': kind, 'args': list(args)},
+                   priority=HIGH_PRIORITY if lane == INTERACTIVE else NORMAL_PRIORITY)
+
+
+def _task_status(task_id: str) -> Optional[str]:
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    return db.session.query(TaskResult.status).filter_by(task_id=task_id).scalar()
+
+
+def _fail_task(task_id: str, message: str):
+    """Mark a task that will not run as failed, unless it already finished."""
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    session = db.session
+    task = session.query(TaskResult).filter(
+        TaskResult.task_id == task_id, TaskResult.status.in_(ACTIVE_STATUSES)).first()
+    if task is not None:
+        task.status = 'error'
+        task.set_result(json.dumps({'error': message}))
+        session.commit()
+
+
+def _claim_task(task_id: str, lease_seconds: float) -> bool:
+    """Take the lease of an active task, False while another worker holds it or when the task is not active."""
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    now = datetime.utcnow()
+    claimed = db.session.query(TaskResult).filter(
+        TaskResult.task_id == task_id, TaskResult.status.in_(ACTIVE_STATUSES),
+        (TaskResult.lease_until.is_(None)) | (TaskResult.lease_until < now)
+    ).update({TaskResult.lease_until: now + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.session.commit()
+    return claimed > 0
+
+
+def _renew_leases(task_ids: Collection[str], lease_seconds: float):
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    db.session.query(TaskResult).filter(TaskResult.task_id.in_(list(task_ids))).update(
+        {TaskResult.lease_until: datetime.utcnow() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.session.commit()
+
+
+def _release_task(task_id: str):
+    """Give the lease up, the next delivery may run the task right away."""
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    db.session.query(TaskResult).filter_by(task_id=task_id).update(
+        {TaskResult.lease_until: None}, synchronize_session=False)
+    db.session.commit()
+
+
+class TaskWorker:
+    """Consumes runs from a broker and runs up to `concurrency` of them at once.
+
+    Args:
+        broker: The broker to consume from
+        concurrency: Runs at once, the prefetch count
+        lease_seconds: Lease on the tasks it runs, renewed every third of it
+    """
+
+    def __init__(self, broker, concurrency: int, lease_seconds: float = LEASE_SECONDS):
+        self.broker = broker
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency,
+                                                               thread_name_prefix='crew-worker')
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._leased = set()
+
+    def run(self):
+        """Consume until `stop` is called, then wait for the runs in progress."""
+        renewer = threading.Thread(target=self._renew, name='task-leases', daemon=True)
+        renewer.start()
+        try:
+            self.broker.consume(self._received, prefetch=self.concurrency, stop=self._stop, busy=self.busy)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._finished.set()
+            renewer.join()
+
+    def _renew(self):
+        from GS.core.app.helper.db_routing import background_task
+        renew = background_task(_renew_leases)
+        while not self._finished.wait(self.lease_seconds / 3):
+            with self._lock:
+                task_ids = set(self._leased)
+            if not task_ids:
+                continue
+            try:
+                renew(task_ids, self.lease_seconds)
+            except Exception:
+                logger.exception("Renewing the leases of tasks %s failed", sorted(task_ids))
+
+    def stop(self):
+        self._stop.set()
+
+    def busy(self) -> bool:
+        with self._lock:
+            return self._running > 0
+
+    def _received(self, delivery: Delivery):
+        if self._stop.is_set():
+            # Leave it to another worker
+            self.broker.reject(delivery, requeue=True)
+            return
+        with self._lock:
+            self._running += 1
+        self._executor.submit(self._handle, delivery)
+
+    def _handle(self, delivery: Delivery):
+        try:
+            self._settle(delivery, self.process(delivery))
+        except Exception:
+            logger.exception("Handling message %s failed", delivery.tag)
+            self._settle(delivery, 'requeue')
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _settle(self, delivery: Delivery, outcome: str):
+        if outcome == 'ack':
+            self.broker.ack(delivery)
+        else:
+            self.broker.reject(delivery, requeue=outcome == 'requeue')
+
+    def process(self, delivery: Delivery) -> str:
+        """Run the message's task.
+
+        Returns:
+            'ack', 'requeue' or 'dead_letter'
+        """
+        from GS.core.app.helper.db_routing import background_task
+        from GS.workflow_engine.helper_classes.cancellation import TaskCancelled
+
+        message: Dict[str, Any] = delivery.message or {}
+        task_id = message.get('task_id')
+        try:
+            target = runner(message.get('kind'))
+            args = list(message['args'])
+        except (KeyError, TypeError, ImportError, AttributeError):
+            logger.error("Dead-lettering malformed task message %s: %s", delivery.tag, message)
+            if isinstance(task_id, str):
+                background_task(_fail_task)(task_id, "The task could not be run")
+            return 'dead_letter'
+
+        while True:
+            status = background_task(_task_status)(task_id)
+            if status is None:
+                logger.error("Dead-lettering the run of unknown task %s", task_id)
+                return 'dead_letter'
+            if status not in ACTIVE_STATUSES:
+                logger.info("Task %s already %s, not running it", task_id, status)
+                return 'ack'
+            if background_task(_claim_task)(task_id, self.lease_seconds):
+                break
+            # Another worker is running it and lost the message, wait for its result or for its lease to run out
+            logger.info("Task %s is running on another worker, waiting for it", task_id)
+            if self._stop.wait(self.lease_seconds / 3):
+                return 'requeue'
+
+        with self._lock:
+            self._leased.add(task_id)
+        try:
+            if delivery.deliveries > DELIVERY_LIMIT:
+                logger.error("Dead-lettering task %s, its run was interrupted %s times",
+                             task_id, delivery.deliveries - 1)
+                background_task(_fail_task)(task_id, "The task's workers stopped before it finished")
+                return 'dead_letter'
+
+            try:
+                background_task(target)(*args)
+            except TaskCancelled as e:
+                logger.info("Task %s stopped: %s", task_id, e)
+            except Exception:
+                # The runners record their errors, the status tells whether it was stored
+                logger.exception("Task %s failed", task_id)
+
+            status = background_task(_task_status)(task_id)
+            if status in ACTIVE_STATUSES:
+                # No final status was committed, another delivery retries the run
+                logger.error("Task %s ended without storing its result", task_id)
+                background_task(_release_task)(task_id)
+                return 'requeue'
+            return 'ack'
+        finally:
+            with self._lock:
+                self._leased.discard(task_id)
+
+
+_local_worker = None
+_local_thread = None
+_local_worker_lock = threading.Lock()
+
+
+def start_local_worker() -> Optional[TaskWorker]:
+    """Start a worker in this process when TASK_BROKER_URL is memory://, a worker process would not see its runs."""
+    global _local_worker, _local_thread
+    broker = get_task_broker()
+    if not isinstance(broker, InMemoryBroker):
+        return None
+    with _local_worker_lock:
+        if _local_worker is None:
+            from GS.core.app import app
+            from GS.core.app.helper.task_executor import MAX_WORKERS
+            _local_worker = TaskWorker(broker, MAX_WORKERS, app.config.get('TASK_LEASE_SECONDS', LEASE_SECONDS))
+            _local_thread = threading.Thread(target=_local_worker.run, name='task-worker', daemon=True)
+            _local_thread.start()
+    return _local_worker
+
+
+def stop_local_worker():
+    """Stop the worker of this process after the runs in progress, queued runs stay 'pending'."""
+    global _local_worker, _local_thread
+    with _local_worker_lock:
+        worker, thread, _local_worker, _local_thread = _local_worker, _local_thread, None, None
+    if worker is not None:
+        worker.stop()
+        thread.join()
@@ -0,0 +1,53 @@
+"""Shared executor for the background crew runs.
+
+The endpoints hand runs to this bounded pool through the fair scheduler
+(`fair_scheduler`), which keeps them queued per user until a worker is
+free. A burst of start requests therefore queues runs rather than starting
+an unbounded number of threads, and submitting never blocks the event loop.
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# The primary connection pool is sized for these workers, see core/app/config.py
+MAX_WORKERS = int(os.environ.get("TASK_EXECUTOR_WORKERS", 8))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_task_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Get the task executor, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix='crew-task')
+    return _executor
+
+
+def _log_failure(future: concurrent.futures.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background task failed", exc_info=future.exception())
+
+
+def dispatch(target: Callable[..., Any], *args: Any) -> concurrent.futures.Future:
+    """Queue `target(*args)` on the task executor and return without waiting."""
+    future = get_task_executor().submit(target, *args)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def shutdown_task_executor(wait: bool = True):
+    """Stop accepting tasks, waiting for the queued ones when `wait` is set."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
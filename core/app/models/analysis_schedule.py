@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+from flask_appbuilder import Model
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
+
+
+class AnalysisSchedule(Model):
+    """A recurring data analysis and how far into its source tables it has got.
+
+    The watermark maps each source table to the value its last successful run
+    analysed up to: the maximum of the table's watermark column, or the table
+    version when it has none. Runs only analyse the rows past the watermark
+    and revise the report of `last_task_id` with them.
+    """
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    user = Column(String(64))  # Owner, runs count against their share and quota
+    interval_seconds = Column(Integer, nullable=False)
+    request = Column(Text, nullable=False)  # Body of a start_data_analysis request, as JSON
+    sources = Column(Text, nullable=False)  # [{"table": ..., "watermark_column": ...}], as JSON
+    watermark = Column(Text)  # {table: value} of the last successful run, as JSON
+    last_task_id = Column(String(50))  # TaskResult holding the current report
+    running_task_id = Column(String(50))
+    enabled = Column(Boolean, default=True, nullable=False)
+    next_run_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_run_at = Column(DateTime)
+    last_checked_at = Column(DateTime)
+    skipped_runs = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def get_request(self):
+        return json.loads(self.request)
+
+    def get_sources(self):
+        return json.loads(self.sources)
+
+    def get_watermark(self):
+        return json.loads(self.watermark) if self.watermark else {}
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'user': self.user,
+            'interval_seconds': self.interval_seconds,
+            'request': self.get_request(),
+            'sources': self.get_sources(),
+            'watermark': self.get_watermark(),
+            'last_task_id': self.last_task_id,
+            'running_task_id': self.running_task_id,
+            'enabled': self.enabled,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
+            'skipped_runs': self.skipped_runs,
+        }
+
+    def __repr__(self):
+        return f"<AnalysisSchedule(name={self.name}, every={self.interval_seconds}s)>"
@@ -0,0 +1,22 @@
+from datetime import datetime
+from flask_appbuilder import Model
+from sqlalchemy import Column, DateTime, Integer, String
+
+
+class ArchivedTaskResult(Model):
+    """Where the result of a task went when it was moved out of the task_result table.
+
+    The result itself is in the Parquet file at `path` of the result archive,
+    see helper/result_archive.py. The row is what lets `get_result` find it
+    without listing the archive.
+    """
+    id = Column(Integer, primary_key=True)
+    task_id = Column(String(50), unique=True, nullable=False)
+    status = Column(String(20))
+    user = Column(String(64))
+    created_at = Column(DateTime, index=True)  # When the task was submitted
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    path = Column(String(500), nullable=False)  # Archive file relative to RESULT_ARCHIVE_URI
+
+    def __repr__(self):
+        return f"<ArchivedTaskResult(task_id={self.task_id}, path={self.path})>"
@@ -1,11 +1,41 @@
+import os
+from datetime import datetime
 from flask_appbuilder import Model
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String, Text
+from GS.core.app.helper.compression import decode_result, encode_result
+
+# Create the table with monthly partitions of created_at on a new Postgres
+# database, see helper/result_partitions.py. Postgres wants the partition key
+# in the primary key and in every unique constraint, task ids are uuid4s.
+PARTITIONED = (os.environ.get("TASK_RESULT_PARTITIONED", "false").lower() == "true"
+               and os.environ.get("SQLALCHEMY_DATABASE_URI", "").startswith("postgresql"))
+
 
 class TaskResult(Model):
-    id = Column(Integer, primary_key=True)
-    task_id = Column(String(50), unique=True, nullable=False)
-    status = Column(String(20), default='pending')  # e.g., 'pending', 'completed', 'failed'
-    result = Column(Text)  # Store the CrewAI result as text
+    __table_args__ = {'postgresql_partition_by': 'RANGE (created_at)'} if PARTITIONED else {}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String(50), unique=not PARTITIONED, index=PARTITIONED, nullable=False)
+    status = Column(String(20), default='pending')  # 'pending', 'in_progress', 'completed', 'error', 'cancelled' or 'timed_out'
+    result = Column(Text)  # Legacy uncompressed result, kept readable for old rows
+    result_data = Column(LargeBinary)  # Compressed CrewAI result
+    result_encoding = Column(String(10))  # 'zstd', 'gzip' or 'identity'
+    created_at = Column(DateTime, default=datetime.utcnow, index=True, primary_key=PARTITIONED)
+    user = Column(String(64), index=True)  # Username that submitted the task
+    lane = Column(String(20))  # 'interactive' or 'batch'
+    total_tokens = Column(Integer)  # LLM tokens the run used, for quotas
+    deadline_at = Column(DateTime)  # The run is stopped as 'timed_out' when it has not finished by then
+    lease_until = Column(DateTime)  # Renewed by the worker running the task, see helper/task_dispatch.py
+
+    def set_result(self, payload: str, codec: str = None):
+        """Store a JSON result string compressed with the configured codec."""
+        self.result_data, self.result_encoding = encode_result(payload, codec)
+        self.result = None
+
+    def get_result_text(self):
+        """Return the stored JSON result string regardless of how it was stored."""
+        if self.result_data is not None:
+            return decode_result(self.result_data, self.result_encoding)
+        return self.result
 
     def __repr__(self):
-        return f"<TaskResult(task_id={self.task_id}, status={self.status})>"
\ No newline at end of file
+        return f"<TaskResult(task_id={self.task_id}, status={self.status})>"
@@ -0,0 +1,59 @@
+"""ASGI entry point, serve with `uvicorn GS.core.asgi:application`.
+
+The async CrewAI endpoints run on the event loop, every other route
+(security, Swagger UI, uploads) is passed on to the Flask app, which runs on
+a pool of WSGI_WORKERS threads. While the app runs it also checks the
+recurring analyses, see `crew_ai.runners.scheduled_analysis`, and moves
+expired task results out of the database, see `helper.result_retention`.
+With a memory:// TASK_BROKER_URL it runs the queued crew runs too. The
+table catalog the crews search is refreshed, see
+`workflow_engine.helper_classes.catalog_index`.
+"""
+
+import contextlib
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount
+
+from GS.core.app import app
+from GS.core.app.apis.crewai_async_api import routes
+from GS.core.app.config import ACCEPTED_ORIGINS
+from GS.core.app.helper.async_db import dispose_async_engine
+from GS.core.app.helper.result_retention import start_result_compactor, stop_result_compactor
+from GS.core.app.helper.task_dispatch import start_local_worker, stop_local_worker
+from GS.core.app.helper.task_executor import shutdown_task_executor
+from GS.crew_ai.runners.scheduled_analysis import start_analysis_scheduler, stop_analysis_scheduler
+from GS.workflow_engine.helper_classes.catalog_index import start_catalog_refresher, stop_catalog_refresher
+
+WSGI_WORKERS = int(os.environ.get("WSGI_WORKERS", 10))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    start_analysis_scheduler()
+    start_result_compactor()
+    start_local_worker()
+    start_catalog_refresher()
+    yield
+    stop_catalog_refresher()
+    stop_local_worker()
+    stop_result_compactor()
+    stop_analysis_scheduler()
+    await dispose_async_engine()
+    # Runs still queued are abandoned, their tasks stay 'pending'
+    shutdown_task_executor(wait=False)
+
+
+application = Starlette(
+    routes=[*routes, Mount('/', app=WSGIMiddleware(app, workers=WSGI_WORKERS))],
+    middleware=[Middleware(CORSMiddleware, allow_origins=ACCEPTED_ORIGINS)],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(application)
@@ -0,0 +1,113 @@
+"""Compressed results, accounting and deadlines of task_result, schedules and the archive index
+
+Revision ID: 4b7d2e91c0a3
+Revises:
+Create Date: 2026-10-19 12:00:00
+
+Databases from before these changes have the four column task_result
+table. The app's db.create_all() creates the missing tables when it starts
+but never adds columns to an existing table, so each step is skipped when
+what it adds is already there.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e91c0a3'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TASK_RESULT_COLUMNS = (
+    ('result_data', sa.LargeBinary()),
+    ('result_encoding', sa.String(10)),
+    ('created_at', sa.DateTime()),
+    ('user', sa.String(64)),
+    ('lane', sa.String(20)),
+    ('total_tokens', sa.Integer()),
+    ('deadline_at', sa.DateTime()),
+)
+TASK_RESULT_INDEXES = (('ix_task_result_created_at', 'created_at'), ('ix_task_result_user', 'user'))
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'task_result' not in tables:
+        op.create_table(
+            'task_result',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('task_id', sa.String(50), nullable=False),
+            sa.Column('status', sa.String(20)),
+            sa.Column('result', sa.Text()),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('task_id'),
+        )
+        existing = {'id', 'task_id', 'status', 'result'}
+        indexes = set()
+    else:
+        existing = {column['name'] for column in inspector.get_columns('task_result')}
+        indexes = {index['name'] for index in inspector.get_indexes('task_result')}
+    missing = [(name, type_) for name, type_ in TASK_RESULT_COLUMNS if name not in existing]
+    if missing:
+        # SQLite adds columns through a batch, the other databases with ALTER TABLE
+        with op.batch_alter_table('task_result') as batch:
+            for name, type_ in missing:
+                batch.add_column(sa.Column(name, type_))
+    for index, column in TASK_RESULT_INDEXES:
+        if index not in indexes:
+            op.create_index(index, 'task_result', [column])
+
+    if 'analysis_schedule' not in tables:
+        op.create_table(
+            'analysis_schedule',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(100), nullable=False),
+            sa.Column('user', sa.String(64)),
+            sa.Column('interval_seconds', sa.Integer(), nullable=False),
+            sa.Column('request', sa.Text(), nullable=False),
+            sa.Column('sources', sa.Text(), nullable=False),
+            sa.Column('watermark', sa.Text()),
+            sa.Column('last_task_id', sa.String(50)),
+            sa.Column('running_task_id', sa.String(50)),
+            sa.Column('enabled', sa.Boolean(), nullable=False),
+            sa.Column('next_run_at', sa.DateTime()),
+            sa.Column('last_run_at', sa.DateTime()),
+            sa.Column('last_checked_at', sa.DateTime()),
+            sa.Column('skipped_runs', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name'),
+        )
+        op.create_index('ix_analysis_schedule_next_run_at', 'analysis_schedule', ['next_run_at'])
+
+    if 'archived_task_result' not in tables:
+        op.create_table(
+            'archived_task_result',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('task_id', sa.String(50), nullable=False),
+            sa.Column('status', sa.String(20)),
+            sa.Column('user', sa.String(64)),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('archived_at', sa.DateTime()),
+            sa.Column('path', sa.String(500), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('task_id'),
+        )
+        op.create_index('ix_archived_task_result_created_at', 'archived_task_result', ['created_at'])
+
+
+def downgrade():
+    op.drop_table('archived_task_result')
+    op.drop_table('analysis_schedule')
+    inspector = sa.inspect(op.get_bind())
+    indexes = {index['name'] for index in inspector.get_indexes('task_result')}
+    for index, _ in TASK_RESULT_INDEXES:
+        if index in indexes:
+            op.drop_index(index, table_name='task_result')
+    with op.batch_alter_table('task_result') as batch:
+        for name, _ in reversed(TASK_RESULT_COLUMNS):
+            batch.drop_column(name)
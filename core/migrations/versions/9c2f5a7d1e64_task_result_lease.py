@@ -0,0 +1,32 @@
+"""Lease of the worker running a task
+
+Revision ID: 9c2f5a7d1e64
+Revises: 4b7d2e91c0a3
+Create Date: 2026-10-19 18:00:00
+
+Workers renew `task_result.lease_until` while they run a task, a redelivered
+run waits for a live owner instead of running the task a second time. The
+column may already exist when the app created the table.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2f5a7d1e64'
+down_revision = '4b7d2e91c0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'lease_until' not in {column['name'] for column in inspector.get_columns('task_result')}:
+        with op.batch_alter_table('task_result') as batch:
+            batch.add_column(sa.Column('lease_until', sa.DateTime()))
+
+
+def downgrade():
+    with op.batch_alter_table('task_result') as batch:
+        batch.drop_column('lease_until')
@@ -0,0 +1,47 @@
+"""Crew worker entry point, run with `python -m GS.core.worker`.
+
+Consumes the runs the API processes publish to TASK_BROKER_URL and runs up
+to `--concurrency` of them at once, see `core.app.helper.task_dispatch`.
+Start as many workers as there is crew capacity to add. SIGTERM and SIGINT
+stop taking runs and wait for the ones in progress, so stop the worker
+with a grace period as long as a run.
+"""
+
+import argparse
+import logging
+import signal
+
+from GS.core.app import app
+from GS.core.app.helper.task_broker import InMemoryBroker, get_task_broker
+from GS.core.app.helper.task_dispatch import LEASE_SECONDS, TaskWorker
+from GS.core.app.helper.task_executor import MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    """Main entry point for the crew worker."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=MAX_WORKERS, help='Runs at once, the prefetch count')
+    args = parser.parse_args(argv)
+
+    broker = get_task_broker()
+    if broker is None:
+        parser.error("TASK_BROKER_URL is not set")
+    if isinstance(broker, InMemoryBroker):
+        parser.error("A memory:// queue is consumed by the web process itself, use amqp://")
+    worker = TaskWorker(broker, args.concurrency, app.config.get('TASK_LEASE_SECONDS', LEASE_SECONDS))
+
+    def stop(signum, _):
+        logger.info("Received signal %s, finishing the runs in progress", signum)
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Crew worker consuming %s with %s slots", app.config.get('TASK_BROKER_QUEUE'), args.concurrency)
+    worker.run()
+    broker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
 from GS.core.app import app
+from GS.core.app.helper.result_retention import start_result_compactor
+from GS.core.app.helper.task_dispatch import start_local_worker
+from GS.crew_ai.runners.scheduled_analysis import start_analysis_scheduler
+from GS.workflow_engine.helper_classes.catalog_index import start_catalog_refresher
+
+start_analysis_scheduler()
+start_result_compactor()
+start_local_worker()
+start_catalog_refresher()
 
 if __name__ == "__main__":
     app.run()
@@ -1,3 +1,3 @@
 """CrewAI package for building and running AI crews."""
 
-__all__ = ['agents', 'tasks', 'tools', 'runners', 'crews'] 
\ No newline at end of file
+__all__ = ['agents', 'tasks', 'tools', 'runners', 'crews', 'llm'] 
\ No newline at end of file
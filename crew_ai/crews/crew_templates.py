@@ -0,0 +1,261 @@
+"""Compile-once crew templates with cheap per-run instantiation.
+
+Building a crew through its `@CrewBase` class runs the decorator machinery,
+resolves every agent's LLM, constructs and validates each Agent and Task and
+parses the tools, on every request, although the YAML behind it rarely
+changes. A `CrewTemplate` does that once per (crew type, config hash) and
+keeps the resulting agents and tasks as a private prototype that is never
+executed. Each run gets shallow copies of them with the run state reset,
+wired into a fresh crew; the run inputs are bound at `kickoff` as before.
+The crew compacts the context each task receives to the task's
+`context_token_budget`, see `context_compaction`.
+
+The copies share what is immutable for the duration of a run: the LLM
+clients, the tool objects and the interpolation-ready descriptions. Counters,
+outputs, token usage, caches and executors are per copy, so concurrent runs
+of the same template do not see each other's state. Editing a YAML file
+changes its hash and the next run compiles a new template.
+
+Every tool call of the crews first checks whether its run was cancelled,
+see `cancellation`.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import yaml
+from crewai import Crew
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.tool_usage_events import ToolUsageStartedEvent
+
+from GS.crew_ai.llm.context_compaction import CompactingCrew
+from GS.workflow_engine.helper_classes.cancellation import check_cancelled
+
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fields that change while a crew runs, reset to their defaults on every copy
+_AGENT_RUN_FIELDS = ('formatting_errors', 'tools_results', 'agent_executor', 'crew',
+                     'tools_handler', 'cache_handler')
+_TASK_RUN_FIELDS = ('used_tools', 'tools_errors', 'delegations', 'output', 'processed_by_agents',
+                    'retry_count', 'start_time', 'end_time', 'prompt_context')
+# Crew settings carried over from the prototype, everything else is per run
+_CREW_SETTINGS = ('process', 'verbose', 'memory', 'max_rpm', 'planning', 'manager_llm',
+                  'function_calling_llm', 'manager_agent', 'full_output', 'output_log_file')
+
+@crewai_event_bus.on(ToolUsageStartedEvent)
+def _check_before_tool(source, event):
+    # Emitted in the agent's thread before the tool runs, TaskCancelled is
+    # not an Exception and gets past crewai's error handling
+    check_cancelled()
+
+
+_config_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_config_lock = threading.Lock()
+
+
+def _load_yaml(path: str) -> Dict[str, Any]:
+    """Parse a YAML file, re-reading it only when it changed on disk."""
+    mtime = os.stat(path).st_mtime_ns
+    with _config_lock:
+        cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+    with _config_lock:
+        _config_cache[path] = (mtime, config)
+    return config
+
+
+def load_crew_config(crew_type: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Load the agent and task configuration of a crew type.
+
+    The returned dictionaries are shared between callers and must not be
+    modified.
+
+    Args:
+        crew_type: The crew type, e.g. 'data_analysis'
+
+    Returns:
+        A tuple of the agents and tasks configuration
+    """
+    agents_config = _load_yaml(os.path.join(CONFIG_DIR, f'agents/{crew_type}_agents.yaml'))
+    tasks_config = _load_yaml(os.path.join(CONFIG_DIR, f'tasks/{crew_type}_tasks.yaml'))
+    return agents_config, tasks_config
+
+
+def config_hash(*parts: Any) -> str:
+    """Stable hash of JSON-compatible configuration values."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _field_default(model, name: str):
+    return type(model).model_fields[name].get_default(call_default_factory=True)
+
+
+def _fresh_copy(model, run_fields, **update):
+    """Shallow copy of a pydantic model with its run state reset."""
+    update = {
+        **{name: _field_default(model, name) for name in run_fields if name in type(model).model_fields},
+        'id': uuid.uuid4(),
+        **update,
+    }
+    clone = model.model_copy(update=update)
+    # Token counters, rpm controllers and interpolation originals live in private attributes
+    for name, attribute in type(model).__private_attributes__.items():
+        if name != '_logger':
+            setattr(clone, name, attribute.get_default())
+    return clone
+
+
+class CrewTemplate:
+    """A validated crew definition that produces independent per-run crews."""
+
+    def __init__(self, crew_type: str, crew_class, agents_config: Dict[str, Any],
+                 tasks_config: Dict[str, Any], llm=None, key: str = ''):
+        """Compile the template by building the crew once.
+
+        Args:
+            crew_type: The crew type the configuration belongs to
+            crew_class: The `@CrewBase` class, e.g. DataAnalysisCrew
+            agents_config: Configuration for crew agents
+            tasks_config: Configuration for crew tasks
+            llm: Default LLM of the crew
+            key: The config hash the template was compiled for
+        """
+        self.crew_type = crew_type
+        self.key = key
+        # The crew class may keep references to the configuration, give it its own
+        instance = crew_class(
+            agents_config=copy.deepcopy(agents_config),
+            tasks_config=copy.deepcopy(tasks_config),
+            llm=llm
+        )
+        # CrewBase loads its own config/*.yaml after __init__ and, not finding
+        # them, replaces the configuration passed in with empty dictionaries
+        instance.agents_config = copy.deepcopy(agents_config)
+        instance.tasks_config = copy.deepcopy(tasks_config)
+        prototype = instance.crew()
+        self._agents = tuple(prototype.agents)
+        self._tasks = tuple(prototype.tasks)
+        self._settings = {name: getattr(prototype, name) for name in _CREW_SETTINGS
+                          if name in Crew.model_fields}
+        # Per-task context budgets from the tasks YAML, the configured default otherwise
+        self._context_budgets = {
+            task.name: tasks_config[task.name]['context_token_budget']
+            for task in self._tasks
+            if isinstance(tasks_config.get(task.name), dict) and 'context_token_budget' in tasks_config[task.name]
+        }
+        self.instances = 0
+
+    def instantiate(self) -> Crew:
+        """Create a crew for one run, ready for `kickoff(inputs=...)`."""
+        agents = {id(agent): _fresh_copy(agent, _AGENT_RUN_FIELDS, tools=list(agent.tools or []))
+                  for agent in self._agents}
+        tasks = {}
+        for task in self._tasks:
+            # Tasks come in dependency order, so their context has been copied already
+            context = task.context
+            if context:
+                context = [tasks.get(id(item), item) for item in context]
+            tasks[id(task)] = _fresh_copy(
+                task, _TASK_RUN_FIELDS,
+                agent=agents.get(id(task.agent), task.agent),
+                context=context,
+                tools=list(task.tools or [])
+            )
+        self.instances += 1
+        crew = CompactingCrew(agents=list(agents.values()), tasks=list(tasks.values()), **self._settings)
+        return crew.set_context_budgets(self._context_budgets)
+
+
+class CrewTemplateRegistry:
+    """Compile crew templates on first use and hand out per-run crews."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates: Dict[Tuple[str, str], CrewTemplate] = {}
+        self._building: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, crew_type: str, crew_class, agents_config: Dict[str, Any], tasks_config: Dict[str, Any],
+            llm_factory: Optional[Callable[[], Any]] = None, variant: str = '') -> CrewTemplate:
+        """Return the template for a configuration, compiling it when it changed.
+
+        Args:
+            crew_type: The crew type, e.g. 'data_analysis'
+            crew_class: The `@CrewBase` class to build the crew with
+            agents_config: Configuration for crew agents
+            tasks_config: Configuration for crew tasks
+            llm_factory: Creates the default LLM, only called when compiling
+            variant: Distinguishes templates of the same configuration built
+                with different LLM factories
+
+        Returns:
+            The compiled template
+        """
+        slot = (crew_type, f'{crew_class.__qualname__}:{variant}')
+        key = config_hash(crew_type, agents_config, tasks_config)
+        with self._lock:
+            template = self._templates.get(slot)
+            if template is not None and template.key == key:
+                return template
+            building = self._building.setdefault(slot, threading.Lock())
+        # Compile outside the registry lock so other crew types are not held up
+        with building:
+            with self._lock:
+                template = self._templates.get(slot)
+            if template is None or template.key != key:
+                llm = llm_factory() if llm_factory else None
+                template = CrewTemplate(crew_type, crew_class, agents_config, tasks_config, llm=llm, key=key)
+                with self._lock:
+                    self._templates[slot] = template
+        return template
+
+    def crew_for_run(self, crew_type: str, crew_class, llm_factory: Optional[Callable[[Dict], Any]] = None,
+                     variant: str = '') -> Crew:
+        """Create a crew for one run from the crew type's YAML configuration.
+
+        Args:
+            crew_type: The crew type, e.g. 'data_analysis'
+            crew_class: The `@CrewBase` class to build the crew with
+            llm_factory: Creates the default LLM from the `llm_config` section
+            variant: See `get`
+
+        Returns:
+            A crew ready for `kickoff(inputs=...)`
+        """
+        agents_config, tasks_config = load_crew_config(crew_type)
+        factory = None
+        if llm_factory:
+            factory = lambda: llm_factory(agents_config.get('llm_config', {}))
+        template = self.get(crew_type, crew_class, agents_config, tasks_config, llm_factory=factory, variant=variant)
+        return template.instantiate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {f'{slot[0]}:{slot[1]}': {'key': template.key, 'instances': template.instances}
+                    for slot, template in self._templates.items()}
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_crew_templates() -> CrewTemplateRegistry:
+    """Return the process-wide crew template registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CrewTemplateRegistry()
+    return _registry
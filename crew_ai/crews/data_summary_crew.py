@@ -1,8 +1,7 @@
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from GS.crew_ai.tools import CalculatorTool
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
+from GS.crew_ai.llm import cascade_for_agent, llm_from_config
 from typing import Dict, Any, Optional
 
 @CrewBase
@@ -24,6 +23,10 @@ class DataSummaryCrew:
 
     def get_agent_llm(self, agent_name):
         """Get the LLM for a specific agent based on configuration."""
+        # The agent's tasks may route their calls through cheap-first model cascades
+        cascade = cascade_for_agent(agent_name, self.agents_config, self.tasks_config, self.default_llm)
+        if cascade:
+            return cascade
         agent_config = self.agents_config.get(agent_name, {})
         llm_config = agent_config.get('llm', None)
         
@@ -40,26 +43,12 @@ class DataSummaryCrew:
         return self._create_llm_from_config(llm_config)
     
     def _create_llm_from_config(self, config):
-        """Create an LLM instance from a configuration dictionary."""
-        provider = config.get('provider', 'openai')
-        model_name = config.get('model_name', 'gpt-4-turbo')
-        temperature = config.get('temperature', 0.7)
-        
-        if provider == 'openai':
-            return ChatOpenAI(
-                model_name=model_name,
-                temperature=temperature
-            )
-        elif provider == 'anthropic':
-            return ChatAnthropic(
-                model_name=model_name,
-                temperature=temperature
-            )
-        # Default to OpenAI
-        return ChatOpenAI(
-            model_name=model_name,
-            temperature=temperature
-        )
+        """Create an LLM instance from a configuration dictionary.
+
+        The LLM keeps the agent's static preamble first in every request so
+        the provider can serve it from its prompt cache.
+        """
+        return llm_from_config(config)
 
     @agent
     def executive_summarizer(self) -> Agent:
@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 import json
-import os
-import yaml
 from typing import Dict, List, Any, Optional
 from pydantic import BaseModel, Field
 from crewai import LLM
 from crewai.flow.flow import Flow, listen, start
 
+from GS.workflow_engine.helper_classes.cancellation import CANCELLED, TIMED_OUT, TaskCancelled, check_cancelled
+
+
+def _flow_llm(agents_config: Dict) -> LLM:
+    """Default LLM of a crew in the flow, from its llm_config section."""
+    from GS.crew_ai.llm import llm_from_config
+    return llm_from_config(agents_config.get('llm_config', {}))
+
 
 # Define our state model
 class AnalysisState(BaseModel):
@@ -14,11 +20,18 @@ class AnalysisState(BaseModel):
     input_data: Dict = {}
     analysis_result: str = ""
     summary_result: Dict = {}
+    analysis_routing: Dict = {}
+    analysis_tokens: int = 0
     status: str = "pending"
 
 
 class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
-    """Flow for running a comprehensive data analysis with summarization"""
+    """Flow for running a comprehensive data analysis with summarization
+
+    Every stage starts by checking whether the run was cancelled or passed its
+    deadline. crewai only logs exceptions of later stages, the TaskCancelled
+    this raises is not an Exception and stops the flow.
+    """
 
     def __init__(self, task_id: str = None, data: Dict = None):
         """Initialize the flow with task ID and input data"""
@@ -43,30 +56,17 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
     @start()
     def load_configurations(self):
         """Load configurations for both crews"""
+        check_cancelled()
         # Get crew types from data
         analysis_crew_type = self.state.input_data.get('analysis_crew_type', 'data_analysis')
         summary_crew_type = self.state.input_data.get('summary_crew_type', 'data_summary')
 
-        # Load configurations
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-        # Analysis crew configs
-        analysis_agents_file = os.path.join(base_dir, f'agents/{analysis_crew_type}_agents.yaml')
-        with open(analysis_agents_file, 'r') as f:
-            self.analysis_agents_config = yaml.safe_load(f)
-
-        analysis_tasks_file = os.path.join(base_dir, f'tasks/{analysis_crew_type}_tasks.yaml')
-        with open(analysis_tasks_file, 'r') as f:
-            self.analysis_tasks_config = yaml.safe_load(f)
-
-        # Summary crew configs
-        summary_agents_file = os.path.join(base_dir, f'agents/{summary_crew_type}_agents.yaml')
-        with open(summary_agents_file, 'r') as f:
-            self.summary_agents_config = yaml.safe_load(f)
-
-        summary_tasks_file = os.path.join(base_dir, f'tasks/{summary_crew_type}_tasks.yaml')
-        with open(summary_tasks_file, 'r') as f:
-            self.summary_tasks_config = yaml.safe_load(f)
+        # Load configurations, unchanged YAML files are not parsed again
+        from GS.crew_ai.crews.crew_templates import load_crew_config
+        self.analysis_agents_config, self.analysis_tasks_config = load_crew_config(analysis_crew_type)
+        self.summary_agents_config, self.summary_tasks_config = load_crew_config(summary_crew_type)
+        self.analysis_crew_type = analysis_crew_type
+        self.summary_crew_type = summary_crew_type
 
         # Update status
         self.state.status = "configured"
@@ -77,24 +77,31 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
     @listen(load_configurations)
     def run_data_analysis(self, state):
         """Run the data analysis crew"""
+        check_cancelled()
         # Import inside function to avoid circular imports
         from GS.crew_ai.crews.data_analysis_crew import DataAnalysisCrew
+        from GS.crew_ai.crews.crew_templates import get_crew_templates
         
-        # Create LLM
-        llm_config = self.analysis_agents_config.get('llm_config', {})
-        llm = LLM(
-            model=llm_config.get('model_name', 'gpt-4-turbo'),
-            temperature=llm_config.get('temperature', 0.7)
-        )
-
-        # Create and run the analysis crew
-        analysis_crew = DataAnalysisCrew(
-            agents_config=self.analysis_agents_config,
-            tasks_config=self.analysis_tasks_config,
-            llm=llm
-        )
-
-        analysis_result = analysis_crew.crew().kickoff(inputs=self.state.input_data.get('inputs', {}))
+        # Create the analysis crew from its compiled template
+        analysis_crew = get_crew_templates().get(
+            self.analysis_crew_type,
+            DataAnalysisCrew,
+            self.analysis_agents_config,
+            self.analysis_tasks_config,
+            llm_factory=lambda: _flow_llm(self.analysis_agents_config)
+        ).instantiate()
+
+        from GS.workflow_engine.helper_classes.artifact_cache import with_artifacts
+        from GS.workflow_engine.helper_classes.document_ingestion import with_documents
+        from GS.workflow_engine.helper_classes.table_profiler import with_profiles
+        # The state keeps the artifact references, the datasets they load belong to the run
+        inputs = with_profiles(self.state.input_data, with_artifacts(with_documents(self.state.input_data)))
+        from GS.crew_ai.llm import routing_run
+        with routing_run() as routing:
+            analysis_result = analysis_crew.kickoff(inputs=inputs)
+        self.state.analysis_routing = routing.summary()
+        if getattr(analysis_result, 'token_usage', None):
+            self.state.analysis_tokens = getattr(analysis_result.token_usage, 'total_tokens', 0) or 0
 
         # Store the result
         if hasattr(analysis_result, 'raw'):
@@ -108,31 +115,35 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
     @listen(run_data_analysis)
     def run_data_summary(self, state):
         """Run the data summary crew with the analysis results"""
+        check_cancelled()
         # Import inside function to avoid circular imports
         from GS.crew_ai.crews.data_summary_crew import DataSummaryCrew
+        from GS.crew_ai.crews.crew_templates import get_crew_templates
         
-        # Create summary inputs
+        from GS.crew_ai.llm.context_compaction import get_context_compactor
+        from GS.workflow_engine.configs import ContextCompaction
+
+        # Create summary inputs, the report is compacted to the summary budget
         summary_inputs = {
-            'analysis_report': self.state.analysis_result,
+            'analysis_report': get_context_compactor().compact(
+                self.state.analysis_result, ContextCompaction.SUMMARY_TOKEN_BUDGET
+            ),
             'additional_context': self.state.input_data.get('additional_context', ''),
             'audience': self.state.input_data.get('audience', 'executive'),
         }
 
-        # Create LLM
-        llm_config = self.summary_agents_config.get('llm_config', {})
-        llm = LLM(
-            model=llm_config.get('model_name', 'gpt-4-turbo'),
-            temperature=llm_config.get('temperature', 0.7)
-        )
-
-        # Create and run the summary crew
-        summary_crew = DataSummaryCrew(
-            agents_config=self.summary_agents_config,
-            tasks_config=self.summary_tasks_config,
-            llm=llm
-        )
+        # Create the summary crew from its compiled template
+        summary_crew = get_crew_templates().get(
+            self.summary_crew_type,
+            DataSummaryCrew,
+            self.summary_agents_config,
+            self.summary_tasks_config,
+            llm_factory=lambda: _flow_llm(self.summary_agents_config)
+        ).instantiate()
 
-        summary_result = summary_crew.crew().kickoff(inputs=summary_inputs)
+        from GS.crew_ai.llm import routing_run
+        with routing_run() as routing:
+            summary_result = summary_crew.kickoff(inputs=summary_inputs)
 
         # Store the summary result
         if hasattr(summary_result, 'raw'):
@@ -150,16 +161,22 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
             self.state.summary_result['token_usage'] = {
                 'total_tokens': getattr(token_usage, 'total_tokens', 0),
                 'prompt_tokens': getattr(token_usage, 'prompt_tokens', 0),
+                # Prompt tokens served from the provider's prefix cache
+                'cached_prompt_tokens': getattr(token_usage, 'cached_prompt_tokens', 0),
                 'completion_tokens': getattr(token_usage, 'completion_tokens', 0),
                 'successful_requests': getattr(token_usage, 'successful_requests', 0)
             }
 
+        if routing.tasks:
+            self.state.summary_result['routing'] = routing.summary()
+
         self.state.status = "completed"
         return self.state
 
     @listen(run_data_summary)
     def save_results(self, state):
         """Save the final results to the database"""
+        check_cancelled()
         # Create combined result
         combined_result = {
             'analysis': {
@@ -168,12 +185,16 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
             'summary': self.state.summary_result
         }
 
-        # Update task status in database
-        self._update_task_status("completed", json.dumps(combined_result))
+        if self.state.analysis_routing:
+            combined_result['analysis']['routing'] = self.state.analysis_routing
+
+        # Update task status in database, with the tokens of both crews for quotas
+        total_tokens = self.state.analysis_tokens + self.state.summary_result.get('token_usage', {}).get('total_tokens', 0)
+        self._update_task_status("completed", json.dumps(combined_result), total_tokens)
 
         return "Analysis and summary completed successfully"
 
-    def _update_task_status(self, status, result=None):
+    def _update_task_status(self, status, result=None, total_tokens=None):
         """Helper method to update task status in the database"""
         if not hasattr(self.state, 'task_id') or not self.state.task_id:
             return
@@ -184,30 +205,52 @@ class ComprehensiveAnalysisFlow(Flow[AnalysisState]):
             
         session = db.session
         task = session.query(TaskResult).filter_by(task_id=self.state.task_id).first()
-        if task:
+        # A cancel request that came in as the flow finished still counts
+        if task and task.status != CANCELLED:
             task.status = status
             if result:
-                task.result = result
+                task.set_result(result)
+            if total_tokens is not None:
+                task.total_tokens = total_tokens
             session.commit()
 
 
 def run_flow_analysis(task_id: str, data: Dict[Any, Any]) -> None:
-    """Run the comprehensive analysis flow"""
+    """Run the comprehensive analysis flow
+
+    Raises:
+        TaskCancelled: When the task is cancelled or passes its deadline, after
+            marking it 'cancelled' or 'timed_out'
+    """
+    from GS.crew_ai.runners.crew_runner import record_stopped, run_deadline
     try:
-        # Create and run the flow
-        flow = ComprehensiveAnalysisFlow(task_id, data)
-        flow.kickoff()
+        from GS.workflow_engine.helper_classes.cancellation import cancellable_run
+        from GS.workflow_engine.helper_classes.dataset_registry import dataset_run
+        from GS.crew_ai.llm import llm_deadline
+        # Run the flow until it is cancelled or its deadline passes, datasets
+        # created by its tools expire with it and both crews share the deadline
+        deadline = run_deadline(task_id, data)
+        with cancellable_run(task_id, deadline), dataset_run(task_id), llm_deadline(deadline):
+            # A task cancelled while it was queued stops before it is reset to pending
+            check_cancelled()
+            flow = ComprehensiveAnalysisFlow(task_id, data)
+            flow.kickoff()
+    except TaskCancelled as e:
+        record_stopped(task_id, e)
+        raise
     except Exception as e:
         # Import inside function to avoid circular imports
         from GS.core.app import db
         from GS.core.app.models.task_result import TaskResult
+        from GS.crew_ai.llm import LLMDeadlineExceeded
         
-        # Update task status in case of error
+        # Update task status in case of error, after dropping a transaction the error may have broken
         session = db.session
+        session.rollback()
         task = session.query(TaskResult).filter_by(task_id=task_id).first()
         if task:
-            task.status = 'error'
-            task.result = json.dumps({'error': str(e)})
+            task.status = TIMED_OUT if isinstance(e, LLMDeadlineExceeded) else 'error'
+            task.set_result(json.dumps({'error': str(e)}))
             session.commit()
         raise
 
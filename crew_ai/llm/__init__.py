@@ -0,0 +1,11 @@
+"""LLM clients used by the crews."""
+
+from .prefix_cache import PrefixCachingLLM, arrange_messages, llm_from_config, static_prefix
+from .cascade import CascadeLLM, TaskRoutedLLM, cascade_for_agent, routing_run
+from .hedging import LLMDeadlineExceeded, hedged_completion, llm_deadline
+from .context_compaction import CompactingCrew, ContextCompactor, count_tokens, get_context_compactor
+
+__all__ = ['PrefixCachingLLM', 'arrange_messages', 'llm_from_config', 'static_prefix',
+           'CascadeLLM', 'TaskRoutedLLM', 'cascade_for_agent', 'routing_run',
+           'LLMDeadlineExceeded', 'hedged_completion', 'llm_deadline',
+           'CompactingCrew', 'ContextCompactor', 'count_tokens', 'get_context_compactor']
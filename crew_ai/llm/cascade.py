@@ -0,0 +1,330 @@
+"""Model cascades: answer with a cheap model, escalate when the answer fails checks.
+
+A task can declare a cascade in its tasks YAML:
+
+    create_executive_summary:
+      ...
+      model_cascade:
+        - model_name: "gpt-4o-mini"
+          min_length: 400
+          confidence: 0.7
+        - model_name: "gpt-4-turbo"
+
+Each stage inherits provider and temperature from the agent's `llm` config
+unless it sets its own. Every call tries the stages in order and returns the
+first answer that passes the stage's validators; the last stage is always
+accepted. Only final answers are validated, the tool-use steps of an agent
+are taken from whichever stage produced them.
+
+Validators:
+    min_length / max_length: Bounds on the final answer in characters
+    json: The final answer must parse as JSON
+    required_keys: Keys the final answer's JSON object must have
+    pattern: Regular expression the final answer must match
+    confidence: The model is asked to end its answer with a
+        `Confidence: <0-1>` line, answers below the threshold escalate
+
+The cascade is resolved per task. An agent working on several tasks that do
+not all share one cascade gets a `TaskRoutedLLM`, which sends each call to
+the cascade, or the agent's plain LLM, of the task the agent is running.
+
+Routing decisions are recorded per task in the `routing_run` of the current
+context, together with the time saved by not calling the last stage, which
+is estimated from that model's running average latency.
+"""
+
+import contextlib
+import contextvars
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.agent_events import AgentExecutionStartedEvent
+
+from GS.crew_ai.llm.prefix_cache import PrefixCachingLLM, llm_from_config
+
+FINAL_ANSWER = 'Final Answer:'
+VALIDATORS = ('min_length', 'max_length', 'json', 'required_keys', 'pattern', 'confidence')
+_CONFIDENCE = re.compile(r'^\s*\**confidence\**\s*[:=]\s*([01](?:\.\d+)?)\s*$', re.IGNORECASE | re.MULTILINE)
+CONFIDENCE_INSTRUCTION = ("When you give your Final Answer, end it with a separate line "
+                          "'Confidence: <number between 0 and 1>' rating how well the answer meets the task.")
+
+_current_log: contextvars.ContextVar = contextvars.ContextVar('routing_log', default=None)
+# Name of the task the agent in this context is working on
+_current_task: contextvars.ContextVar = contextvars.ContextVar('routing_task', default=None)
+
+
+@crewai_event_bus.on(AgentExecutionStartedEvent)
+def _track_task(source, event):
+    # Emitted in the thread running the task, before the agent's first LLM call
+    _current_task.set(getattr(event.task, 'name', None))
+
+
+class ModelLatency:
+    """Running average latency per model, used to estimate the time a cascade saves."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._averages: Dict[str, float] = {}
+
+    def observe(self, model: str, seconds: float):
+        with self._lock:
+            previous = self._averages.get(model)
+            self._averages[model] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def get(self, model: str) -> Optional[float]:
+        with self._lock:
+            return self._averages.get(model)
+
+
+model_latency = ModelLatency()
+
+
+@dataclass
+class RoutingLog:
+    """Routing decisions of one run, grouped by task."""
+
+    tasks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, task: str, model: str, stage: int, escalations: List[Dict[str, Any]],
+               latency: float, saved: Optional[float]):
+        with self._lock:
+            entry = self.tasks.setdefault(task, {
+                'calls': 0, 'answered_by': {}, 'escalations': 0, 'reasons': {},
+                'latency_ms': 0.0, 'estimated_saved_ms': 0.0,
+            })
+            entry['calls'] += 1
+            entry['answered_by'][model] = entry['answered_by'].get(model, 0) + 1
+            entry['escalations'] += len(escalations)
+            for escalation in escalations:
+                for reason in escalation['reasons']:
+                    entry['reasons'][reason] = entry['reasons'].get(reason, 0) + 1
+            entry['latency_ms'] = round(entry['latency_ms'] + latency * 1000, 1)
+            if saved is not None:
+                entry['estimated_saved_ms'] = round(entry['estimated_saved_ms'] + saved * 1000, 1)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(self.tasks))
+
+
+@contextlib.contextmanager
+def routing_run() -> Iterator[RoutingLog]:
+    """Collect the routing decisions of the cascades called in this context."""
+    log = RoutingLog()
+    token = _current_log.set(log)
+    try:
+        yield log
+    finally:
+        _current_log.reset(token)
+
+
+def final_answer(text: str) -> Optional[str]:
+    """The final answer of a ReAct response, None for tool-use steps."""
+    if FINAL_ANSWER not in text:
+        return None
+    return text.split(FINAL_ANSWER, 1)[1].strip()
+
+
+def validate(answer: str, validators: Dict[str, Any]) -> List[str]:
+    """Check a final answer, returning the names of the validators it fails."""
+    failures = []
+    body = _CONFIDENCE.sub('', answer).strip()
+    if 'min_length' in validators and len(body) < validators['min_length']:
+        failures.append('min_length')
+    if 'max_length' in validators and len(body) > validators['max_length']:
+        failures.append('max_length')
+    if validators.get('json') or validators.get('required_keys'):
+        candidate = re.sub(r'^```(?:json)?\s*|\s*```$', '', body)
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            failures.append('json')
+        else:
+            missing = [key for key in validators.get('required_keys') or []
+                       if not isinstance(parsed, dict) or key not in parsed]
+            if missing:
+                failures.append('required_keys')
+    if 'pattern' in validators and not re.search(validators['pattern'], body, re.MULTILINE):
+        failures.append('pattern')
+    if 'confidence' in validators:
+        match = _CONFIDENCE.search(answer)
+        if not match or float(match.group(1)) < validators['confidence']:
+            failures.append('confidence')
+    return failures
+
+
+@dataclass
+class Stage:
+    llm: PrefixCachingLLM
+    validators: Dict[str, Any]
+
+
+class CascadeLLM(PrefixCachingLLM):
+    """LLM that tries a sequence of models, escalating when validators fail."""
+
+    def __init__(self, stages: List[Stage], task_name: str = ''):
+        """Initialize the cascade.
+
+        Args:
+            stages: The models to try, cheapest first
+            task_name: Task the routing decisions are recorded under
+        """
+        if not stages:
+            raise ValueError("A model cascade needs at least one stage")
+        first = stages[0].llm
+        super().__init__(model=first.model, temperature=first.temperature)
+        self.stages = stages
+        self.task_name = task_name
+
+    def supports_stop_words(self) -> bool:
+        return all(stage.llm.supports_stop_words() for stage in self.stages)
+
+    def get_context_window_size(self) -> int:
+        # The agent has to fit the smallest window of the models it may end up on
+        return min(stage.llm.get_context_window_size() for stage in self.stages)
+
+    def call(
+        self,
+        messages: Union[str, List[Dict[str, str]]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+    ) -> Union[str, Any]:
+        if isinstance(messages, str):
+            messages = [{'role': 'user', 'content': messages}]
+        escalations = []
+        started = time.perf_counter()
+        last = len(self.stages) - 1
+        for index, stage in enumerate(self.stages):
+            # The agent executor sets its stop words on the LLM it was given
+            stage.llm.stop = list(self.stop)
+            stage_messages = messages
+            if index < last and 'confidence' in stage.validators:
+                # Appended last so the cached prompt prefix stays the same
+                stage_messages = messages + [{'role': 'user', 'content': CONFIDENCE_INSTRUCTION}]
+            stage_started = time.perf_counter()
+            response = stage.llm.call(stage_messages, tools, callbacks, available_functions)
+            model_latency.observe(stage.llm.model, time.perf_counter() - stage_started)
+
+            answer = final_answer(response) if isinstance(response, str) else None
+            if index < last and answer is not None:
+                failures = validate(answer, stage.validators)
+                if failures:
+                    escalations.append({'model': stage.llm.model, 'reasons': failures})
+                    continue
+            if isinstance(response, str) and answer is not None:
+                response = _CONFIDENCE.sub('', response).rstrip()
+            self._record(stage.llm.model, index, escalations, time.perf_counter() - started)
+            return response
+        raise RuntimeError("Model cascade finished without an answer")
+
+    def _record(self, model: str, stage: int, escalations: List[Dict[str, Any]], latency: float):
+        log = _current_log.get()
+        if log is None:
+            return
+        saved = None
+        top = model_latency.get(self.stages[-1].llm.model)
+        if stage < len(self.stages) - 1 and top is not None:
+            saved = top - latency
+        log.record(self.task_name or 'unnamed', model, stage, escalations, latency, saved)
+
+
+class TaskRoutedLLM(PrefixCachingLLM):
+    """LLM of an agent whose tasks use different models, calling the one of the running task."""
+
+    def __init__(self, routes: Dict[str, PrefixCachingLLM], default: PrefixCachingLLM):
+        """Initialize the router.
+
+        Args:
+            routes: The LLM of each task name, usually its cascade
+            default: The LLM of the agent's other tasks
+        """
+        super().__init__(model=default.model, temperature=default.temperature)
+        self.routes = routes
+        self.default = default
+
+    def _targets(self) -> List[PrefixCachingLLM]:
+        return [self.default, *self.routes.values()]
+
+    def target(self) -> PrefixCachingLLM:
+        return self.routes.get(_current_task.get(), self.default)
+
+    def supports_stop_words(self) -> bool:
+        return all(llm.supports_stop_words() for llm in self._targets())
+
+    def get_context_window_size(self) -> int:
+        return min(llm.get_context_window_size() for llm in self._targets())
+
+    def call(
+        self,
+        messages: Union[str, List[Dict[str, str]]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+    ) -> Union[str, Any]:
+        target = self.target()
+        # The agent executor sets its stop words on the LLM it was given
+        target.stop = list(self.stop)
+        return target.call(messages, tools, callbacks, available_functions)
+
+
+def cascade_from_config(cascade: List[Dict[str, Any]], base_config: Dict[str, Any],
+                        task_name: str = '') -> CascadeLLM:
+    """Create a cascade from the `model_cascade` list of a task.
+
+    Args:
+        cascade: The stages, each with model settings and validators
+        base_config: The agent's `llm` config the stages inherit from
+        task_name: Task the routing decisions are recorded under
+
+    Returns:
+        The cascade LLM
+    """
+    stages = []
+    for stage_config in cascade:
+        unknown = set(stage_config) - set(VALIDATORS) - {'provider', 'model_name', 'temperature'}
+        if unknown:
+            raise ValueError(f"Unknown keys in model cascade of {task_name}: {', '.join(sorted(unknown))}")
+        llm_config = {**base_config, **{key: value for key, value in stage_config.items() if key not in VALIDATORS}}
+        validators = {key: value for key, value in stage_config.items() if key in VALIDATORS}
+        stages.append(Stage(llm=llm_from_config(llm_config), validators=validators))
+    return CascadeLLM(stages, task_name=task_name)
+
+
+def cascade_for_agent(agent_name: str, agents_config: Dict[str, Any], tasks_config: Dict[str, Any],
+                      default_llm: Optional[PrefixCachingLLM] = None) -> Optional[PrefixCachingLLM]:
+    """The LLM routing an agent's calls through the cascades its tasks declare, if any.
+
+    Args:
+        agent_name: Name of the agent in the agents YAML
+        agents_config: Configuration for crew agents
+        tasks_config: Configuration for crew tasks
+        default_llm: LLM of the agent's tasks without a cascade when the
+            agent has no `llm` config and there is no `llm_config`
+
+    Returns:
+        The task's cascade when the agent has a single task, a TaskRoutedLLM
+        when its tasks differ, None when none of them declares a cascade
+    """
+    agent_config = agents_config.get(agent_name, {})
+    base_config = agent_config.get('llm') or agents_config.get('llm_config', {})
+    task_names = [task_name for task_name, task_config in tasks_config.items()
+                  if isinstance(task_config, dict) and task_config.get('agent') == agent_name]
+    routes = {
+        task_name: cascade_from_config(tasks_config[task_name]['model_cascade'], base_config, task_name=task_name)
+        for task_name in task_names if tasks_config[task_name].get('model_cascade')
+    }
+    if not routes:
+        return None
+    if len(task_names) == 1:
+        return routes[task_names[0]]
+    if base_config or default_llm is None:
+        default_llm = llm_from_config(base_config)
+    return TaskRoutedLLM(routes, default_llm)
@@ -0,0 +1,325 @@
+"""Fit upstream task outputs into a token budget before they reach a prompt.
+
+`report_generation_task` receives the full outputs of the analysis and
+research tasks as context, and the summary crew receives the whole analysis
+report, so prompts grow with every report. The compactor measures text with
+tiktoken and, when it is over budget:
+
+1. keeps the key sections (summary, findings, recommendations, ...)
+   verbatim, up to `KEEP_SHARE` of the budget,
+2. compresses the other sections into what is left, either with a cheaper
+   summarization model when `CONTEXT_SUMMARIZER_MODEL` is set or by
+   extractive selection: the sentences and bullets carrying the document's
+   most frequent terms and numbers, in their original order.
+
+Several outputs share one budget fairly: short outputs are kept whole and the
+rest is split evenly between the long ones.
+"""
+
+import functools
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from crewai import Crew, Task
+from pydantic import PrivateAttr
+
+from GS.workflow_engine.helper_classes.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+KEEP_SHARE = 0.6
+OMISSION = '[...]'
+# Separator crewai puts between task outputs
+DIVIDER = '\n\n----------\n\n'
+
+_HEADING = re.compile(r'^(#{1,6}\s+\S.*|\*\*[^*\n]{1,80}\*\*:?|[A-Z][A-Za-z0-9 ,/&()-]{1,60}:)\s*$', re.MULTILINE)
+_SENTENCE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"(\[])')
+_BULLET = re.compile(r'^\s*([-*+•]|\d+[.)])\s+')
+_WORD = re.compile(r'[a-z][a-z0-9_]{2,}')
+_STOPWORDS = frozenset(
+    'the and for are but not you all any can had her was one our out has have this that with from they '
+    'will would there their what which when where who how been were also into than then them these those '
+    'such its more most other some very over only just about each may might should could between while'.split()
+)
+
+
+def _settings():
+    # Imported on use, so importing the crews does not load the workflow engine configuration
+    from GS.workflow_engine.configs import ContextCompaction
+    return ContextCompaction
+
+
+@functools.lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # Offline boxes cannot download the encoding, count approximately instead
+        logger.warning("Token encoding %s unavailable, estimating token counts: %s", name, e)
+        return None
+
+
+def count_tokens(text: str, encoding: Optional[str] = None) -> int:
+    """Number of tokens in a text, estimated from its length when tiktoken is unavailable."""
+    if not text:
+        return 0
+    enc = _encoding(encoding or _settings().ENCODING)
+    if enc is None:
+        return math.ceil(len(text) / 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, tokens: int, encoding: Optional[str] = None) -> str:
+    """Cut a text down to its first `tokens` tokens."""
+    enc = _encoding(encoding or _settings().ENCODING)
+    if enc is None:
+        return text[:tokens * 4]
+    return enc.decode(enc.encode(text, disallowed_special=())[:tokens])
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """Split a report into (heading, body) pairs, the first heading may be empty."""
+    sections = []
+    last_heading, last_end = '', 0
+    for match in _HEADING.finditer(text):
+        body = text[last_end:match.start()]
+        if last_heading or body.strip():
+            sections.append((last_heading, body))
+        last_heading, last_end = match.group(0), match.end()
+    sections.append((last_heading, text[last_end:]))
+    return sections
+
+
+def _units(body: str) -> List[str]:
+    """Bullets and sentences of a section body, the units extractive selection picks from."""
+    units = []
+    for paragraph in re.split(r'\n\s*\n', body):
+        lines = [line for line in paragraph.splitlines() if line.strip()]
+        if lines and all(_BULLET.match(line) or line.lstrip().startswith('|') for line in lines):
+            units.extend(lines)
+        elif lines:
+            units.extend(sentence for sentence in _SENTENCE.split(' '.join(line.strip() for line in lines))
+                         if sentence)
+    return units
+
+
+def allocate(sizes: Sequence[int], budget: int) -> List[int]:
+    """Split a budget fairly: small items get what they need, large ones share the rest evenly."""
+    shares = [0] * len(sizes)
+    remaining = budget
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while pending:
+        fair = remaining // len(pending)
+        index = pending.pop(0)
+        shares[index] = min(sizes[index], fair)
+        remaining -= shares[index]
+    return shares
+
+
+class ContextCompactor:
+    """Compact texts to token budgets, keeping key sections verbatim."""
+
+    def __init__(self, encoding: Optional[str] = None, keep_sections: Optional[str] = None,
+                 summarizer: Optional[Callable[[str, int], str]] = None):
+        """Initialize the compactor.
+
+        Args:
+            encoding: tiktoken encoding used to measure texts, CONTEXT_TOKEN_ENCODING when None
+            keep_sections: Regular expression of section headings kept verbatim,
+                CONTEXT_KEEP_SECTIONS when None
+            summarizer: Optional callable (text, max_tokens) -> summary used for
+                the sections that are not kept, extractive selection when None
+        """
+        settings = _settings()
+        encoding = encoding or settings.ENCODING
+        keep_sections = settings.KEEP_SECTIONS if keep_sections is None else keep_sections
+        self.encoding = encoding
+        self.keep = re.compile(keep_sections, re.IGNORECASE) if keep_sections else None
+        self.summarizer = summarizer
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.encoding)
+
+    def extract(self, text: str, budget: int, terms: Optional[Counter] = None) -> str:
+        """Select the most informative sentences and bullets of a text within a budget."""
+        if budget <= 0:
+            return ''
+        if self.count(text) <= budget:
+            return text
+        units = _units(text)
+        terms = terms if terms is not None else Counter(
+            word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS)
+        scored = []
+        for position, unit in enumerate(units):
+            words = {word for word in _WORD.findall(unit.lower()) if word not in _STOPWORDS}
+            score = sum(math.log1p(terms[word]) for word in words) / math.sqrt(len(words) + 1)
+            # Figures and the opening sentence usually carry the point of a section
+            score += 1.0 if re.search(r'\d', unit) else 0.0
+            score += 0.5 if position == 0 else 0.0
+            scored.append((score, position, unit, self.count(unit) + 1))
+
+        # Every picked unit may open a gap, so it is charged for an omission marker too
+        marker = self.count(OMISSION) + 1
+        chosen, used = [], marker
+        for score, position, unit, tokens in sorted(scored, key=lambda item: (-item[0], item[1])):
+            if used + tokens + marker <= budget:
+                chosen.append(position)
+                used += tokens + marker
+        while chosen:
+            result = self._join(units, sorted(chosen))
+            if self.count(result) <= budget:
+                return result
+            # Joining can merge tokens differently, drop the weakest pick until it fits
+            chosen.pop()
+        return truncate_tokens(text, budget, self.encoding)
+
+    @staticmethod
+    def _join(units: List[str], positions: List[int]) -> str:
+        parts, previous = [], -1
+        for position in positions:
+            if position != previous + 1:
+                parts.append(OMISSION)
+            parts.append(units[position])
+            previous = position
+        if previous != len(units) - 1:
+            parts.append(OMISSION)
+        return '\n'.join(parts)
+
+    def _compress(self, sections: List[Tuple[str, str]], budget: int, terms: Counter) -> List[str]:
+        """Compress the bodies of the sections that are not kept into a shared budget."""
+        bodies = [body for _, body in sections]
+        if self.summarizer and budget > 0:
+            joined = '\n\n'.join(heading + body for heading, body in sections)
+            try:
+                summary = self.summarizer(joined, budget)
+                if self.count(summary) > budget:
+                    summary = self.extract(summary, budget)
+                # One summary replaces all of them, placed where the first one was
+                return [summary] + [''] * (len(sections) - 1)
+            except Exception as e:
+                logger.warning("Context summarizer failed, falling back to extraction: %s", e)
+        shares = allocate([self.count(body) for body in bodies], budget)
+        return [self.extract(body, share, terms) for body, share in zip(bodies, shares)]
+
+    def compact(self, text: str, budget: int) -> str:
+        """Fit a text into `budget` tokens.
+
+        Args:
+            text: The upstream output
+            budget: Maximum number of tokens of the result
+
+        Returns:
+            The text itself when it fits, the compacted text otherwise
+        """
+        if not text or self.count(text) <= budget:
+            return text
+        sections = split_sections(text)
+        terms = Counter(word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS)
+        headings = sum(self.count(heading) + 1 for heading, _ in sections)
+        available = max(budget - headings, 0)
+
+        kept = [i for i, (heading, _) in enumerate(sections) if self.keep and heading and self.keep.search(heading)]
+        rest = [i for i in range(len(sections)) if i not in kept]
+        bodies = {}
+        if kept:
+            cap = int(available * KEEP_SHARE) if rest else available
+            kept_sizes = [self.count(sections[i][1]) for i in kept]
+            if sum(kept_sizes) <= cap:
+                bodies.update({i: sections[i][1] for i in kept})
+            else:
+                for i, share in zip(kept, allocate(kept_sizes, cap)):
+                    bodies[i] = self.extract(sections[i][1], share, terms)
+        if not rest:
+            return self._assemble(sections, bodies, budget)
+        used = sum(self.count(body) for body in bodies.values())
+        remaining = available - used
+        for _ in range(3):
+            bodies.update(zip(rest, self._compress([sections[i] for i in rest], remaining, terms)))
+            result = self._assemble(sections, bodies)
+            overflow = self.count(result) - budget
+            if overflow <= 0:
+                return result
+            # Separators and headings cost a little more than estimated, take it from the rest
+            remaining -= overflow
+        return self._assemble(sections, bodies, budget)
+
+    def _assemble(self, sections: List[Tuple[str, str]], bodies: Dict[int, str], budget: int = 0) -> str:
+        parts = []
+        for i, (heading, _) in enumerate(sections):
+            body = bodies[i].strip()
+            if heading or body:
+                parts.append(f'{heading}\n{body}' if heading else body)
+        result = '\n\n'.join(parts)
+        if budget and self.count(result) > budget:
+            result = truncate_tokens(result, budget, self.encoding)
+        return result
+
+    def compact_many(self, texts: Sequence[str], budget: int, separator: str = DIVIDER) -> str:
+        """Fit several outputs into one budget and join them like crewai does."""
+        texts = [text for text in texts if text]
+        if not texts:
+            return ''
+        overhead = self.count(separator) * (len(texts) - 1)
+        shares = allocate([self.count(text) for text in texts], max(budget - overhead, 0))
+        return separator.join(self.compact(text, share) for text, share in zip(texts, shares))
+
+
+def _llm_summarizer(model: str) -> Callable[[str, int], str]:
+    """Summarize with a cheaper model through the crews' LLM layer."""
+    from GS.crew_ai.llm.prefix_cache import PrefixCachingLLM
+
+    def summarize(text: str, max_tokens: int) -> str:
+        llm = PrefixCachingLLM(model=model, temperature=0, max_tokens=max_tokens)
+        return llm.call([
+            {'role': 'system', 'content': 'Condense the report sections you are given. Keep every figure, '
+                                          'finding and recommendation, drop repetition and narrative. '
+                                          f'Answer in at most {max_tokens} tokens.'},
+            {'role': 'user', 'content': text},
+        ])
+    return summarize
+
+
+class CompactingCrew(Crew):
+    """Crew that compacts the context each task receives to the task's token budget.
+
+    crewai asks for the context right before it executes each task, which
+    also makes it where a cancelled run stops between tasks.
+    """
+
+    _context_budgets: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    def set_context_budgets(self, budgets: Dict[str, int]) -> 'CompactingCrew':
+        self._context_budgets = dict(budgets)
+        return self
+
+    def _get_context(self, task: Task, task_outputs):
+        check_cancelled()
+        budget = self._context_budgets.get(task.name or '', _settings().TASK_TOKEN_BUDGET)
+        if task.context:
+            outputs = [item.output.raw for item in task.context if item.output]
+        else:
+            outputs = [output.raw for output in task_outputs]
+        if not budget:
+            return DIVIDER.join(outputs)
+        return get_context_compactor().compact_many(outputs, budget)
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def get_context_compactor() -> ContextCompactor:
+    """Return the process-wide context compactor."""
+    global _compactor
+    if _compactor is None:
+        with _compactor_lock:
+            if _compactor is None:
+                model = _settings().SUMMARIZER_MODEL
+                summarizer = _llm_summarizer(model) if model else None
+                _compactor = ContextCompactor(summarizer=summarizer)
+    return _compactor
@@ -0,0 +1,337 @@
+"""Hedged, deadline-aware LLM requests.
+
+A few LLM calls stall for a long time before their first token and dominate
+the tail latency of a run. Requests are therefore streamed: when no token
+has arrived after the `PERCENTILE` of recent first-token times for the
+model, a duplicate is sent, to the same model or to the fallback provider,
+and whichever starts answering first is kept. The other request is
+cancelled, which closes its connection. The winner's chunks are assembled
+into a regular response, so usage accounting and tool calls work as without
+hedging.
+
+Until a model has `MIN_SAMPLES` first-token times the threshold is
+`INITIAL_DELAY_SECONDS`, and at most `MAX_HEDGE_RATIO` of requests are
+hedged so a struggling provider does not receive twice the load.
+
+`llm_deadline` bounds everything called in its context: requests get the
+remaining time as their timeout, hedges are not sent past it and calls
+after it raise `LLMDeadlineExceeded` without reaching the provider.
+
+Requests of a cancellable run (see `cancellation`) check its token before
+they are sent and are made asynchronously, hedged or not, so that the token
+firing cancels them and closes their connections right away.
+
+Asynchronous requests run on one event loop in a background thread, started
+on first use, so litellm's clients and their connections are reused from one
+call to the next.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+import litellm
+
+from GS.workflow_engine.helper_classes.cancellation import CancellationToken, check_cancelled, current_token
+
+logger = logging.getLogger(__name__)
+
+# Model used for the fallback provider when LLM_HEDGE_FALLBACK_MODEL is not set
+FALLBACK_MODELS = {'openai': 'gpt-4-turbo', 'anthropic': 'claude-3-5-sonnet-20241022'}
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('llm_deadline', default=None)
+
+
+def _settings():
+    # Imported on use, so importing the crews does not load the workflow engine configuration
+    from GS.workflow_engine.configs import LLMHedging
+    return LLMHedging
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The deadline of the run ended before the LLM answered."""
+
+
+@contextlib.contextmanager
+def llm_deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Bound the LLM calls made in this context to `seconds` from now.
+
+    Nested deadlines can only shorten the one around them, None or 0 keeps it.
+    """
+    current = _deadline.get()
+    deadline = current
+    if seconds:
+        deadline = time.monotonic() + float(seconds)
+        if current is not None:
+            deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left until the current deadline, None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class FirstTokenLatency:
+    """Recent first-token times per model and the hedging threshold derived from them."""
+
+    def __init__(self, percentile: Optional[float] = None, window: Optional[int] = None,
+                 min_samples: Optional[int] = None, initial: Optional[float] = None,
+                 minimum: Optional[float] = None, maximum: Optional[float] = None):
+        """Initialize the tracker, arguments left None take their LLM_HEDGE_* setting."""
+        settings = _settings()
+        self.percentile = settings.PERCENTILE if percentile is None else percentile
+        self.window = settings.WINDOW if window is None else window
+        self.min_samples = settings.MIN_SAMPLES if min_samples is None else min_samples
+        self.initial = settings.INITIAL_DELAY_SECONDS if initial is None else initial
+        self.minimum = settings.MIN_DELAY_SECONDS if minimum is None else minimum
+        self.maximum = settings.MAX_DELAY_SECONDS if maximum is None else maximum
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._sorted: Dict[str, List[float]] = {}
+
+    def observe(self, model: str, seconds: float):
+        with self._lock:
+            samples = self._samples.setdefault(model, deque())
+            ordered = self._sorted.setdefault(model, [])
+            samples.append(seconds)
+            bisect.insort(ordered, seconds)
+            if len(samples) > self.window:
+                ordered.pop(bisect.bisect_left(ordered, samples.popleft()))
+
+    def threshold(self, model: str) -> float:
+        with self._lock:
+            ordered = self._sorted.get(model) or []
+            if len(ordered) < self.min_samples:
+                return self.initial
+            value = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+        return min(max(value, self.minimum), self.maximum)
+
+
+class HedgeBudget:
+    """Allow hedging at most `ratio` of the requests, plus a small burst."""
+
+    def __init__(self, ratio: Optional[float] = None, burst: int = 2):
+        self.ratio = _settings().MAX_HEDGE_RATIO if ratio is None else ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges >= self.ratio * self.requests + self.burst:
+                return False
+            self.hedges += 1
+            return True
+
+
+# Created on first use from the settings, benchmarks replace them with their own
+first_token_latency: Optional[FirstTokenLatency] = None
+hedge_budget: Optional[HedgeBudget] = None
+_trackers_lock = threading.Lock()
+
+
+def _trackers():
+    """The process-wide first-token latencies and hedge budget."""
+    global first_token_latency, hedge_budget
+    with _trackers_lock:
+        if first_token_latency is None:
+            first_token_latency = FirstTokenLatency()
+        if hedge_budget is None:
+            hedge_budget = HedgeBudget()
+        return first_token_latency, hedge_budget
+
+
+async def _open_stream(params: Dict[str, Any]):
+    """Start a streamed request and wait for its first chunk."""
+    started = time.monotonic()
+    stream = await litellm.acompletion(**params)
+    try:
+        first = await stream.__anext__()
+    except BaseException:
+        await _close(stream)
+        raise
+    return stream, first, time.monotonic() - started
+
+
+async def _close(stream):
+    close = getattr(getattr(stream, 'completion_stream', None), 'aclose', None)
+    if close:
+        with contextlib.suppress(Exception):
+            await close()
+
+
+async def _cancel(task: asyncio.Task):
+    """Cancel a losing request and close its stream if it had one."""
+    task.cancel()
+    with contextlib.suppress(BaseException):
+        stream, _, _ = await task
+        await _close(stream)
+
+
+def _with_timeout(params: Dict[str, Any], remaining: Optional[float]) -> Dict[str, Any]:
+    params = {**params, 'stream': True, 'stream_options': {'include_usage': True}}
+    if remaining is not None:
+        params['timeout'] = min(params.get('timeout') or remaining, remaining)
+    return params
+
+
+async def _hedged(primary: Dict[str, Any], hedge: Optional[Dict[str, Any]], delay: float,
+                  deadline: Optional[float]) -> Dict[str, Any]:
+    def left() -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    latency, budget = _trackers()
+    tasks = {asyncio.ensure_future(_open_stream(_with_timeout(primary, left()))): primary}
+    hedged = False
+    try:
+        wait = delay if left() is None else min(delay, max(left(), 0))
+        done, _ = await asyncio.wait(set(tasks), timeout=wait)
+        if not done and hedge is not None and (left() is None or left() > 0) and budget.try_hedge():
+            hedged = True
+            logger.info("No first token from %s after %.1fs, hedging to %s", primary['model'], delay, hedge['model'])
+            tasks[asyncio.ensure_future(_open_stream(_with_timeout(hedge, left())))] = hedge
+
+        winner, errors = None, []
+        pending = set(tasks)
+        while pending and winner is None:
+            timeout = left()
+            if timeout is not None and timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None and winner is None:
+                    winner = task
+                elif task.exception() is not None:
+                    errors.append(task.exception())
+        for task in pending:
+            await _cancel(task)
+        if winner is None:
+            if errors:
+                raise errors[0]
+            raise LLMDeadlineExceeded(f"No answer from {primary['model']} before the deadline")
+
+        stream, first, ttft = winner.result()
+        params = tasks[winner]
+        latency.observe(params['model'], ttft)
+        chunks = [first]
+
+        async def collect():
+            async for chunk in stream:
+                chunks.append(chunk)
+        try:
+            await asyncio.wait_for(collect(), timeout=left())
+        except asyncio.TimeoutError:
+            await _close(stream)
+            raise LLMDeadlineExceeded(f"{params['model']} did not finish before the deadline")
+        response = litellm.stream_chunk_builder(chunks, messages=params['messages'])
+        return {'response': response, 'params': params, 'hedged': hedged, 'ttft': ttft}
+    finally:
+        for task in tasks:
+            if not task.done():
+                await _cancel(task)
+
+
+async def _abortable(coroutine, token: Optional[CancellationToken]):
+    """Await a request, cancelling it when the run's token fires."""
+    if token is None:
+        return await coroutine
+    task = asyncio.ensure_future(coroutine)
+    loop = asyncio.get_running_loop()
+    remove = token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await task
+    except (asyncio.CancelledError, LLMDeadlineExceeded):
+        # Raises TaskCancelled when the token fired or the run's deadline passed
+        token.check()
+        raise
+    finally:
+        remove()
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """The event loop requests run on, in a daemon thread started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-requests', daemon=True).start()
+        return _loop
+
+
+def _run(coroutine, token: Optional[CancellationToken] = None):
+    """Run a coroutine to completion from synchronous code, even inside a running loop."""
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # Waiting for the loop from its own thread would block it forever
+        coroutine.close()
+        raise RuntimeError("Synchronous LLM calls cannot be made from the request loop")
+    # Flows call crews from their own event loop, which keeps running meanwhile
+    return asyncio.run_coroutine_threadsafe(_abortable(coroutine, token), loop).result()
+
+
+def hedged_completion(primary: Dict[str, Any], hedge: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Complete a request, hedging it when the first token is late.
+
+    Args:
+        primary: Parameters of the litellm completion call
+        hedge: Parameters of the duplicate request, the primary's when None
+
+    Returns:
+        A dictionary with the response, the parameters of the request that
+        won, whether a hedge was sent and the first-token time
+
+    Raises:
+        LLMDeadlineExceeded: When the deadline of the context ends first
+        TaskCancelled: When the run is cancelled or passes its own deadline
+    """
+    check_cancelled()
+    deadline = _deadline.get()
+    if deadline is not None and deadline <= time.monotonic():
+        raise LLMDeadlineExceeded("The deadline of the run has passed")
+    latency, budget = _trackers()
+    budget.request()
+    delay = latency.threshold(primary['model'])
+    return _run(_hedged(primary, hedge if hedge is not None else primary, delay, deadline), current_token())
+
+
+def completion(primary: Dict[str, Any], hedge: Optional[Dict[str, Any]] = None):
+    """The completion call of the crews' LLMs, hedged when enabled."""
+    if _settings().ENABLED and not primary.get('stream'):
+        return hedged_completion(primary, hedge)['response']
+    check_cancelled()
+    remaining = remaining_time()
+    if remaining is not None:
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("The deadline of the run has passed")
+        primary = {**primary, 'timeout': min(primary.get('timeout') or remaining, remaining)}
+    token = current_token()
+    if token is not None and not primary.get('stream'):
+        return _run(litellm.acompletion(**primary), token)
+    return litellm.completion(**primary)
@@ -0,0 +1,189 @@
+"""Keep the static part of agent prompts first so providers can cache it.
+
+Every call an agent makes starts with the same system message: its role, goal
+and backstory from the agents YAML plus the descriptions of its tools. Both
+providers can skip re-processing such a prefix, as long as it is byte for
+byte identical and comes before anything that changes:
+
+- OpenAI caches prompt prefixes of 1024 tokens and more on its own, stable
+  ordering is all it needs.
+- Anthropic caches up to an explicit breakpoint, so the last static message
+  gets a `cache_control` block. Prefixes shorter than the model's minimum
+  are simply not cached.
+
+Cache hits show up as `cached_prompt_tokens` in the crew's token usage, which
+crewai reads from the provider's `prompt_tokens_details.cached_tokens`. The
+requests themselves are sent through `hedging`, by overriding crewai's
+private completion handler. Where crewai's handler does not have the
+signature the override was written for (crewai 0.108), crewai's own is kept
+and requests are neither hedged nor deadline bound.
+"""
+
+import inspect
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from crewai import LLM
+from crewai.llm import LLMCallType
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+# Parameters of crewai's LLM._handle_non_streaming_response the override replaces
+HANDLER_PARAMETERS = ['self', 'params', 'callbacks', 'available_functions']
+
+
+def arrange_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Move system messages to the front, keeping the order within each group."""
+    system = [message for message in messages if message.get('role') == 'system']
+    if not system or messages[:len(system)] == system:
+        return messages
+    return system + [message for message in messages if message.get('role') != 'system']
+
+
+def static_prefix(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The leading system messages, the part of a prompt that is the same on every call."""
+    prefix = []
+    for message in messages:
+        if message.get('role') != 'system':
+            # Anthropic formatting puts a placeholder user turn before the system prompt
+            if not prefix and message.get('content') == '.':
+                continue
+            break
+        prefix.append(message)
+    return prefix
+
+
+def _mark_breakpoint(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Put an Anthropic cache breakpoint on the last message of the static prefix."""
+    prefix = static_prefix(messages)
+    if not prefix:
+        return messages
+    last = prefix[-1]
+    content = last['content']
+    if isinstance(content, str):
+        content = [{'type': 'text', 'text': content, 'cache_control': CACHE_CONTROL}]
+    else:
+        content = [dict(block) for block in content]
+        content[-1]['cache_control'] = CACHE_CONTROL
+    # Copy instead of editing in place, the executor keeps reusing its messages
+    return [dict(message, content=content) if message is last else message for message in messages]
+
+
+def _plain_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Undo the provider formatting of prepared messages, to prepare them for another provider."""
+    plain = []
+    for message in messages:
+        if not plain and message.get('role') == 'user' and message.get('content') == '.':
+            continue
+        content = message['content']
+        if isinstance(content, list) and all(block.get('type') == 'text' for block in content):
+            content = ''.join(block['text'] for block in content)
+        plain.append(dict(message, content=content))
+    return plain
+
+
+_fallbacks: Dict[tuple, 'PrefixCachingLLM'] = {}
+
+
+class PrefixCachingLLM(LLM):
+    """crewai LLM that sends the static prompt prefix first and marks it cacheable.
+
+    Requests go through `hedging.completion`, which hedges slow requests and
+    enforces the deadline of the run.
+    """
+
+    def _prepare_completion_params(
+        self,
+        messages: Union[str, List[Dict[str, str]]],
+        tools: Optional[List[dict]] = None,
+    ) -> Dict[str, Any]:
+        if not isinstance(messages, str):
+            messages = arrange_messages(messages)
+        params = super()._prepare_completion_params(messages, tools)
+        if self.is_anthropic:
+            params['messages'] = _mark_breakpoint(params['messages'])
+        return params
+
+    def _hedge_params(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Parameters of the duplicate request, for the fallback provider when one is configured."""
+        from GS.workflow_engine.configs import LLMHedging
+        from GS.crew_ai.llm.hedging import FALLBACK_MODELS
+
+        provider = LLMHedging.FALLBACK_PROVIDER
+        if not provider:
+            return None
+        model_name = LLMHedging.FALLBACK_MODEL or FALLBACK_MODELS.get(provider, FALLBACK_MODELS['openai'])
+        key = (provider, model_name, self.temperature)
+        fallback = _fallbacks.get(key)
+        if fallback is None:
+            fallback = _fallbacks.setdefault(key, llm_from_config(
+                {'provider': provider, 'model_name': model_name, 'temperature': self.temperature}))
+        if fallback.model == self.model:
+            return None
+        hedge = fallback._prepare_completion_params(_plain_messages(params['messages']), params.get('tools'))
+        # The executor set its stop words on this LLM only
+        if self.stop and fallback.supports_stop_words():
+            hedge['stop'] = list(self.stop)
+        return hedge
+
+    def _handle_non_streaming_response(
+        self,
+        params: Dict[str, Any],
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Same as crewai's, with the completion call going through the hedging layer."""
+        from GS.crew_ai.llm.hedging import completion
+
+        response = completion(params, self._hedge_params(params))
+        response_message = response.choices[0].message
+        text_response = response_message.content or ""
+
+        for callback in callbacks or []:
+            usage_info = getattr(response, "usage", None)
+            if hasattr(callback, "log_success_event") and usage_info:
+                callback.log_success_event(
+                    kwargs=params,
+                    response_obj={"usage": usage_info},
+                    start_time=0,
+                    end_time=0,
+                )
+
+        tool_calls = getattr(response_message, "tool_calls", [])
+        if tool_calls and available_functions:
+            tool_result = self._handle_tool_call(tool_calls, available_functions)
+            if tool_result is not None:
+                return tool_result
+        self._handle_emit_call_events(text_response, LLMCallType.LLM_CALL)
+        return text_response
+
+
+def overrides_handler() -> bool:
+    """Whether crewai's completion handler is the one `PrefixCachingLLM` was written against."""
+    handler = getattr(LLM, '_handle_non_streaming_response', None)
+    return handler is not None and list(inspect.signature(handler).parameters) == HANDLER_PARAMETERS
+
+
+if not overrides_handler():
+    logger.warning("This crewai version changed LLM._handle_non_streaming_response, "
+                   "LLM requests are sent without hedging or deadlines")
+    del PrefixCachingLLM._handle_non_streaming_response
+
+
+def llm_from_config(config: Dict[str, Any]) -> PrefixCachingLLM:
+    """Create the LLM of an agent from its YAML configuration.
+
+    Args:
+        config: The `llm` or `llm_config` section, with provider, model_name
+            and temperature
+
+    Returns:
+        The LLM, unknown providers fall back to OpenAI
+    """
+    provider = config.get('provider', 'openai')
+    model_name = config.get('model_name', 'gpt-4-turbo')
+    temperature = config.get('temperature', 0.7)
+    if provider == 'anthropic' and not model_name.startswith('anthropic/'):
+        model_name = f'anthropic/{model_name}'
+    return PrefixCachingLLM(model=model_name, temperature=temperature)
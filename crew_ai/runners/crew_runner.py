@@ -1,9 +1,9 @@
-import os
-import yaml
 import json
+from datetime import datetime
 from typing import Dict, Any, Optional
 from GS.core.app.models.task_result import TaskResult
 from GS.crew_ai.crews.data_analysis_crew import DataAnalysisCrew
+from GS.crew_ai.llm import llm_from_config
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 
@@ -29,50 +29,81 @@ def get_llm(provider: str = 'openai', model_name: str = 'gpt-4-turbo', temperatu
             **kwargs
         )
 
+def run_deadline(task_id: str, data: Dict[Any, Any]) -> Optional[float]:
+    """Seconds a run has left until its deadline, None when it has none.
+
+    A deadline set at submission counts from then, time spent queued
+    included. Runs submitted without one, such as scheduled runs, get the
+    `deadline_seconds` of their data or the default deadline from now.
+    """
+    from GS.core.app import db
+    from GS.workflow_engine.configs import LLMHedging
+    deadline_at = db.session.query(TaskResult.deadline_at).filter_by(task_id=task_id).scalar()
+    if deadline_at is not None:
+        return (deadline_at - datetime.utcnow()).total_seconds()
+    return data.get('deadline_seconds') or LLMHedging.DEFAULT_DEADLINE_SECONDS or None
+
+
+def record_stopped(task_id: str, stopped) -> None:
+    """Mark a task that was cancelled or ran past its deadline."""
+    from GS.core.app import db
+    session = db.session
+    session.rollback()
+    task = session.query(TaskResult).filter_by(task_id=task_id).first()
+    if task:
+        task.status = stopped.reason
+        task.set_result(json.dumps({'error': str(stopped)}))
+        session.commit()
+
+
 def run_data_analysis_crew(task_id: str, data: Dict[Any, Any]) -> None:
     """Run a CrewAI data analysis task.
     
     Args:
         task_id: The ID of the task to run.
         data: The data to pass to the crew.
+
+    Raises:
+        TaskCancelled: When the task is cancelled or passes its deadline, after
+            marking it 'cancelled' or 'timed_out'
     """
     from GS.core.app import db
+    from GS.crew_ai.llm import LLMDeadlineExceeded
+    from GS.workflow_engine.helper_classes.cancellation import (
+        CANCELLED, TIMED_OUT, TaskCancelled, cancellable_run, check_cancelled
+    )
     
     try:
         # Get crew type from data or default to data_analysis
         crew_type = data.get('crew_type', 'data_analysis')
         
-        # Load agent and task configurations from YAML files
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-        # Load agent configuration
-        agents_file = os.path.join(base_dir, f'agents/{crew_type}_agents.yaml')
-        with open(agents_file, 'r') as f:
-            agents_config = yaml.safe_load(f)
-        
-        # Load task configuration
-        tasks_file = os.path.join(base_dir, f'tasks/{crew_type}_tasks.yaml')
-        with open(tasks_file, 'r') as f:
-            tasks_config = yaml.safe_load(f)
-        
-        # Initialize default LLM (can be overridden by agent configs)
-        llm_config = agents_config.get('llm_config', {})
-        default_llm = get_llm(
-            provider=llm_config.get('provider', 'openai'),
-            model_name=llm_config.get('model_name', 'gpt-4-turbo'),
-            temperature=llm_config.get('temperature', 0.7)
+        # The crew is compiled once per configuration, each run gets a fresh copy
+        from GS.crew_ai.crews.crew_templates import get_crew_templates
+        crew = get_crew_templates().crew_for_run(
+            crew_type,
+            DataAnalysisCrew,
+            # Default LLM, can be overridden by agent configs
+            llm_factory=llm_from_config
         )
         
-        # Create crew instance
-        crew_instance = DataAnalysisCrew(
-            agents_config=agents_config,
-            tasks_config=tasks_config,
-            llm=default_llm
-        )
-        
-        # Run the crew
-        crew = crew_instance.crew()
-        result = crew.kickoff(inputs=data.get('inputs', {}))
+        # Attached documents are extracted once and listed in the inputs,
+        # referenced artifacts become datasets of the run, requested tables
+        # are profiled and handed over as compact profiles
+        from GS.workflow_engine.helper_classes.artifact_cache import with_artifacts
+        from GS.workflow_engine.helper_classes.document_ingestion import with_documents
+        from GS.workflow_engine.helper_classes.table_profiler import with_profiles
+        from GS.workflow_engine.helper_classes.dataset_registry import dataset_run
+        from GS.crew_ai.llm import llm_deadline, routing_run
+        # The run stops when it is cancelled or its deadline passes, datasets
+        # the tools create during the run are released when it ends, model
+        # cascades record which model answered each task and no LLM call
+        # outlives the deadline
+        deadline = run_deadline(task_id, data)
+        with cancellable_run(task_id, deadline), dataset_run(task_id), routing_run() as routing, \
+                llm_deadline(deadline):
+            # A task cancelled while it was queued stops here
+            check_cancelled()
+            result = crew.kickoff(inputs=with_profiles(data, with_artifacts(with_documents(data))))
         
         # Convert CrewOutput to a JSON-serializable format
         serializable_result = {}
@@ -89,10 +120,19 @@ def run_data_analysis_crew(task_id: str, data: Dict[Any, Any]) -> None:
             serializable_result['token_usage'] = {
                 'total_tokens': getattr(token_usage, 'total_tokens', 0),
                 'prompt_tokens': getattr(token_usage, 'prompt_tokens', 0),
+                # Prompt tokens served from the provider's prefix cache
+                'cached_prompt_tokens': getattr(token_usage, 'cached_prompt_tokens', 0),
                 'completion_tokens': getattr(token_usage, 'completion_tokens', 0),
                 'successful_requests': getattr(token_usage, 'successful_requests', 0)
             }
         
+        if routing.tasks:
+            serializable_result['routing'] = routing.summary()
+        
+        # Scheduled runs record which report they revised and the rows they covered
+        if data.get('incremental'):
+            serializable_result['incremental'] = data['incremental']
+        
         # Convert the dictionary to a JSON string
         json_result = json.dumps(serializable_result)
         
@@ -100,16 +140,23 @@ def run_data_analysis_crew(task_id: str, data: Dict[Any, Any]) -> None:
         session = db.session
         task = session.query(TaskResult).filter_by(task_id=task_id).first()
         if task:
-            task.status = 'completed'
-            task.result = json_result
+            # A cancel request that came in as the crew finished still counts
+            if task.status != CANCELLED:
+                task.status = 'completed'
+                task.set_result(json_result)
+            task.total_tokens = serializable_result.get('token_usage', {}).get('total_tokens')
             session.commit()
     
+    except TaskCancelled as e:
+        record_stopped(task_id, e)
+        raise
     except Exception as e:
-        # Update task status in case of error
+        # Update task status in case of error, after dropping a transaction the error may have broken
         session = db.session
+        session.rollback()
         task = session.query(TaskResult).filter_by(task_id=task_id).first()
         if task:
-            task.status = 'error'
-            task.result = json.dumps({'error': str(e)})
+            task.status = TIMED_OUT if isinstance(e, LLMDeadlineExceeded) else 'error'
+            task.set_result(json.dumps({'error': str(e)}))
             session.commit()
         raise
\ No newline at end of file
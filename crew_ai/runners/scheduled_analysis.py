@@ -0,0 +1,226 @@
+"""Recurring data analyses that only analyse what changed since their last run.
+
+An `AnalysisSchedule` names source tables and the request to run for them
+every `interval_seconds`. When a schedule is due the scheduler reads the
+current watermark of every source, the maximum of its watermark column or
+its table version without one, and compares it with the stored watermark:
+
+- Nothing changed: the run is skipped, no crew is started.
+- Otherwise a data analysis run is queued with the profiles of only the rows
+  past the stored watermark and the report of the previous run, which the
+  crew revises. Rows appended while the run works are left for the next one.
+- The first run, or one whose previous report is gone, analyses everything.
+
+The watermark and the report moves forward only when a run completes, so a
+failed run is retried with the same delta at the next interval. Schedules are
+claimed with a conditional update of `next_run_at`, several app processes
+may run the scheduler without starting a schedule twice.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from GS.core.app.models.analysis_schedule import AnalysisSchedule
+from GS.core.app.models.task_result import TaskResult
+
+logger = logging.getLogger(__name__)
+
+# Runs of a schedule that are older than this are not waited for any more
+RUN_TIMEOUT_SECONDS = 6 * 3600
+
+
+def current_watermarks(sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Read the current watermark of every source table."""
+    from GS.workflow_engine.helper_classes.table_profiler import get_table_profiler
+    profiler = get_table_profiler()
+    return {source['table']: profiler.watermark(source['table'], source.get('watermark_column'))
+            for source in sources}
+
+
+def _previous_report(session, task_id: Optional[str]) -> Optional[str]:
+    task = session.query(TaskResult).filter_by(task_id=task_id).first() if task_id else None
+    if task is None or task.status != 'completed':
+        return None
+    try:
+        return json.loads(task.get_result_text()).get('content')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def incremental_request(schedule: AnalysisSchedule, watermarks: Dict[str, Any],
+                        previous_report: Optional[str]) -> Dict[str, Any]:
+    """Build the data analysis request of a run that moves the schedule to `watermarks`."""
+    data = schedule.get_request()
+    stored = schedule.get_watermark() if previous_report is not None else {}
+    tables = []
+    for source in schedule.get_sources():
+        table, column = source['table'], source.get('watermark_column')
+        if table in stored and stored[table] == watermarks[table]:
+            continue
+        if column:
+            tables.append({'table': table, 'watermark_column': column,
+                           'since': stored.get(table), 'until': watermarks[table]})
+        else:
+            # No column to tell appended rows apart, the changed table is profiled as a whole
+            tables.append(table)
+    data['profile_tables'] = tables
+    data['previous_report'] = previous_report
+    data['incremental'] = {
+        'schedule': schedule.name,
+        'base_task_id': schedule.last_task_id if previous_report is not None else None,
+        'watermark_from': stored,
+        'watermark_to': watermarks,
+    }
+    return data
+
+
+def run_scheduled_analysis(schedule_id: int, task_id: str, data: Dict[str, Any], watermarks: Dict[str, Any]):
+    """Run the analysis of a schedule and move its watermark forward when it completes."""
+    from GS.core.app import db
+    from GS.crew_ai.runners.crew_runner import run_data_analysis_crew
+
+    completed = False
+    try:
+        run_data_analysis_crew(task_id, data)
+        completed = True
+    finally:
+        session = db.session
+        session.rollback()
+        schedule = session.get(AnalysisSchedule, schedule_id)
+        if schedule is not None:
+            if completed:
+                schedule.watermark = json.dumps(watermarks)
+                schedule.last_task_id = task_id
+                schedule.last_run_at = datetime.utcnow()
+            if schedule.running_task_id == task_id:
+                schedule.running_task_id = None
+            session.commit()
+
+
+def _claim(session, schedule_id: int, next_run_at: datetime, interval_seconds: int, now: datetime) -> bool:
+    claimed = session.query(AnalysisSchedule).filter_by(id=schedule_id, next_run_at=next_run_at).update(
+        {'next_run_at': now + timedelta(seconds=interval_seconds)}, synchronize_session=False)
+    session.commit()
+    return claimed == 1
+
+
+def _still_running(session, schedule: AnalysisSchedule, now: datetime) -> bool:
+    if not schedule.running_task_id:
+        return False
+    task = session.query(TaskResult).filter_by(task_id=schedule.running_task_id).first()
+    return (task is not None and task.status in ('pending', 'in_progress')
+            and task.created_at > now - timedelta(seconds=RUN_TIMEOUT_SECONDS))
+
+
+def run_due_schedules(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Check every due schedule once, skip or start its run.
+
+    Returns:
+        What happened to each claimed schedule, for logging
+    """
+    from GS.core.app import db
+    from GS.core.app.helper.fair_scheduler import ANONYMOUS, BATCH
+    from GS.core.app.helper.task_dispatch import SCHEDULED_ANALYSIS, submit_run
+
+    now = now or datetime.utcnow()
+    session = db.session
+    due = session.query(AnalysisSchedule.id, AnalysisSchedule.next_run_at, AnalysisSchedule.interval_seconds).filter(
+        AnalysisSchedule.enabled.is_(True), AnalysisSchedule.next_run_at <= now).all()
+    session.commit()
+
+    outcomes = []
+    for schedule_id, next_run_at, interval_seconds in due:
+        if not _claim(session, schedule_id, next_run_at, interval_seconds, now):
+            # Another process got it first
+            continue
+        schedule = session.get(AnalysisSchedule, schedule_id)
+        if _still_running(session, schedule, now):
+            outcomes.append({'schedule': schedule.name, 'outcome': 'running', 'task_id': schedule.running_task_id})
+            continue
+        try:
+            watermarks = current_watermarks(schedule.get_sources())
+        except Exception:
+            logger.exception("Could not read the watermarks of schedule %s", schedule.name)
+            outcomes.append({'schedule': schedule.name, 'outcome': 'error'})
+            continue
+
+        previous_report = _previous_report(session, schedule.last_task_id)
+        if previous_report is not None and watermarks == schedule.get_watermark():
+            schedule.skipped_runs += 1
+            schedule.last_checked_at = now
+            session.commit()
+            outcomes.append({'schedule': schedule.name, 'outcome': 'skipped'})
+            continue
+
+        data = incremental_request(schedule, watermarks, previous_report)
+        task_id = str(uuid4())
+        user = schedule.user or ANONYMOUS
+        session.add(TaskResult(task_id=task_id, status='pending', user=user, lane=BATCH))
+        schedule.running_task_id = task_id
+        schedule.last_checked_at = now
+        session.commit()
+        # Recurring runs are batch work of the schedule's owner
+        submit_run(task_id, user, BATCH, SCHEDULED_ANALYSIS, schedule_id, task_id, data, watermarks)
+        outcomes.append({'schedule': schedule.name, 'outcome': 'started', 'task_id': task_id,
+                         'tables': [table if isinstance(table, str) else table['table']
+                                    for table in data['profile_tables']]})
+    return outcomes
+
+
+class AnalysisScheduler:
+    """Background thread checking the schedules every `poll_seconds`."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analysis-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        from GS.core.app.helper.db_routing import background_task
+        tick = background_task(run_due_schedules)
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                for outcome in tick():
+                    logger.info("Scheduled analysis %s", outcome)
+            except Exception:
+                logger.exception("Checking the analysis schedules failed")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_analysis_scheduler() -> Optional[AnalysisScheduler]:
+    """Start the scheduler of this process, unless ANALYSIS_SCHEDULER_ENABLED is off."""
+    global _scheduler
+    from GS.core.app import app
+    if not app.config.get('ANALYSIS_SCHEDULER_ENABLED', True):
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AnalysisScheduler(app.config.get('ANALYSIS_SCHEDULER_POLL_SECONDS', 30))
+            _scheduler.start()
+    return _scheduler
+
+
+def stop_analysis_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        scheduler.stop()
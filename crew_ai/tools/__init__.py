@@ -3,5 +3,8 @@
 from .data_retrieval_tool import DataRetrievalTool
 from .search_tool import SearchTool
 from .calculator_tool import CalculatorTool
+from .table_finder_tool import TableFinderTool
+from .document_reader_tool import DocumentReaderTool
+from .data_profile_tool import DataProfileTool
 
-__all__ = ['DataRetrievalTool', 'SearchTool', 'CalculatorTool'] 
\ No newline at end of file
+__all__ = ['DataRetrievalTool', 'SearchTool', 'CalculatorTool', 'TableFinderTool', 'DocumentReaderTool', 'DataProfileTool'] 
\ No newline at end of file
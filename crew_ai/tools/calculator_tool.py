@@ -1,27 +1,45 @@
 from typing import Dict, Any, ClassVar
 import json
+import math
 import numexpr
 from crewai.tools import tool
 
 @tool("calculator_tool")
-def calculate(expression: str) -> str:
+def calculate(expression: str, dataset: str = "", aggregate: str = "") -> str:
     """A tool to evaluate mathematical expressions.
     
     Args:
-        expression: The mathematical expression to evaluate
+        expression: The mathematical expression to evaluate, may use the
+            column names of `dataset` as variables, e.g. "price * quantity"
+        dataset: Optional dataset handle returned by another tool
+        aggregate: Optional reduction over the dataset rows: sum, mean, min,
+            max or count
         
     Returns:
         A JSON string with the result of the calculation
     """
     try:
+        if dataset:
+            # Computed on the mapped Arrow buffers, the rows never pass through JSON
+            from GS.workflow_engine.helper_classes.dataset_registry import evaluate_on_dataset
+            data = {"expression": expression, "dataset": dataset}
+            result = evaluate_on_dataset(expression, dataset, aggregate)
+            if "dataset" in result:
+                result["result_dataset"] = result.pop("dataset")
+            data.update(result)
+            data["success"] = True
+            return json.dumps(data, indent=2, default=str, allow_nan=False)
         # Safely evaluate the expression using numexpr
         result = numexpr.evaluate(expression).item()
+        if isinstance(result, float) and not math.isfinite(result):
+            # NaN and infinities are not valid JSON
+            result = None
         data = {
             "expression": expression,
             "result": result,
             "success": True
         }
-        return json.dumps(data, indent=2)
+        return json.dumps(data, indent=2, allow_nan=False)
     except Exception as e:
         data = {
             "expression": expression,
@@ -0,0 +1,39 @@
+from typing import Dict, Any, ClassVar
+import json
+from crewai.tools import tool
+
+@tool("data_profile_tool")
+def profile_table(table: str) -> str:
+    """A tool to get the statistical profile of a table without reading its rows.
+
+    Args:
+        table: The table to profile, e.g. schema.table, or a dataset handle
+            returned by another tool
+
+    Returns:
+        A JSON string with row count and per-column null share, distinct
+        count, min/max, mean/std, quantiles, histogram edges and top values.
+        Tables are checked with the data access policies, masked columns
+        have no statistics showing their values.
+    """
+    try:
+        # Import here so crews load without the profiling dependencies
+        from GS.workflow_engine.helper_classes.dataset_registry import is_handle
+        from GS.workflow_engine.helper_classes.table_profiler import authorized_summary, get_table_profiler
+        profiler = get_table_profiler()
+        # Datasets were checked and masked when they were retrieved
+        if is_handle(table):
+            data = profiler.profile_dataset(table).summary()
+        else:
+            data = authorized_summary(profiler, table)
+        data["success"] = True
+    except Exception as e:
+        data = {
+            "table": table,
+            "error": str(e),
+            "success": False
+        }
+    return json.dumps(data, indent=2, default=str)
+
+# Create an instance of the tool for import
+DataProfileTool = profile_table
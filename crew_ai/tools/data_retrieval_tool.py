@@ -1,21 +1,30 @@
 from typing import Dict, Any, ClassVar
 import json
 from crewai.tools import tool
+from GS.crew_ai.tools.policy_gateway import (
+    AccessDenied, PolicyUnavailable, apply_masks, get_policy_gateway, retrieval_identity
+)
+
+PREVIEW_ROWS = 5
+
 
 @tool("data_retrieval_tool")
-def retrieve_data(query: str, limit: int = 10) -> str:
+def retrieve_data(query: str, limit: int = 10, table: str = "") -> str:
     """A tool to retrieve data from internal databases or data sources.
-    
+
     Args:
         query: The search query for retrieving data
         limit: The maximum number of results to return, defaults to 10
-        
+        table: Optional fully qualified table (catalog.schema.table) to read from
+
     Returns:
-        A JSON string with the retrieved data
+        A JSON string with a dataset handle for the retrieved rows, their
+        columns and a short preview. Pass the handle to the calculator or
+        profile tools instead of copying rows.
     """
     # In a real implementation, this would connect to your database
     # or other data source and retrieve the actual data
-    
+
     # This is a mock implementation that returns dummy data
     data = {
         "results": [
@@ -26,8 +35,29 @@ def retrieve_data(query: str, limit: int = 10) -> str:
         "query": query,
         "limit": limit
     }
-    
+
+    import pyarrow as pa
+    rows = pa.Table.from_pylist(data.pop("results"))
+    if table:
+        # Check access with the same policies Trino enforces, decisions are cached.
+        # Without a decision or a mask that cannot be applied no rows are returned.
+        try:
+            catalog, schema, table_name = table.split('.', 2)
+            masks = get_policy_gateway().authorize_select(retrieval_identity(), catalog, schema, table_name,
+                                                          sorted(rows.column_names))
+            rows = apply_masks(rows, masks)
+        except (ValueError, AccessDenied, PolicyUnavailable) as e:
+            return json.dumps({"query": query, "table": table, "error": str(e), "success": False}, indent=2)
+        data["table"] = table
+        data["masked_columns"] = sorted(column for column, mask in masks.items() if mask)
+
+    # Store the rows once as Arrow and hand out a handle, other tools read the buffers
+    from GS.workflow_engine.helper_classes.dataset_registry import get_dataset_registry
+    data["dataset"] = get_dataset_registry().put(rows)
+    data["columns"] = sorted(rows.column_names)
+    data["preview"] = rows.slice(0, PREVIEW_ROWS).to_pylist()
+
     return json.dumps(data, indent=2)
 
 # Create an instance of the tool for import
-DataRetrievalTool = retrieve_data 
\ No newline at end of file
+DataRetrievalTool = retrieve_data
@@ -0,0 +1,44 @@
+from typing import Dict, Any, ClassVar
+import json
+from crewai.tools import tool
+
+@tool("document_reader_tool")
+def read_document(document_id: str, chunk: int = -1, query: str = "") -> str:
+    """A tool to read the documents attached to the analysis request.
+
+    Args:
+        document_id: The document_id listed in the task's documents
+        chunk: The chunk number to read, -1 to pick chunks by query instead
+        query: Words to look for when no chunk number is given, returns the
+            three best matching chunks
+
+    Returns:
+        A JSON string with the requested chunks and the pages they cover
+    """
+    try:
+        # Import here so crews load without the document dependencies
+        from GS.workflow_engine.helper_classes.document_ingestion import get_document_ingestor
+        chunks = get_document_ingestor().chunks(document_id)
+        if chunk >= 0:
+            selected = [chunks[chunk]]
+        else:
+            words = set(query.lower().split())
+            # Rank chunks by how many query words they contain
+            ranked = sorted(chunks, key=lambda c: -sum(word in c['text'].lower() for word in words))
+            selected = ranked[:3] if words else chunks[:1]
+        data = {
+            "document_id": document_id,
+            "chunk_count": len(chunks),
+            "chunks": selected,
+            "success": True
+        }
+    except Exception as e:
+        data = {
+            "document_id": document_id,
+            "error": str(e),
+            "success": False
+        }
+    return json.dumps(data, indent=2)
+
+# Create an instance of the tool for import
+DocumentReaderTool = read_document
@@ -0,0 +1,288 @@
+"""Authorization gateway for the data retrieval path.
+
+Evaluates the same Rego decisions Trino asks OPA for (`allow` and
+`columnMask` in `trino_new/good_sell`) and caches them per identity groups and
+resource, so repeated checks for the same table do not cost a round-trip each.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+
+import httpx
+
+DEFAULT_POLICY_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'trino_new', 'good_sell'
+)
+
+
+class AccessDenied(Exception):
+    """Raised when the policy denies access to a resource."""
+
+
+class PolicyUnavailable(Exception):
+    """Raised when no decision could be obtained from OPA, access is then denied."""
+
+
+class OpaServerEvaluator:
+    """Evaluate decisions against a running OPA server (local process or container)."""
+
+    def __init__(self, base_url: str, timeout: float = 5.0, package: str = 'trino'):
+        self.base_url = base_url.rstrip('/')
+        self.package = package
+        self.client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def evaluate(self, rule: str, input_data: Dict[str, Any]):
+        """Return the value of a rule for the given input, None when undefined."""
+        try:
+            response = self.client.post(f"/v1/data/{self.package}/{rule}", json={'input': input_data})
+            response.raise_for_status()
+            return response.json().get('result')
+        except (httpx.HTTPError, ValueError) as e:
+            raise PolicyUnavailable(f"OPA at {self.base_url} could not evaluate {rule}: {e}") from e
+
+    def revision(self) -> str:
+        """Return a hash of the policies currently loaded in the server."""
+        try:
+            response = self.client.get('/v1/policies')
+            response.raise_for_status()
+            policies = sorted((p['id'], p.get('raw', '')) for p in response.json().get('result', []))
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            raise PolicyUnavailable(f"Could not list the policies of OPA at {self.base_url}: {e}") from e
+        return hashlib.sha256(json.dumps(policies).encode('utf-8')).hexdigest()
+
+
+class OpaEvalEvaluator:
+    """Evaluate decisions in-process over a policy directory using `opa eval`.
+
+    No server is needed, which makes it the evaluator of choice for tests and
+    local runs. Each decision spawns the OPA binary, the gateway cache is what
+    keeps that off the hot path.
+    """
+
+    def __init__(self, policy_dir: str = DEFAULT_POLICY_DIR, opa_binary: str = 'opa',
+                 package: str = 'trino', ignore: Iterable[str] = ('debug',)):
+        self.policy_dir = policy_dir
+        self.opa_binary = opa_binary
+        self.package = package
+        self.ignore = list(ignore)
+
+    def _policy_files(self) -> List[str]:
+        files = glob.glob(os.path.join(self.policy_dir, '**', '*.rego'), recursive=True)
+        return sorted(
+            f for f in files
+            if not any(part in self.ignore for part in os.path.relpath(f, self.policy_dir).split(os.sep))
+        )
+
+    def evaluate(self, rule: str, input_data: Dict[str, Any]):
+        """Return the value of a rule for the given input, None when undefined."""
+        command = [self.opa_binary, 'eval', '--format', 'json', '--stdin-input']
+        for policy_file in self._policy_files():
+            command += ['--data', policy_file]
+        command.append(f"data.{self.package}.{rule}")
+        try:
+            completed = subprocess.run(command, input=json.dumps(input_data), capture_output=True, text=True,
+                                       check=True)
+            output = json.loads(completed.stdout)
+        except subprocess.CalledProcessError as e:
+            raise PolicyUnavailable(f"opa eval of {rule} failed: {e.stderr.strip() or e}") from e
+        except (OSError, ValueError) as e:
+            # A missing binary or output that is not JSON
+            raise PolicyUnavailable(f"opa eval of {rule} failed: {e}") from e
+        results = output.get('result') or []
+        if not results:
+            return None
+        return results[0]['expressions'][0]['value']
+
+    def revision(self) -> str:
+        """Return a hash of the policy files' contents."""
+        digest = hashlib.sha256()
+        try:
+            for policy_file in self._policy_files():
+                digest.update(policy_file.encode('utf-8'))
+                with open(policy_file, 'rb') as f:
+                    digest.update(f.read())
+        except OSError as e:
+            raise PolicyUnavailable(f"Could not read the policies in {self.policy_dir}: {e}") from e
+        return digest.hexdigest()
+
+
+class PolicyGateway:
+    """Cache allow and column mask decisions per (identity groups, resource).
+
+    Entries expire after `ttl` seconds and the whole cache is dropped as soon as
+    the evaluator reports a different policy revision, which is checked at most
+    every `revision_check_interval` seconds. Each drop starts a new generation,
+    a decision that was asked for in an earlier one is returned but not cached.
+    """
+
+    def __init__(self, evaluator, ttl: float = 300, revision_check_interval: float = 5,
+                 max_entries: int = 10000):
+        self.evaluator = evaluator
+        self.ttl = ttl
+        self.revision_check_interval = revision_check_interval
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._revision = None
+        self._revision_checked_at = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_input(identity: Dict[str, Any], operation: str, resource: Dict[str, Any]) -> Dict[str, Any]:
+        """Build an OPA input document shaped like the ones the Trino plugin sends."""
+        return {
+            'context': {
+                'identity': {'user': identity.get('user'), 'groups': list(identity.get('groups', []))},
+                'softwareStack': {'trinoVersion': identity.get('trino_version', '')},
+            },
+            'action': {'operation': operation, 'resource': resource},
+        }
+
+    @staticmethod
+    def _cache_key(identity: Dict[str, Any], rule: str, operation: str, resource: Dict[str, Any]):
+        # Policies only look at the groups, so users sharing groups share entries
+        groups = tuple(sorted(set(identity.get('groups', []))))
+        return groups, rule, operation, json.dumps(resource, sort_keys=True)
+
+    def _check_revision(self):
+        now = time.monotonic()
+        if now - self._revision_checked_at < self.revision_check_interval:
+            return
+        revision = self.evaluator.revision()
+        with self._lock:
+            self._revision_checked_at = now
+            if revision != self._revision:
+                self._clear()
+                self._revision = revision
+
+    def _clear(self):
+        self._cache.clear()
+        self._generation += 1
+
+    def _decide(self, identity: Dict[str, Any], rule: str, operation: str, resource: Dict[str, Any]):
+        self._check_revision()
+        key = self._cache_key(identity, rule, operation, resource)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = self.evaluator.evaluate(rule, self.build_input(identity, operation, resource))
+
+        with self._lock:
+            if generation != self._generation:
+                # The policies changed while OPA was asked, the decision may be stale
+                return value
+            self._cache[key] = (now + self.ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Drop every cached decision."""
+        with self._lock:
+            self._clear()
+
+    def is_allowed(self, identity: Dict[str, Any], operation: str, resource: Dict[str, Any]) -> bool:
+        """Return whether the `allow` rule grants the operation on the resource."""
+        return bool(self._decide(identity, 'allow', operation, resource))
+
+    def column_mask(self, identity: Dict[str, Any], catalog: str, schema: str, table: str,
+                    column: str, column_type: str = 'varchar') -> Optional[str]:
+        """Return the mask expression for a column, None when it is not masked."""
+        resource = {'column': {
+            'catalogName': catalog,
+            'schemaName': schema,
+            'tableName': table,
+            'columnName': column,
+            'columnType': column_type,
+        }}
+        mask = self._decide(identity, 'columnMask', 'GetColumnMask', resource)
+        return mask.get('expression') if mask else None
+
+    def authorize_select(self, identity: Dict[str, Any], catalog: str, schema: str, table: str,
+                         columns: List[str]) -> Dict[str, Optional[str]]:
+        """Check a SELECT on a table and return the mask expression per column.
+
+        Raises:
+            AccessDenied: If the identity may not select from the table
+            PolicyUnavailable: If OPA could not be asked
+        """
+        resource = {'table': {
+            'catalogName': catalog,
+            'schemaName': schema,
+            'tableName': table,
+            'columns': sorted(columns),
+        }}
+        if not self.is_allowed(identity, 'SelectFromColumns', resource):
+            raise AccessDenied(f"Access denied to {catalog}.{schema}.{table}")
+        return {column: self.column_mask(identity, catalog, schema, table, column) for column in columns}
+
+
+def retrieval_identity() -> Dict[str, Any]:
+    """Identity the crews' tools read the lake as."""
+    from GS.workflow_engine.configs import OPA
+    groups = [group.strip() for group in OPA.RETRIEVAL_GROUPS.split(',') if group.strip()]
+    return {'user': OPA.RETRIEVAL_USER, 'groups': groups}
+
+
+def apply_masks(table, masks: Dict[str, Optional[str]]):
+    """Replace the masked columns of an Arrow table by their mask expressions.
+
+    The expressions are SQL over the table's columns, as Trino would apply
+    them, and are evaluated with DuckDB row by row.
+
+    Raises:
+        ValueError: When an expression cannot be evaluated, the rows are then not returned
+    """
+    import duckdb
+    if not any(masks.get(column) for column in table.column_names):
+        return table
+    connection = duckdb.connect()
+    try:
+        connection.register('masked_rows', table)
+        select = ', '.join(f'({masks[column]}) AS "{column}"' if masks.get(column) else f'"{column}"'
+                           for column in table.column_names)
+        return connection.execute(f'SELECT {select} FROM masked_rows').fetch_record_batch().read_all()
+    except duckdb.Error as e:
+        raise ValueError(f"Could not apply the column masks: {e}") from e
+    finally:
+        connection.close()
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+
+def get_policy_gateway() -> PolicyGateway:
+    """Return the process-wide gateway configured from `workflow_engine.configs.OPA`."""
+    global _default_gateway
+    if _default_gateway is None:
+        with _default_gateway_lock:
+            if _default_gateway is None:
+                from GS.workflow_engine.configs import OPA
+                if OPA.URL:
+                    evaluator = OpaServerEvaluator(OPA.URL)
+                else:
+                    evaluator = OpaEvalEvaluator(OPA.POLICY_DIR or DEFAULT_POLICY_DIR, OPA.BINARY)
+                _default_gateway = PolicyGateway(
+                    evaluator,
+                    ttl=OPA.DECISION_CACHE_TTL_SECONDS,
+                    revision_check_interval=OPA.REVISION_CHECK_SECONDS,
+                )
+    return _default_gateway
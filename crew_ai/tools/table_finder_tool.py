@@ -0,0 +1,35 @@
+from typing import Dict, Any, ClassVar
+import json
+from crewai.tools import tool
+
+@tool("table_finder_tool")
+def find_relevant_tables(question: str, top_k: int = 5) -> str:
+    """A tool to find the lake tables most relevant to a question.
+
+    Args:
+        question: What the data should answer, in natural language
+        top_k: The maximum number of tables to return, defaults to 5
+
+    Returns:
+        A JSON string with the matching tables and their columns
+    """
+    try:
+        # Import here so crews load without the catalog dependencies
+        from GS.workflow_engine.helper_classes.catalog_index import get_catalog_index
+        tables = get_catalog_index().find_tables(question, top_k=top_k)
+        data = {
+            "question": question,
+            "tables": tables,
+            "count": len(tables),
+            "success": True
+        }
+    except Exception as e:
+        data = {
+            "question": question,
+            "error": str(e),
+            "success": False
+        }
+    return json.dumps(data, indent=2)
+
+# Create an instance of the tool for import
+TableFinderTool = find_relevant_tables
@@ -0,0 +1,63 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from GS.workflow_engine.configs import Artifacts, DuckDB
+from GS.workflow_engine.helper_classes.artifact_cache import (ArtifactCache, parse_reference, read_table,
+                                                              request_artifacts)
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    monkeypatch.setattr(Artifacts, 'ALLOWED_BUCKETS', ['reports'])
+    monkeypatch.setattr(DuckDB, 'S3_BUCKET_NAME', 'reports')
+
+
+def test_references_to_the_allowed_buckets_are_parsed(buckets):
+    reference = parse_reference({'artifact': 's3://reports/2026/sales.parquet', 'columns': ['amount']})
+    assert (reference.bucket, reference.key, reference.format) == ('reports', '2026/sales.parquet', 'parquet')
+    assert parse_reference({'artifact': 's3:///notes.txt'}).bucket == 'reports'
+    assert parse_reference({'artifact': 's3://other/a.csv'}, allowed_buckets=['other']).format == 'csv'
+
+
+@pytest.mark.parametrize('uri', ['s3://other/sales.parquet', 's3://reports.evil/sales.parquet'])
+def test_other_buckets_are_rejected(buckets, uri):
+    with pytest.raises(ValueError, match='allowed artifact buckets'):
+        parse_reference({'artifact': uri})
+    with pytest.raises(ValueError):
+        request_artifacts({'inputs': {'sales': {'artifact': uri}}})
+
+
+def test_no_bucket_is_allowed_without_s3_bucket_name(monkeypatch):
+    monkeypatch.setattr(Artifacts, 'ALLOWED_BUCKETS', [])
+    with pytest.raises(ValueError):
+        parse_reference({'artifact': 's3://reports/sales.parquet'})
+
+
+@pytest.mark.parametrize('value', [
+    {}, {'artifact': 'http://host/a.csv'}, {'artifact': 's3://reports/'},
+    {'artifact': 's3://reports/a', 'columns': 'a'}, {'artifact': 's3://reports/a.bin', 'format': 'excel'},
+])
+def test_malformed_references_are_rejected(buckets, value):
+    with pytest.raises(ValueError):
+        parse_reference(value)
+
+
+def test_parquet_columns_are_read_through_the_cache(buckets, tmp_path):
+    os.makedirs(tmp_path / 'store' / 'reports')
+    table = pa.table({'region': ['north', 'south'] * 500, 'amount': [float(i) for i in range(1000)],
+                      'notes': [f'{i:08d}' * 25 for i in range(1000)]})
+    pq.write_table(table, tmp_path / 'store' / 'reports' / 'sales.parquet', row_group_size=250, compression='none')
+    cache = ArtifactCache(str(tmp_path / 'cache'), block_bytes=4096, concurrency=2,
+                          s3_endpoint=f"file://{tmp_path / 'store'}")
+    reference = parse_reference({'artifact': 's3://reports/sales.parquet', 'columns': ['amount']})
+
+    with cache.open(reference) as artifact:
+        assert read_table(artifact, reference).equals(table.select(['amount']))
+        # The notes column was not fetched
+        assert artifact.fetched_bytes < artifact.size / 2
+    with cache.open(reference) as artifact:
+        read_table(artifact, reference)
+        assert artifact.fetched_bytes == 0
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from GS.workflow_engine.helper_classes.cancellation import (CANCELLED, TIMED_OUT, CancellationToken, TaskCancelled,
+                                                            cancel_task, cancellable_run, check_cancelled,
+                                                            current_token, request_deadline)
+
+
+def test_the_token_fires_once_and_runs_its_callbacks():
+    token = CancellationToken('a', poll_seconds=0)
+    calls = []
+    token.add_callback(lambda: calls.append('first'))
+    remove = token.add_callback(lambda: calls.append('removed'))
+    remove()
+    token.check()
+
+    assert token.cancel() and not token.cancel(TIMED_OUT)
+    assert calls == ['first'] and token.reason == CANCELLED
+    # Callbacks added later run right away
+    token.add_callback(lambda: calls.append('late'))
+    assert calls == ['first', 'late']
+    with pytest.raises(TaskCancelled) as raised:
+        token.check()
+    assert raised.value.reason == CANCELLED and raised.value.task_id == 'a'
+    # Not an Exception, crewai's retries and error handling must not catch it
+    assert not isinstance(raised.value, Exception)
+
+
+def test_failing_callbacks_do_not_stop_the_others():
+    token = CancellationToken('a', poll_seconds=0)
+    calls = []
+    token.add_callback(lambda: 1 / 0)
+    token.add_callback(lambda: calls.append('ran'))
+    token.cancel()
+    assert calls == ['ran']
+
+
+def test_cancellation_elsewhere_is_polled_at_most_every_poll_seconds():
+    polls = []
+
+    def poll(task_id):
+        polls.append(task_id)
+        return len(polls) > 1
+
+    token = CancellationToken('a', poll=poll, poll_seconds=3600)
+    token.check()
+    token.check()
+    assert polls == ['a'] and not token.cancelled
+
+    token = CancellationToken('a', poll=poll, poll_seconds=0)
+    with pytest.raises(TaskCancelled):
+        token.check()
+
+
+def test_polling_errors_do_not_stop_the_run():
+    def poll(task_id):
+        raise ConnectionError("database is down")
+
+    CancellationToken('a', poll=poll, poll_seconds=0).check()
+
+
+def test_a_passed_deadline_times_the_run_out():
+    token = CancellationToken('a', deadline_seconds=-1, poll_seconds=0)
+    with pytest.raises(TaskCancelled) as raised:
+        token.check()
+    assert raised.value.reason == TIMED_OUT
+
+
+def test_runs_are_cancelled_by_task_id():
+    assert current_token() is None
+    check_cancelled()
+    with cancellable_run('a', poll=None) as token:
+        assert current_token() is token
+        check_cancelled()
+        assert cancel_task('a') and not cancel_task('a')
+        with pytest.raises(TaskCancelled):
+            check_cancelled()
+    assert current_token() is None and not cancel_task('a')
+
+
+def test_the_deadline_timer_fires_the_token():
+    fired = threading.Event()
+    with cancellable_run('a', deadline_seconds=0.01, poll=None) as token:
+        token.add_callback(fired.set)
+        assert fired.wait(5)
+        assert token.reason == TIMED_OUT
+
+
+@pytest.mark.parametrize('data, seconds', [(None, None), ({}, None), ({'deadline_seconds': 30}, 30.0)])
+def test_request_deadline(data, seconds):
+    assert request_deadline(data) == seconds
+
+
+@pytest.mark.parametrize('value', [0, -5, True, '30'])
+def test_invalid_request_deadlines_are_rejected(value):
+    with pytest.raises(ValueError):
+        request_deadline({'deadline_seconds': value})
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip('crewai')
+from crewai import Agent, Task  # noqa: E402
+from crewai.utilities.events import crewai_event_bus  # noqa: E402
+from crewai.utilities.events.agent_events import AgentExecutionStartedEvent  # noqa: E402
+
+from GS.crew_ai.llm.cascade import CascadeLLM, TaskRoutedLLM, cascade_for_agent  # noqa: E402
+
+AGENTS = {'analyst': {'llm': {'provider': 'openai', 'model_name': 'gpt-4-turbo', 'temperature': 0.2}}}
+CASCADE = [{'model_name': 'gpt-4o-mini', 'min_length': 10}, {'model_name': 'gpt-4-turbo'}]
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+
+
+def start_task(name):
+    """Emit what crewai emits when an agent starts working on a task."""
+    agent = Agent(role='Analyst', goal='Analyse', backstory='An analyst', llm='gpt-4o-mini')
+    task = Task(name=name, description='Do it', expected_output='Done', agent=agent)
+    crewai_event_bus.emit(agent, AgentExecutionStartedEvent(agent=agent, task=task, tools=[], task_prompt='Do it'))
+
+
+def test_each_task_gets_its_own_cascade():
+    tasks = {
+        'first': {'agent': 'analyst', 'model_cascade': CASCADE},
+        'second': {'agent': 'analyst'},
+        'third': {'agent': 'analyst', 'model_cascade': [{'model_name': 'gpt-4o'}]},
+        'other': {'agent': 'writer', 'model_cascade': CASCADE},
+    }
+    llm = cascade_for_agent('analyst', AGENTS, tasks)
+    assert isinstance(llm, TaskRoutedLLM)
+    assert set(llm.routes) == {'first', 'third'}
+
+    start_task('first')
+    assert llm.target() is llm.routes['first']
+    assert [stage.llm.model for stage in llm.target().stages] == ['gpt-4o-mini', 'gpt-4-turbo']
+    start_task('second')
+    assert llm.target() is llm.default
+    assert llm.default.model == 'gpt-4-turbo' and llm.default.temperature == 0.2
+    start_task('third')
+    assert [stage.llm.model for stage in llm.target().stages] == ['gpt-4o']
+
+
+def test_single_task_agents_get_the_cascade_itself():
+    llm = cascade_for_agent('analyst', AGENTS, {'first': {'agent': 'analyst', 'model_cascade': CASCADE}})
+    assert isinstance(llm, CascadeLLM) and llm.task_name == 'first'
+    assert cascade_for_agent('analyst', AGENTS, {'first': {'agent': 'analyst'}}) is None
+
+
+def test_calls_go_to_the_running_task(monkeypatch):
+    tasks = {'first': {'agent': 'analyst', 'model_cascade': CASCADE}, 'second': {'agent': 'analyst'}}
+    llm = cascade_for_agent('analyst', AGENTS, tasks)
+    called = []
+    for name, target in (('first', llm.routes['first']), ('second', llm.default)):
+        monkeypatch.setattr(target, 'call', lambda *args, name=name, target=target: called.append((name, target.stop)))
+    llm.stop = ['Observation:']
+
+    start_task('second')
+    llm.call('hello')
+    start_task('first')
+    llm.call('hello')
+    assert called == [('second', ['Observation:']), ('first', ['Observation:'])]
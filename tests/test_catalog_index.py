@@ -0,0 +1,106 @@
+import hashlib
+import json
+
+import duckdb
+import pytest
+
+pytest.importorskip('chromadb')
+from GS.workflow_engine.configs import GenerateCatalog  # noqa: E402
+from GS.workflow_engine.helper_classes import catalog_index  # noqa: E402
+from GS.workflow_engine.helper_classes.catalog_index import CatalogIndex, get_chroma_client  # noqa: E402
+
+WORDS = 64
+
+
+def embed(texts):
+    """Bag of words hashed into a fixed number of dimensions."""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * WORDS
+        for word in text.lower().replace('(', ' ').replace(')', ' ').replace(',', ' ').split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % WORDS] += 1
+        vectors.append(vector)
+    return vectors
+
+
+class CountingEmbed:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return embed(texts)
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'lake.duckdb')
+    connection = duckdb.connect(path)
+    connection.execute("CREATE TABLE orders (order_id INTEGER, customer_id INTEGER, amount DOUBLE)")
+    connection.execute("CREATE TABLE customers (customer_id INTEGER, name VARCHAR, country VARCHAR)")
+    connection.close()
+    return path
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    embedder = CountingEmbed()
+    index = CatalogIndex(get_chroma_client(str(tmp_path / 'chroma')), 'test_catalog', embed=embedder)
+    index.embedder = embedder
+    monkeypatch.setattr(catalog_index, '_default_index', index)
+    return index
+
+
+def test_refresh_only_embeds_changed_tables(index, database):
+    assert catalog_index.refresh_catalog_index('duckdb', database=database) == {
+        'upserted': 2, 'unchanged': 0, 'deleted': 0}
+    assert catalog_index.refresh_catalog_index('duckdb', database=database) == {
+        'upserted': 0, 'unchanged': 2, 'deleted': 0}
+
+    connection = duckdb.connect(database)
+    connection.execute("ALTER TABLE customers ADD COLUMN email VARCHAR")
+    connection.execute("DROP TABLE orders")
+    connection.close()
+    embedded = len(index.embedder.texts)
+    assert catalog_index.refresh_catalog_index('duckdb', database=database) == {
+        'upserted': 1, 'unchanged': 0, 'deleted': 1}
+    assert len(index.embedder.texts) == embedded + 1 and 'email' in index.embedder.texts[-1]
+
+
+def test_find_tables_ranks_by_question(index, database):
+    assert index.find_tables('customer country') == []
+    catalog_index.refresh_catalog_index('duckdb', database=database)
+    tables = index.find_tables('name and country of each customer', top_k=1)
+    assert [table['table'] for table in tables] == ['lake.main.customers']
+    assert tables[0]['columns'] == ['customer_id', 'name', 'country']
+
+
+def test_index_persists_across_clients(tmp_path, database, index):
+    catalog_index.refresh_catalog_index('duckdb', database=database)
+    reopened = CatalogIndex(get_chroma_client(str(tmp_path / 'chroma')), 'test_catalog', embed=embed)
+    assert reopened.collection.count() == 2
+
+
+def test_defaults_come_from_the_config(index, database, monkeypatch):
+    monkeypatch.setattr(catalog_index.DuckDB, 'DATABASE', database)
+    monkeypatch.setattr(GenerateCatalog, 'ENGINE', 'duckdb')
+    assert catalog_index.refresh_catalog_index()['upserted'] == 2
+
+
+def test_command_line_refresh(index, database, capsys):
+    catalog_index.main(['--engine', 'duckdb', '--database', database])
+    assert json.loads(capsys.readouterr().out) == {'upserted': 2, 'unchanged': 0, 'deleted': 0}
+
+
+def test_refresher_refreshes_when_started(index, database, monkeypatch):
+    monkeypatch.setattr(catalog_index.DuckDB, 'DATABASE', database)
+    monkeypatch.setattr(GenerateCatalog, 'REFRESH_SECONDS', 3600)
+    refresher = catalog_index.start_catalog_refresher()
+    try:
+        assert catalog_index.start_catalog_refresher() is refresher
+    finally:
+        catalog_index.stop_catalog_refresher()
+    assert index.collection.count() == 2
+
+    monkeypatch.setattr(GenerateCatalog, 'REFRESH_SECONDS', 0)
+    assert catalog_index.start_catalog_refresher() is None
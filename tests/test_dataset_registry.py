@@ -0,0 +1,89 @@
+import json
+import os
+
+import pyarrow as pa
+import pytest
+
+from GS.crew_ai.tools import calculator_tool
+from GS.workflow_engine.helper_classes import dataset_registry
+from GS.workflow_engine.helper_classes.dataset_registry import (SHARED_RUN, DatasetRegistry, dataset_run,
+                                                                evaluate_on_dataset, is_handle, open_dataset)
+
+ORDERS = pa.table({'price': [2.0, 3.0, None, 5.0], 'qty': [1, 2, 4, None], 'paid': [True, False, True, True]})
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = DatasetRegistry(str(tmp_path / 'datasets'))
+    monkeypatch.setattr(dataset_registry, '_registry', registry)
+    return registry
+
+
+def test_datasets_are_mapped_by_handle(registry):
+    handle = registry.put(ORDERS, run_id='run')
+    assert is_handle(handle) and not is_handle('orders')
+    assert open_dataset(handle, registry.directory).equals(ORDERS)
+    assert registry.open(handle).to_pydict() == ORDERS.to_pydict()
+
+
+def test_datasets_live_until_the_last_reference_is_released(registry):
+    handle = registry.put(ORDERS, run_id='run')
+    other = registry.put(ORDERS, run_id='run')
+    registry.acquire(handle)
+    registry.release_run('run')
+    assert os.path.exists(registry.path(handle)) and not os.path.exists(registry.path(other))
+    assert registry.stats() == {'datasets': 1, 'runs': 0}
+
+    registry.release(handle)
+    assert not os.path.exists(registry.path(handle))
+    with pytest.raises(KeyError):
+        registry.acquire(handle)
+    registry.release(handle)
+
+
+def test_datasets_of_a_run_are_released_when_it_ends(registry):
+    with dataset_run('run'):
+        handle = registry.put(ORDERS)
+    assert not os.path.exists(registry.path(handle))
+
+
+def test_shared_datasets_expire(registry):
+    registry.shared_ttl_seconds = 0
+    handle = registry.put(ORDERS)
+    assert handle.startswith(f'ds-{SHARED_RUN}-')
+    registry.put(ORDERS)
+    assert not os.path.exists(registry.path(handle))
+
+
+def test_rows_with_nulls_are_skipped(registry):
+    handle = registry.put(ORDERS)
+    assert evaluate_on_dataset('price * qty', handle, 'sum') == {'result': 8.0, 'aggregate': 'sum'}
+    assert evaluate_on_dataset('price * qty', handle, 'count')['result'] == 2
+    assert evaluate_on_dataset('price', handle, 'mean')['result'] == pytest.approx(10 / 3)
+
+    result = evaluate_on_dataset('where(paid, price, 0)', handle)
+    assert registry.open(result['dataset'])['result'].to_pylist() == [2.0, 0.0, None, 5.0]
+    assert result['summary'] == {'sum': 7.0, 'mean': 7 / 3, 'min': 0.0, 'max': 5.0}
+
+    with pytest.raises(ValueError):
+        evaluate_on_dataset('sum(price)', handle)
+
+
+def test_undefined_values_are_null(registry):
+    handle = registry.put(pa.table({'a': [0.0, 1.0, 2.0], 'b': [0.0, 0.0, 1.0]}))
+    result = evaluate_on_dataset('a / b', handle)
+    assert registry.open(result['dataset'])['result'].to_pylist() == [None, None, 2.0]
+    assert evaluate_on_dataset('a / b', handle, 'max')['result'] == 2.0
+    empty = registry.put(pa.table({'a': [0.0], 'b': [0.0]}))
+    assert evaluate_on_dataset('a / b', empty, 'sum')['result'] is None
+
+
+def test_calculator_returns_valid_json(registry):
+    handle = registry.put(ORDERS)
+    result = json.loads(calculator_tool.calculate.run(expression='price * qty', dataset=handle, aggregate='sum'))
+    assert result['success'] and result['result'] == 8.0
+
+    result = calculator_tool.calculate.run(expression='price / 0', dataset=handle)
+    assert 'NaN' not in result and 'Infinity' not in result
+    assert json.loads(result)['summary'] == {'sum': None, 'mean': None, 'min': None, 'max': None}
+    assert json.loads(calculator_tool.calculate.run(expression='sqrt(-1.0)'))['result'] is None
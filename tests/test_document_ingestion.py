@@ -0,0 +1,44 @@
+from GS.workflow_engine.helper_classes import document_ingestion
+from GS.workflow_engine.helper_classes.document_ingestion import DocumentIngestor, chunk_pages, describe_documents
+
+DIGEST = 'a' * 64
+
+
+def pages(count):
+    return [{'page': number, 'text': f'Page {number} ' + 'words ' * 200, 'tables': []} for number in range(1, count + 1)]
+
+
+def test_chunks_overlap_and_span_pages():
+    chunks = chunk_pages(pages(3), chunk_chars=1000, overlap=100)
+    assert [chunk['chunk'] for chunk in chunks] == list(range(len(chunks)))
+    assert chunks[0]['pages'][0] == 1 and chunks[-1]['pages'][1] == 3
+    # The end of a chunk is repeated at the start of the next one
+    assert chunks[1]['text'].startswith(chunks[0]['text'][-100:])
+
+
+def test_chunks_are_cut_once_per_document(tmp_path, monkeypatch):
+    ingestor = DocumentIngestor(cache_dir=str(tmp_path / 'cache'), upload_dir=str(tmp_path / 'uploads'),
+                                allowed_roots=[], chunk_cache_size=1)
+    ingestor.cache.put(DIGEST, {'document_id': DIGEST, 'name': 'a.pdf', 'kind': 'pdf', 'page_count': 3,
+                                'pages': pages(3)})
+    ingestor.cache.put('b' * 64, {'document_id': 'b' * 64, 'name': 'b.pdf', 'kind': 'pdf', 'page_count': 1,
+                                  'pages': pages(1)})
+    calls = []
+
+    def counting_chunk_pages(document_pages):
+        calls.append(len(document_pages))
+        return chunk_pages(document_pages)
+
+    monkeypatch.setattr(document_ingestion, 'chunk_pages', counting_chunk_pages)
+    first = ingestor.chunks(DIGEST)
+    assert ingestor.chunks(DIGEST) is first and calls == [3]
+
+    ingestor.chunks('b' * 64)
+    ingestor.chunks(DIGEST)
+    assert calls == [3, 1, 3]
+
+
+def test_describe_documents():
+    assert describe_documents([]) == "No documents were provided."
+    text = describe_documents([{'name': 'a.pdf', 'document_id': DIGEST, 'page_count': 3, 'chunk_count': 2}])
+    assert f'a.pdf (document_id: {DIGEST}, 3 pages, chunks 0-1)' in text
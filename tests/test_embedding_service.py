@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from GS.workflow_engine.helper_classes.embedding_service import EmbeddingService
+
+
+class FakeModel:
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        return np.array([[len(text), 0, 0, 0] for text in texts], dtype=np.float32)
+
+
+def load_recording_model(model_name: str):
+    """The model name is a file, every process loading the model appends its pid."""
+    with open(model_name, 'a') as f:
+        f.write(f'{os.getpid()}\n')
+    return FakeModel()
+
+
+def loading_pids(path):
+    with open(path) as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_model_is_loaded_by_the_encoding_processes_only(tmp_path, processes):
+    loads = str(tmp_path / 'loads')
+    service = EmbeddingService(loads, max_wait_ms=1, cache_dir=str(tmp_path / 'cache'), processes=processes,
+                               model_loader=load_recording_model)
+    try:
+        vectors = service.encode(['a', 'bbb', 'a'])
+    finally:
+        service.close()
+
+    assert service.dimension == 4
+    assert vectors[:, 0].tolist() == [1, 3, 1]
+    pids = loading_pids(loads)
+    if processes:
+        assert os.getpid() not in pids
+        assert 0 < len(pids) <= processes
+    else:
+        assert pids == [os.getpid()]
@@ -0,0 +1,175 @@
+import collections
+import importlib.util
+import os
+
+import pytest
+
+HELPERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core', 'app', 'helper')
+
+
+def helper(name):
+    """Load a helper from its file, importing GS.core.app would create the whole app."""
+    spec = importlib.util.spec_from_file_location(f'helper_{name}', os.path.join(HELPERS, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+fair_scheduler = helper('fair_scheduler')
+BATCH, INTERACTIVE = fair_scheduler.BATCH, fair_scheduler.INTERACTIVE
+FairQueue, FairScheduler, Job = fair_scheduler.FairQueue, fair_scheduler.FairScheduler, fair_scheduler.Job
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def fair_queue(clock, **kwargs):
+    return FairQueue({INTERACTIVE: 4, BATCH: 1}, clock=clock, **kwargs)
+
+
+def push(queue, user, count, lane=INTERACTIVE):
+    for index in range(count):
+        queue.push(Job(f'{user}-{index}', user, lane, print))
+
+
+def pop_users(queue, count):
+    users = []
+    for _ in range(count):
+        job = queue.pop()
+        users.append(job and job.user)
+        if job:
+            queue.done(job)
+    return users
+
+
+def test_lanes_share_the_workers_by_weight(clock):
+    queue = fair_queue(clock)
+    push(queue, 'alice', 20, BATCH)
+    push(queue, 'bob', 20)
+    lanes = collections.Counter(job.lane for job in (queue.pop() for _ in range(10)))
+    assert lanes == {INTERACTIVE: 8, BATCH: 2}
+
+
+def test_users_take_turns_however_many_runs_they_queued(clock):
+    queue = fair_queue(clock, user_weights={'carol': 2})
+    push(queue, 'alice', 10)
+    push(queue, 'bob', 2)
+    assert pop_users(queue, 6) == ['alice', 'bob', 'alice', 'bob', 'alice', 'alice']
+
+    push(queue, 'carol', 10)
+    assert collections.Counter(pop_users(queue, 6)) == {'carol': 4, 'alice': 2}
+
+
+def test_idle_users_do_not_build_up_credit(clock):
+    queue = fair_queue(clock)
+    push(queue, 'alice', 10)
+    assert pop_users(queue, 4) == ['alice'] * 4
+    push(queue, 'bob', 10)
+    assert pop_users(queue, 4) == ['bob', 'alice', 'bob', 'alice']
+
+
+def test_concurrent_runs_are_limited_per_user(clock):
+    queue = fair_queue(clock, max_concurrent=1)
+    push(queue, 'alice', 2)
+    first = queue.pop()
+    assert queue.pop() is None and len(queue) == 1
+    queue.done(first)
+    assert queue.pop().task_id == 'alice-1'
+
+
+def test_token_quota_holds_runs_back_until_the_window_moves_on(clock):
+    queue = fair_queue(clock, tokens_per_hour=100)
+    queue.record_tokens('alice', 60, at=clock.now - 3000)
+    queue.record_tokens('alice', 50, at=clock.now - 100)
+    assert queue.tokens_used('alice') == 110
+    # The oldest usage leaves the window in 600s, which brings alice under the quota
+    assert queue.quota_retry_after('alice') == 600
+    assert queue.quota_retry_after('bob') == 0
+
+    push(queue, 'alice', 1)
+    push(queue, 'bob', 1)
+    assert pop_users(queue, 2) == ['bob', None]
+    clock.now += 600
+    assert queue.quota_retry_after('alice') == 0 and pop_users(queue, 1) == ['alice']
+
+
+def test_queued_runs_can_be_removed(clock):
+    queue = fair_queue(clock)
+    push(queue, 'alice', 2)
+    assert queue.remove('alice-0').task_id == 'alice-0'
+    assert queue.remove('alice-0') is None
+    assert queue.queued() == {INTERACTIVE: {'alice': 1}, BATCH: {}} and len(queue) == 1
+
+
+class Timer:
+    """threading.Timer that only fires when the test says so."""
+    started = []
+
+    def __init__(self, interval, function):
+        self.interval = interval
+        self.function = function
+        self.daemon = False
+
+    def start(self):
+        self.started.append(self)
+
+
+@pytest.fixture
+def scheduler(clock, monkeypatch):
+    Timer.started = []
+    monkeypatch.setattr(fair_scheduler.threading, 'Timer', Timer)
+    dispatched = []
+    scheduler = FairScheduler(fair_queue(clock, tokens_per_hour=100), workers=2,
+                              dispatch=lambda target, job: dispatched.append(job))
+    scheduler.dispatched = dispatched
+    # Usage that would be read from task_result
+    scheduler._known_users.update({'alice', 'bob'})
+    return scheduler
+
+
+def test_runs_start_when_a_worker_is_free(scheduler):
+    for task_id in ('a', 'b', 'c'):
+        scheduler.submit(task_id, 'alice', INTERACTIVE, print)
+    assert [job.task_id for job in scheduler.dispatched] == ['a', 'b']
+    assert scheduler.stats()['queued'] == {INTERACTIVE: {'alice': 1}, BATCH: {}}
+
+    scheduler._finished(scheduler.dispatched[0], tokens=30)
+    assert [job.task_id for job in scheduler.dispatched] == ['a', 'b', 'c']
+    assert scheduler.queue.tokens_used('alice') == 30
+    assert scheduler.stats()['active'] == 2
+
+
+def test_queued_runs_are_cancelled_in_the_queue(scheduler):
+    for task_id in ('a', 'b', 'c'):
+        scheduler.submit(task_id, 'alice', INTERACTIVE, print)
+    assert scheduler.cancel('c') == 'queued'
+    assert scheduler.cancel('unknown') is None
+    scheduler._finished(scheduler.dispatched[0], tokens=0)
+    assert [job.task_id for job in scheduler.dispatched] == ['a', 'b']
+
+
+def test_runs_held_back_by_the_quota_start_when_the_timer_fires(scheduler, clock):
+    scheduler.queue.record_tokens('alice', 100, at=clock.now - 3590)
+    with pytest.raises(fair_scheduler.QuotaExceeded) as raised:
+        scheduler.check_quota('alice')
+    assert raised.value.retry_after == 10
+
+    scheduler.submit('a', 'alice', INTERACTIVE, print)
+    scheduler.submit('b', 'bob', INTERACTIVE, print)
+    assert [job.task_id for job in scheduler.dispatched] == ['b']
+    [timer] = Timer.started
+    assert timer.interval == 10 and timer.daemon
+
+    clock.now += 10
+    timer.function()
+    assert [job.task_id for job in scheduler.dispatched] == ['b', 'a'] and scheduler._timer is None
@@ -0,0 +1,119 @@
+import asyncio
+import glob
+import os
+
+import httpx
+import pytest
+
+from GS.workflow_engine.activities.fetch_engine import FetchEngine, IncompleteBody
+
+
+def respond(status, body=b'', headers=None):
+    """A response streamed like one read off the network."""
+    headers = {'Content-Length': str(len(body)), **(headers or {})}
+    return httpx.Response(status, headers=headers, stream=httpx.ByteStream(body))
+
+
+class Site:
+    """A stand-in server answering with an ETag and recording the requests."""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path
+        if path == '/missing':
+            return respond(404, b'not here')
+        if path == '/short':
+            return respond(200, b'only this', {'Content-Length': '100'})
+        if path == '/large':
+            return respond(200, b'x' * 1000)
+        language = request.headers.get('accept-language', 'en')
+        etag = f'"{language}"'
+        if request.headers.get('if-none-match') == etag:
+            return respond(304, headers={'ETag': etag})
+        return respond(200, f'page in {language}'.encode(), {'ETag': etag})
+
+
+@pytest.fixture
+def engine(tmp_path):
+    site = Site()
+    engine = FetchEngine(cache_dir=str(tmp_path), politeness_delay=0, max_body_bytes=500)
+    engine._client = lambda origin, proxy: httpx.AsyncClient(transport=httpx.MockTransport(site))
+    engine.site = site
+    return engine
+
+
+def part_files(engine):
+    return glob.glob(os.path.join(engine.cache.directory, '*.part'))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_repeat_fetch_is_conditional_and_keyed_by_varying_headers(engine):
+    first = run(engine.fetch('http://site/page'))
+    again = run(engine.fetch('http://site/page'))
+    german = run(engine.fetch('http://site/page', headers={'Accept-Language': 'de'}))
+    head = run(engine.fetch('http://site/page', method='HEAD'))
+
+    assert not first.owns_body and first.text() == 'page in en'
+    assert again.from_cache and again.text() == 'page in en'
+    assert engine.site.requests[1].headers['if-none-match'] == '"en"'
+    assert not german.from_cache and german.text() == 'page in de'
+    assert not head.from_cache and 'if-none-match' not in engine.site.requests[3].headers
+    assert part_files(engine) == []
+
+
+def test_bodies_that_are_not_cached_belong_to_the_caller(engine):
+    missing = run(engine.fetch('http://site/missing'))
+    uncached = run(engine.fetch('http://site/page', use_cache=False))
+    assert missing.status_code == 404 and missing.owns_body and missing.text() == 'not here'
+    assert uncached.owns_body and uncached.text() == 'page in en'
+    assert part_files(engine) == []
+
+    path = missing.body_path
+    missing.discard()
+    assert not os.path.exists(path) and missing.body_path is None
+    run(engine.aclose())
+    assert not os.path.exists(uncached.body_path)
+
+
+def test_large_bodies_are_cut_and_flagged(engine):
+    result = run(engine.fetch('http://site/large'))
+    assert result.truncated and result.owns_body
+    assert result.size == 500 == os.path.getsize(result.body_path)
+    assert engine.cache.lookup(engine.cache.key('GET', 'http://site/large', {})) is None
+    assert part_files(engine) == []
+
+
+def test_short_bodies_raise(engine):
+    with pytest.raises(IncompleteBody, match='9 of 100'):
+        run(engine.fetch('http://site/short'))
+    assert part_files(engine) == []
+
+
+def test_idle_clients_beyond_the_limit_are_closed(engine):
+    engine.max_clients = 1
+    clients = []
+    make_client = engine._client
+    engine._client = lambda origin, proxy: clients.append(make_client(origin, proxy)) or clients[-1]
+
+    async def scenario():
+        await engine.fetch('http://one/page')
+        stream = engine.stream('http://two/page')
+        await stream.__anext__()
+        assert clients[0].is_closed
+        # The open stream keeps its client past the limit until it ends
+        await engine.fetch('http://three/page')
+        assert not clients[1].is_closed and len(engine._clients) == 2
+        await stream.aclose()
+        await engine.fetch('http://four/page')
+
+    run(scenario())
+    assert [client.is_closed for client in clients] == [True, True, True, False]
+    assert list(engine._clients) == [('http://four', None)]
+    run(engine.aclose())
+    assert clients[3].is_closed
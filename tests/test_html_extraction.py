@@ -0,0 +1,35 @@
+import pytest
+
+from GS.workflow_engine.activities.html_extraction import Block, extract_raw_text, iter_blocks
+
+
+def test_boilerplate_is_dropped():
+    html = ('<html><head><title>Shop</title><script>track()</script></head><body>'
+            '<nav><a href="/">Home</a></nav><div class="cookie-banner">We use cookies</div>'
+            '<div id="site_footer">Links</div><ul class="main-menu"><li>Sale</li></ul>'
+            '<div role="navigation">More links</div><main><h1>Product</h1><p>Ships in two days.</p></main>'
+            '<footer>Footer</footer></body></html>')
+    assert extract_raw_text(html) == 'Shop\n\n# Product\n\nShips in two days.'
+
+
+@pytest.mark.parametrize('html', [
+    '<html><body class="home has-sidebar"><main><h1>Title</h1><p>Real article text here.</p></main></body></html>',
+    '<html><body><main class="nav-open"><article id="ads-free"><h1>Title</h1>'
+    '<p>Real article text here.</p></article></main></body></html>',
+    '<html><body aria-hidden="true"><h1>Title</h1><p>Real article text here.</p></body></html>',
+])
+def test_content_containers_are_kept_whatever_their_class(html):
+    assert extract_raw_text(html) == '# Title\n\nReal article text here.'
+
+
+def test_class_names_are_matched_whole():
+    html = '<div class="post-header"><h1>Title</h1></div><div class="share-count">12 shares</div>' \
+           '<div class="share">Share this</div>'
+    assert extract_raw_text(html) == '# Title\n\n12 shares'
+
+
+def test_blocks_stream_across_chunks():
+    html = '<p>Café menu</p><table><tr><td>Tea</td><td>2.50</td></tr></table><pre>a\n  b</pre>'.encode()
+    chunks = [html[i:i + 7] for i in range(0, len(html), 7)]
+    assert list(iter_blocks(chunks, 'utf-8')) == [
+        Block('paragraph', 'Café menu'), Block('table_row', 'Tea | 2.50'), Block('code', 'a\n  b')]
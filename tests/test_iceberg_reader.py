@@ -0,0 +1,103 @@
+import types
+
+import pyarrow as pa
+import pytest
+
+pytest.importorskip('pyiceberg')
+from pyiceberg.catalog.sql import SqlCatalog  # noqa: E402
+from pyiceberg.partitioning import PartitionField, PartitionSpec  # noqa: E402
+from pyiceberg.schema import Schema  # noqa: E402
+from pyiceberg.transforms import IdentityTransform  # noqa: E402
+from pyiceberg.types import LongType, NestedField, StringType  # noqa: E402
+
+from GS.workflow_engine.helper_classes import iceberg_reader  # noqa: E402
+from GS.workflow_engine.helper_classes.iceberg_reader import IcebergReader  # noqa: E402
+
+
+class CountingCatalog:
+    """A catalog counting how often tables are loaded."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.loads = 0
+
+    def load_table(self, name):
+        self.loads += 1
+        return self.catalog.load_table(name)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = SqlCatalog('test', uri=f'sqlite:///{tmp_path}/catalog.db', warehouse=f'file://{tmp_path}')
+    catalog.create_namespace('test')
+    schema = Schema(
+        NestedField(1, 'id', LongType(), required=False),
+        NestedField(2, 'region', StringType(), required=False),
+        NestedField(3, 'amount', LongType(), required=False),
+    )
+    spec = PartitionSpec(PartitionField(source_id=2, field_id=1000, transform=IdentityTransform(), name='region'))
+    table = catalog.create_table('test.orders', schema=schema, partition_spec=spec)
+    # One append per file, the ids of each file do not overlap
+    for start, region in ((0, 'eu'), (100, 'us'), (200, 'us')):
+        table.append(pa.table({
+            'id': pa.array(range(start, start + 10), pa.int64()),
+            'region': [region] * 10,
+            'amount': pa.array(range(10), pa.int64()),
+        }))
+    return CountingCatalog(catalog)
+
+
+def test_projection_and_filters(catalog):
+    reader = IcebergReader(catalog)
+    result = reader.read('test.orders', columns=['id', 'amount'], filters=[('region', '=', 'us'), ('amount', '>=', 8)])
+    assert result.column_names == ['id', 'amount']
+    assert sorted(result.column('id').to_pylist()) == [108, 109, 208, 209]
+
+
+def test_partitions_and_statistics_prune_files(catalog):
+    reader = IcebergReader(catalog)
+    assert len(reader.plan_files('test.orders')) == 3
+    assert len(reader.plan_files('test.orders', filters=[('region', '=', 'us')])) == 2
+    assert len(reader.plan_files('test.orders', filters=[('id', '>', 205)])) == 1
+    assert len(reader.plan_files('test.orders', filters=[('id', 'in', [5, 105])])) == 2
+    assert reader.plan_files('test.orders', filters=[('id', '<', 0)]) == []
+
+
+def test_table_is_loaded_once_and_manifests_are_cached(catalog):
+    reader = IcebergReader(catalog)
+    reader.read('test.orders', filters=[('region', '=', 'eu')])
+    assert catalog.loads == 1
+    manifest_reads = reader.cache_stats()['manifest_reads']
+    assert manifest_reads > 0
+
+    result = reader.read('test.orders', limit=5)
+    assert catalog.loads == 1
+    assert result.num_rows == 5
+    assert reader.cache_stats() == {'cached_snapshots': 1, 'manifest_reads': manifest_reads}
+
+
+def test_snapshot_reads_reuse_the_table_and_current_reads_reload_it(catalog):
+    reader = IcebergReader(catalog, table_cache_seconds=0)
+    first = catalog.catalog.load_table('test.orders').current_snapshot().snapshot_id
+    assert reader.read('test.orders').num_rows == 30
+    assert catalog.loads == 1
+
+    catalog.catalog.load_table('test.orders').append(pa.table({
+        'id': pa.array([300], pa.int64()), 'region': ['eu'], 'amount': pa.array([0], pa.int64())}))
+    assert reader.read('test.orders', snapshot_id=first).num_rows == 30
+    assert catalog.loads == 1
+    # The current snapshot moved on, the metadata is reloaded
+    assert reader.read('test.orders').num_rows == 31
+    assert catalog.loads == 2
+    assert reader.read('test.orders', snapshot_id=first).num_rows == 30
+    assert catalog.loads == 2
+
+
+def test_snapshots_with_delete_files_are_read_by_a_scan(catalog, monkeypatch):
+    # pyiceberg only writes copy-on-write deletes, so treat every manifest as a delete manifest
+    monkeypatch.setattr(iceberg_reader, 'ManifestContent', types.SimpleNamespace(DATA=object()))
+    reader = IcebergReader(catalog)
+    result = reader.read('test.orders', columns=['id'], filters=[('region', '=', 'eu'), ('amount', '<', 2)])
+    assert result.column_names == ['id']
+    assert sorted(result.column('id').to_pylist()) == [0, 1]
+    assert len(reader.plan_files('test.orders', filters=[('region', '=', 'us')])) == 2
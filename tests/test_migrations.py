@@ -0,0 +1,75 @@
+import importlib.util
+import os
+
+import pytest
+import sqlalchemy as sa
+
+pytest.importorskip('alembic')
+from alembic.migration import MigrationContext  # noqa: E402
+from alembic.operations import Operations  # noqa: E402
+
+VERSIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core', 'migrations', 'versions')
+
+
+def revision(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(VERSIONS, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade(engine, name, step='upgrade'):
+    with engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            getattr(revision(name), step)()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return sa.create_engine(f'sqlite:///{tmp_path}/app.db')
+
+
+def columns(engine, table):
+    return [column['name'] for column in sa.inspect(engine).get_columns(table)]
+
+
+def test_task_result_columns_are_added_to_the_original_table(engine):
+    with engine.begin() as connection:
+        # The table of the first release
+        connection.execute(sa.text(
+            "CREATE TABLE task_result (id INTEGER NOT NULL, task_id VARCHAR(50) NOT NULL, status VARCHAR(20), "
+            "result TEXT, PRIMARY KEY (id), UNIQUE (task_id))"))
+        connection.execute(sa.text("INSERT INTO task_result (task_id, status, result) VALUES ('a', 'completed', '{}')"))
+
+    upgrade(engine, '4b7d2e91c0a3_task_result_accounting')
+
+    assert columns(engine, 'task_result') == [
+        'id', 'task_id', 'status', 'result', 'result_data', 'result_encoding', 'created_at', 'user', 'lane',
+        'total_tokens', 'deadline_at']
+    assert {index['name'] for index in sa.inspect(engine).get_indexes('task_result')} == {
+        'ix_task_result_created_at', 'ix_task_result_user'}
+    assert {'analysis_schedule', 'archived_task_result'} <= set(sa.inspect(engine).get_table_names())
+    with engine.connect() as connection:
+        assert connection.execute(sa.text("SELECT task_id, result, user FROM task_result")).all() == [('a', '{}', None)]
+
+    upgrade(engine, '4b7d2e91c0a3_task_result_accounting', 'downgrade')
+    assert columns(engine, 'task_result') == ['id', 'task_id', 'status', 'result']
+
+
+def test_tables_created_by_the_app_are_left_alone(engine):
+    # The app creates the tables itself when it starts, before the revision runs
+    upgrade(engine, '4b7d2e91c0a3_task_result_accounting')
+    before = {table: columns(engine, table) for table in sa.inspect(engine).get_table_names()}
+    upgrade(engine, '4b7d2e91c0a3_task_result_accounting')
+    assert {table: columns(engine, table) for table in sa.inspect(engine).get_table_names()} == before
+
+
+def test_the_lease_column_is_added_once(engine):
+    upgrade(engine, '4b7d2e91c0a3_task_result_accounting')
+    upgrade(engine, '9c2f5a7d1e64_task_result_lease')
+    assert columns(engine, 'task_result')[-1] == 'lease_until'
+    upgrade(engine, '9c2f5a7d1e64_task_result_lease')
+    assert columns(engine, 'task_result').count('lease_until') == 1
+
+    upgrade(engine, '9c2f5a7d1e64_task_result_lease', 'downgrade')
+    assert 'lease_until' not in columns(engine, 'task_result')
@@ -0,0 +1,154 @@
+import json
+import subprocess
+
+import httpx
+import pyarrow as pa
+import pytest
+
+from GS.crew_ai.tools import data_retrieval_tool
+from GS.crew_ai.tools.policy_gateway import (
+    AccessDenied, OpaEvalEvaluator, OpaServerEvaluator, PolicyGateway, PolicyUnavailable, apply_masks
+)
+
+
+class FakeEvaluator:
+    """Grants SELECT on the `lake` catalog and masks the columns in `masks`."""
+
+    def __init__(self, masks=None, error=None):
+        self.masks = masks or {}
+        self.error = error
+        self.policy_revision = '1'
+        self.calls = 0
+
+    def evaluate(self, rule, input_data):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        resource = input_data['action']['resource']
+        if rule == 'allow':
+            return resource['table']['catalogName'] == 'lake'
+        expression = self.masks.get(resource['column']['columnName'])
+        return {'expression': expression} if expression else None
+
+    def revision(self):
+        return self.policy_revision
+
+
+def run_tool(monkeypatch, evaluator, table='lake.sales.orders'):
+    gateway = PolicyGateway(evaluator, revision_check_interval=0)
+    monkeypatch.setattr(data_retrieval_tool, 'get_policy_gateway', lambda: gateway)
+    return json.loads(data_retrieval_tool.retrieve_data.run(query='orders', table=table))
+
+
+def test_decisions_are_cached_until_the_revision_changes():
+    evaluator = FakeEvaluator()
+    gateway = PolicyGateway(evaluator, revision_check_interval=0)
+    identity = {'user': 'u', 'groups': ['human']}
+
+    gateway.authorize_select(identity, 'lake', 's', 't', ['a', 'b'])
+    calls = evaluator.calls
+    gateway.authorize_select(identity, 'lake', 's', 't', ['a', 'b'])
+    assert evaluator.calls == calls
+    assert gateway.hits == calls
+
+    evaluator.policy_revision = '2'
+    gateway.authorize_select(identity, 'lake', 's', 't', ['a', 'b'])
+    assert evaluator.calls == 2 * calls
+
+
+def test_decisions_asked_for_before_a_revision_change_are_not_cached():
+    evaluator = FakeEvaluator()
+    gateway = PolicyGateway(evaluator, revision_check_interval=0)
+    identity = {'user': 'u', 'groups': ['human']}
+    evaluate = evaluator.evaluate
+
+    def evaluate_during_a_policy_update(rule, input_data):
+        # Another thread notices the new revision while this decision is computed
+        evaluator.policy_revision = '2'
+        gateway._check_revision()
+        return evaluate(rule, input_data)
+
+    evaluator.evaluate = evaluate_during_a_policy_update
+    assert gateway.is_allowed(identity, 'SelectFromColumns', {'table': {'catalogName': 'lake'}})
+    evaluator.evaluate = evaluate
+    assert gateway._cache == {}
+
+    gateway.is_allowed(identity, 'SelectFromColumns', {'table': {'catalogName': 'lake'}})
+    assert len(gateway._cache) == 1
+    gateway.invalidate()
+    assert gateway._cache == {}
+
+
+def test_denied_table_raises():
+    gateway = PolicyGateway(FakeEvaluator(), revision_check_interval=0)
+    with pytest.raises(AccessDenied):
+        gateway.authorize_select({'groups': []}, 'other', 's', 't', ['a'])
+
+
+def test_masks_are_evaluated_as_sql_expressions():
+    table = pa.table({'id': [1, 2], 'title': ['first', 'second'], 'content': ['abc', 'defgh']})
+    masked = apply_masks(table, {'id': None, 'title': "'XXXX'", 'content': 'substr(content, 1, 2)'})
+    assert masked.column_names == ['id', 'title', 'content']
+    assert masked.to_pylist() == [
+        {'id': 1, 'title': 'XXXX', 'content': 'ab'},
+        {'id': 2, 'title': 'XXXX', 'content': 'de'},
+    ]
+
+
+def test_tool_applies_masks(monkeypatch):
+    result = run_tool(monkeypatch, FakeEvaluator(masks={'content': "upper(substr(content, 1, 4))"}))
+    assert result['masked_columns'] == ['content']
+    assert [row['content'] for row in result['preview']] == ['THIS', 'MORE']
+    assert [row['title'] for row in result['preview']] == ['Sample data 1', 'Sample data 2']
+
+
+@pytest.mark.parametrize('masks, evaluator_error', [
+    ({}, PolicyUnavailable("opa eval of allow failed: no such file")),
+    ({'content': 'no_such_function(content)'}, None),
+])
+def test_tool_returns_an_error_instead_of_rows(monkeypatch, masks, evaluator_error):
+    result = run_tool(monkeypatch, FakeEvaluator(masks=masks, error=evaluator_error))
+    assert result['success'] is False
+    assert 'preview' not in result and 'dataset' not in result
+
+
+def test_tool_rejects_a_malformed_table(monkeypatch):
+    result = run_tool(monkeypatch, FakeEvaluator(), table='orders')
+    assert result['success'] is False
+
+
+def test_opa_eval_failures_are_policy_unavailable(tmp_path):
+    (tmp_path / 'policy.rego').write_text('package trino\n')
+    missing_binary = OpaEvalEvaluator(str(tmp_path), opa_binary=str(tmp_path / 'no-opa'))
+    with pytest.raises(PolicyUnavailable):
+        missing_binary.evaluate('allow', {})
+
+    failing = tmp_path / 'opa'
+    failing.write_text('#!/bin/sh\necho "rego_parse_error" >&2\nexit 1\n')
+    failing.chmod(0o755)
+    with pytest.raises(PolicyUnavailable, match='rego_parse_error'):
+        OpaEvalEvaluator(str(tmp_path), opa_binary=str(failing)).evaluate('allow', {})
+
+
+def test_opa_server_failures_are_policy_unavailable():
+    evaluator = OpaServerEvaluator('http://opa.invalid')
+    evaluator.client = httpx.Client(base_url=evaluator.base_url,
+                                    transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+    with pytest.raises(PolicyUnavailable):
+        evaluator.evaluate('allow', {})
+    with pytest.raises(PolicyUnavailable):
+        evaluator.revision()
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+    evaluator.client = httpx.Client(base_url=evaluator.base_url, transport=httpx.MockTransport(refuse))
+    with pytest.raises(PolicyUnavailable):
+        evaluator.evaluate('allow', {})
+
+
+def test_subprocess_error_is_not_leaked(monkeypatch, tmp_path):
+    def fail(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, args[0], stderr='boom')
+    monkeypatch.setattr(subprocess, 'run', fail)
+    with pytest.raises(PolicyUnavailable, match='boom'):
+        OpaEvalEvaluator(str(tmp_path)).evaluate('allow', {})
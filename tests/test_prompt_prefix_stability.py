@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('crewai')
+from GS.benchmarks.prompt_prefix_stability import FakeProvider, check  # noqa: E402
+from GS.crew_ai.llm import arrange_messages, llm_from_config, static_prefix  # noqa: E402
+from GS.workflow_engine.configs import LLMHedging  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    # Nothing reaches a provider, the clients only insist on a key
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(LLMHedging, 'ENABLED', LLMHedging.ENABLED)
+
+
+def test_system_messages_are_moved_first():
+    messages = [
+        {'role': 'user', 'content': 'question 1'},
+        {'role': 'system', 'content': 'role and tools'},
+        {'role': 'assistant', 'content': 'answer'},
+    ]
+    arranged = arrange_messages(messages)
+    assert [message['role'] for message in arranged] == ['system', 'user', 'assistant']
+    assert static_prefix(arranged) == [messages[1]]
+
+
+@pytest.mark.parametrize('provider, model_name', [('openai', 'gpt-4-turbo'),
+                                                  ('anthropic', 'claude-3-5-sonnet-20241022')])
+def test_only_the_dynamic_part_changes_between_requests(provider, model_name):
+    llm = llm_from_config({'provider': provider, 'model_name': model_name})
+    fake = FakeProvider()
+    requests = [
+        llm._prepare_completion_params([{'role': 'user', 'content': f'question {run}'},
+                                        {'role': 'system', 'content': 'role and tools'}])
+        for run in range(2)
+    ]
+    assert requests[0]['messages'] != requests[1]['messages']
+    assert fake.prefix_bytes(requests[0]) == fake.prefix_bytes(requests[1])
+    last_static = static_prefix(requests[0]['messages'])[-1]['content']
+    if provider == 'anthropic':
+        assert last_static[-1]['cache_control'] == {'type': 'ephemeral'}
+    else:
+        assert last_static == 'role and tools'
+
+
+@pytest.mark.parametrize('crew_type', ['data_analysis', 'data_summary'])
+@pytest.mark.parametrize('provider, model_name', [('openai', 'gpt-4-turbo'),
+                                                  ('anthropic', 'claude-3-5-sonnet-20241022')])
+def test_crew_prefixes_are_stable_across_runs(crew_type, provider, model_name):
+    report = check(crew_type, provider, model_name, runs=2)
+    assert report['calls_per_run'] > 0
+    assert report['stable']
+    assert report['ok']
+    first, second = report['token_usage']
+    # Calls of one agent within a run may already hit, the second run hits on every call
+    assert second['cached_prompt_tokens'] > first['cached_prompt_tokens']
+
+
+def test_requests_share_one_background_loop():
+    from GS.crew_ai.llm import hedging
+
+    async def running_loop():
+        return asyncio.get_running_loop()
+
+    async def from_a_flow():
+        return hedging._run(running_loop())
+
+    loop = hedging._run(running_loop())
+    assert hedging._run(running_loop()) is loop and asyncio.run(from_a_flow()) is loop
+    assert not loop.is_closed()
+
+
+def test_the_completion_handler_is_only_replaced_where_it_fits(monkeypatch):
+    from crewai import LLM
+    from GS.crew_ai.llm import prefix_cache
+
+    assert prefix_cache.overrides_handler()
+    assert '_handle_non_streaming_response' in vars(prefix_cache.PrefixCachingLLM)
+
+    def changed_handler(self, params, callbacks=None, available_functions=None, from_task=None):
+        pass
+
+    monkeypatch.setattr(LLM, '_handle_non_streaming_response', changed_handler)
+    assert not prefix_cache.overrides_handler()
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from GS.workflow_engine.activities.proxy_pool import (BANNED, FAILED, SUCCESS, THROTTLED, InMemoryProxyStore,
+                                                      ProxyPool, RedisProxyStore, classify)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def redis_store():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return RedisProxyStore(fakeredis.FakeStrictRedis(decode_responses=True), prefix='test')
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    return InMemoryProxyStore() if request.param == 'memory' else redis_store()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def pool(store, clock):
+    return ProxyPool(['a', 'b', 'c'], store=store, clock=clock, cooldown_seconds=30, ban_seconds=600,
+                     max_window_seconds=1000, failures_before_cooldown=3)
+
+
+def test_classify():
+    assert [classify(code) for code in (200, 404, 429, 403, 407, 503)] == [
+        SUCCESS, SUCCESS, THROTTLED, BANNED, BANNED, FAILED]
+    assert classify(None) == classify(200, error=True) == FAILED
+
+
+def test_requests_in_flight_spread_over_the_proxies(pool):
+    picked = [pool.get_next_proxy('site') for _ in range(3)]
+    assert sorted(picked) == ['a', 'b', 'c']
+    assert all(pool.store.get_stats('site', proxy)['inflight'] == 1 for proxy in picked)
+
+    for proxy in picked:
+        pool.report('site', proxy, 200, 0.5)
+    assert all(pool.store.get_stats('site', proxy)['inflight'] == 0 for proxy in picked)
+
+
+def test_slow_and_failing_proxies_rank_lower(pool):
+    for _ in range(3):
+        pool.get_next_proxy('site')
+    pool.report('site', 'a', 200, 0.1)
+    pool.report('site', 'b', 200, 3.0)
+    pool.report('site', 'c', 500, 0.1)
+    ready = pool.store.snapshot('site')['ready']
+    assert ready['a'] > ready['b'] and ready['a'] > ready['c']
+    assert pool.get_next_proxy('site') == 'a'
+
+
+def test_throttled_proxies_are_parked_for_growing_windows(pool, clock):
+    pool.proxies = ['a']
+    assert pool.get_next_proxy('site') == 'a'
+    assert pool.report('site', 'a', 429, 0.5) == THROTTLED
+    assert pool.store.snapshot('site') == {'ready': {}, 'parked': {'a': clock.now + 30}}
+    clock.now += 29
+    assert pool.get_next_proxy('site') is None
+
+    clock.now += 1
+    assert pool.get_next_proxy('site') == 'a'
+    pool.report('site', 'a', 429, 0.5)
+    assert pool.store.snapshot('site')['parked'] == {'a': clock.now + 60}
+    assert pool.store.get_stats('site', 'a')['throttles'] == 2
+
+
+def test_bans_are_capped_and_other_sites_are_not_affected(pool, clock):
+    pool.proxies = ['a']
+    for bans in range(1, 4):
+        assert pool.get_next_proxy('site') == 'a'
+        pool.report('site', 'a', 403, 0.5)
+        assert pool.store.snapshot('site')['parked'] == {'a': clock.now + min(1000, 600 * 2 ** (bans - 1))}
+        clock.now += 1000
+    assert pool.store.get_stats('site', 'a')['bans'] == 3
+    assert pool.get_next_proxy('other') == 'a'
+
+
+def test_repeated_errors_cool_a_proxy_down(pool, clock):
+    pool.proxies = ['a']
+    for _ in range(2):
+        assert pool.get_next_proxy('site') == 'a'
+        pool.report('site', 'a', None, 0.5, error=True)
+        assert pool.store.snapshot('site')['parked'] == {}
+    pool.get_next_proxy('site')
+    pool.report('site', 'a', 500, 0.5)
+    assert pool.store.snapshot('site')['parked'] == {'a': clock.now + 30}
+    assert pool.get_next_proxy('site') is None
+
+    clock.now += 30
+    assert pool.get_next_proxy('site') == 'a'
+    pool.report('site', 'a', 200, 0.5)
+    assert pool.store.get_stats('site', 'a')['failures'] == 0
+
+
+def test_reports_do_not_race_each_other(pool):
+    pool.proxies = ['a']
+    workers, reports = 8, 50
+    for _ in range(workers * reports):
+        pool.get_next_proxy('site')
+    assert pool.store.get_stats('site', 'a')['inflight'] == workers * reports
+
+    def report():
+        for _ in range(reports):
+            pool.report('site', 'a', 200, 0.5)
+
+    threads = [threading.Thread(target=report) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.store.get_stats('site', 'a')['inflight'] == 0
@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask_appbuilder')
+pytest.importorskip('pyarrow')
+from GS.core.app import db  # noqa: E402
+from GS.core.app.helper import result_archive  # noqa: E402
+from GS.core.app.helper.result_archive import ResultArchive, archived_task  # noqa: E402
+from GS.core.app.helper.result_retention import compact_results  # noqa: E402
+from GS.core.app.models.analysis_schedule import AnalysisSchedule  # noqa: E402
+from GS.core.app.models.archived_task_result import ArchivedTaskResult  # noqa: E402
+from GS.core.app.models.task_result import TaskResult  # noqa: E402
+
+NOW = datetime(2026, 10, 15, 12, 0)
+
+
+@pytest.fixture
+def retention(app, tmp_path, monkeypatch):
+    """Archive to a local directory, completed results after 30 days, errors deleted after 7."""
+    monkeypatch.setitem(app.config, 'RESULT_TTL_DAYS', {'completed': 30, 'error': 7})
+    monkeypatch.setitem(app.config, 'RESULT_ARCHIVE_STATUSES', ['completed'])
+    monkeypatch.setitem(app.config, 'RESULT_ARCHIVE_URI', str(tmp_path / 'archive'))
+    monkeypatch.setitem(app.config, 'RESULT_ARCHIVE_TTL_DAYS', 0)
+    monkeypatch.setattr(result_archive, '_archive', None)
+    return app
+
+
+def stored(task_id, status='completed', age_days=0, created_at=None, result=None):
+    task = TaskResult(task_id=task_id, status=status, user='alice', lane='batch', total_tokens=10,
+                      created_at=created_at or NOW - timedelta(days=age_days))
+    task.set_result(json.dumps(result or {'report': task_id}))
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+def remaining():
+    return sorted(task.task_id for task in db.session.query(TaskResult))
+
+
+def test_expired_results_are_archived_or_deleted(retention):
+    stored('old', age_days=40)
+    stored('new', age_days=5)
+    stored('failed', status='error', age_days=10)
+    stored('running', status='in_progress', age_days=400)
+
+    outcome = compact_results(NOW)
+    assert outcome['archived'] == {'completed': 1} and outcome['deleted'] == {'error': 1}
+    assert remaining() == ['new', 'running']
+    [entry] = db.session.query(ArchivedTaskResult).all()
+    assert entry.task_id == 'old' and entry.path.startswith('created_month=2026-09/')
+
+    task = archived_task('old')
+    assert task.status == 'completed' and task.user == 'alice' and task.total_tokens == 10
+    assert json.loads(task.get_result_text()) == {'report': 'old'}
+    assert archived_task('failed') is None and archived_task('new') is None
+
+
+def test_archived_results_are_still_served(retention):
+    stored('old', age_days=40, result={'rows': list(range(100))})
+    compact_results(NOW)
+    response = retention.test_client().get('/api/v1/crewai/get_result/old')
+    assert response.status_code == 200 and response.get_json() == {'result': {'rows': list(range(100))}}
+
+
+def test_reports_of_schedules_are_kept(retention):
+    stored('report', age_days=40)
+    stored('running', status='error', age_days=40)
+    db.session.add(AnalysisSchedule(name='daily', interval_seconds=86400, request='{}', sources='[]',
+                                    last_task_id='report', running_task_id='running'))
+    db.session.commit()
+    assert compact_results(NOW)['archived'] == {}
+    assert remaining() == ['report', 'running']
+
+
+def test_undated_rows_expire_from_when_they_are_first_seen(retention):
+    task = stored('legacy')
+    db.session.query(TaskResult).filter_by(task_id='legacy').update({TaskResult.created_at: None})
+    db.session.commit()
+
+    assert compact_results(NOW)['undated'] == 1
+    db.session.refresh(task)
+    assert task.created_at == NOW
+    assert compact_results(NOW + timedelta(days=31))['archived'] == {'completed': 1}
+
+
+def test_results_are_kept_without_an_archive(retention, monkeypatch):
+    monkeypatch.setitem(retention.config, 'RESULT_ARCHIVE_URI', None)
+    stored('old', age_days=40)
+    assert compact_results(NOW)['archived'] == {}
+    assert remaining() == ['old']
+
+
+def test_archive_months_expire_as_a_whole(retention, monkeypatch):
+    monkeypatch.setitem(retention.config, 'RESULT_ARCHIVE_TTL_DAYS', 60)
+    stored('july', created_at=datetime(2026, 7, 20))
+    stored('august', created_at=datetime(2026, 8, 31))
+    stored('september', created_at=datetime(2026, 9, 1))
+
+    # Up to 60 days back is the middle of August, all of August is kept
+    outcome = compact_results(NOW)
+    assert outcome['archive_months_expired'] == ['2026-07']
+    assert sorted(entry.task_id for entry in db.session.query(ArchivedTaskResult)) == ['august', 'september']
+    assert archived_task('july') is None and archived_task('august').task_id == 'august'
+
+
+def test_tasks_are_read_from_their_row_group(tmp_path):
+    archive = ResultArchive(str(tmp_path))
+    rows = [{'task_id': f'task-{index:04d}', 'status': 'completed', 'user': 'alice', 'lane': 'batch',
+             'created_at': datetime(2026, 9, 1), 'total_tokens': index, 'result': None}
+            for index in range(200)]
+    paths = archive.write(rows)
+    assert len(set(paths.values())) == 1
+    assert archive.read(paths['task-0150'], 'task-0150')['total_tokens'] == 150
+    assert archive.read(paths['task-0150'], 'missing') is None
+    assert archive.months() == [('2026-09', os.path.join(str(tmp_path), 'created_month=2026-09'))]
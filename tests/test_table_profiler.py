@@ -0,0 +1,103 @@
+import json
+
+import duckdb
+import pytest
+
+from GS.crew_ai.tools import data_profile_tool, policy_gateway
+from GS.crew_ai.tools.policy_gateway import AccessDenied, PolicyGateway
+from GS.workflow_engine.helper_classes import table_profiler
+from GS.workflow_engine.helper_classes.table_profiler import TableProfiler, VALUE_STATISTICS, with_profiles
+
+
+@pytest.fixture
+def profiler():
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE events AS SELECT range AS id, range % 7 AS kind FROM range(20000)")
+    return TableProfiler(connection, cache_dir=None, sample_rows=2000)
+
+
+def test_sampled_profile_is_extended_with_a_sample_of_the_appended_rows(profiler):
+    first = profiler.profile('events', watermark_column='id')
+    assert first.sample_fraction == pytest.approx(0.1)
+    assert 1500 < first.columns['id'].count <= 2000
+    sampled = first.columns['id'].count
+
+    profiler.connection.execute("INSERT INTO events SELECT range AS id, 100 AS kind FROM range(20000, 30000)")
+    extended = profiler.profile('events', watermark_column='id')
+
+    assert extended.rows == 30000 and extended.watermark == 29999
+    appended = extended.columns['id'].count - sampled
+    # A 10% Bernoulli sample of the 10000 appended rows, none of the older ones
+    assert 700 < appended < 1300
+    assert extended.columns['id'].maximum >= 29000
+    assert extended.columns['kind'].maximum == 100
+
+
+def test_delta_reservoir_samples_the_filtered_rows(profiler):
+    delta = profiler.profile_delta('events', 'id', since=9999)
+    assert delta.rows == 10000 and delta.sample_fraction == pytest.approx(0.2)
+    assert delta.columns['id'].count == 2000
+    assert delta.columns['id'].minimum >= 10000
+
+
+def test_version_changes_when_rows_change_but_not_their_count(profiler):
+    before = profiler.table_version('events')
+    assert profiler.table_version('events') == before
+    profiler.connection.execute("UPDATE events SET kind = kind + 1 WHERE id = 5")
+    assert profiler.table_version('events') != before
+
+    profiled = profiler.profile('events')
+    assert profiler.profile('events') is profiled
+    profiler.connection.execute("UPDATE events SET kind = 50 WHERE id = 6")
+    assert profiler.profile('events') is not profiled
+
+
+class Policies:
+    """Grants SELECT on the tables in `allowed` and masks the `kind` column."""
+
+    def __init__(self, allowed=('memory.main.events',)):
+        self.allowed = allowed
+        self.tables = []
+
+    def evaluate(self, rule, input_data):
+        resource = input_data['action']['resource']
+        if rule == 'allow':
+            table = resource['table']
+            self.tables.append('.'.join([table['catalogName'], table['schemaName'], table['tableName']]))
+            return self.tables[-1] in self.allowed
+        return {'expression': "'***'"} if resource['column']['columnName'] == 'kind' else None
+
+    def revision(self):
+        return '1'
+
+
+@pytest.fixture
+def policies(monkeypatch, profiler):
+    policies = Policies()
+    gateway = PolicyGateway(policies, revision_check_interval=0)
+    monkeypatch.setattr(policy_gateway, 'get_policy_gateway', lambda: gateway)
+    monkeypatch.setattr(table_profiler, '_profiler', profiler)
+    return policies
+
+
+def test_profiles_of_masked_columns_show_no_values(policies):
+    result = json.loads(data_profile_tool.profile_table.run(table='events'))
+    assert result['success'] and policies.tables == ['memory.main.events']
+    columns = {column['name']: column for column in result['columns']}
+    assert 'min' in columns['id'] and 'masked' not in columns['id']
+    assert columns['kind']['masked'] and not set(VALUE_STATISTICS) & set(columns['kind'])
+    assert columns['kind']['distinct'] == 7
+
+
+def test_profiles_of_denied_tables_are_not_returned(policies, profiler):
+    profiler.connection.execute("CREATE SCHEMA private")
+    profiler.connection.execute("CREATE TABLE private.salaries AS SELECT 1 AS amount")
+    result = json.loads(data_profile_tool.profile_table.run(table='private.salaries'))
+    assert not result['success'] and 'Access denied' in result['error']
+    with pytest.raises(AccessDenied):
+        table_profiler.authorized_summary(profiler, 'memory.private.salaries')
+
+    inputs = with_profiles({'profile_tables': ['private.salaries', 'events']}, {})
+    denied, allowed = [json.loads(line) for line in inputs['data_profile'].splitlines()[1:]]
+    assert denied == {'table': 'private.salaries', 'error': 'Access denied to memory.private.salaries'}
+    assert allowed['table'] == 'events' and 'min' not in allowed['columns'][1]
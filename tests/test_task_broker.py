@@ -0,0 +1,265 @@
+import importlib.util
+import os
+import threading
+import time
+
+import pytest
+
+HELPERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core', 'app', 'helper')
+
+
+def helper(name):
+    """Load a helper from its file, importing GS.core.app would create the whole app."""
+    spec = importlib.util.spec_from_file_location(f'helper_{name}', os.path.join(HELPERS, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+task_broker = helper('task_broker')
+DELIVERY_LIMIT, HIGH_PRIORITY = task_broker.DELIVERY_LIMIT, task_broker.HIGH_PRIORITY
+InMemoryBroker = task_broker.InMemoryBroker
+LEASE_SECONDS = 0.3
+
+
+class Tasks:
+    """The task_result table, the status and lease of each task id."""
+
+    def __init__(self):
+        self.status = {}
+        self.leases = {}
+        self.renewed = []
+        self.runs = []
+
+    def fail(self, task_id, message):
+        if self.status.get(task_id) in ('pending', 'in_progress'):
+            self.status[task_id] = 'error'
+
+    def claim(self, task_id, lease_seconds):
+        if self.status.get(task_id) not in ('pending', 'in_progress'):
+            return False
+        if self.leases.get(task_id, 0) > time.monotonic():
+            return False
+        self.leases[task_id] = time.monotonic() + lease_seconds
+        return True
+
+    def renew(self, task_ids, lease_seconds):
+        self.renewed.extend(task_ids)
+        self.leases.update((task_id, time.monotonic() + lease_seconds) for task_id in task_ids)
+
+    def release(self, task_id):
+        self.leases.pop(task_id, None)
+
+    def finish(self, task_id):
+        self.runs.append(task_id)
+        self.status[task_id] = 'completed'
+
+    def slow(self, task_id):
+        time.sleep(LEASE_SECONDS * 2)
+        self.finish(task_id)
+
+    def crash(self, task_id):
+        """A run whose worker stopped before it stored a result."""
+        self.runs.append(task_id)
+        if self.runs.count(task_id) > 1:
+            self.status[task_id] = 'completed'
+
+    def hang(self, task_id):
+        self.runs.append(task_id)
+
+
+@pytest.fixture
+def task_dispatch():
+    pytest.importorskip('flask_appbuilder')
+    from GS.core.app.helper import task_dispatch
+    return task_dispatch
+
+
+@pytest.fixture
+def tasks(task_dispatch, monkeypatch):
+    from GS.core.app.helper import db_routing
+    tasks = Tasks()
+    runners = {'finish': tasks.finish, 'slow': tasks.slow, 'crash': tasks.crash, 'hang': tasks.hang}
+    monkeypatch.setattr(db_routing, 'background_task', lambda target: target)
+    monkeypatch.setattr(task_dispatch, 'runner', lambda kind: runners[kind])
+    monkeypatch.setattr(task_dispatch, '_task_status', tasks.status.get)
+    monkeypatch.setattr(task_dispatch, '_fail_task', tasks.fail)
+    monkeypatch.setattr(task_dispatch, '_claim_task', tasks.claim)
+    monkeypatch.setattr(task_dispatch, '_renew_leases', tasks.renew)
+    monkeypatch.setattr(task_dispatch, '_release_task', tasks.release)
+    return tasks
+
+
+@pytest.fixture
+def broker():
+    return InMemoryBroker()
+
+
+@pytest.fixture
+def worker(broker, tasks, task_dispatch):
+    worker = task_dispatch.TaskWorker(broker, concurrency=2, lease_seconds=LEASE_SECONDS)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    yield worker
+    worker.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def publish(broker, tasks, task_id, kind, priority=0):
+    tasks.status[task_id] = 'pending'
+    broker.publish({'task_id': task_id, 'user': 'alice', 'lane': 'batch', 'kind': kind, 'args': [task_id]},
+                   priority=priority)
+
+
+def settled(broker, timeout=5):
+    """Wait until the queue is empty and every delivery was settled."""
+    deadline = time.monotonic() + timeout
+    while len(broker) or broker._unacked:
+        assert time.monotonic() < deadline, "The worker did not settle the messages"
+        time.sleep(0.01)
+
+
+def test_prefetch_and_priority(broker):
+    broker.publish({'task_id': 'batch'})
+    broker.publish({'task_id': 'interactive'}, priority=HIGH_PRIORITY)
+    received, stop = [], threading.Event()
+
+    def handler(delivery):
+        received.append(delivery)
+        stop.set()
+
+    broker.consume(handler, prefetch=1, stop=stop)
+    assert [delivery.message['task_id'] for delivery in received] == ['interactive']
+    # The consumer went away without settling, the message is back at the front
+    again = []
+    stop.clear()
+    broker.consume(lambda delivery: (again.append(delivery), stop.set()), prefetch=1, stop=stop)
+    assert again[0].message['task_id'] == 'interactive' and again[0].deliveries == 2
+
+
+def test_messages_returned_too_often_are_dead_lettered(broker):
+    broker.publish({'task_id': 'a'})
+    stop = threading.Event()
+    broker.consume(lambda delivery: (broker.reject(delivery, requeue=True), stop.set()), prefetch=1, stop=stop)
+    for _ in range(DELIVERY_LIMIT):
+        stop.clear()
+        broker.consume(lambda delivery: (broker.reject(delivery, requeue=True), stop.set()), prefetch=1, stop=stop)
+    assert len(broker) == 0 and [dead['deliveries'] for dead in broker.dead] == [DELIVERY_LIMIT + 1]
+
+
+def test_the_queue_outlasts_long_runs():
+    pytest.importorskip('pika')
+    declared = {}
+
+    class Channel:
+        def exchange_declare(self, *args, **kwargs):
+            pass
+
+        def queue_bind(self, *args, **kwargs):
+            pass
+
+        def queue_declare(self, queue, durable, arguments):
+            declared[queue] = arguments
+
+    task_broker.RabbitMQBroker('amqp://localhost', consumer_timeout=7200).declare(Channel())
+    assert declared[task_broker.DEFAULT_QUEUE]['x-consumer-timeout'] == 7200 * 1000
+    declared.clear()
+    task_broker.RabbitMQBroker('amqp://localhost', consumer_timeout=0).declare(Channel())
+    assert 'x-consumer-timeout' not in declared[task_broker.DEFAULT_QUEUE]
+
+
+def test_finished_runs_are_acknowledged(broker, tasks, worker):
+    for task_id in ('a', 'b', 'c'):
+        publish(broker, tasks, task_id, 'finish')
+    settled(broker)
+    assert sorted(tasks.runs) == ['a', 'b', 'c']
+    assert set(tasks.status.values()) == {'completed'}
+    assert broker.dead == []
+
+
+def test_runs_without_a_result_are_redelivered(broker, tasks, worker):
+    publish(broker, tasks, 'a', 'crash')
+    settled(broker)
+    assert tasks.runs == ['a', 'a']
+    assert tasks.status['a'] == 'completed' and broker.dead == []
+
+
+def test_runs_interrupted_too_often_are_dead_lettered(broker, tasks, worker):
+    publish(broker, tasks, 'a', 'hang')
+    settled(broker)
+    assert tasks.runs == ['a'] * DELIVERY_LIMIT
+    assert tasks.status['a'] == 'error'
+    assert [dead['deliveries'] for dead in broker.dead] == [DELIVERY_LIMIT + 1]
+
+
+def test_messages_that_cannot_run_are_dead_lettered(broker, tasks, worker):
+    publish(broker, tasks, 'a', 'unknown')
+    broker.publish({'task_id': 'b', 'kind': 'finish', 'args': ['b']})
+    settled(broker)
+    assert tasks.runs == [] and tasks.status['a'] == 'error'
+    assert [dead['deliveries'] for dead in broker.dead] == [1, 1]
+
+
+def test_finished_tasks_are_not_run_again(broker, tasks, worker):
+    tasks.status['a'] = 'cancelled'
+    broker.publish({'task_id': 'a', 'kind': 'finish', 'args': ['a']})
+    settled(broker)
+    assert tasks.runs == [] and broker.dead == []
+
+
+def test_leases_are_renewed_while_the_task_runs(broker, tasks, worker):
+    publish(broker, tasks, 'a', 'slow')
+    settled(broker)
+    assert tasks.runs == ['a'] and 'a' in tasks.renewed
+
+
+def test_redeliveries_wait_for_a_live_owner(broker, tasks, worker):
+    # Another worker runs the task, its channel was closed and the message redelivered
+    tasks.status['a'] = 'in_progress'
+    tasks.leases['a'] = time.monotonic() + 60
+    broker.publish({'task_id': 'a', 'kind': 'finish', 'args': ['a']})
+    time.sleep(LEASE_SECONDS)
+    assert tasks.runs == [] and broker._unacked
+
+    tasks.status['a'] = 'completed'
+    settled(broker)
+    assert tasks.runs == [] and broker.dead == []
+
+
+def test_redeliveries_run_once_the_owners_lease_runs_out(broker, tasks, worker):
+    tasks.status['a'] = 'in_progress'
+    tasks.leases['a'] = time.monotonic() + LEASE_SECONDS
+    broker.publish({'task_id': 'a', 'kind': 'finish', 'args': ['a']})
+    settled(broker)
+    assert tasks.runs == ['a'] and tasks.status['a'] == 'completed'
+
+
+def test_memory_broker_runs_in_the_web_process(tasks, task_dispatch, monkeypatch):
+    broker = task_dispatch.InMemoryBroker()
+    monkeypatch.setattr(task_dispatch, 'get_task_broker', lambda: broker)
+    worker = task_dispatch.start_local_worker()
+    try:
+        assert task_dispatch.start_local_worker() is worker
+        publish(broker, tasks, 'a', 'finish')
+        settled(broker)
+        assert tasks.status['a'] == 'completed'
+    finally:
+        task_dispatch.stop_local_worker()
+    monkeypatch.setattr(task_dispatch, 'get_task_broker', lambda: None)
+    assert task_dispatch.start_local_worker() is None
+
+
+def test_leases_are_claimed_in_the_database(app, task_dispatch):
+    from GS.core.app import db
+    from GS.core.app.models.task_result import TaskResult
+    db.session.add(TaskResult(task_id='a', status='in_progress'))
+    db.session.commit()
+
+    assert task_dispatch._claim_task('a', 60) and not task_dispatch._claim_task('a', 60)
+    task_dispatch._release_task('a')
+    assert task_dispatch._claim_task('a', -1) and task_dispatch._claim_task('a', 60)
+    task_dispatch._renew_leases(['a'], -1)
+    db.session.query(TaskResult).filter_by(task_id='a').update({TaskResult.status: 'completed'})
+    db.session.commit()
+    assert not task_dispatch._claim_task('a', 60)
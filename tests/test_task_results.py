@@ -0,0 +1,76 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip('flask_appbuilder')
+from GS.core.app import db  # noqa: E402
+from GS.core.app.apis import crewai_api  # noqa: E402
+from GS.core.app.helper.compression import GZIP, IDENTITY, ZSTD, decompress  # noqa: E402
+from GS.core.app.models.task_result import TaskResult  # noqa: E402
+
+RESULT = {'report': 'x' * 2000, 'rows': list(range(100))}
+
+
+def stored(task_id, payload=RESULT, codec=None, user='alice'):
+    task = TaskResult(task_id=task_id, status='completed', user=user)
+    task.set_result(json.dumps(payload), codec)
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+@pytest.mark.parametrize('codec', [ZSTD, GZIP, IDENTITY])
+def test_results_are_stored_compressed(app, codec):
+    task = stored('a', codec=codec)
+    assert task.result is None and task.result_encoding in (codec, GZIP)
+    if task.result_encoding != IDENTITY:
+        assert len(task.result_data) < len(json.dumps(RESULT))
+    assert json.loads(task.get_result_text()) == RESULT
+
+
+def test_small_and_legacy_results_are_read_as_they_are(app):
+    small = stored('small', {'answer': 42})
+    assert small.result_encoding == IDENTITY and json.loads(small.get_result_text()) == {'answer': 42}
+    legacy = TaskResult(task_id='legacy', status='completed', result='{"old": true}')
+    assert legacy.get_result_text() == '{"old": true}'
+
+
+def test_get_result_sends_the_stored_bytes_when_the_client_accepts_them(app):
+    task = stored('a', codec=GZIP)
+    client = app.test_client()
+
+    response = client.get('/api/v1/crewai/get_result/a', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip' and response.headers['Vary'] == 'Accept-Encoding'
+    assert response.data.endswith(gzip.compress(b'}', compresslevel=1)) and task.result_data in response.data
+    assert json.loads(decompress(response.data, GZIP)) == {'result': RESULT}
+
+    plain = client.get('/api/v1/crewai/get_result/a', headers={'Accept-Encoding': 'br'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_json() == {'result': RESULT}
+
+
+def test_export_only_has_the_users_own_tasks(app, monkeypatch):
+    stored('mine')
+    stored('theirs', user='bob')
+    client = app.test_client()
+    assert client.get('/api/v1/crewai/export').status_code == 401
+
+    monkeypatch.setattr(crewai_api, 'request_user', lambda: 'alice')
+    lines = client.get('/api/v1/crewai/export').data.decode().splitlines()
+    assert [json.loads(line)['task_id'] for line in lines] == ['mine']
+    assert json.loads(lines[0])['result'] == RESULT
+
+
+def test_only_the_creator_deletes_a_schedule(app, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(crewai_api, 'request_user', lambda: 'bob')
+    created = client.post('/api/v1/crewai/schedules', json={
+        'name': 'daily', 'interval_seconds': 86400, 'sources': [{'table': 'orders'}]})
+    assert created.status_code == 201
+
+    monkeypatch.setattr(crewai_api, 'request_user', lambda: 'alice')
+    assert client.delete('/api/v1/crewai/schedules/daily').status_code == 403
+    monkeypatch.setattr(crewai_api, 'request_user', lambda: 'bob')
+    assert client.delete('/api/v1/crewai/schedules/daily').status_code == 200
+    assert client.delete('/api/v1/crewai/schedules/daily').status_code == 404
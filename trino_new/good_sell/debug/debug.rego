@@ -0,0 +1,27 @@
+package trino
+import future.keywords.contains
+import future.keywords.if
+
+# Development only: every definition below prints the input and then fails,
+# so it never changes a decision. Load the policies with `--ignore debug` in
+# production to keep the evaluation path free of logging.
+
+allow if {
+    print("allow", input)
+    false
+}
+
+single_resource if {
+    print("single_resource", input)
+    false
+}
+
+batch contains -1 if {
+    print("batch", input)
+    false
+}
+
+columnMask = {} if {
+    print("column_masking", input)
+    false
+}
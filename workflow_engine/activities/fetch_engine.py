@@ -0,0 +1,422 @@
+"""Async, pooled HTTP fetch engine for the scraping worker (Agent D).
+
+Each (host, proxy) pair gets its own keep-alive connection pool, with HTTP/2
+when the `h2` package is installed. At most `max_clients` pools are kept, the
+least recently used idle ones are closed beyond that. Requests to a domain are bounded by a
+per-domain concurrency limit and a politeness delay between request starts.
+Responses are streamed to disk in chunks, never held whole in memory, and
+kept in a local response cache so repeat fetches become conditional requests
+(If-None-Match / If-Modified-Since) that usually end in a cheap 304. The cache
+is keyed by method, URL and the request headers that change the response.
+Bodies that are not cached belong to the caller, who drops them with
+`FetchResult.discard()`; whatever is left is removed when the engine closes.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from GS.workflow_engine.configs import Scraping
+
+try:
+    import h2  # noqa: F401  httpx needs it for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+CHUNK_SIZE = 64 * 1024
+
+# Request headers that select a different response for the same URL
+VARYING_HEADERS = ('accept', 'accept-language', 'authorization', 'cookie')
+
+
+class IncompleteBody(Exception):
+    """The connection ended before the body announced by Content-Length arrived."""
+
+
+def _cookie_header(cookies: Optional[Dict[str, str]]) -> Dict[str, str]:
+    # Sent as a header, httpx deprecates per-request cookie jars on shared clients
+    if not cookies:
+        return {}
+    return {'Cookie': '; '.join(f'{name}={value}' for name, value in cookies.items())}
+
+
+@dataclass
+class FetchResult:
+    """Outcome of a fetch, the body lives in a file rather than in memory."""
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    body_path: Optional[str]
+    size: int
+    elapsed: float
+    from_cache: bool = False
+    http_version: str = ''
+    proxy: Optional[str] = None
+    # The body was cut at the engine's max_body_bytes
+    truncated: bool = False
+    # The body file is the caller's rather than the cache's
+    owns_body: bool = False
+
+    def iter_bytes(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream the body back from disk."""
+        if not self.body_path:
+            return
+        with open(self.body_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        """Read the whole body as text, only for pages known to be small."""
+        return b''.join(self.iter_bytes()).decode(encoding, errors='replace')
+
+    def discard(self):
+        """Delete a body the cache does not keep, once it has been read."""
+        if self.owns_body and self.body_path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.body_path)
+            self.body_path = None
+
+
+class ResponseCache:
+    """On-disk cache of response bodies with their validators."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(method: str, url: str, headers: Dict[str, str]) -> str:
+        """Cache key of a request, from its method, URL and response-varying headers."""
+        varying = {name.lower(): value for name, value in headers.items() if name.lower() in VARYING_HEADERS}
+        request = json.dumps([method.upper(), url, sorted(varying.items())])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self.directory, f'{key}.body'), os.path.join(self.directory, f'{key}.json')
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Return cached metadata for a request key, None when absent."""
+        body_path, meta_path = self._paths(key)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        meta['body_path'] = body_path
+        return meta
+
+    @staticmethod
+    def validators(meta: Optional[Dict]) -> Dict[str, str]:
+        """Conditional request headers for a cached response."""
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def temp_body(self) -> Tuple[int, str]:
+        """Open a temporary file in the cache directory for a streamed body."""
+        return tempfile.mkstemp(dir=self.directory, suffix='.part')
+
+    def store(self, key: str, url: str, temp_path: str, status_code: int, headers: httpx.Headers) -> str:
+        """Move a streamed body into the cache and record its validators."""
+        body_path, meta_path = self._paths(key)
+        os.replace(temp_path, body_path)
+        meta = {
+            'url': url,
+            'status_code': status_code,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'content_type': headers.get('content-type'),
+            'stored_at': time.time(),
+        }
+        with open(meta_path + '.part', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.part', meta_path)
+        return body_path
+
+
+class _DomainLimiter:
+    """Concurrency limit plus a minimum delay between request starts."""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.delay:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self.delay
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class FetchEngine:
+    """Fetch pages concurrently with per-host pools and per-domain politeness."""
+
+    def __init__(self, cache_dir: Optional[str] = Scraping.FETCH_CACHE_DIR,
+                 per_domain_concurrency: int = Scraping.PER_DOMAIN_CONCURRENCY,
+                 politeness_delay: float = Scraping.POLITENESS_DELAY_SECONDS,
+                 max_connections_per_host: int = Scraping.MAX_CONNECTIONS_PER_HOST,
+                 timeout: float = Scraping.FETCH_TIMEOUT_SECONDS,
+                 max_body_bytes: int = Scraping.MAX_BODY_BYTES,
+                 http2: bool = True, domain_overrides: Optional[Dict[str, Tuple[int, float]]] = None,
+                 max_clients: int = Scraping.MAX_CLIENTS):
+        """Initialize the engine.
+
+        Args:
+            cache_dir: Response cache directory, a temporary one when None
+            per_domain_concurrency: Requests in flight per domain
+            politeness_delay: Seconds between request starts on one domain
+            max_connections_per_host: Size of each host's connection pool
+            timeout: Connect/read/write/pool timeout in seconds
+            max_body_bytes: Bodies larger than this are cut off
+            http2: Use HTTP/2 where the server and the h2 package allow it
+            domain_overrides: {domain: (concurrency, delay)} for specific sites
+            max_clients: Connection pools kept open, one per (host, proxy)
+        """
+        self.cache = ResponseCache(cache_dir or tempfile.mkdtemp(prefix='fetch_cache_'))
+        self.per_domain_concurrency = per_domain_concurrency
+        self.politeness_delay = politeness_delay
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = httpx.Timeout(timeout)
+        self.max_body_bytes = max_body_bytes
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.domain_overrides = domain_overrides or {}
+        self.max_clients = max_clients
+        # Least recently used first, with the requests in flight on each
+        self._clients: 'OrderedDict[Tuple[str, Optional[str]], httpx.AsyncClient]' = OrderedDict()
+        self._leases: Counter = Counter()
+        self._limiters: Dict[str, _DomainLimiter] = {}
+        # Bodies handed to callers without being cached
+        self._owned_bodies: Set[str] = set()
+
+    def _client(self, origin: str, proxy: Optional[str]) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            proxy=proxy,
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={'User-Agent': Scraping.USER_AGENT},
+            limits=httpx.Limits(
+                max_connections=self.max_connections_per_host,
+                max_keepalive_connections=self.max_connections_per_host,
+            ),
+        )
+
+    @contextlib.asynccontextmanager
+    async def _pooled_client(self, url: str, proxy: Optional[str]) -> AsyncIterator[httpx.AsyncClient]:
+        """The client of the URL's origin and the proxy, kept open for the next requests."""
+        parts = urlsplit(url)
+        key = (f'{parts.scheme}://{parts.netloc}', proxy)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = self._client(*key)
+        self._clients.move_to_end(key)
+        self._leases[key] += 1
+        try:
+            await self._evict()
+            yield client
+        finally:
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+
+    async def _evict(self):
+        """Close the least recently used idle clients beyond `max_clients`."""
+        excess = len(self._clients) - self.max_clients
+        if excess <= 0:
+            return
+        # Clients with requests in flight stay, the pool shrinks once they finish
+        idle = [key for key in self._clients if key not in self._leases][:excess]
+        evicted = [self._clients.pop(key) for key in idle]
+        await asyncio.gather(*(client.aclose() for client in evicted))
+
+    def _limiter(self, domain: str) -> _DomainLimiter:
+        limiter = self._limiters.get(domain)
+        if limiter is None:
+            concurrency, delay = self.domain_overrides.get(domain, (self.per_domain_concurrency, self.politeness_delay))
+            limiter = _DomainLimiter(concurrency, delay)
+            self._limiters[domain] = limiter
+        return limiter
+
+    async def fetch(self, url: str, proxy: Optional[str] = None, cookies: Optional[Dict[str, str]] = None,
+                    headers: Optional[Dict[str, str]] = None, use_cache: bool = True,
+                    method: str = 'GET') -> FetchResult:
+        """Fetch a URL, streaming the body to disk.
+
+        Args:
+            url: The page to fetch
+            proxy: Proxy URL to route through
+            cookies: Login session cookies
+            headers: Extra request headers
+            use_cache: Send conditional headers and reuse the cached body on 304
+            method: The HTTP method
+
+        Returns:
+            A FetchResult whose body is readable with `iter_bytes()`. Bodies that
+            were not cached are the caller's to `discard()`.
+
+        Raises:
+            IncompleteBody: Fewer bytes arrived than the Content-Length announced
+        """
+        parts = urlsplit(url)
+        request_headers = dict(headers or {})
+        request_headers.update(_cookie_header(cookies))
+        key = self.cache.key(method, url, request_headers)
+        cached = self.cache.lookup(key) if use_cache else None
+        if cached:
+            request_headers.update(self.cache.validators(cached))
+
+        async with self._limiter(parts.hostname or ''), self._pooled_client(url, proxy) as client:
+            started = time.perf_counter()
+            async with client.stream(method, url, headers=request_headers) as response:
+                if response.status_code == 304 and cached:
+                    return FetchResult(
+                        url=url,
+                        status_code=cached['status_code'],
+                        headers=dict(response.headers),
+                        body_path=cached['body_path'],
+                        size=os.path.getsize(cached['body_path']),
+                        elapsed=time.perf_counter() - started,
+                        from_cache=True,
+                        http_version=response.http_version,
+                        proxy=proxy,
+                    )
+
+                fd, temp_path = self.cache.temp_body()
+                size = 0
+                truncated = False
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            remaining = self.max_body_bytes - size
+                            if len(chunk) > remaining:
+                                f.write(chunk[:remaining])
+                                size += remaining
+                                truncated = True
+                                break
+                            f.write(chunk)
+                            size += len(chunk)
+                    elapsed = time.perf_counter() - started
+                    self._check_length(method, response, truncated)
+
+                    owns_body = not (use_cache and response.status_code == 200 and not truncated)
+                    if owns_body:
+                        body_path = temp_path[:-len('.part')] + '.body'
+                        os.replace(temp_path, body_path)
+                        self._own(body_path)
+                    else:
+                        body_path = self.cache.store(key, url, temp_path, response.status_code, response.headers)
+                finally:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(temp_path)
+
+        return FetchResult(
+            url=url,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            body_path=body_path,
+            size=size,
+            elapsed=elapsed,
+            http_version=response.http_version,
+            proxy=proxy,
+            truncated=truncated,
+            owns_body=owns_body,
+        )
+
+    def _own(self, body_path: str):
+        if len(self._owned_bodies) >= 1024:
+            # Forget the bodies callers already discarded
+            self._owned_bodies = {path for path in self._owned_bodies if os.path.exists(path)}
+        self._owned_bodies.add(body_path)
+
+    @staticmethod
+    def _check_length(method: str, response: httpx.Response, truncated: bool):
+        expected = response.headers.get('content-length', '')
+        if truncated or method.upper() == 'HEAD' or response.status_code in (204, 304) or not expected.isdigit():
+            return
+        # Compared on the wire, Content-Length counts the encoded bytes
+        if response.num_bytes_downloaded != int(expected):
+            raise IncompleteBody(f"{response.url}: received {response.num_bytes_downloaded} of {expected} bytes")
+
+    async def stream(self, url: str, proxy: Optional[str] = None,
+                     cookies: Optional[Dict[str, str]] = None) -> AsyncIterator[bytes]:
+        """Yield the body of a URL chunk by chunk without caching it."""
+        parts = urlsplit(url)
+        async with self._limiter(parts.hostname or ''), self._pooled_client(url, proxy) as client:
+            async with client.stream('GET', url, headers=_cookie_header(cookies)) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    yield chunk
+
+    async def fetch_many(self, urls, proxy: Optional[str] = None, return_exceptions: bool = True):
+        """Fetch many URLs concurrently, limits still apply per domain."""
+        return await asyncio.gather(*(self.fetch(url, proxy=proxy) for url in urls),
+                                    return_exceptions=return_exceptions)
+
+    async def aclose(self):
+        """Close every pooled connection and delete the bodies callers did not discard."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._leases.clear()
+        await asyncio.gather(*(client.aclose() for client in clients))
+        for body_path in self._owned_bodies:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(body_path)
+        self._owned_bodies.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+_engine = None
+
+
+def get_fetch_engine() -> FetchEngine:
+    """Return the fetch engine shared by the activities of this worker."""
+    global _engine
+    if _engine is None:
+        _engine = FetchEngine()
+    return _engine
+
+
+async def fetch_page(url: str, proxy: Optional[str] = None, login_session: Optional[Dict[str, str]] = None) -> FetchResult:
+    """Fetch a page for the scraping workflow.
+
+    Args:
+        url: The page to fetch
+        proxy: Proxy URL returned by the proxy manager
+        login_session: Cookies of an authenticated session
+
+    Returns:
+        A FetchResult with the streamed body on disk
+    """
+    return await get_fetch_engine().fetch(url, proxy=proxy, cookies=login_session)
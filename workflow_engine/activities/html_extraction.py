@@ -0,0 +1,289 @@
+"""Streaming HTML-to-text extraction for the data processing stage (Agent E).
+
+Pages are parsed incrementally from their byte stream with the standard
+library's HTMLParser, so memory stays bounded by the largest text block
+rather than the page or its DOM. Boilerplate (scripts, styles, navigation,
+headers, footers, cookie banners...) is dropped while it streams, and the
+remaining content comes out of a generator as structured blocks. Batches of
+pages are parsed across a process pool, each worker reading its files from
+disk so page bodies never cross process boundaries.
+"""
+
+import codecs
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from GS.workflow_engine.configs import Scraping
+
+CHUNK_SIZE = 64 * 1024
+MAX_BLOCK_CHARS = 20_000
+
+# Elements whose whole subtree is dropped
+SKIP_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object',
+    'nav', 'header', 'footer', 'aside', 'form', 'button', 'select',
+}
+SKIP_ROLES = {'navigation', 'banner', 'contentinfo', 'complementary', 'search', 'dialog'}
+# Whole class names and ids marking boilerplate containers, underscores read as hyphens. Parts of
+# names are not enough: "post-header" holds a title and "has-sidebar" a whole page.
+SKIP_HINTS = {
+    'nav', 'navbar', 'navigation', 'menu', 'main-nav', 'main-menu', 'site-nav', 'site-navigation',
+    'header', 'site-header', 'page-header', 'footer', 'site-footer', 'page-footer', 'sidebar',
+    'breadcrumb', 'breadcrumbs', 'cookie', 'cookies', 'cookie-banner', 'cookie-consent', 'cookie-notice',
+    'banner', 'ad', 'ads', 'advert', 'advertisement', 'share', 'share-buttons', 'social', 'social-share',
+    'newsletter', 'popup', 'modal',
+}
+# The page itself and its content containers, never dropped for their attributes
+CONTENT_TAGS = {'html', 'body', 'main', 'article'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+             'source', 'track', 'wbr'}
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+BLOCK_KINDS = {
+    'p': 'paragraph', 'div': 'paragraph', 'section': 'paragraph', 'article': 'paragraph', 'main': 'paragraph',
+    'blockquote': 'quote', 'li': 'list_item', 'dt': 'list_item', 'dd': 'list_item',
+    'tr': 'table_row', 'pre': 'code', 'title': 'title', 'caption': 'paragraph', 'figcaption': 'paragraph',
+}
+CELL_TAGS = {'td', 'th'}
+
+_WHITESPACE = re.compile(r'\s+')
+_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_\-]+)', re.IGNORECASE)
+
+
+@dataclass
+class Block:
+    """A piece of page content."""
+    kind: str
+    text: str
+    level: int = 0
+
+
+def sniff_encoding(head: bytes, default: str = 'utf-8') -> str:
+    """Find the charset declared in the first bytes of a page."""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    match = _CHARSET.search(head[:4096])
+    if match:
+        name = match.group(1).decode('ascii', errors='ignore')
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    return default
+
+
+def _is_boilerplate(tag: str, attrs) -> bool:
+    if tag in SKIP_TAGS:
+        return True
+    if tag in CONTENT_TAGS:
+        return False
+    for name, value in attrs:
+        if not value:
+            continue
+        if name == 'role' and value.lower() in SKIP_ROLES:
+            return True
+        if name == 'aria-hidden' and value == 'true':
+            return True
+        if name in ('class', 'id') and SKIP_HINTS.intersection(value.lower().replace('_', '-').split()):
+            return True
+    return False
+
+
+class StreamingTextExtractor(HTMLParser):
+    """Incremental parser turning HTML into content blocks.
+
+    Feed decoded text with `feed()` (or raw bytes with `feed_bytes()`) and
+    collect finished blocks with `drain()` in between; only the block being
+    built and HTMLParser's unparsed tail are kept in memory.
+    """
+
+    def __init__(self, encoding: str = 'utf-8'):
+        super().__init__(convert_charrefs=True)
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._blocks: List[Block] = []
+        self._parts: List[str] = []
+        self._size = 0
+        self._kind = 'paragraph'
+        self._level = 0
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._pre_depth = 0
+
+    def feed_bytes(self, chunk: bytes):
+        """Decode and parse the next chunk of the byte stream."""
+        self.feed(self._decoder.decode(chunk))
+
+    def drain(self) -> List[Block]:
+        """Return and forget the blocks completed so far."""
+        blocks, self._blocks = self._blocks, []
+        return blocks
+
+    def close(self):
+        self.feed(self._decoder.decode(b'', final=True))
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        if not self._parts:
+            return
+        text = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        if self._pre_depth == 0:
+            text = _WHITESPACE.sub(' ', text)
+        text = text.strip()
+        if text:
+            self._blocks.append(Block(self._kind, text, self._level))
+
+    def _start_block(self, kind: str, level: int = 0):
+        self._flush()
+        self._kind = kind
+        self._level = level
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag not in VOID_TAGS and _is_boilerplate(tag, attrs):
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        if tag in HEADING_TAGS:
+            self._start_block('heading', int(tag[1]))
+        elif tag in BLOCK_KINDS:
+            self._start_block(BLOCK_KINDS[tag])
+            if tag == 'pre':
+                self._pre_depth += 1
+        elif tag in CELL_TAGS:
+            if self._parts:
+                self._parts.append(' | ')
+        elif tag == 'br':
+            self._parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in HEADING_TAGS or tag in BLOCK_KINDS:
+            self._flush()
+            if tag == 'pre' and self._pre_depth:
+                self._pre_depth -= 1
+            self._kind = 'paragraph'
+            self._level = 0
+
+    def handle_data(self, data):
+        if self._skip_tag is not None:
+            return
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= MAX_BLOCK_CHARS:
+            # Split runaway blocks instead of growing without bound
+            self._flush()
+
+
+def iter_blocks(chunks: Iterable[bytes], encoding: Optional[str] = None) -> Iterator[Block]:
+    """Yield content blocks from an HTML byte stream.
+
+    Args:
+        chunks: The page body in chunks, e.g. `FetchResult.iter_bytes()`
+        encoding: Page encoding, sniffed from the first chunk when None
+
+    Returns:
+        A generator of Block
+    """
+    extractor = None
+    head = b''
+    for chunk in chunks:
+        if extractor is None:
+            # Hold back the first KiB so the charset declaration can be seen
+            head += chunk
+            if len(head) < 1024:
+                continue
+            extractor = StreamingTextExtractor(encoding or sniff_encoding(head))
+            chunk, head = head, b''
+        extractor.feed_bytes(chunk)
+        yield from extractor.drain()
+    if extractor is None:
+        if not head:
+            return
+        extractor = StreamingTextExtractor(encoding or sniff_encoding(head))
+        extractor.feed_bytes(head)
+    extractor.close()
+    yield from extractor.drain()
+
+
+def iter_file_blocks(path: str, encoding: Optional[str] = None) -> Iterator[Block]:
+    """Yield content blocks from an HTML file read in chunks."""
+    def chunks():
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    return iter_blocks(chunks(), encoding)
+
+
+def blocks_to_text(blocks: Iterable[Block]) -> str:
+    """Join blocks into plain text, headings prefixed with markdown hashes."""
+    lines = []
+    for block in blocks:
+        lines.append(f"{'#' * block.level} {block.text}" if block.kind == 'heading' else block.text)
+    return '\n\n'.join(lines)
+
+
+def extract_raw_text(raw_html: Union[str, bytes]) -> str:
+    """Convert a page to clean text (Agent E activity).
+
+    Args:
+        raw_html: The page as text or bytes
+
+    Returns:
+        The page content without boilerplate
+    """
+    if isinstance(raw_html, str):
+        raw_html = raw_html.encode('utf-8')
+        encoding = 'utf-8'
+    else:
+        encoding = None
+    chunks = (raw_html[i:i + CHUNK_SIZE] for i in range(0, len(raw_html), CHUNK_SIZE))
+    return blocks_to_text(iter_blocks(chunks, encoding))
+
+
+def extract_fetch_result(result) -> List[Block]:
+    """Extract the blocks of a FetchResult straight from its body on disk."""
+    return list(iter_blocks(result.iter_bytes()))
+
+
+def _extract_path(path: str) -> List[Dict]:
+    return [asdict(block) for block in iter_file_blocks(path)]
+
+
+def extract_many(paths: List[str], processes: int = Scraping.EXTRACT_PROCESSES) -> List[List[Dict]]:
+    """Extract a batch of saved pages in parallel.
+
+    Args:
+        paths: HTML files, e.g. the `body_path` of fetch results
+        processes: Worker processes, 0 uses every CPU and 1 stays in this process
+
+    Returns:
+        One list of block dicts per page, in the order of `paths`
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(paths) < 2:
+        return [_extract_path(path) for path in paths]
+    with ProcessPoolExecutor(min(processes, len(paths))) as executor:
+        return list(executor.map(_extract_path, paths, chunksize=max(1, len(paths) // (processes * 4))))
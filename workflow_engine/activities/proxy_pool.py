@@ -0,0 +1,434 @@
+"""Health-scored proxy pool with per-site ban tracking (Agent C).
+
+Every site keeps its own ranking of proxies. A proxy's score is its smoothed
+success rate divided by its smoothed latency, minus a small penalty per
+request in flight so concurrent callers spread over the best proxies instead
+of piling on one. Responses reported from the fetch path move proxies out of
+the ranking: 429 parks a proxy for a cooldown, 403/407 bans it for a longer
+window, repeated errors cool it down, and windows grow exponentially on
+repeat offences. Parked proxies return to the ranking once their window ends.
+
+State lives in Redis (sorted sets per site, updated atomically with Lua) or,
+for tests and simulations, in memory behind the same interface. Stores apply
+an outcome to a proxy's stats themselves, with `apply_outcome` in memory and
+the same steps in the Lua script, so concurrent workers never overwrite each
+other's counts.
+"""
+
+import heapq
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from GS.workflow_engine.configs import ProxyConfig
+
+SUCCESS = 'success'
+THROTTLED = 'throttled'
+BANNED = 'banned'
+FAILED = 'failed'
+
+EWMA_ALPHA = 0.2
+INFLIGHT_PENALTY = 0.05
+INITIAL_STATS = {'success': 1.0, 'latency': 0.5, 'inflight': 0, 'failures': 0, 'throttles': 0, 'bans': 0}
+
+
+def classify(status_code: Optional[int], error: bool = False) -> str:
+    """Map a fetch outcome to a health event."""
+    if error or status_code is None:
+        return FAILED
+    if status_code == 429:
+        return THROTTLED
+    if status_code in (403, 407):
+        return BANNED
+    if status_code >= 500:
+        return FAILED
+    return SUCCESS
+
+
+def health_score(stats: Dict) -> float:
+    """Higher is better, smoothed success rate per second of latency."""
+    return stats['success'] / (1.0 + stats['latency']) - stats['inflight'] * INFLIGHT_PENALTY
+
+
+class Windows(NamedTuple):
+    """How long proxies are parked, see `ProxyPool`."""
+    cooldown_seconds: float
+    ban_seconds: float
+    max_window_seconds: float
+    failures_before_cooldown: int
+
+    def window(self, base: float, repeats: int) -> float:
+        return min(self.max_window_seconds, base * (2 ** (repeats - 1)))
+
+
+def apply_outcome(stats: Dict, event: str, latency: float, now: float, windows: Windows) -> Optional[float]:
+    """Update a proxy's stats in place for the outcome of one of its requests.
+
+    Returns:
+        When the proxy is released again, None when it stays in the ranking
+    """
+    stats['inflight'] = max(0, stats['inflight'] - 1)
+    stats['success'] = (1 - EWMA_ALPHA) * stats['success'] + EWMA_ALPHA * (1.0 if event == SUCCESS else 0.0)
+    if event != FAILED:
+        stats['latency'] = (1 - EWMA_ALPHA) * stats['latency'] + EWMA_ALPHA * latency
+
+    if event == SUCCESS:
+        stats['failures'] = 0
+        stats['throttles'] = 0
+    elif event == THROTTLED:
+        stats['throttles'] += 1
+        return now + windows.window(windows.cooldown_seconds, stats['throttles'])
+    elif event == BANNED:
+        stats['bans'] += 1
+        return now + windows.window(windows.ban_seconds, stats['bans'])
+    else:
+        stats['failures'] += 1
+        if stats['failures'] >= windows.failures_before_cooldown:
+            return now + windows.window(windows.cooldown_seconds,
+                                        stats['failures'] - windows.failures_before_cooldown + 1)
+    return None
+
+
+class InMemoryProxyStore:
+    """Process-local store, a lazily invalidated max-heap per site behind a lock."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._scores: Dict[str, Dict[str, float]] = {}
+        self._heaps: Dict[str, List[Tuple[float, int, str]]] = {}
+        self._parked: Dict[str, List[Tuple[float, str]]] = {}
+        # proxy -> (release_at, score), heap entries whose release_at differs are stale
+        self._parked_scores: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        self._stats: Dict[Tuple[str, str], Dict] = {}
+        self._version = 0
+
+    def _push(self, site_id: str, proxy: str, score: float):
+        self._version += 1
+        scores = self._scores.setdefault(site_id, {})
+        scores[proxy] = score
+        heap = self._heaps.setdefault(site_id, [])
+        heapq.heappush(heap, (-score, self._version, proxy))
+        if len(heap) > 4 * len(scores) + 64:
+            # Rebuild from live scores once stale entries dominate
+            heap[:] = [(-value, self._version, name) for name, value in scores.items()]
+            heapq.heapify(heap)
+
+    def ensure(self, site_id: str, proxies: Iterable[str]):
+        """Register proxies for a site that are not known yet."""
+        with self._lock:
+            scores = self._scores.setdefault(site_id, {})
+            parked = self._parked_scores.setdefault(site_id, {})
+            for proxy in proxies:
+                if proxy not in scores and proxy not in parked:
+                    self._stats[(site_id, proxy)] = dict(INITIAL_STATS)
+                    self._push(site_id, proxy, health_score(INITIAL_STATS))
+
+    def select(self, site_id: str, now: float) -> Optional[str]:
+        """Return the best ready proxy and count it as in flight."""
+        with self._lock:
+            return self._select(site_id, now)
+
+    def _select(self, site_id: str, now: float) -> Optional[str]:
+        parked = self._parked.get(site_id, [])
+        while parked and parked[0][0] <= now:
+            release_at, proxy = heapq.heappop(parked)
+            entry = self._parked_scores[site_id].get(proxy)
+            if entry is not None and entry[0] == release_at:
+                del self._parked_scores[site_id][proxy]
+                self._push(site_id, proxy, entry[1])
+
+        heap = self._heaps.get(site_id, [])
+        scores = self._scores.get(site_id, {})
+        while heap:
+            negative_score, _, proxy = heap[0]
+            if scores.get(proxy) == -negative_score:
+                break
+            heapq.heappop(heap)  # stale entry left by an update or a park
+        else:
+            return None
+
+        stats = self._stats[(site_id, proxy)]
+        stats['inflight'] += 1
+        self._push(site_id, proxy, health_score(stats))
+        return proxy
+
+    def get_stats(self, site_id: str, proxy: str) -> Dict:
+        with self._lock:
+            return dict(self._stats.get((site_id, proxy), INITIAL_STATS))
+
+    def record(self, site_id: str, proxy: str, event: str, latency: float, now: float,
+               windows: Windows) -> Optional[float]:
+        """Apply an outcome to the proxy's stats and re-rank or park it.
+
+        Returns:
+            When the proxy is released again, None when it stays in the ranking
+        """
+        with self._lock:
+            stats = dict(self._stats.get((site_id, proxy), INITIAL_STATS))
+            release_at = apply_outcome(stats, event, latency, now, windows)
+            self._update(site_id, proxy, stats, release_at)
+            return release_at
+
+    def _update(self, site_id: str, proxy: str, stats: Dict, release_at: Optional[float]):
+        """Store new stats and either re-rank the proxy or park it until release_at."""
+        self._stats[(site_id, proxy)] = stats
+        score = health_score(stats)
+        parked = self._parked_scores.setdefault(site_id, {})
+        if release_at is None:
+            if proxy in parked:
+                parked[proxy] = (parked[proxy][0], score)
+            else:
+                self._push(site_id, proxy, score)
+            return
+        self._scores.get(site_id, {}).pop(proxy, None)
+        parked[proxy] = (release_at, score)
+        heapq.heappush(self._parked.setdefault(site_id, []), (release_at, proxy))
+
+    def snapshot(self, site_id: str) -> Dict[str, Dict]:
+        """Scores of ready proxies and release times of parked ones."""
+        with self._lock:
+            return {
+                'ready': dict(self._scores.get(site_id, {})),
+                'parked': {proxy: release_at
+                           for proxy, (release_at, _) in self._parked_scores.get(site_id, {}).items()},
+            }
+
+
+# KEYS: ready zset, parked zset, parked scores hash, stats key prefix
+# ARGV: now, inflight penalty
+_SELECT_SCRIPT = """
+local released = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, proxy in ipairs(released) do
+    local score = redis.call('HGET', KEYS[3], proxy)
+    redis.call('ZREM', KEYS[2], proxy)
+    redis.call('HDEL', KEYS[3], proxy)
+    if score then
+        redis.call('ZADD', KEYS[1], score, proxy)
+    end
+end
+local best = redis.call('ZREVRANGE', KEYS[1], 0, 0)
+if #best == 0 then
+    return false
+end
+redis.call('ZINCRBY', KEYS[1], -tonumber(ARGV[2]), best[1])
+redis.call('HINCRBY', KEYS[4] .. best[1], 'inflight', 1)
+return best[1]
+"""
+
+# KEYS: ready zset, parked zset, parked scores hash, stats key
+# ARGV: proxy, event, latency, now, EWMA alpha, inflight penalty, cooldown, ban, max window,
+#       failures before cooldown
+# The steps of `apply_outcome`, then the proxy is re-ranked or parked until the release time it returns
+_RECORD_SCRIPT = """
+local proxy, event = ARGV[1], ARGV[2]
+local latency, now, alpha, penalty = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local cooldown, ban, max_window = tonumber(ARGV[7]), tonumber(ARGV[8]), tonumber(ARGV[9])
+local failures_before_cooldown = tonumber(ARGV[10])
+
+local function field(name, default)
+    local value = redis.call('HGET', KEYS[4], name)
+    if value then
+        return tonumber(value)
+    end
+    return default
+end
+local function window(base, repeats)
+    return math.min(max_window, base * 2 ^ (repeats - 1))
+end
+
+local inflight = math.max(0, field('inflight', 0) - 1)
+local success = (1 - alpha) * field('success', 1.0)
+if event == 'success' then
+    success = success + alpha
+end
+local smoothed_latency = field('latency', 0.5)
+if event ~= 'failed' then
+    smoothed_latency = (1 - alpha) * smoothed_latency + alpha * latency
+end
+local failures, throttles, bans = field('failures', 0), field('throttles', 0), field('bans', 0)
+local release_at = nil
+if event == 'success' then
+    failures, throttles = 0, 0
+elseif event == 'throttled' then
+    throttles = throttles + 1
+    release_at = now + window(cooldown, throttles)
+elseif event == 'banned' then
+    bans = bans + 1
+    release_at = now + window(ban, bans)
+else
+    failures = failures + 1
+    if failures >= failures_before_cooldown then
+        release_at = now + window(cooldown, failures - failures_before_cooldown + 1)
+    end
+end
+redis.call('HSET', KEYS[4], 'inflight', inflight, 'success', tostring(success),
+           'latency', tostring(smoothed_latency), 'failures', failures, 'throttles', throttles, 'bans', bans)
+
+local score = tostring(success / (1 + smoothed_latency) - inflight * penalty)
+if release_at == nil then
+    if redis.call('ZSCORE', KEYS[2], proxy) then
+        redis.call('HSET', KEYS[3], proxy, score)
+    else
+        redis.call('ZADD', KEYS[1], score, proxy)
+    end
+    return false
+end
+redis.call('ZREM', KEYS[1], proxy)
+redis.call('ZADD', KEYS[2], tostring(release_at), proxy)
+redis.call('HSET', KEYS[3], proxy, score)
+-- Numbers would be truncated to integers in the reply
+return tostring(release_at)
+"""
+
+
+class RedisProxyStore:
+    """Redis-backed store shared by every scraping worker."""
+
+    def __init__(self, client=None, prefix: str = 'proxy_pool'):
+        if client is None:
+            import redis
+            from GS.workflow_engine.configs import Redis
+            client = redis.Redis(host=Redis.HOST, port=Redis.PORT, password=Redis.PASSWORD,
+                                 db=Redis.PROXY_DB, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self._select = client.register_script(_SELECT_SCRIPT)
+        self._record = client.register_script(_RECORD_SCRIPT)
+
+    def _keys(self, site_id: str) -> List[str]:
+        base = f'{self.prefix}:{site_id}'
+        return [f'{base}:ready', f'{base}:parked', f'{base}:parked_scores', f'{base}:stats:']
+
+    def ensure(self, site_id: str, proxies: Iterable[str]):
+        proxies = list(proxies)
+        ready, _, _, stats_prefix = self._keys(site_id)
+        pipe = self.client.pipeline()
+        for proxy in proxies:
+            pipe.hsetnx(f'{stats_prefix}{proxy}', 'success', INITIAL_STATS['success'])
+        created = pipe.execute()
+        pipe = self.client.pipeline()
+        for proxy, is_new in zip(proxies, created):
+            if is_new:
+                pipe.hset(f'{stats_prefix}{proxy}', mapping=INITIAL_STATS)
+                pipe.zadd(ready, {proxy: health_score(INITIAL_STATS)})
+        pipe.execute()
+
+    def select(self, site_id: str, now: float) -> Optional[str]:
+        proxy = self._select(keys=self._keys(site_id), args=[now, INFLIGHT_PENALTY])
+        return proxy or None
+
+    def get_stats(self, site_id: str, proxy: str) -> Dict:
+        raw = self.client.hgetall(f'{self._keys(site_id)[3]}{proxy}')
+        stats = dict(INITIAL_STATS)
+        for key, value in raw.items():
+            stats[key] = float(value) if key in ('success', 'latency') else int(float(value))
+        return stats
+
+    def record(self, site_id: str, proxy: str, event: str, latency: float, now: float,
+               windows: Windows) -> Optional[float]:
+        keys = self._keys(site_id)
+        keys[3] = f'{keys[3]}{proxy}'
+        release_at = self._record(keys=keys, args=[
+            proxy, event, latency, now, EWMA_ALPHA, INFLIGHT_PENALTY, windows.cooldown_seconds,
+            windows.ban_seconds, windows.max_window_seconds, windows.failures_before_cooldown,
+        ])
+        return float(release_at) if release_at else None
+
+    def snapshot(self, site_id: str) -> Dict[str, Dict]:
+        ready, parked, _, _ = self._keys(site_id)
+        return {
+            'ready': dict(self.client.zrange(ready, 0, -1, withscores=True)),
+            'parked': dict(self.client.zrange(parked, 0, -1, withscores=True)),
+        }
+
+
+class ProxyPool:
+    """Pick the healthiest proxy per site and learn from fetch outcomes."""
+
+    def __init__(self, proxies: Iterable[str], store=None, clock: Callable[[], float] = time.time,
+                 cooldown_seconds: float = ProxyConfig.COOLDOWN_SECONDS,
+                 ban_seconds: float = ProxyConfig.BAN_SECONDS,
+                 max_window_seconds: float = ProxyConfig.MAX_WINDOW_SECONDS,
+                 failures_before_cooldown: int = ProxyConfig.FAILURES_BEFORE_COOLDOWN):
+        """Initialize the pool.
+
+        Args:
+            proxies: Proxy URLs available to every site
+            store: InMemoryProxyStore or RedisProxyStore, in memory by default
+            clock: Time source, injectable for simulations
+            cooldown_seconds: First cooldown after a 429 or repeated errors
+            ban_seconds: First ban window after a 403/407
+            max_window_seconds: Upper bound of the growing cooldown/ban windows
+            failures_before_cooldown: Consecutive errors that trigger a cooldown
+        """
+        self.proxies = list(proxies)
+        self.store = store or InMemoryProxyStore()
+        self.clock = clock
+        self.windows = Windows(cooldown_seconds, ban_seconds, max_window_seconds, failures_before_cooldown)
+        self._known_sites = set()
+
+    def get_next_proxy(self, site_id: str) -> Optional[str]:
+        """Return the best healthy proxy for a site, None when all are parked."""
+        if site_id not in self._known_sites:
+            self.store.ensure(site_id, self.proxies)
+            self._known_sites.add(site_id)
+        return self.store.select(site_id, self.clock())
+
+    def report(self, site_id: str, proxy: str, status_code: Optional[int], latency: float,
+               error: bool = False) -> str:
+        """Record the outcome of a request made through a proxy.
+
+        Returns:
+            The health event the outcome was classified as
+        """
+        event = classify(status_code, error)
+        self.store.record(site_id, proxy, event, latency, self.clock(), self.windows)
+        return event
+
+
+async def fetch_via_pool(engine, pool: ProxyPool, site_id: str, url: str, attempts: int = 3, **kwargs):
+    """Fetch a URL through the pool, rotating to the next proxy on bans and throttling.
+
+    Args:
+        engine: A FetchEngine
+        pool: The ProxyPool to draw proxies from
+        site_id: Site the URL belongs to
+        url: The page to fetch
+        attempts: Maximum number of proxies to try
+
+    Returns:
+        The last FetchResult, None when no proxy was available
+    """
+    result = None
+    for _ in range(attempts):
+        proxy = pool.get_next_proxy(site_id)
+        if proxy is None:
+            return result
+        if result is not None:
+            # Only the last attempt's body is handed back
+            result.discard()
+        started = time.perf_counter()
+        try:
+            result = await engine.fetch(url, proxy=proxy, **kwargs)
+        except Exception:
+            pool.report(site_id, proxy, None, time.perf_counter() - started, error=True)
+            continue
+        if pool.report(site_id, proxy, result.status_code, result.elapsed) == SUCCESS:
+            return result
+    return result
+
+
+_pool = None
+
+
+def get_proxy_pool() -> ProxyPool:
+    """Return the Redis-backed pool configured with PROXY_LIST."""
+    global _pool
+    if _pool is None:
+        _pool = ProxyPool(ProxyConfig.PROXIES, store=RedisProxyStore())
+    return _pool
+
+
+def get_next_proxy(site_id: str) -> Optional[str]:
+    """Return a healthy proxy for the site (Temporal activity entry point)."""
+    return get_proxy_pool().get_next_proxy(site_id)
@@ -17,6 +17,33 @@ class GenerateCatalog:
     CHROMA_HOST = os.environ.get("CHROMA_HOST")
     CHROMA_PORT = os.environ.get("CHROMA_PORT")
     CHROMA_COLLECTION = os.environ.get("CHROMA_COLLECTION")
+    # Embedded persistent Chroma store, used when CHROMA_HOST is not set
+    CHROMA_PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR", os.path.expanduser("~/.cache/gs/chroma"))
+    # What the catalog index crawls, "duckdb" (DUCK_DB_DATABASE) or "trino" (CATALOG_TRINO_CATALOG)
+    ENGINE = os.environ.get("CATALOG_ENGINE", "trino" if TrinoConfig.HOST else "duckdb")
+    TRINO_CATALOG = os.environ.get("CATALOG_TRINO_CATALOG")
+    # The app re-crawls this often, 0 leaves it to `python -m GS.workflow_engine.helper_classes.catalog_index`
+    REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", 3600))
+
+
+class Embedding:
+    MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR")
+    MAX_BATCH = int(os.environ.get("EMBEDDING_MAX_BATCH", 64))
+    MAX_WAIT_MS = float(os.environ.get("EMBEDDING_MAX_WAIT_MS", 5))
+    # Encoding processes for CPU-only boxes, 0 encodes in the calling process
+    PROCESSES = int(os.environ.get("EMBEDDING_PROCESSES", 0))
+
+
+class OPA:
+    # Use a running OPA server when set, otherwise evaluate OPA_POLICY_DIR locally
+    URL = os.environ.get("OPA_URL")
+    POLICY_DIR = os.environ.get("OPA_POLICY_DIR")
+    BINARY = os.environ.get("OPA_BINARY", "opa")
+    DECISION_CACHE_TTL_SECONDS = 300
+    REVISION_CHECK_SECONDS = 5
+    RETRIEVAL_USER = os.environ.get("DATA_RETRIEVAL_USER")
+    RETRIEVAL_GROUPS = os.environ.get("DATA_RETRIEVAL_GROUPS", "")
 
 
 class Configs:
@@ -27,16 +54,17 @@ class Configs:
     TEMPORAL_URL = os.environ.get("TEMPORAL_URL")
     FLASK_ADMIN_USERNAME = os.environ.get("FLASK_ADMIN_USERNAME")
     FLASK_ADMIN_PASSWORD = os.environ.get("FLASK_ADMIN_PASSWORD")
-    TEMPORAL_ACTIVITIES_MAXIMUM_RETRY_ATTEMPTS = int(os.environ.get("TEMPORAL_ACTIVITIES_MAXIMUM_RETRY_ATTEMPTS"))
+    TEMPORAL_ACTIVITIES_MAXIMUM_RETRY_ATTEMPTS = int(os.environ.get("TEMPORAL_ACTIVITIES_MAXIMUM_RETRY_ATTEMPTS", 3))
     DATALAKE_CATALOG = os.environ.get("DATALAKE_CATALOG")
 
 
 class Redis:
     HOST = os.environ.get("REDIS_HOST")
-    PORT = int(os.environ.get("REDIS_PORT"))
+    PORT = int(os.environ.get("REDIS_PORT", 6379))
     PASSWORD = os.environ.get("REDIS_PASSWORD")
-    QUERY_RESULT_DB = int(os.environ.get("REDIS_DB_QUERY_RESULT"))
+    QUERY_RESULT_DB = int(os.environ.get("REDIS_DB_QUERY_RESULT", 1))
     LLM_DB = 2
+    PROXY_DB = int(os.environ.get("REDIS_DB_PROXY_POOL", 3))
     RESPONSE_EXPIRY_SECONDS = 1200
     OPPORTUNITIES = 3
 
@@ -46,12 +74,132 @@ class LLM:
     MODEL = os.environ.get("MODEL1")
 
 
+class ContextCompaction:
+    # Token budget for the upstream outputs a task receives as context, 0 disables
+    TASK_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 6000))
+    # Budget for the analysis report handed to the summary crew
+    SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_CONTEXT_TOKEN_BUDGET", 8000))
+    ENCODING = os.environ.get("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+    # Cheaper model for compressing what is not kept verbatim, extractive selection when unset
+    SUMMARIZER_MODEL = os.environ.get("CONTEXT_SUMMARIZER_MODEL")
+    KEEP_SECTIONS = os.environ.get(
+        "CONTEXT_KEEP_SECTIONS",
+        r"summary|key (findings|insights)|findings|recommendations?|conclusions?|anomal"
+    )
+
+
+class LLMHedging:
+    ENABLED = os.environ.get("LLM_HEDGING", "true").lower() == "true"
+    # A duplicate request is sent when no token arrived within this percentile of recent first-token times
+    PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 0.95))
+    INITIAL_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_INITIAL_DELAY_SECONDS", 10))
+    MIN_DELAY_SECONDS = 0.5
+    MAX_DELAY_SECONDS = 30
+    MIN_SAMPLES = 20
+    WINDOW = 500
+    # At most this share of requests is hedged, so a slow provider is not hit twice as hard
+    MAX_HEDGE_RATIO = float(os.environ.get("LLM_HEDGE_MAX_RATIO", 0.1))
+    # Send the duplicate to another provider of crew_runner.get_llm, e.g. "anthropic"
+    FALLBACK_PROVIDER = os.environ.get("LLM_HEDGE_FALLBACK_PROVIDER")
+    FALLBACK_MODEL = os.environ.get("LLM_HEDGE_FALLBACK_MODEL")
+    # Deadline of a whole crew run when the request does not set deadline_seconds, 0 for none
+    DEFAULT_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", 0))
+
+
+class Cancellation:
+    # How often a running crew looks for a cancel request made through another process
+    POLL_SECONDS = float(os.environ.get("CANCEL_POLL_SECONDS", 2))
+
+
+class IcebergConfig:
+    CATALOG_NAME = os.environ.get("ICEBERG_CATALOG_NAME", "iceberg")
+    # "rest" in the trino_new stack, "sql" for a local sqlite catalog
+    CATALOG_TYPE = os.environ.get("ICEBERG_CATALOG_TYPE")
+    CATALOG_URI = os.environ.get("ICEBERG_CATALOG_URI")
+    WAREHOUSE = os.environ.get("ICEBERG_WAREHOUSE")
+    S3_ENDPOINT = os.environ.get("ICEBERG_S3_ENDPOINT")
+    MANIFEST_CACHE_SNAPSHOTS = 32
+    # Reads of the current snapshot reuse the table metadata loaded this recently
+    TABLE_CACHE_SECONDS = float(os.environ.get("ICEBERG_TABLE_CACHE_SECONDS", 10))
+
+
+class Scraping:
+    FETCH_CACHE_DIR = os.environ.get("FETCH_CACHE_DIR")
+    FETCH_TIMEOUT_SECONDS = float(os.environ.get("FETCH_TIMEOUT_SECONDS", 30))
+    PER_DOMAIN_CONCURRENCY = int(os.environ.get("FETCH_PER_DOMAIN_CONCURRENCY", 4))
+    POLITENESS_DELAY_SECONDS = float(os.environ.get("FETCH_POLITENESS_DELAY_SECONDS", 0.5))
+    MAX_CONNECTIONS_PER_HOST = int(os.environ.get("FETCH_MAX_CONNECTIONS_PER_HOST", 10))
+    # Connection pools kept open, one per (host, proxy) pair
+    MAX_CLIENTS = int(os.environ.get("FETCH_MAX_CLIENTS", 256))
+    MAX_BODY_BYTES = 50 * 1024 * 1024
+    USER_AGENT = os.environ.get("FETCH_USER_AGENT", "GS-Scraper/1.0")
+    # HTML extraction processes, 0 uses every CPU
+    EXTRACT_PROCESSES = int(os.environ.get("EXTRACT_PROCESSES", 0))
+
+
+class ProxyConfig:
+    # Comma separated proxy URLs shared by every scraped site
+    PROXIES = [proxy.strip() for proxy in os.environ.get("PROXY_LIST", "").split(",") if proxy.strip()]
+    COOLDOWN_SECONDS = float(os.environ.get("PROXY_COOLDOWN_SECONDS", 30))
+    BAN_SECONDS = float(os.environ.get("PROXY_BAN_SECONDS", 600))
+    MAX_WINDOW_SECONDS = float(os.environ.get("PROXY_MAX_WINDOW_SECONDS", 6 * 3600))
+    FAILURES_BEFORE_COOLDOWN = 3
+
+
+class Documents:
+    UPLOAD_DIR = os.environ.get("DOCUMENT_UPLOAD_DIR", "/tmp/gs_documents/uploads")
+    CACHE_DIR = os.environ.get("DOCUMENT_CACHE_DIR", "/tmp/gs_documents/cache")
+    # Comma separated directories documents may be referenced from by path
+    ALLOWED_ROOTS = [root.strip() for root in os.environ.get("DOCUMENT_ALLOWED_ROOTS", "").split(",") if root.strip()]
+    # Extraction processes, 0 uses every CPU
+    PROCESSES = int(os.environ.get("DOCUMENT_PROCESSES", 0))
+    PAGES_PER_TASK = 16
+    # Table detection is the slowest part of PDF extraction
+    EXTRACT_TABLES = os.environ.get("DOCUMENT_EXTRACT_TABLES", "true").lower() == "true"
+    DOCX_PARAGRAPHS_PER_PAGE = 40
+    CHUNK_CHARS = 4000
+    CHUNK_OVERLAP = 200
+    # Chunked documents the reader tool keeps in memory
+    CHUNK_CACHE_SIZE = int(os.environ.get("DOCUMENT_CHUNK_CACHE_SIZE", 32))
+
+
+class Datasets:
+    # Directory of shared Arrow datasets, /dev/shm/gs_datasets when unset and available
+    DIRECTORY = os.environ.get("DATASET_DIRECTORY")
+    # Lifetime of datasets created outside a crew run
+    SHARED_TTL_SECONDS = 3600
+
+
+class Artifacts:
+    # Content-addressed cache of the objects analyses reference on S3/MinIO
+    CACHE_DIR = os.environ.get("ARTIFACT_CACHE_DIR", "/tmp/gs_artifacts")
+    CACHE_MAX_BYTES = int(os.environ.get("ARTIFACT_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+    # Objects are fetched in ranges of this size, several at once
+    BLOCK_BYTES = int(os.environ.get("ARTIFACT_BLOCK_BYTES", 4 * 1024 * 1024))
+    FETCH_CONCURRENCY = int(os.environ.get("ARTIFACT_FETCH_CONCURRENCY", 8))
+    # MinIO endpoint such as http://minio:9000, AWS when unset. A file:// URI
+    # serves the buckets from the subdirectories of a local directory instead.
+    S3_ENDPOINT = os.environ.get("ARTIFACT_S3_ENDPOINT")
+    # Comma separated buckets s3:// artifacts may name, S3_BUCKET_NAME by default
+    ALLOWED_BUCKETS = [bucket.strip() for bucket in os.environ.get(
+        "ARTIFACT_ALLOWED_BUCKETS", os.environ.get("S3_BUCKET_NAME", "")).split(",") if bucket.strip()]
+    # Comma separated directories artifacts may also be read from by path
+    ALLOWED_ROOTS = [root.strip() for root in os.environ.get("ARTIFACT_ALLOWED_ROOTS", "").split(",") if root.strip()]
+    # Text artifacts are cut to this many characters in the crew inputs
+    MAX_TEXT_CHARS = 20000
+
+
 class DuckDB:
     HOST = os.environ.get("DUCK_DB_HOST")
     PORT = os.environ.get("DUCK_DB_PORT")
+    # Database file profiled by the analysis crew
+    DATABASE = os.environ.get("DUCK_DB_DATABASE", ":memory:")
     S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
     QUERY_LIMIT = 100
     PROFILE_QUERY_LIMIT = 1000
+    # Tables above this many rows are profiled over a reservoir sample
+    PROFILE_SAMPLE_ROWS = int(os.environ.get("PROFILE_SAMPLE_ROWS", 200000))
+    PROFILE_CACHE_DIR = os.environ.get("PROFILE_CACHE_DIR")
 
 
 
@@ -0,0 +1,511 @@
+"""Analysis inputs passed by reference and read through a local disk cache.
+
+Large inputs need not travel inline in the request body and sit in every
+crew's inputs. A crew input may instead reference an artifact:
+
+    "inputs": {"sales": {"artifact": "s3://reports/sales.parquet", "columns": ["region", "amount"]}}
+
+which `with_artifacts` resolves when the run starts:
+
+- Tables, Parquet, Arrow IPC/Feather, CSV and JSON lines files, become a
+  dataset of the run (see `dataset_registry`). The input describes its
+  handle, rows and columns, tools compute over the mapped buffers, and only
+  that description is copied into the crews' prompts.
+- Other files are text, the input is their first MAX_TEXT_CHARS characters.
+
+References are s3://bucket/key URIs of the ARTIFACT_ALLOWED_BUCKETS,
+S3_BUCKET_NAME unless set, s3:///key for the S3_BUCKET_NAME bucket, or paths
+under ARTIFACT_ALLOWED_ROOTS, which are mapped in place. The workers' S3
+credentials may reach other buckets, requests may not.
+
+Objects are cached under CACHE_DIR by content: the address is the sha256
+of their ETag and size, so every worker process of a node shares one copy
+and its pages, and a changed object gets a new address. A cached object is
+a sparse file filled in BLOCK_BYTES blocks as readers reach them, with a
+byte per block in a `.blocks` file next to it recording what is there:
+
+- Parquet is read through the cache. Its footer is fetched first, then the
+  column chunks of the selected columns, together as parallel ranged GETs.
+- Text artifacts fetch the blocks of their first MAX_TEXT_CHARS characters.
+- Other formats need the whole file. Its missing blocks are fetched as
+  FETCH_CONCURRENCY parallel ranged GETs, and it is read through mmap.
+
+Every ranged GET is conditional on the ETag of the cached object, an object
+replaced while it is being fetched fails the read instead of mixing the two
+versions. The least recently used objects are evicted beyond CACHE_MAX_BYTES.
+
+With ARTIFACT_S3_ENDPOINT=file:///some/dir the buckets are the directories
+under /some/dir, which stands in for MinIO in tests and benchmarks.
+"""
+
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import pyarrow as pa
+
+from GS.workflow_engine.configs import Artifacts, DuckDB
+
+FORMATS = {
+    '.parquet': 'parquet', '.pq': 'parquet',
+    '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow',
+    '.csv': 'csv',
+    '.jsonl': 'json', '.ndjson': 'json',
+}
+TABLE_FORMATS = ('parquet', 'arrow', 'csv', 'json')
+# Objects opened this recently are not evicted, runs may still map them
+EVICTION_GRACE_SECONDS = 300
+
+
+class Reference:
+    """A parsed artifact reference."""
+    __slots__ = ('uri', 'bucket', 'key', 'path', 'format', 'columns')
+
+    def __init__(self, uri: str, bucket: Optional[str], key: Optional[str], path: Optional[str],
+                 format: str, columns: Optional[List[str]]):
+        self.uri = uri
+        self.bucket = bucket
+        self.key = key
+        self.path = path  # Local artifacts only
+        self.format = format
+        self.columns = columns
+
+
+def is_artifact(value: Any) -> bool:
+    return isinstance(value, dict) and 'artifact' in value
+
+
+def parse_reference(value: Dict[str, Any], allowed_roots: Optional[List[str]] = None,
+                    allowed_buckets: Optional[List[str]] = None) -> Reference:
+    """Check an {"artifact", "columns", "format"} input and parse it.
+
+    Raises:
+        ValueError: When the reference is malformed, its bucket is not allowed or its path is outside the
+            allowed roots
+    """
+    uri = value.get('artifact')
+    if not isinstance(uri, str) or not uri:
+        raise ValueError("An artifact reference needs an 'artifact' URI or path")
+    columns = value.get('columns')
+    if columns is not None and not (isinstance(columns, list) and all(isinstance(c, str) for c in columns)):
+        raise ValueError(f"The 'columns' of artifact {uri} must be a list of column names")
+
+    bucket = key = path = None
+    if uri.startswith('s3://'):
+        parsed = urlparse(uri)
+        bucket, key = parsed.netloc or DuckDB.S3_BUCKET_NAME, parsed.path.lstrip('/')
+        if not bucket or not key:
+            raise ValueError(f"Artifact {uri} needs a bucket and a key, s3:///key uses S3_BUCKET_NAME")
+        if bucket not in (Artifacts.ALLOWED_BUCKETS if allowed_buckets is None else allowed_buckets):
+            raise ValueError(f"Artifact {uri} is outside the allowed artifact buckets")
+    elif '://' in uri:
+        raise ValueError(f"Unsupported artifact URI {uri}, use s3:// or a local path")
+    else:
+        path = os.path.realpath(uri)
+        roots = Artifacts.ALLOWED_ROOTS if allowed_roots is None else allowed_roots
+        if not any(path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+                   for root in map(os.path.realpath, roots)):
+            raise ValueError(f"Artifact {uri} is outside the allowed artifact directories")
+
+    kind = value.get('format') or FORMATS.get(os.path.splitext(key or path)[1].lower(), 'text')
+    if kind not in (*TABLE_FORMATS, 'text'):
+        raise ValueError(f"Unsupported artifact format {kind}, use one of {', '.join(TABLE_FORMATS)} or text")
+    return Reference(uri, bucket, key, path, kind, columns)
+
+
+def request_artifacts(data: Dict[str, Any]) -> List[Reference]:
+    """The artifact references of a request's inputs, ValueError for a malformed one."""
+    inputs = data.get('inputs') or {}
+    if not isinstance(inputs, dict):
+        return []
+    return [parse_reference(value) for value in inputs.values() if is_artifact(value)]
+
+
+class S3Source:
+    """Ranged reads of one S3/MinIO object."""
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.etag = None
+
+    def stat(self) -> Tuple[str, int]:
+        """ETag and size of the object, FileNotFoundError when it does not exist."""
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(f"s3://{self.bucket}/{self.key} does not exist") from e
+            raise
+        self.etag = head['ETag']
+        return head['ETag'].strip('"'), head['ContentLength']
+
+    def read(self, start: int, end: int) -> bytes:
+        """Bytes [start, end) of the version `stat` saw."""
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f'bytes={start}-{end - 1}',
+                                          IfMatch=self.etag)
+        return response['Body'].read()
+
+
+class DirectorySource:
+    """An object of a local directory standing in for a bucket."""
+
+    def __init__(self, root: str, bucket: str, key: str):
+        root = os.path.realpath(root)
+        self.path = os.path.realpath(os.path.join(root, bucket, key))
+        if not self.path.startswith(root + os.sep):
+            raise ValueError(f"s3://{bucket}/{key} is outside of {root}")
+
+    def stat(self) -> Tuple[str, int]:
+        stat = os.stat(self.path)
+        # Stands in for the ETag, which S3 derives from the content
+        version = hashlib.md5(f'{self.path}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()
+        return version, stat.st_size
+
+    def read(self, start: int, end: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+class LocalArtifact:
+    """A file under the allowed roots, mapped in place."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.fetched_bytes = 0
+
+    def read_prefix(self, length: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read(length)
+
+    def ensure_ranges(self, ranges: List[Tuple[int, int]]):
+        pass
+
+    def open_file(self) -> pa.NativeFile:
+        return pa.memory_map(self.path, 'r')
+
+    def memory_map(self) -> pa.MemoryMappedFile:
+        return pa.memory_map(self.path, 'r')
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CachedObject:
+    """A remote object in the cache, fetched block by block as it is read.
+
+    Threads of a process share the fetches of one object through its lock.
+    Processes may fetch the same block at once, they write the same bytes.
+    """
+
+    def __init__(self, path: str, size: int, source, block_bytes: int,
+                 executor: concurrent.futures.Executor):
+        self.path = path
+        self.size = size
+        self.source = source
+        self.block_bytes = block_bytes
+        self.blocks = -(-size // block_bytes)
+        self.fetched_bytes = 0
+        self._executor = executor
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._map_fd = os.open(path + '.blocks', os.O_RDWR | os.O_CREAT, 0o644)
+        # Sparse until the blocks are written, growing to the same size twice is harmless
+        if os.fstat(self._fd).st_size != size:
+            os.ftruncate(self._fd, size)
+        if os.fstat(self._map_fd).st_size != self.blocks:
+            os.ftruncate(self._map_fd, self.blocks)
+        os.utime(path)
+
+    @property
+    def complete(self) -> bool:
+        # Set by any process that fetched the block
+        return all(os.pread(self._map_fd, self.blocks, 0))
+
+    def _fetch(self, block: int) -> int:
+        start = block * self.block_bytes
+        data = self.source.read(start, min(start + self.block_bytes, self.size))
+        if len(data) != min(self.block_bytes, self.size - start):
+            raise IOError(f"Short read of block {block} of {self.path}")
+        os.pwrite(self._fd, data, start)
+        # Only marked once the data is in place
+        os.pwrite(self._map_fd, b'\x01', block)
+        return len(data)
+
+    def ensure(self, start: int = 0, end: Optional[int] = None):
+        """Fetch the missing blocks of bytes [start, end)."""
+        self.ensure_ranges([(start, self.size if end is None else end)])
+
+    def ensure_ranges(self, ranges: List[Tuple[int, int]]):
+        """Fetch the missing blocks of the [start, end) byte ranges, in parallel."""
+        wanted = sorted({block for start, end in ranges
+                         for block in range(start // self.block_bytes, -(-min(end, self.size) // self.block_bytes))})
+        if not wanted:
+            return
+        with self._lock:
+            present = os.pread(self._map_fd, self.blocks, 0)
+            missing = [block for block in wanted if not present[block]]
+            if missing:
+                self.fetched_bytes += sum(self._executor.map(self._fetch, missing))
+
+    def pread(self, offset: int, length: int) -> bytes:
+        self.ensure(offset, offset + length)
+        return os.pread(self._fd, min(length, self.size - offset), offset)
+
+    def read_prefix(self, length: int) -> bytes:
+        return self.pread(0, length)
+
+    def open_file(self) -> pa.NativeFile:
+        """Random access to the object, fetching what is read."""
+        if self.complete:
+            return self.memory_map()
+        return pa.PythonFile(_ObjectFile(self), mode='r')
+
+    def memory_map(self) -> pa.MemoryMappedFile:
+        """Map the whole object, fetching what is missing."""
+        self.ensure()
+        return pa.memory_map(self.path, 'r')
+
+    def close(self):
+        for fd in (self._fd, self._map_fd):
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ObjectFile(io.RawIOBase):
+    """File object over a cached object for pyarrow readers."""
+
+    def __init__(self, cached: CachedObject):
+        super().__init__()
+        self._object = cached
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._object.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self._object.size:
+            return 0
+        data = self._object.pread(self._position, len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class ArtifactCache:
+    """Opens artifact references, caching remote objects under `directory`."""
+
+    def __init__(self, directory: str = Artifacts.CACHE_DIR, max_bytes: int = Artifacts.CACHE_MAX_BYTES,
+                 block_bytes: int = Artifacts.BLOCK_BYTES, concurrency: int = Artifacts.FETCH_CONCURRENCY,
+                 s3_endpoint: Optional[str] = Artifacts.S3_ENDPOINT):
+        """Initialize the cache.
+
+        Args:
+            directory: Where cached objects are stored
+            max_bytes: Disk space of the cache, the least recently used objects are evicted beyond it
+            block_bytes: Size of the ranges objects are fetched in
+            concurrency: Ranged GETs running at once
+            s3_endpoint: MinIO endpoint, AWS when unset, or a file:// directory standing in for S3
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_bytes = block_bytes
+        self.s3_endpoint = s3_endpoint
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency,
+                                                               thread_name_prefix='artifact-fetch')
+        self._concurrency = concurrency
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _s3_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+                    self._client = boto3.client('s3', endpoint_url=self.s3_endpoint or None,
+                                                config=Config(max_pool_connections=self._concurrency))
+        return self._client
+
+    def source(self, bucket: str, key: str):
+        if self.s3_endpoint and self.s3_endpoint.startswith('file://'):
+            return DirectorySource(urlparse(self.s3_endpoint).path, bucket, key)
+        return S3Source(self._s3_client(), bucket, key)
+
+    def open(self, reference: Reference):
+        """Open a referenced artifact, close it once read.
+
+        Raises:
+            FileNotFoundError: When the artifact does not exist
+        """
+        if reference.path is not None:
+            return LocalArtifact(reference.path)
+        source = self.source(reference.bucket, reference.key)
+        etag, size = source.stat()
+        digest = hashlib.sha256(f'{etag}:{size}'.encode()).hexdigest()
+        path = os.path.join(self.directory, digest[:2], digest)
+        new = not os.path.exists(path)
+        cached = CachedObject(path, size, source, self.block_bytes, self._executor)
+        if new:
+            self.evict()
+        return cached
+
+    def evict(self) -> List[str]:
+        """Remove the least recently opened objects until the cache fits in `max_bytes`.
+
+        Returns:
+            The paths of the evicted objects
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.blocks'):
+                    continue
+                path = os.path.join(root, name)
+                with contextlib.suppress(FileNotFoundError):
+                    stat = os.stat(path)
+                    # Sparse files take up only the blocks fetched so far
+                    entries.append((stat.st_mtime, stat.st_blocks * 512, path))
+        used = sum(size for _, size, _ in entries)
+        cutoff = time.time() - EVICTION_GRACE_SECONDS
+        evicted = []
+        for mtime, size, path in sorted(entries):
+            if used <= self.max_bytes or mtime > cutoff:
+                break
+            for name in (path, path + '.blocks'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(name)
+            used -= size
+            evicted.append(path)
+        return evicted
+
+
+def column_chunk_ranges(metadata, columns: Optional[List[str]]) -> List[Tuple[int, int]]:
+    """Byte ranges of the column chunks of `columns`, all columns when None, in a Parquet file."""
+    ranges = []
+    for row_group in range(metadata.num_row_groups):
+        group = metadata.row_group(row_group)
+        for index in range(group.num_columns):
+            chunk = group.column(index)
+            if columns is not None and chunk.path_in_schema.split('.')[0] not in columns:
+                continue
+            start = chunk.data_page_offset
+            if chunk.has_dictionary_page and chunk.dictionary_page_offset is not None:
+                start = min(start, chunk.dictionary_page_offset)
+            ranges.append((start, start + chunk.total_compressed_size))
+    return ranges
+
+
+def read_table(artifact, reference: Reference) -> pa.Table:
+    """The table of a tabular artifact, only its `columns` when given."""
+    columns = reference.columns
+    if reference.format == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(artifact.open_file())
+        # All the column chunks at once, instead of one by one as the reader reaches them
+        artifact.ensure_ranges(column_chunk_ranges(parquet.metadata, columns))
+        return parquet.read(columns=columns)
+    if reference.format == 'arrow':
+        table = pa.ipc.open_file(artifact.memory_map()).read_all()
+    elif reference.format == 'csv':
+        from pyarrow import csv
+        return csv.read_csv(artifact.memory_map(), convert_options=csv.ConvertOptions(include_columns=columns or []))
+    else:
+        from pyarrow import json
+        table = json.read_json(artifact.memory_map())
+    return table.select(columns) if columns else table
+
+
+def describe_dataset(handle: str, uri: str, table: pa.Table) -> str:
+    columns = ', '.join(f'{field.name} ({field.type})' for field in table.schema)
+    return (f"Dataset {handle} holds {uri}: {table.num_rows} rows, columns {columns}. "
+            f"Pass the handle to the calculator tool to compute over its columns.")
+
+
+def resolve_artifact(reference: Reference, cache: Optional[ArtifactCache] = None) -> str:
+    """Load an artifact for the current run and describe it for the crew."""
+    from GS.workflow_engine.helper_classes.dataset_registry import get_dataset_registry
+
+    cache = cache or get_artifact_cache()
+    with cache.open(reference) as artifact:
+        if reference.format == 'text':
+            limit = Artifacts.MAX_TEXT_CHARS
+            # UTF-8 takes up to 4 bytes per character
+            text = artifact.read_prefix(limit * 4).decode('utf-8', errors='replace')
+            if len(text) > limit or artifact.size > limit * 4:
+                return text[:limit] + f"\n[Cut, {reference.uri} has {artifact.size} bytes]"
+            return text
+        registry = get_dataset_registry()
+        if reference.format == 'arrow' and not reference.columns:
+            # Already in the registry's format, the file itself becomes the dataset
+            table = pa.ipc.open_file(artifact.memory_map()).read_all()
+            handle = registry.link(artifact.path)
+        else:
+            table = read_table(artifact, reference)
+            handle = registry.put(table)
+    return describe_dataset(handle, reference.uri, table)
+
+
+def with_artifacts(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the artifact references among crew inputs by what they hold.
+
+    The `artifacts` input lists them and is always set so task descriptions
+    can reference it. Call it inside the run's `dataset_run`, the datasets
+    belong to the run.
+    """
+    resolved = []
+    for name, value in inputs.items():
+        if is_artifact(value):
+            inputs[name] = resolve_artifact(parse_reference(value))
+            resolved.append(f"- {name}: {inputs[name]}")
+    inputs['artifacts'] = '\n'.join(["The following inputs were provided:", *resolved]) if resolved \
+        else "No input artifacts were provided."
+    return inputs
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_artifact_cache() -> ArtifactCache:
+    """Return the process-wide artifact cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ArtifactCache()
+    return _cache
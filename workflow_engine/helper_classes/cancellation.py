@@ -0,0 +1,198 @@
+"""Cooperative cancellation and hard deadlines of crew runs.
+
+A crew run holds a `CancellationToken` for as long as it runs, see
+`cancellable_run`. The token fires when the task is cancelled through the
+API or when its deadline passes, and the run stops at the next point that
+calls `check_cancelled`: between flow stages, before each crew task, before
+each tool call and before each LLM request. LLM requests that are in flight
+when the token fires are aborted, which closes their connections.
+
+A run in another process is cancelled through its `TaskResult`: the API
+sets its status to 'cancelled' and the token of the run reads the status
+back at most every `POLL_SECONDS` when checked. The deadline needs no
+polling, a timer fires the token when it passes.
+
+`TaskCancelled` derives from BaseException, like asyncio.CancelledError:
+crewai retries agents on any Exception, hands tool errors back to the agent
+as observations and logs failed flow stages without stopping the flow, none
+of which should happen to a cancelled run.
+
+The module has no dependencies beyond the standard library at import time,
+so the web app and the crews can import it without loading the workflow
+engine configuration.
+"""
+
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = 'cancelled'
+TIMED_OUT = 'timed_out'
+
+# Token of the crew run executing in this context
+_current_token: contextvars.ContextVar = contextvars.ContextVar('cancellation_token', default=None)
+
+
+class TaskCancelled(BaseException):
+    """The run was cancelled or passed its deadline, `reason` is the status to record."""
+
+    def __init__(self, task_id: str, reason: str):
+        message = "Task was cancelled" if reason == CANCELLED else "Task did not finish before its deadline"
+        super().__init__(message)
+        self.task_id = task_id
+        self.reason = reason
+
+
+def cancel_requested(task_id: str) -> bool:
+    """Whether the API marked the task cancelled, read from the task's status."""
+    from GS.core.app.helper.db_routing import read_session
+    from GS.core.app.models.task_result import TaskResult
+    with read_session() as session:
+        return session.query(TaskResult.status).filter_by(task_id=task_id).scalar() == CANCELLED
+
+
+class CancellationToken:
+    """Cancellation state of one run, shared by the threads working on it."""
+
+    def __init__(self, task_id: str, deadline_seconds: Optional[float] = None,
+                 poll: Optional[Callable[[str], bool]] = None, poll_seconds: Optional[float] = None):
+        """Initialize the token.
+
+        Args:
+            task_id: The task of the run
+            deadline_seconds: Time the run has from now, None for no deadline
+            poll: Tells whether the task was cancelled elsewhere, not polled when None
+            poll_seconds: Minimum time between polls, CANCEL_POLL_SECONDS when None
+        """
+        if poll_seconds is None:
+            from GS.workflow_engine.configs import Cancellation
+            poll_seconds = Cancellation.POLL_SECONDS
+        self.task_id = task_id
+        self.deadline = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+        self.reason: Optional[str] = None
+        self._poll = poll
+        self._poll_seconds = poll_seconds
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = CANCELLED) -> bool:
+        """Fire the token, False when it had fired already."""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info("Stopping task %s: %s", self.task_id, reason)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Cancellation callback of task %s failed", self.task_id)
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call `callback` when the token fires, right away if it has.
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                fired = False
+            else:
+                fired = True
+        if fired:
+            callback()
+
+        def remove():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return remove
+
+    def check(self):
+        """Raise TaskCancelled when the run has to stop."""
+        if self.reason is None:
+            now = time.monotonic()
+            if self.deadline is not None and now >= self.deadline:
+                self.cancel(TIMED_OUT)
+            elif self._poll is not None and now >= self._next_poll:
+                self._next_poll = now + self._poll_seconds
+                try:
+                    if self._poll(self.task_id):
+                        self.cancel(CANCELLED)
+                except Exception:
+                    logger.warning("Could not look up whether task %s was cancelled", self.task_id, exc_info=True)
+        if self.reason is not None:
+            raise TaskCancelled(self.task_id, self.reason)
+
+
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token of the run executing in this context, None outside of runs."""
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Raise TaskCancelled when the run executing in this context has to stop."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def cancel_task(task_id: str, reason: str = CANCELLED) -> bool:
+    """Fire the token of a run of this process, False when none is running here."""
+    with _tokens_lock:
+        token = _tokens.get(task_id)
+    return token is not None and token.cancel(reason)
+
+
+@contextlib.contextmanager
+def cancellable_run(task_id: str, deadline_seconds: Optional[float] = None,
+                    poll: Optional[Callable[[str], bool]] = cancel_requested) -> Iterator[CancellationToken]:
+    """Make the run in this context cancellable and stop it after `deadline_seconds`.
+
+    None or 0 sets no deadline, a negative one has passed already.
+    """
+    token = CancellationToken(task_id, deadline_seconds or None, poll=poll)
+    timer = None
+    if token.deadline is not None:
+        timer = threading.Timer(max(deadline_seconds, 0), token.cancel, args=(TIMED_OUT,))
+        timer.daemon = True
+        timer.start()
+    with _tokens_lock:
+        _tokens[task_id] = token
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+        with _tokens_lock:
+            if _tokens.get(task_id) is token:
+                del _tokens[task_id]
+        if timer is not None:
+            timer.cancel()
+
+
+def request_deadline(data: Optional[Dict]) -> Optional[float]:
+    """The `deadline_seconds` a start request asks for, None when it sets none."""
+    seconds = (data or {}).get('deadline_seconds')
+    if seconds is None:
+        return None
+    if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+        raise ValueError("deadline_seconds must be a positive number of seconds")
+    return float(seconds)
@@ -0,0 +1,323 @@
+"""Semantic index of lake tables and columns backed by Chroma.
+
+Agents use it to find the tables relevant to a question with one lookup
+instead of exploring schemas through the query engine. Table and column
+metadata is crawled from DuckDB or Trino `information_schema`, one document
+per table is embedded, and only tables whose schema hash changed since the
+last run are re-embedded.
+
+The index is kept in CHROMA_PERSIST_DIR, or on the Chroma server at
+CHROMA_HOST, so it outlives the process and is shared by the processes
+running crews. The app refreshes it every CATALOG_REFRESH_SECONDS, see
+`start_catalog_refresher`, and it can be refreshed by hand:
+
+    python -m GS.workflow_engine.helper_classes.catalog_index --engine duckdb --database lake.duckdb
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from GS.workflow_engine.configs import DuckDB, GenerateCatalog, TrinoConfig
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_QUERY = """
+SELECT table_catalog, table_schema, table_name, column_name, data_type, {comment}
+FROM {information_schema}.columns
+WHERE table_schema NOT IN ('information_schema', 'pg_catalog')
+ORDER BY table_catalog, table_schema, table_name, ordinal_position
+"""
+
+
+def connect_duckdb(database: str = ':memory:', read_only: bool = False):
+    """Open a DuckDB connection to crawl."""
+    import duckdb
+    return duckdb.connect(database, read_only=read_only)
+
+
+def connect_trino(catalog: Optional[str] = None):
+    """Open a Trino DB-API connection with the credentials from TrinoConfig."""
+    import trino
+    auth = None
+    if TrinoConfig.PASSWORD:
+        auth = trino.auth.BasicAuthentication(TrinoConfig.USERNAME, TrinoConfig.PASSWORD)
+    return trino.dbapi.connect(
+        host=TrinoConfig.HOST,
+        port=int(TrinoConfig.PORT),
+        user=TrinoConfig.USERNAME,
+        catalog=catalog,
+        auth=auth,
+        http_scheme='https' if auth else 'http',
+    )
+
+
+def crawl_tables(connection, catalog: Optional[str] = None, with_comments: bool = True) -> List[Dict[str, Any]]:
+    """Read table and column metadata from `information_schema.columns`.
+
+    Args:
+        connection: A DB-API connection (DuckDB or Trino)
+        catalog: Trino catalog to crawl, DuckDB uses the attached databases
+        with_comments: Whether the engine exposes a `comment` column (Trino does)
+
+    Returns:
+        A list of tables with their columns
+    """
+    information_schema = f'"{catalog}".information_schema' if catalog else 'information_schema'
+    query = COLUMNS_QUERY.format(
+        information_schema=information_schema,
+        comment='comment' if with_comments else 'NULL AS comment',
+    )
+    cursor = connection.cursor()
+    cursor.execute(query)
+    tables = defaultdict(list)
+    for table_catalog, table_schema, table_name, column_name, data_type, comment in cursor.fetchall():
+        tables[(table_catalog, table_schema, table_name)].append(
+            {'name': column_name, 'type': str(data_type), 'comment': comment or ''}
+        )
+    return [
+        {'catalog': key[0], 'schema': key[1], 'table': key[2], 'columns': columns}
+        for key, columns in tables.items()
+    ]
+
+
+def table_id(table: Dict[str, Any]) -> str:
+    """Fully qualified table name used as the document id."""
+    return f"{table['catalog']}.{table['schema']}.{table['table']}"
+
+
+def schema_hash(table: Dict[str, Any]) -> str:
+    """Hash of everything that ends up in a table's document."""
+    payload = json.dumps([table_id(table), table.get('description', ''), table['columns']], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def describe_table(table: Dict[str, Any]) -> str:
+    """Build the text that is embedded for a table."""
+    columns = ', '.join(
+        f"{column['name']} ({column['type']}{': ' + column['comment'] if column['comment'] else ''})"
+        for column in table['columns']
+    )
+    description = f" {table['description']}" if table.get('description') else ''
+    return f"Table {table_id(table)}.{description} Columns: {columns}"
+
+
+def get_chroma_client(persist_directory: Optional[str] = None):
+    """Return a Chroma client: remote when CHROMA_HOST is set, otherwise local.
+
+    A persist directory, CHROMA_PERSIST_DIR by default, gives an embedded
+    persistent store. With CHROMA_PERSIST_DIR set empty the store lives in
+    memory for the lifetime of the process.
+    """
+    import chromadb
+    if GenerateCatalog.CHROMA_HOST and not persist_directory:
+        return chromadb.HttpClient(host=GenerateCatalog.CHROMA_HOST, port=int(GenerateCatalog.CHROMA_PORT or 8000))
+    persist_directory = persist_directory or GenerateCatalog.CHROMA_PERSIST_DIR
+    if persist_directory:
+        return chromadb.PersistentClient(path=persist_directory)
+    return chromadb.EphemeralClient()
+
+
+def _service_embed(texts: Sequence[str]) -> List[List[float]]:
+    from GS.workflow_engine.helper_classes.embedding_service import get_embedding_service
+    return get_embedding_service().encode(texts).tolist()
+
+
+class CatalogIndex:
+    """Chroma collection holding one embedded document per lake table."""
+
+    def __init__(self, client=None, collection_name: Optional[str] = None,
+                 embed: Callable[[Sequence[str]], List[List[float]]] = None):
+        """Initialize the index.
+
+        Args:
+            client: A Chroma client, defaults to `get_chroma_client()`
+            collection_name: Collection to use, defaults to CHROMA_COLLECTION
+            embed: Function turning texts into embeddings, defaults to the embedding service
+        """
+        self.client = client or get_chroma_client()
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name or GenerateCatalog.CHROMA_COLLECTION or 'lake_catalog',
+            metadata={'hnsw:space': 'cosine'},
+        )
+        self.embed = embed or _service_embed
+
+    def _indexed_hashes(self) -> Dict[str, str]:
+        existing = self.collection.get(include=['metadatas'])
+        return {
+            doc_id: (metadata or {}).get('schema_hash', '')
+            for doc_id, metadata in zip(existing['ids'], existing['metadatas'])
+        }
+
+    def reindex(self, tables: List[Dict[str, Any]], prune: bool = True) -> Dict[str, int]:
+        """Embed the tables whose schema hash changed and drop vanished ones.
+
+        Args:
+            tables: Crawled tables as returned by `crawl_tables`
+            prune: Whether to delete indexed tables that are no longer crawled
+
+        Returns:
+            Counts of upserted, unchanged and deleted tables
+        """
+        indexed = self._indexed_hashes()
+        changed = [table for table in tables if indexed.get(table_id(table)) != schema_hash(table)]
+
+        if changed:
+            documents = [describe_table(table) for table in changed]
+            self.collection.upsert(
+                ids=[table_id(table) for table in changed],
+                documents=documents,
+                embeddings=self.embed(documents),
+                metadatas=[{
+                    'catalog': table['catalog'],
+                    'schema': table['schema'],
+                    'table': table['table'],
+                    'columns': json.dumps([column['name'] for column in table['columns']]),
+                    'schema_hash': schema_hash(table),
+                } for table in changed],
+            )
+
+        removed = []
+        if prune:
+            # Only prune inside the crawled catalogs so partial crawls keep other catalogs
+            crawled = {table_id(table) for table in tables}
+            catalogs = {table['catalog'] for table in tables}
+            removed = [
+                doc_id for doc_id in indexed
+                if doc_id not in crawled and doc_id.split('.', 1)[0] in catalogs
+            ]
+            if removed:
+                self.collection.delete(ids=removed)
+
+        return {'upserted': len(changed), 'unchanged': len(tables) - len(changed), 'deleted': len(removed)}
+
+    def find_tables(self, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Return the tables most relevant to a natural language question."""
+        count = self.collection.count()
+        if not count:
+            return []
+        result = self.collection.query(
+            query_embeddings=self.embed([question]),
+            n_results=min(top_k, count),
+            include=['metadatas', 'distances'],
+        )
+        return [
+            {
+                'table': doc_id,
+                'columns': json.loads(metadata['columns']),
+                'score': round(1 - distance, 4),
+            }
+            for doc_id, metadata, distance in zip(result['ids'][0], result['metadatas'][0], result['distances'][0])
+        ]
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_catalog_index() -> CatalogIndex:
+    """Return the process-wide catalog index."""
+    global _default_index
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = CatalogIndex()
+    return _default_index
+
+
+def refresh_catalog_index(engine: Optional[str] = None, catalog: Optional[str] = None,
+                          database: Optional[str] = None) -> Dict[str, int]:
+    """Crawl DuckDB or Trino and incrementally reindex the catalog.
+
+    Args:
+        engine: 'duckdb' or 'trino', defaults to CATALOG_ENGINE
+        catalog: Trino catalog to crawl, defaults to CATALOG_TRINO_CATALOG
+        database: DuckDB database file to crawl, defaults to DUCK_DB_DATABASE
+
+    Returns:
+        Counts of upserted, unchanged and deleted tables
+    """
+    engine = engine or GenerateCatalog.ENGINE
+    catalog = catalog or GenerateCatalog.TRINO_CATALOG
+    database = database or DuckDB.DATABASE
+    if engine == 'trino':
+        connection = connect_trino(catalog)
+        tables = crawl_tables(connection, catalog=catalog, with_comments=True)
+    else:
+        connection = connect_duckdb(database, read_only=database != ':memory:')
+        tables = crawl_tables(connection, with_comments=False)
+    try:
+        return get_catalog_index().reindex(tables)
+    finally:
+        connection.close()
+
+
+class CatalogRefresher:
+    """Background thread refreshing the catalog index now and every `poll_seconds`."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='catalog-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                logger.info("Catalog index refreshed %s", refresh_catalog_index())
+            except Exception:
+                logger.exception("Refreshing the catalog index failed")
+            if self._stop.wait(self.poll_seconds):
+                return
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_catalog_refresher() -> Optional[CatalogRefresher]:
+    """Start the refresher of this process, unless CATALOG_REFRESH_SECONDS is 0."""
+    global _refresher
+    if GenerateCatalog.REFRESH_SECONDS <= 0:
+        return None
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = CatalogRefresher(GenerateCatalog.REFRESH_SECONDS)
+            _refresher.start()
+    return _refresher
+
+
+def stop_catalog_refresher():
+    global _refresher
+    with _refresher_lock:
+        refresher, _refresher = _refresher, None
+    if refresher is not None:
+        refresher.stop()
+
+
+def main(argv=None):
+    """Main entry point for refreshing the catalog index by hand."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', choices=('duckdb', 'trino'), help='Defaults to CATALOG_ENGINE')
+    parser.add_argument('--catalog', help='Trino catalog, defaults to CATALOG_TRINO_CATALOG')
+    parser.add_argument('--database', help='DuckDB database file, defaults to DUCK_DB_DATABASE')
+    args = parser.parse_args(argv)
+    print(json.dumps(refresh_catalog_index(args.engine, args.catalog, args.database), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Registry of Arrow datasets shared between tools by handle.
+
+Tools store a result once as an uncompressed Arrow IPC file and pass around
+a short handle such as `ds-3f2a9c1e-0007` instead of a JSON payload. Readers
+memory-map the file, so opening a dataset copies nothing, and since the
+handle encodes its path, process-pool workers open the same pages without
+talking to the registry. Files live under /dev/shm when it exists, which
+makes them shared memory rather than disk.
+
+Every dataset belongs to a crew run. The run holds one reference and drops
+it when the run ends; consumers that outlive a step take their own with
+`acquire`/`release`. The file is deleted once the last reference is gone.
+Readers that still have it mapped keep working, POSIX unlink only removes
+the name.
+"""
+
+import contextlib
+import contextvars
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from GS.workflow_engine.configs import Datasets
+
+_HANDLE = re.compile(r'^ds-([0-9a-f]{8,32})-([0-9a-f]{4,})$')
+
+# Run of the crew executing in this context, tools fall back to the shared run
+_current_run: contextvars.ContextVar = contextvars.ContextVar('dataset_run', default=None)
+SHARED_RUN = '0' * 8
+
+
+def default_directory() -> str:
+    """Shared memory when available, the temp directory otherwise."""
+    if Datasets.DIRECTORY:
+        return Datasets.DIRECTORY
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm/gs_datasets'
+    return os.path.join(tempfile.gettempdir(), 'gs_datasets')
+
+
+def run_key(run_id: str) -> str:
+    """Short hex key of a run id, used in handles and directory names."""
+    return uuid.uuid5(uuid.NAMESPACE_OID, run_id).hex[:8] if run_id != SHARED_RUN else SHARED_RUN
+
+
+def handle_path(handle: str, directory: Optional[str] = None) -> str:
+    """Path of the IPC file behind a handle."""
+    match = _HANDLE.match(handle)
+    if not match:
+        raise ValueError(f"Not a dataset handle: {handle}")
+    return os.path.join(directory or default_directory(), match.group(1), f'{match.group(2)}.arrow')
+
+
+def open_dataset(handle: str, directory: Optional[str] = None) -> pa.Table:
+    """Memory-map a dataset, usable in any process that can see the directory."""
+    source = pa.memory_map(handle_path(handle, directory), 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def is_handle(value: str) -> bool:
+    return bool(_HANDLE.match(value or ''))
+
+
+class DatasetRegistry:
+    """Create, reference-count and expire dataset handles."""
+
+    def __init__(self, directory: Optional[str] = None, shared_ttl_seconds: float = Datasets.SHARED_TTL_SECONDS):
+        """Initialize the registry.
+
+        Args:
+            directory: Where IPC files are written, /dev/shm when available
+            shared_ttl_seconds: Lifetime of datasets created outside any crew run
+        """
+        self.directory = directory or default_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        self.shared_ttl_seconds = shared_ttl_seconds
+        self._lock = threading.Lock()
+        self._refs: Dict[str, int] = {}
+        self._runs: Dict[str, List[str]] = {}
+        self._created: Dict[str, float] = {}
+        self._counter = 0
+
+    def put(self, table: pa.Table, run_id: Optional[str] = None) -> str:
+        """Store a table and return its handle, owned by the run.
+
+        Args:
+            table: The data to share
+            run_id: The crew run owning it, the current run when None
+
+        Returns:
+            The dataset handle
+        """
+        run_id = run_id or _current_run.get() or SHARED_RUN
+        handle, path = self._new_handle(run_id)
+        # Uncompressed so readers map the buffers instead of decoding them
+        with pa.OSFile(path + '.part', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(path + '.part', path)
+        return self._register(handle, run_id)
+
+    def link(self, path: str, run_id: Optional[str] = None) -> str:
+        """Make an Arrow IPC file a dataset of the run without rewriting it.
+
+        The file is hard-linked when it is on the registry's filesystem, so
+        deleting either name leaves the other intact, and copied otherwise.
+
+        Returns:
+            The dataset handle
+        """
+        run_id = run_id or _current_run.get() or SHARED_RUN
+        handle, target = self._new_handle(run_id)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target + '.part')
+            os.replace(target + '.part', target)
+        return self._register(handle, run_id)
+
+    def _new_handle(self, run_id: str):
+        with self._lock:
+            self._counter += 1
+            handle = f'ds-{run_key(run_id)}-{self._counter:04x}{uuid.uuid4().hex[:4]}'
+        path = handle_path(handle, self.directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return handle, path
+
+    def _register(self, handle: str, run_id: str) -> str:
+        with self._lock:
+            self._refs[handle] = 1
+            self._runs.setdefault(run_id, []).append(handle)
+            self._created[handle] = time.time()
+        if run_id == SHARED_RUN:
+            self.expire_shared()
+        return handle
+
+    def open(self, handle: str) -> pa.Table:
+        """Memory-map a dataset of this registry."""
+        return open_dataset(handle, self.directory)
+
+    def path(self, handle: str) -> str:
+        return handle_path(handle, self.directory)
+
+    def acquire(self, handle: str):
+        """Keep a dataset alive beyond its run until `release`."""
+        with self._lock:
+            if handle not in self._refs:
+                raise KeyError(f"Dataset {handle} has expired or does not exist")
+            self._refs[handle] += 1
+
+    def release(self, handle: str):
+        """Drop a reference, deleting the dataset when it was the last."""
+        with self._lock:
+            refs = self._refs.get(handle)
+            if refs is None:
+                return
+            if refs > 1:
+                self._refs[handle] = refs - 1
+                return
+            del self._refs[handle]
+            self._created.pop(handle, None)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(handle))
+
+    def release_run(self, run_id: str):
+        """Drop the run's reference on every dataset it created."""
+        with self._lock:
+            handles = self._runs.pop(run_id, [])
+        for handle in handles:
+            self.release(handle)
+        with contextlib.suppress(OSError):
+            os.rmdir(os.path.join(self.directory, run_key(run_id)))
+
+    def expire_shared(self):
+        """Release datasets created outside a run once they are older than the TTL."""
+        cutoff = time.time() - self.shared_ttl_seconds
+        with self._lock:
+            shared = self._runs.get(SHARED_RUN, [])
+            expired = [handle for handle in shared if self._created.get(handle, 0) < cutoff]
+            self._runs[SHARED_RUN] = [handle for handle in shared if handle not in expired]
+        for handle in expired:
+            self.release(handle)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'datasets': len(self._refs), 'runs': len(self._runs)}
+
+
+AGGREGATES = ('sum', 'mean', 'min', 'max', 'count')
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def _buffer(array: pa.Array):
+    """Numpy view of an Arrow column and its validity mask.
+
+    Nulls are filled with zeros, the copy that costs is only made for columns
+    with nulls or booleans. The mask is None when every value is valid.
+    """
+    valid = None
+    if array.null_count:
+        valid = array.is_valid().to_numpy(zero_copy_only=False)
+        array = array.fill_null(False if pa.types.is_boolean(array.type) else 0)
+    try:
+        return array.to_numpy(zero_copy_only=True), valid
+    except pa.ArrowInvalid:
+        return array.to_numpy(zero_copy_only=False), valid
+
+
+def _finite(value):
+    """A scalar result, None for NaN and infinities, which JSON cannot carry."""
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _to_arrow(values, valid) -> pa.Array:
+    """Arrow array of evaluated values, null where an input was null or the value is not finite."""
+    invalid = None if valid is None else ~valid
+    if values.dtype.kind == 'f':
+        not_finite = ~np.isfinite(values)
+        invalid = not_finite if invalid is None else invalid | not_finite
+    return pa.array(values, mask=invalid if invalid is not None and invalid.any() else None)
+
+
+def evaluate_on_dataset(expression: str, handle: str, aggregate: str = '',
+                        registry: Optional['DatasetRegistry'] = None) -> Dict:
+    """Evaluate a numexpr expression over the columns of a dataset.
+
+    The expression runs record batch by record batch on numpy views of the
+    mapped Arrow buffers. Scalar results are returned as they are,
+    element-wise results are reduced by `aggregate` or stored as a new dataset.
+    Rows with a null in a column of the expression give a null, as do NaN and
+    infinite values, and aggregates skip them like SQL does.
+
+    Args:
+        expression: Element-wise expression over column names, e.g. "price * quantity"
+        handle: The dataset handle
+        aggregate: Optional reduction of the result: sum, mean, min, max or count
+        registry: Registry to use, the process-wide one when None
+
+    Returns:
+        The result value, or the handle and summary of the result column
+    """
+    import numexpr
+    import pyarrow.compute as pc
+
+    if aggregate and aggregate not in AGGREGATES:
+        raise ValueError(f"Unsupported aggregate {aggregate}, use one of {', '.join(AGGREGATES)}")
+    registry = registry or get_dataset_registry()
+    table = registry.open(handle)
+    names = [name for name in table.column_names if name in set(_IDENTIFIER.findall(expression))]
+
+    if not names:
+        # Constant expression, nothing to vectorise over
+        return {'result': _finite(numexpr.evaluate(expression).item())}
+    chunks = []
+    for batch in table.to_batches():
+        local, valid = {}, None
+        for name in names:
+            local[name], column_valid = _buffer(batch.column(name))
+            if column_valid is not None:
+                valid = column_valid if valid is None else valid & column_valid
+        chunks.append((numexpr.evaluate(expression, local_dict=local), valid))
+    if chunks and all(values.ndim == 0 for values, _ in chunks):
+        if len(chunks) > 1 or chunks[0][1] is not None:
+            raise ValueError("Reductions inside the expression only work on single-batch datasets without "
+                             "nulls, use the aggregate argument instead")
+        return {'result': _finite(chunks[0][0].item())}
+
+    result = pa.chunked_array([_to_arrow(values, valid) for values, valid in chunks])
+    if aggregate == 'count':
+        return {'result': len(result) - result.null_count, 'aggregate': aggregate}
+    if aggregate:
+        return {'result': _finite(getattr(pc, aggregate)(result).as_py()), 'aggregate': aggregate}
+    stats = pc.min_max(result)
+    return {
+        'dataset': registry.put(pa.table({'result': result})),
+        'rows': len(result),
+        'summary': {
+            'sum': _finite(pc.sum(result).as_py()),
+            'mean': _finite(pc.mean(result).as_py()),
+            'min': stats['min'].as_py(),
+            'max': stats['max'].as_py(),
+        },
+    }
+
+
+@contextlib.contextmanager
+def dataset_run(run_id: str) -> Iterator[str]:
+    """Scope the datasets created by tools to a crew run, released when it ends."""
+    token = _current_run.set(run_id)
+    try:
+        yield run_id
+    finally:
+        _current_run.reset(token)
+        get_dataset_registry().release_run(run_id)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_dataset_registry() -> DatasetRegistry:
+    """Return the process-wide dataset registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DatasetRegistry()
+    return _registry
@@ -0,0 +1,364 @@
+"""Page-level PDF and DOCX ingestion for the analysis crews.
+
+Documents are referenced by path (inside the allowed roots) or by the id of
+an uploaded file. A document is hashed through a memory map, and its
+extracted pages are cached on disk under that hash, so a file is extracted
+once no matter how often, or under which name, it is analysed again. PDF
+pages are extracted in ranges across a process pool with PyMuPDF (PyPDF2
+when PyMuPDF is missing), text plus tables. DOCX bodies are split into
+pseudo-pages of paragraphs. Extracted pages are cut into overlapping chunks
+the crews read through the document reader tool, the chunks of recently read
+documents are kept in memory.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence
+
+from GS.workflow_engine.configs import Documents
+
+PDF = 'pdf'
+DOCX = 'docx'
+SUPPORTED_EXTENSIONS = {'.pdf': PDF, '.docx': DOCX}
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file read through a memory map."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return sha.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            sha.update(mapped)
+    return sha.hexdigest()
+
+
+def document_kind(path: str) -> str:
+    """Return 'pdf' or 'docx' from the file extension."""
+    kind = SUPPORTED_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if kind is None:
+        raise ValueError(f"Unsupported document type: {os.path.basename(path)}")
+    return kind
+
+
+def _table_text(rows: Sequence[Sequence[Any]]) -> str:
+    return '\n'.join(' | '.join('' if cell is None else str(cell).strip() for cell in row) for row in rows)
+
+
+def _open_pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    return pymupdf
+
+
+def _pdf_page_count(path: str) -> int:
+    try:
+        pymupdf = _open_pymupdf()
+    except ImportError:
+        from PyPDF2 import PdfReader
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return len(PdfReader(mapped).pages)
+    with pymupdf.open(path) as document:
+        return document.page_count
+
+
+def _extract_pdf_range(path: str, start: int, stop: int, tables: bool) -> List[Dict]:
+    """Extract pages [start, stop) of a PDF, runs in a pool worker."""
+    pages = []
+    try:
+        pymupdf = _open_pymupdf()
+    except ImportError:
+        from PyPDF2 import PdfReader
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            reader = PdfReader(mapped)
+            for number in range(start, stop):
+                pages.append({'page': number + 1, 'text': reader.pages[number].extract_text() or '', 'tables': []})
+        return pages
+
+    with pymupdf.open(path) as document:
+        for number in range(start, stop):
+            page = document[number]
+            page_tables = []
+            if tables and hasattr(page, 'find_tables'):
+                page_tables = [table.extract() for table in page.find_tables().tables]
+            pages.append({'page': number + 1, 'text': page.get_text('text'), 'tables': page_tables})
+    return pages
+
+
+def _extract_docx(path: str, paragraphs_per_page: int) -> List[Dict]:
+    """Split a DOCX body into pseudo-pages, keeping tables where they appear."""
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    pages = []
+    lines: List[str] = []
+    page_tables: List[List[List[str]]] = []
+
+    def close_page():
+        if lines or page_tables:
+            pages.append({'page': len(pages) + 1, 'text': '\n'.join(lines), 'tables': list(page_tables)})
+        lines.clear()
+        page_tables.clear()
+
+    # zipfile needs seekable(), which mmap objects lack before Python 3.13
+    with open(path, 'rb') as f:
+        document = Document(f)
+        for element in document.element.body.iterchildren():
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'p':
+                text = Paragraph(element, document).text
+                if text.strip():
+                    lines.append(text)
+            elif tag == 'tbl':
+                table = Table(element, document)
+                page_tables.append([[cell.text for cell in row.cells] for row in table.rows])
+            if len(lines) >= paragraphs_per_page:
+                close_page()
+        close_page()
+    return pages
+
+
+class DocumentCache:
+    """Extracted pages stored as JSON files named by content hash."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f'{digest}.json')
+
+    def get(self, digest: str) -> Optional[Dict]:
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, digest: str, record: Dict):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(temp_path, self._path(digest))
+
+
+def chunk_pages(pages: List[Dict], chunk_chars: int = Documents.CHUNK_CHARS,
+                overlap: int = Documents.CHUNK_OVERLAP) -> List[Dict]:
+    """Cut extracted pages into overlapping text chunks.
+
+    Args:
+        pages: Pages as returned by `DocumentIngestor.extract`
+        chunk_chars: Target size of a chunk in characters
+        overlap: Characters repeated at the start of the next chunk
+
+    Returns:
+        Chunks with their index, the pages they span and their text
+    """
+    chunks = []
+    buffer = ''
+    first_page = None
+    for page in pages:
+        text = page['text'].strip()
+        for rows in page.get('tables') or []:
+            text += '\n\n' + _table_text(rows)
+        if not text:
+            continue
+        if first_page is None:
+            first_page = page['page']
+        buffer = f'{buffer}\n\n{text}' if buffer else text
+        while len(buffer) >= chunk_chars:
+            cut = buffer.rfind('\n', chunk_chars // 2, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            chunks.append({'chunk': len(chunks), 'pages': [first_page, page['page']], 'text': buffer[:cut]})
+            buffer = buffer[cut - min(overlap, cut // 2):]
+            first_page = page['page']
+    if buffer.strip():
+        chunks.append({'chunk': len(chunks), 'pages': [first_page, pages[-1]['page']], 'text': buffer})
+    return chunks
+
+
+class DocumentIngestor:
+    """Extract documents once, in parallel, and serve their chunks."""
+
+    def __init__(self, cache_dir: str = Documents.CACHE_DIR, upload_dir: str = Documents.UPLOAD_DIR,
+                 allowed_roots: Optional[List[str]] = None, processes: int = Documents.PROCESSES,
+                 pages_per_task: int = Documents.PAGES_PER_TASK,
+                 extract_tables: bool = Documents.EXTRACT_TABLES,
+                 chunk_cache_size: int = Documents.CHUNK_CACHE_SIZE):
+        """Initialize the ingestor.
+
+        Args:
+            cache_dir: Directory of the extracted text cache
+            upload_dir: Directory uploaded documents are stored in by hash
+            allowed_roots: Directories documents may be referenced from by path
+            processes: Extraction processes, 0 uses every CPU
+            pages_per_task: PDF pages extracted per pool task
+            extract_tables: Detect tables on PDF pages, slower but keeps them intact
+            chunk_cache_size: Documents whose chunks are kept in memory
+        """
+        self.cache = DocumentCache(cache_dir)
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        roots = Documents.ALLOWED_ROOTS if allowed_roots is None else allowed_roots
+        self.allowed_roots = [os.path.realpath(root) for root in [upload_dir, *roots]]
+        self.processes = processes or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.extract_tables = extract_tables
+        self.chunk_cache_size = chunk_cache_size
+        # document id -> chunks, documents are named by content hash so entries never go stale
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save_upload(self, stream: BinaryIO, filename: str) -> Dict:
+        """Store an uploaded file under its content hash.
+
+        Returns:
+            The document id (its hash), name and stored path
+        """
+        kind = document_kind(filename)
+        fd, temp_path = tempfile.mkstemp(dir=self.upload_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+        digest = file_digest(temp_path)
+        path = os.path.join(self.upload_dir, f'{digest}.{kind}')
+        os.replace(temp_path, path)
+        return {'document_id': digest, 'name': os.path.basename(filename), 'path': path}
+
+    def resolve(self, reference: str) -> str:
+        """Turn a document id or a path into a readable path inside the allowed roots."""
+        if _DIGEST.match(reference):
+            for kind in SUPPORTED_EXTENSIONS.values():
+                path = os.path.join(self.upload_dir, f'{reference}.{kind}')
+                if os.path.exists(path):
+                    return path
+            raise FileNotFoundError(f"No uploaded document with id {reference}")
+        path = os.path.realpath(reference)
+        if not any(os.path.commonpath([path, root]) == root for root in self.allowed_roots):
+            raise PermissionError(f"Document path is outside the allowed roots: {reference}")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Document not found: {reference}")
+        return path
+
+    def extract(self, reference: str) -> Dict:
+        """Extract a document, or return its cached extraction.
+
+        Returns:
+            A record with the document id, name, kind, page count and pages
+        """
+        path = self.resolve(reference)
+        kind = document_kind(path)
+        digest = file_digest(path)
+        record = self.cache.get(digest)
+        if record is not None:
+            return record
+
+        if kind == DOCX:
+            pages = _extract_docx(path, Documents.DOCX_PARAGRAPHS_PER_PAGE)
+        else:
+            pages = self._extract_pdf(path)
+        record = {
+            'document_id': digest,
+            'name': os.path.basename(reference),
+            'kind': kind,
+            'page_count': len(pages),
+            'pages': pages,
+        }
+        self.cache.put(digest, record)
+        return record
+
+    def _extract_pdf(self, path: str) -> List[Dict]:
+        page_count = _pdf_page_count(path)
+        ranges = [(start, min(start + self.pages_per_task, page_count))
+                  for start in range(0, page_count, self.pages_per_task)]
+        if self.processes == 1 or len(ranges) < 2:
+            return [page for start, stop in ranges for page in _extract_pdf_range(path, start, stop, self.extract_tables)]
+        with ProcessPoolExecutor(min(self.processes, len(ranges))) as executor:
+            futures = [executor.submit(_extract_pdf_range, path, start, stop, self.extract_tables)
+                       for start, stop in ranges]
+            return [page for future in futures for page in future.result()]
+
+    def chunks(self, document_id: str) -> List[Dict]:
+        """Chunks of an already extracted document."""
+        with self._lock:
+            if document_id in self._chunks:
+                self._chunks.move_to_end(document_id)
+                return self._chunks[document_id]
+        record = self.cache.get(document_id)
+        if record is None:
+            raise KeyError(f"Document {document_id} has not been ingested")
+        return self._remember_chunks(document_id, chunk_pages(record['pages']))
+
+    def _remember_chunks(self, document_id: str, chunks: List[Dict]) -> List[Dict]:
+        with self._lock:
+            self._chunks[document_id] = chunks
+            self._chunks.move_to_end(document_id)
+            while len(self._chunks) > self.chunk_cache_size:
+                self._chunks.popitem(last=False)
+        return chunks
+
+    def ingest(self, references: Sequence[str]) -> List[Dict]:
+        """Extract documents and summarise them for a crew.
+
+        Returns:
+            One entry per document with its id, name, page and chunk counts
+        """
+        documents = []
+        for reference in references:
+            record = self.extract(reference)
+            documents.append({
+                'document_id': record['document_id'],
+                'name': record['name'],
+                'kind': record['kind'],
+                'page_count': record['page_count'],
+                'chunk_count': len(self._remember_chunks(record['document_id'], chunk_pages(record['pages']))),
+            })
+        return documents
+
+
+def describe_documents(documents: List[Dict]) -> str:
+    """Render ingested documents as the `documents` input of a crew."""
+    if not documents:
+        return "No documents were provided."
+    lines = ["The following documents were provided, read them with the document reader tool:"]
+    for document in documents:
+        lines.append(
+            f"- {document['name']} (document_id: {document['document_id']}, {document['page_count']} pages, "
+            f"chunks 0-{document['chunk_count'] - 1})"
+        )
+    return '\n'.join(lines)
+
+
+def with_documents(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the crew inputs of a request with its documents ingested.
+
+    The `documents` input is always set so task descriptions can reference it.
+    """
+    inputs = dict(data.get('inputs', {}))
+    references = data.get('documents') or []
+    documents = get_document_ingestor().ingest(references) if references else []
+    inputs['documents'] = describe_documents(documents)
+    return inputs
+
+
+_ingestor = None
+
+
+def get_document_ingestor() -> DocumentIngestor:
+    """Return the ingestor configured from the environment."""
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = DocumentIngestor()
+    return _ingestor
@@ -0,0 +1,285 @@
+"""Process-wide embedding service for sentence-transformers workloads.
+
+The model is loaded once per encoding process, the pool workers when there
+is a process pool and the calling process otherwise. Concurrent `encode` calls are merged
+into micro-batches (up to `max_batch` texts, waiting at most `max_wait_ms` for
+a batch to fill), optionally encoded across a process pool on CPU-only boxes,
+and every embedding is cached on disk by content hash in a memory-mapped
+float32 array so the same text is never encoded twice.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from GS.workflow_engine.configs import Embedding
+
+
+def load_sentence_transformer(model_name: str):
+    """Load a sentence-transformers model."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class MmapEmbeddingCache:
+    """Append-only embedding cache keyed by content hash.
+
+    Vectors live in `vectors.f32`, a memory-mapped float32 matrix, and row i
+    belongs to the i-th 20 byte digest in `keys.bin`. A vector is flushed
+    before its key is appended, so a crash never leaves a key pointing at an
+    unwritten row. Safe for threads of one process, not for several writers.
+    """
+
+    DIGEST_SIZE = 20
+
+    def __init__(self, directory: str, dimension: int, initial_capacity: int = 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.dimension = dimension
+        self._vectors_path = os.path.join(directory, 'vectors.f32')
+        self._keys_path = os.path.join(directory, 'keys.bin')
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, 'rb') as f:
+                keys = f.read()
+            usable = len(keys) - len(keys) % self.DIGEST_SIZE
+            for row, offset in enumerate(range(0, usable, self.DIGEST_SIZE)):
+                self._index[keys[offset:offset + self.DIGEST_SIZE]] = row
+
+        row_bytes = dimension * 4
+        existing_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        self._capacity = max(initial_capacity, existing_rows, len(self._index))
+        self._resize(self._capacity)
+        self._keys_file = open(self._keys_path, 'ab')
+
+    def _resize(self, capacity: int):
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension))
+        self._capacity = capacity
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        """Return a cached vector or None."""
+        row = self._index.get(digest)
+        if row is None:
+            return None
+        return np.array(self._vectors[row])
+
+    def put_many(self, digests: Sequence[bytes], vectors: np.ndarray):
+        """Append vectors for digests that are not cached yet."""
+        with self._lock:
+            rows = []
+            for digest, vector in zip(digests, vectors):
+                if digest in self._index:
+                    continue
+                row = len(self._index) + len(rows)
+                if row >= self._capacity:
+                    self._vectors.flush()
+                    self._resize(self._capacity * 2)
+                self._vectors[row] = vector
+                rows.append((digest, row))
+            if not rows:
+                return
+            self._vectors.flush()
+            self._keys_file.write(b''.join(digest for digest, _ in rows))
+            self._keys_file.flush()
+            for digest, row in rows:
+                self._index[digest] = row
+
+    def close(self):
+        """Flush and close the underlying files."""
+        with self._lock:
+            self._vectors.flush()
+            self._keys_file.close()
+
+
+# Model used by process pool workers, loaded once per worker by the initializer
+_worker_model = None
+
+
+def _init_worker(model_name: str, model_loader: Callable):
+    global _worker_model
+    _worker_model = model_loader(model_name)
+
+
+def _worker_dimension() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+
+def _worker_encode(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True), dtype=np.float32)
+
+
+class EmbeddingService:
+    """Batched, cached text embeddings with a single model load per process."""
+
+    def __init__(self, model_name: str = Embedding.MODEL, max_batch: int = Embedding.MAX_BATCH,
+                 max_wait_ms: float = Embedding.MAX_WAIT_MS, cache_dir: Optional[str] = Embedding.CACHE_DIR,
+                 processes: int = Embedding.PROCESSES, model_loader: Callable = load_sentence_transformer):
+        """Initialize the service.
+
+        Args:
+            model_name: The sentence-transformers model to load
+            max_batch: Maximum number of texts encoded in one model call
+            max_wait_ms: How long the first queued text waits for a batch to fill
+            cache_dir: Directory of the on-disk embedding cache, None disables it
+            processes: Size of the encoding process pool, 0 encodes in this process
+            model_loader: Function loading a model from its name
+        """
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._model = None
+        self._pool = None
+        self._in_flight = None
+        if processes:
+            # Only the workers hold the model, one of them reports its dimension
+            self._pool = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(model_name, model_loader))
+            self._in_flight = threading.BoundedSemaphore(processes * 2)
+            self.dimension = self._pool.submit(_worker_dimension).result()
+        else:
+            self._model = model_loader(model_name)
+            self.dimension = self._model.get_sentence_embedding_dimension()
+        self._cache = MmapEmbeddingCache(os.path.join(cache_dir, self._cache_namespace()), self.dimension) \
+            if cache_dir else None
+
+        self._queue = queue.Queue()
+        self._pending: Dict[bytes, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._batcher = threading.Thread(target=self._run_batcher, name='embedding-batcher', daemon=True)
+        self._batcher.start()
+        self.batches = 0
+        self.encoded = 0
+
+    def _cache_namespace(self) -> str:
+        return hashlib.sha1(self.model_name.encode('utf-8')).hexdigest()[:16]
+
+    def _digest(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode texts into normalized float32 embeddings, one row per text."""
+        digests = [self._digest(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        futures: Dict[bytes, Future] = {}
+
+        for text, digest in zip(texts, digests):
+            if digest in vectors or digest in futures:
+                continue
+            cached = self._cache.get(digest) if self._cache is not None else None
+            if cached is not None:
+                vectors[digest] = cached
+                continue
+            with self._pending_lock:
+                # Another caller may already be encoding the same text
+                future = self._pending.get(digest)
+                if future is None:
+                    future = Future()
+                    self._pending[digest] = future
+                    self._queue.put((digest, text, future))
+            futures[digest] = future
+
+        for digest, future in futures.items():
+            vectors[digest] = future.result()
+
+        if not digests:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.stack([vectors[digest] for digest in digests])
+
+    def _run_batcher(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        texts = [text for _, text, _ in batch]
+        self.batches += 1
+        if self._pool is None:
+            try:
+                vectors = np.asarray(
+                    self._model.encode(texts, batch_size=len(texts), normalize_embeddings=True), dtype=np.float32
+                )
+            except Exception as e:
+                self._resolve(batch, error=e)
+            else:
+                self._resolve(batch, vectors=vectors)
+            return
+
+        # Keep collecting the next batch while workers encode this one
+        self._in_flight.acquire()
+        future = self._pool.submit(_worker_encode, texts)
+
+        def done(result):
+            self._in_flight.release()
+            if result.exception() is not None:
+                self._resolve(batch, error=result.exception())
+            else:
+                self._resolve(batch, vectors=result.result())
+
+        future.add_done_callback(done)
+
+    def _resolve(self, batch, vectors=None, error=None):
+        if error is None and self._cache is not None:
+            self._cache.put_many([digest for digest, _, _ in batch], vectors)
+        with self._pending_lock:
+            for digest, _, _ in batch:
+                self._pending.pop(digest, None)
+        for index, (_, _, future) in enumerate(batch):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[index])
+        if error is None:
+            self.encoded += len(batch)
+
+    def close(self):
+        """Stop the batcher, the process pool and flush the cache."""
+        self._queue.put(None)
+        self._batcher.join()
+        if self._pool:
+            self._pool.shutdown()
+        if self._cache is not None:
+            self._cache.close()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the process-wide embedding service, loading the model on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
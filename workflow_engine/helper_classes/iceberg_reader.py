@@ -0,0 +1,328 @@
+"""Read Iceberg tables straight from their Parquet data files.
+
+Simple scans over the lake (e.g. `iceberg.test.orders`) do not need a Trino
+coordinator: the reader plans the scan from the table metadata itself, prunes
+data files on partition values and column statistics and reads only the
+projected columns. Manifests are cached per snapshot id and the loaded table
+metadata is reused: reads of a given snapshot never reload it, since
+snapshots are immutable, and reads of the current snapshot reload it once
+it is older than `table_cache_seconds`.
+
+Snapshots with delete files are read through pyiceberg's own scan, which
+applies the deletes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyiceberg.catalog import load_catalog
+from pyiceberg.expressions import (
+    AlwaysTrue,
+    And,
+    EqualTo,
+    GreaterThan,
+    GreaterThanOrEqual,
+    In,
+    IsNull,
+    LessThan,
+    LessThanOrEqual,
+    NotEqualTo,
+    NotIn,
+    NotNull,
+)
+from pyiceberg.conversions import from_bytes
+from pyiceberg.expressions.visitors import expression_evaluator, inclusive_projection
+from pyiceberg.io.pyarrow import schema_to_pyarrow
+from pyiceberg.manifest import ManifestContent
+from pyiceberg.schema import Schema
+
+from GS.workflow_engine.configs import IcebergConfig
+
+# Filters use the same (column, op, value) tuples as pyarrow.parquet
+_PREDICATES = {
+    '=': EqualTo,
+    '==': EqualTo,
+    '!=': NotEqualTo,
+    '<': LessThan,
+    '<=': LessThanOrEqual,
+    '>': GreaterThan,
+    '>=': GreaterThanOrEqual,
+    'in': In,
+    'not in': NotIn,
+}
+
+Filter = Tuple[str, str, Any]
+
+
+def to_iceberg_expression(filters: Optional[Sequence[Filter]]):
+    """Convert AND-ed (column, op, value) filters into an Iceberg expression."""
+    expression = AlwaysTrue()
+    for column, op, value in filters or []:
+        op = op.lower()
+        if op == 'is null':
+            predicate = IsNull(column)
+        elif op == 'is not null':
+            predicate = NotNull(column)
+        elif op in _PREDICATES:
+            predicate = _PREDICATES[op](column, set(value) if op in ('in', 'not in') else value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        expression = And(expression, predicate)
+    return expression
+
+
+def _bound(bounds, field) -> Any:
+    value = (bounds or {}).get(field.field_id)
+    return None if value is None else from_bytes(field.field_type, value)
+
+
+def file_may_match(data_file, schema: Schema, filters: Optional[Sequence[Filter]]) -> bool:
+    """Whether the column statistics of a data file allow rows matching the filters.
+
+    Only says no when the lower/upper bounds and null counts rule the file
+    out, missing statistics or values that do not compare keep it.
+    """
+    for column, op, value in filters or []:
+        op = op.lower()
+        try:
+            field = schema.find_field(column)
+        except ValueError:
+            continue
+        nulls = (data_file.null_value_counts or {}).get(field.field_id)
+        values = (data_file.value_counts or {}).get(field.field_id)
+        if op == 'is null':
+            if nulls == 0:
+                return False
+            continue
+        if op == 'is not null':
+            if nulls is not None and values is not None and nulls == values:
+                return False
+            continue
+        if op in ('!=', 'not in'):
+            continue
+        try:
+            lower, upper = _bound(data_file.lower_bounds, field), _bound(data_file.upper_bounds, field)
+            candidates = list(value) if op == 'in' else [value]
+            if lower is not None and op in ('<', '<='):
+                if not (lower < value if op == '<' else lower <= value):
+                    return False
+            elif upper is not None and op in ('>', '>='):
+                if not (upper > value if op == '>' else upper >= value):
+                    return False
+            elif op in ('=', '==', 'in') and not any(
+                    (lower is None or lower <= candidate) and (upper is None or candidate <= upper)
+                    for candidate in candidates):
+                return False
+        except TypeError:
+            # The filter value does not compare with the column's type, the rows decide
+            continue
+    return True
+
+
+def to_arrow_filter(filters: Optional[Sequence[Filter]]):
+    """Convert the same filters into a pyarrow expression for row-level filtering."""
+    expression = None
+    for column, op, value in filters or []:
+        field = pc.field(column)
+        op = op.lower()
+        if op == 'is null':
+            predicate = field.is_null()
+        elif op == 'is not null':
+            predicate = ~field.is_null()
+        elif op in ('=', '=='):
+            predicate = field == value
+        elif op == '!=':
+            predicate = field != value
+        elif op == '<':
+            predicate = field < value
+        elif op == '<=':
+            predicate = field <= value
+        elif op == '>':
+            predicate = field > value
+        elif op == '>=':
+            predicate = field >= value
+        elif op == 'in':
+            predicate = field.isin(list(value))
+        elif op == 'not in':
+            predicate = ~field.isin(list(value))
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        expression = predicate if expression is None else expression & predicate
+    return expression
+
+
+class IcebergReader:
+    """Scan Iceberg tables without going through Trino."""
+
+    def __init__(self, catalog=None, manifest_cache_size: int = IcebergConfig.MANIFEST_CACHE_SNAPSHOTS,
+                 table_cache_seconds: float = IcebergConfig.TABLE_CACHE_SECONDS):
+        """Initialize the reader.
+
+        Args:
+            catalog: A pyiceberg catalog, defaults to the one configured in IcebergConfig
+            manifest_cache_size: Number of snapshots whose manifests, and of tables whose metadata, are kept in memory
+            table_cache_seconds: How long reads of the current snapshot reuse the loaded table metadata
+        """
+        self.catalog = catalog or self.load_configured_catalog()
+        self.manifest_cache_size = manifest_cache_size
+        self.table_cache_seconds = table_cache_seconds
+        self._manifest_cache = OrderedDict()
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self.manifest_reads = 0
+
+    @staticmethod
+    def load_configured_catalog():
+        """Load the catalog from IcebergConfig (REST in the stack, sqlite locally)."""
+        properties = {'uri': IcebergConfig.CATALOG_URI}
+        if IcebergConfig.CATALOG_TYPE:
+            properties['type'] = IcebergConfig.CATALOG_TYPE
+        if IcebergConfig.WAREHOUSE:
+            properties['warehouse'] = IcebergConfig.WAREHOUSE
+        if IcebergConfig.S3_ENDPOINT:
+            properties['s3.endpoint'] = IcebergConfig.S3_ENDPOINT
+            properties['s3.path-style-access'] = 'true'
+        return load_catalog(IcebergConfig.CATALOG_NAME, **properties)
+
+    def _snapshot_entries(self, table, snapshot) -> Optional[List[Tuple[int, Any]]]:
+        """Return (spec_id, data_file) for every live data file of a snapshot.
+
+        Results are cached per (table, snapshot id); a snapshot is immutable so
+        the cache never needs invalidating, only bounding.
+
+        Returns:
+            The entries, None when the snapshot has delete files
+        """
+        key = (table.metadata.table_uuid, snapshot.snapshot_id)
+        with self._lock:
+            if key in self._manifest_cache:
+                self._manifest_cache.move_to_end(key)
+                return self._manifest_cache[key]
+
+        entries = []
+        for manifest in snapshot.manifests(table.io):
+            if manifest.content != ManifestContent.DATA:
+                # Reading the data files alone would return deleted rows
+                entries = None
+                break
+            self.manifest_reads += 1
+            for entry in manifest.fetch_manifest_entry(table.io, discard_deleted=True):
+                entries.append((manifest.partition_spec_id, entry.data_file))
+
+        with self._lock:
+            self._manifest_cache[key] = entries
+            while len(self._manifest_cache) > self.manifest_cache_size:
+                self._manifest_cache.popitem(last=False)
+        return entries
+
+    def load_table(self, table_name: str, snapshot_id: Optional[int] = None):
+        """The table's metadata, loaded from the catalog only when the cached one cannot serve the read."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._tables.get(table_name)
+        if cached is not None:
+            loaded_at, table = cached
+            if snapshot_id is None and now - loaded_at < self.table_cache_seconds:
+                return table
+            if snapshot_id is not None and table.snapshot_by_id(snapshot_id) is not None:
+                return table
+
+        table = self.catalog.load_table(table_name)
+        with self._lock:
+            self._tables[table_name] = (now, table)
+            self._tables.move_to_end(table_name)
+            while len(self._tables) > self.manifest_cache_size:
+                self._tables.popitem(last=False)
+        return table
+
+    def plan_files(self, table_name: str, filters: Optional[Sequence[Filter]] = None,
+                   snapshot_id: Optional[int] = None) -> List[Any]:
+        """Return the data files of a snapshot that may contain matching rows."""
+        table = self.load_table(table_name, snapshot_id)
+        data_files = self._plan(table, filters, snapshot_id)
+        if data_files is None:
+            return [task.file for task in self._scan(table, None, filters, snapshot_id, None).plan_files()]
+        return data_files
+
+    def _plan(self, table, filters: Optional[Sequence[Filter]], snapshot_id: Optional[int]) -> Optional[List[Any]]:
+        """The data files of a loaded table to read, None when the snapshot has delete files."""
+        snapshot = table.snapshot_by_id(snapshot_id) if snapshot_id else table.current_snapshot()
+        if snapshot is None:
+            return []
+        entries = self._snapshot_entries(table, snapshot)
+        if entries is None:
+            return None
+        schema = table.metadata.schema_by_id(snapshot.schema_id) if snapshot.schema_id is not None else table.schema()
+        row_filter = to_iceberg_expression(filters)
+
+        partition_evaluators = {}
+        for spec_id, spec in table.specs().items():
+            partition_filter = inclusive_projection(schema, spec)(row_filter)
+            partition_schema = Schema(*spec.partition_type(schema).fields)
+            partition_evaluators[spec_id] = expression_evaluator(partition_schema, partition_filter, True)
+
+        return [
+            data_file
+            for spec_id, data_file in entries
+            if partition_evaluators[spec_id](data_file.partition) and file_may_match(data_file, schema, filters)
+        ]
+
+    @staticmethod
+    def _scan(table, columns: Optional[List[str]], filters: Optional[Sequence[Filter]],
+              snapshot_id: Optional[int], limit: Optional[int]):
+        return table.scan(row_filter=to_iceberg_expression(filters), selected_fields=tuple(columns or ('*',)),
+                          snapshot_id=snapshot_id, limit=limit)
+
+    def read(self, table_name: str, columns: Optional[List[str]] = None,
+             filters: Optional[Sequence[Filter]] = None, snapshot_id: Optional[int] = None,
+             limit: Optional[int] = None) -> pa.Table:
+        """Read a table into Arrow.
+
+        Args:
+            table_name: Table identifier, e.g. 'test.orders'
+            columns: Columns to project, defaults to all columns
+            filters: AND-ed (column, op, value) tuples
+            snapshot_id: Snapshot to read, defaults to the current one
+            limit: Maximum number of rows to return
+
+        Returns:
+            A pyarrow Table with the matching rows
+        """
+        table = self.load_table(table_name, snapshot_id)
+        data_files = self._plan(table, filters, snapshot_id)
+        if data_files is None:
+            return self._scan(table, columns, filters, snapshot_id, limit).to_arrow()
+        arrow_filter = to_arrow_filter(filters)
+
+        parts = []
+        rows = 0
+        for data_file in data_files:
+            with table.io.new_input(data_file.file_path).open() as f:
+                # Column names are matched by name, files written before a column rename are not remapped
+                part = pq.read_table(f, columns=columns, filters=arrow_filter)
+            parts.append(part)
+            rows += part.num_rows
+            if limit is not None and rows >= limit:
+                break
+
+        if parts:
+            result = pa.concat_tables(parts, promote_options='default')
+        else:
+            schema = schema_to_pyarrow(table.schema(), include_field_ids=False)
+            result = schema.empty_table().select(columns) if columns else schema.empty_table()
+        return result.slice(0, limit) if limit is not None else result
+
+    def clear_cache(self):
+        """Drop every cached snapshot manifest and table metadata."""
+        with self._lock:
+            self._manifest_cache.clear()
+            self._tables.clear()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Return the number of cached snapshots and manifests read so far."""
+        return {'cached_snapshots': len(self._manifest_cache), 'manifest_reads': self.manifest_reads}
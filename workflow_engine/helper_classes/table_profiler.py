@@ -0,0 +1,672 @@
+"""Sampled, incremental table profiling for the analysis crew.
+
+Profiles are built from mergeable sketches in one streaming pass over Arrow
+record batches read from DuckDB: exact counts, min/max and moments, a
+HyperLogLog for distinct counts, a merging t-digest for quantiles and
+histograms, and a Misra-Gries summary for frequent values. Value hashing
+and reservoir sampling are pushed down into the DuckDB query. Because every
+sketch merges, a profile is cached per table version and, when the table has
+a monotonically increasing watermark column, brought up to date by profiling
+only the appended rows. Scheduled analyses use the same watermark to profile
+just the rows added since their previous run. Profiles of lake tables are
+checked against the same SELECT policies as their rows, and the statistics
+that show values are left out for masked columns.
+"""
+
+import base64
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from GS.workflow_engine.configs import DuckDB
+
+BATCH_ROWS = 64 * 1024
+HLL_PRECISION = 12
+TDIGEST_COMPRESSION = 200
+TOP_K = 20
+HISTOGRAM_BINS = 10
+SAMPLE_SEED = 42
+# Statistics showing values of a column, left out for columns the policies mask
+VALUE_STATISTICS = ('min', 'max', 'mean', 'std', 'quantiles', 'histogram_edges', 'top_values')
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def quote_table(table: str) -> str:
+    """Quote a dotted table name part by part."""
+    return '.'.join(_quote(part) for part in table.split('.'))
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch over 64-bit hashes."""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add uint64 hashes, e.g. DuckDB's hash() of the column."""
+        if not len(hashes):
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        # Exact count of leading zeros by binary search over the bit width
+        zeros = np.zeros(len(rest), dtype=np.uint8)
+        for shift in (32, 16, 8, 4, 2, 1):
+            empty = rest < (np.uint64(1) << np.uint64(64 - shift))
+            zeros += np.where(empty, shift, 0).astype(np.uint8)
+            rest = np.where(empty, rest << np.uint64(shift), rest)
+        max_rank = 64 - self.precision + 1
+        rank = np.minimum(zeros + 1, max_rank).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog'):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> float:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / empty)
+        return estimate
+
+    def to_dict(self) -> Dict:
+        return {'p': self.precision, 'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return cls(data['p'], registers)
+
+
+class TDigest:
+    """Merging t-digest for quantiles, compressed with the arcsine scale."""
+
+    def __init__(self, compression: int = TDIGEST_COMPRESSION, means=None, weights=None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray):
+        """Add a batch of values with weight one each."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self._compress(np.concatenate([self.means, values]),
+                           np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other: 'TDigest'):
+        if len(other.means):
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+        q_mid = (cumulative - weights / 2) / total
+        # Points whose quantile falls in the same unit of the scale function share a centroid
+        k = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q_mid - 1, -1, 1))
+        groups = np.floor(k)
+        starts = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]]))
+        group_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / group_weights
+        self.weights = group_weights
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        if not len(self.means):
+            return [None for _ in qs]
+        centers = (np.cumsum(self.weights) - self.weights / 2) / self.total
+        return [float(value) for value in np.interp(qs, centers, self.means)]
+
+    def to_dict(self) -> Dict:
+        return {'compression': self.compression, 'means': self.means.tolist(), 'weights': self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TDigest':
+        return cls(data['compression'], data['means'], data['weights'])
+
+
+class FrequentValues:
+    """Misra-Gries summary keeping approximate counts of the most frequent values."""
+
+    def __init__(self, capacity: int = TOP_K, counts: Optional[Dict[str, int]] = None):
+        self.capacity = capacity
+        self.counts = counts or {}
+
+    def update(self, counts: Dict[str, int]):
+        for value, count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) > self.capacity:
+            # Subtract the (capacity+1)-th largest count and drop what falls to zero
+            threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {value: count - threshold for value, count in self.counts.items() if count > threshold}
+
+    def merge(self, other: 'FrequentValues'):
+        self.update(other.counts)
+
+    def top(self, n: int) -> List[List[Any]]:
+        return [[value, count] for value, count in sorted(self.counts.items(), key=lambda item: -item[1])[:n]]
+
+
+def _kind(arrow_type: pa.DataType) -> str:
+    if pa.types.is_boolean(arrow_type):
+        return 'boolean'
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return 'numeric'
+    if pa.types.is_temporal(arrow_type):
+        return 'temporal'
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return 'string'
+    return 'other'
+
+
+class ColumnProfile:
+    """Mergeable statistics of one column."""
+
+    def __init__(self, name: str, data_type: str, kind: str):
+        self.name = name
+        self.data_type = data_type
+        self.kind = kind
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.hll = HyperLogLog()
+        self.digest = TDigest() if kind == 'numeric' else None
+        self.frequent = FrequentValues() if kind in ('string', 'boolean') else None
+
+    def update(self, array: pa.Array, hashes: Optional[pa.Array]):
+        """Fold one record batch column into the statistics."""
+        nulls = array.null_count
+        valid = len(array) - nulls
+        self.nulls += nulls
+        if hashes is not None:
+            self.hll.add_hashes(hashes.drop_null().to_numpy(zero_copy_only=False))
+        if not valid:
+            return
+
+        if self.kind in ('numeric', 'temporal', 'string'):
+            bounds = pc.min_max(array)
+            low, high = bounds['min'].as_py(), bounds['max'].as_py()
+            if self.kind == 'temporal':
+                # Kept as ISO strings so bounds loaded from the cache still compare
+                low, high = _jsonable(low), _jsonable(high)
+            elif self.kind == 'numeric' and not isinstance(low, (int, float)):
+                low, high = float(low), float(high)
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+        if self.kind == 'numeric':
+            values = pc.cast(array.drop_null(), pa.float64()).to_numpy(zero_copy_only=False)
+            batch_mean = float(values.mean())
+            batch_m2 = float(((values - batch_mean) ** 2).sum())
+            # Chan et al. combination of running moments
+            total = self.count + valid
+            delta = batch_mean - self.mean
+            self.mean += delta * valid / total
+            self.m2 += batch_m2 + delta * delta * self.count * valid / total
+            self.digest.update(values)
+        elif self.frequent is not None:
+            counts = pc.value_counts(array.drop_null())
+            self.frequent.update({str(value): count for value, count in
+                                  zip(counts.field('values').to_pylist(), counts.field('counts').to_pylist())})
+        self.count += valid
+
+    def merge_state(self, other: 'ColumnProfile'):
+        """Merge the statistics of the same column computed over other rows."""
+        if other.count:
+            if self.minimum is None or (other.minimum is not None and other.minimum < self.minimum):
+                self.minimum = other.minimum
+            if self.maximum is None or (other.maximum is not None and other.maximum > self.maximum):
+                self.maximum = other.maximum
+            total = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / total
+            self.m2 += other.m2 + delta * delta * self.count * other.count / total
+            self.count = total
+        self.nulls += other.nulls
+        self.hll.merge(other.hll)
+        if self.digest is not None and other.digest is not None:
+            self.digest.merge(other.digest)
+        if self.frequent is not None and other.frequent is not None:
+            self.frequent.merge(other.frequent)
+
+    def summary(self, scale: float = 1.0) -> Dict[str, Any]:
+        """Compact, JSON-ready statistics, counts scaled up for sampled profiles."""
+        rows = self.count + self.nulls
+        result = {
+            'name': self.name,
+            'type': self.data_type,
+            'null_pct': round(100.0 * self.nulls / rows, 2) if rows else None,
+            # Distinct values seen, a sample does not scale them up
+            'distinct': int(round(min(self.hll.count(), self.count))),
+        }
+        if self.minimum is not None:
+            result['min'] = _jsonable(self.minimum)
+            result['max'] = _jsonable(self.maximum)
+        if self.kind == 'numeric' and self.count:
+            result['mean'] = round(self.mean, 6)
+            result['std'] = round(math.sqrt(self.m2 / self.count), 6)
+            p5, p25, p50, p75, p95 = self.digest.quantiles([0.05, 0.25, 0.5, 0.75, 0.95])
+            result['quantiles'] = {'p5': p5, 'p25': p25, 'p50': p50, 'p75': p75, 'p95': p95}
+            edges = self.digest.quantiles(np.linspace(0, 1, HISTOGRAM_BINS + 1))
+            edges[0], edges[-1] = self.minimum, self.maximum
+            result['histogram_edges'] = [round(edge, 6) for edge in edges]
+        if self.frequent is not None and self.frequent.counts:
+            result['top_values'] = [[value, int(count * scale)] for value, count in self.frequent.top(5)]
+        return result
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name, 'data_type': self.data_type, 'kind': self.kind,
+            'count': self.count, 'nulls': self.nulls,
+            'minimum': _jsonable(self.minimum), 'maximum': _jsonable(self.maximum),
+            'mean': self.mean, 'm2': self.m2,
+            'hll': self.hll.to_dict(),
+            'digest': self.digest.to_dict() if self.digest is not None else None,
+            'frequent': self.frequent.counts if self.frequent is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ColumnProfile':
+        column = cls(data['name'], data['data_type'], data['kind'])
+        column.count, column.nulls = data['count'], data['nulls']
+        column.mean, column.m2 = data['mean'], data['m2']
+        # Temporal bounds come back as ISO strings, still comparable with each other
+        column.minimum, column.maximum = data['minimum'], data['maximum']
+        column.hll = HyperLogLog.from_dict(data['hll'])
+        if data['digest'] is not None:
+            column.digest = TDigest.from_dict(data['digest'])
+        if data['frequent'] is not None:
+            column.frequent = FrequentValues(counts=data['frequent'])
+        return column
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class TableProfile:
+    """Profile of a table at a version, with the state needed to extend it."""
+
+    def __init__(self, table: str, version: str, schema_hash: str, columns: Dict[str, ColumnProfile],
+                 rows: int = 0, sample_fraction: float = 1.0, watermark_column: Optional[str] = None,
+                 watermark=None):
+        self.table = table
+        self.version = version
+        self.schema_hash = schema_hash
+        self.columns = columns
+        self.rows = rows
+        self.sample_fraction = sample_fraction
+        self.watermark_column = watermark_column
+        self.watermark = watermark
+
+    def summary(self) -> Dict[str, Any]:
+        """The compact profile handed to the analysis crew."""
+        scale = 1.0 / self.sample_fraction if self.sample_fraction else 1.0
+        return {
+            'table': self.table,
+            'rows': self.rows,
+            'sampled': self.sample_fraction < 1.0,
+            'sample_fraction': round(self.sample_fraction, 6),
+            'columns': [column.summary(scale) for column in self.columns.values()],
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            'table': self.table, 'version': self.version, 'schema_hash': self.schema_hash,
+            'rows': self.rows, 'sample_fraction': self.sample_fraction,
+            'watermark_column': self.watermark_column, 'watermark': _jsonable(self.watermark),
+            'columns': [column.to_dict() for column in self.columns.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TableProfile':
+        columns = {column['name']: ColumnProfile.from_dict(column) for column in data['columns']}
+        return cls(data['table'], data['version'], data['schema_hash'], columns, data['rows'],
+                   data['sample_fraction'], data['watermark_column'], data['watermark'])
+
+
+class ProfileCache:
+    """Table profiles stored as JSON files, one per table."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, table: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(table.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, table: str) -> Optional[TableProfile]:
+        path = self._path(table)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return TableProfile.from_dict(json.load(f))
+
+    def put(self, profile: TableProfile):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(profile.to_dict(), f)
+        os.replace(temp_path, self._path(profile.table))
+
+
+class TableProfiler:
+    """Profile DuckDB tables with sketches, cached per version and extended on appends."""
+
+    def __init__(self, connection=None, cache_dir: Optional[str] = DuckDB.PROFILE_CACHE_DIR,
+                 sample_rows: int = DuckDB.PROFILE_SAMPLE_ROWS):
+        """Initialize the profiler.
+
+        Args:
+            connection: A DuckDB connection, DuckDB.DATABASE is opened when None
+            cache_dir: Directory of the profile cache, None keeps profiles in memory
+            sample_rows: Tables larger than this are profiled over a reservoir sample
+        """
+        if connection is None:
+            from GS.workflow_engine.helper_classes.catalog_index import connect_duckdb
+            connection = connect_duckdb(DuckDB.DATABASE, read_only=DuckDB.DATABASE != ':memory:')
+        self.connection = connection
+        self.cache = ProfileCache(cache_dir) if cache_dir else None
+        self.sample_rows = sample_rows
+        self._memory: Dict[str, TableProfile] = {}
+        self._lock = threading.RLock()
+
+    def _columns(self, table: str) -> List[tuple]:
+        cursor = self.connection.execute(f'DESCRIBE {quote_table(table)}')
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+    def table_version(self, table: str) -> str:
+        """Fingerprint of a table: its schema, row count and a checksum of its rows.
+
+        The checksum is an order-independent sum of row hashes computed inside
+        DuckDB, so updates that keep the row count still change the version.
+        It costs one scan of the table; pass a snapshot id as the version
+        where the table has one.
+        """
+        columns = self._columns(table)
+        row_hash = f"hash({', '.join(_quote(name) for name, _ in columns)})"
+        rows, checksum = self.connection.execute(
+            f'SELECT count(*), sum({row_hash}::HUGEINT) FROM {quote_table(table)}').fetchone()
+        return hashlib.sha1(json.dumps([columns, rows, str(checksum)]).encode('utf-8')).hexdigest()
+
+    def _cached(self, table: str) -> Optional[TableProfile]:
+        if table in self._memory:
+            return self._memory[table]
+        return self.cache.get(table) if self.cache else None
+
+    def _store(self, profile: TableProfile):
+        self._memory[profile.table] = profile
+        if self.cache:
+            self.cache.put(profile)
+
+    def authorize(self, table: str) -> Dict[str, Optional[str]]:
+        """Check that the crews may read a table, as `PolicyGateway.authorize_select` does for its rows.
+
+        Names without a catalog or schema are qualified with DuckDB's current ones.
+
+        Returns:
+            The mask expression per column, None for unmasked columns
+
+        Raises:
+            AccessDenied: If the table may not be read
+            PolicyUnavailable: If OPA could not be asked
+        """
+        from GS.crew_ai.tools.policy_gateway import get_policy_gateway, retrieval_identity
+        parts = table.split('.')
+        if len(parts) > 3:
+            raise ValueError(f"Invalid table name: {table}")
+        with self._lock:
+            columns = [name for name, _ in self._columns(table)]
+            if len(parts) < 3:
+                catalog, schema = self.connection.execute('SELECT current_database(), current_schema()').fetchone()
+                parts = [catalog, schema][:3 - len(parts)] + parts
+        return get_policy_gateway().authorize_select(retrieval_identity(), *parts, columns)
+
+    def profile(self, table: str, version: Optional[str] = None,
+                watermark_column: Optional[str] = None) -> TableProfile:
+        """Return the profile of a table, computing only what changed.
+
+        Args:
+            table: Table name, optionally schema or catalog qualified
+            version: Table version (e.g. an Iceberg snapshot id), fingerprinted when None
+            watermark_column: Monotonically increasing column (id, ingestion time)
+                marking appended rows, enables incremental updates
+
+        Returns:
+            The up to date TableProfile
+        """
+        with self._lock:
+            columns = self._columns(table)
+            schema_hash = hashlib.sha1(json.dumps(columns).encode('utf-8')).hexdigest()
+            version = version or self.table_version(table)
+            cached = self._cached(table)
+            if cached is not None and cached.version == version:
+                return cached
+            if (cached is not None and watermark_column and cached.watermark_column == watermark_column
+                    and cached.schema_hash == schema_hash and cached.watermark is not None):
+                profile = self._extend(cached, table, version)
+            else:
+                profile = self._full(table, version, columns, schema_hash, watermark_column)
+            self._store(profile)
+            return profile
+
+    def profile_dataset(self, handle: str) -> TableProfile:
+        """Profile a dataset handle, DuckDB scans its mapped Arrow buffers in place.
+
+        Datasets are immutable, so the handle itself is the version.
+        """
+        from GS.workflow_engine.helper_classes.dataset_registry import get_dataset_registry
+        view = handle.replace('-', '_')
+        with self._lock:
+            self.connection.register(view, get_dataset_registry().open(handle))
+            try:
+                profile = self.profile(view, version=handle)
+            finally:
+                self.connection.unregister(view)
+            profile.table = handle
+            return profile
+
+    def watermark(self, table: str, watermark_column: Optional[str] = None):
+        """How far a table has got: the maximum of its watermark column, its version without one.
+
+        The value is JSON-ready, so it can be stored and compared with a later one.
+        """
+        if not watermark_column:
+            return self.table_version(table)
+        with self._lock:
+            value = self.connection.execute(
+                f'SELECT max({_quote(watermark_column)}) FROM {quote_table(table)}').fetchone()[0]
+        return _jsonable(value)
+
+    def profile_delta(self, table: str, watermark_column: str, since=None, until=None) -> TableProfile:
+        """Profile only the rows whose watermark column is after `since`, up to `until`.
+
+        Incremental analyses use this for the rows added since their last run.
+        Delta profiles are not cached, the table's cached profile is left alone.
+
+        Args:
+            table: Table name, optionally schema or catalog qualified
+            watermark_column: Monotonically increasing column (id, ingestion time)
+            since: Watermark of the rows already analysed, None for all rows
+            until: Last watermark to include, so rows appended meanwhile are
+                left for the next run, None for all rows
+
+        Returns:
+            The TableProfile of the delta, its watermark is `until`
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append(f'{_quote(watermark_column)} > ?')
+            params.append(since)
+        if until is not None:
+            conditions.append(f'{_quote(watermark_column)} <= ?')
+            params.append(until)
+        where = ' AND '.join(conditions) or None
+        with self._lock:
+            columns = self._columns(table)
+            schema_hash = hashlib.sha1(json.dumps(columns).encode('utf-8')).hexdigest()
+            query = f'SELECT count(*) FROM {quote_table(table)}'
+            rows = self.connection.execute(query + (f' WHERE {where}' if where else ''), params).fetchone()[0]
+            sample = None
+            fraction = 1.0
+            if rows > self.sample_rows:
+                sample = f'USING SAMPLE reservoir({int(self.sample_rows)} ROWS) REPEATABLE ({SAMPLE_SEED})'
+                fraction = self.sample_rows / rows
+            profile = TableProfile(table, f'{since}..{until}', schema_hash, {}, rows, fraction, watermark_column,
+                                   until)
+            self._scan(profile, table, [name for name, _ in columns], sample=sample, where=where, params=params)
+            return profile
+
+    def _full(self, table: str, version: str, columns: List[tuple], schema_hash: str,
+              watermark_column: Optional[str]) -> TableProfile:
+        rows = self.connection.execute(f'SELECT count(*) FROM {quote_table(table)}').fetchone()[0]
+        sample = None
+        fraction = 1.0
+        if rows > self.sample_rows:
+            # Reservoir sampling happens inside DuckDB, only the sample is streamed out
+            sample = f'USING SAMPLE reservoir({int(self.sample_rows)} ROWS) REPEATABLE ({SAMPLE_SEED})'
+            fraction = self.sample_rows / rows
+        profile = TableProfile(table, version, schema_hash, {}, rows, fraction, watermark_column)
+        self._scan(profile, table, [name for name, _ in columns], sample=sample)
+        if watermark_column:
+            profile.watermark = self.connection.execute(
+                f'SELECT max({_quote(watermark_column)}) FROM {quote_table(table)}').fetchone()[0]
+        return profile
+
+    def _extend(self, cached: TableProfile, table: str, version: str) -> TableProfile:
+        watermark_column = cached.watermark_column
+        where = f'{_quote(watermark_column)} > ?'
+        appended, watermark = self.connection.execute(
+            f'SELECT count(*), max({_quote(watermark_column)}) FROM {quote_table(table)} WHERE {where}',
+            [cached.watermark]).fetchone()
+        if not appended:
+            cached.version = version
+            return cached
+        sample = None
+        if cached.sample_fraction < 1.0:
+            # Keep the sampling rate of the original profile so counts stay comparable
+            sample = f'USING SAMPLE {cached.sample_fraction * 100:.6f} PERCENT (bernoulli, {SAMPLE_SEED})'
+        delta = TableProfile(table, version, cached.schema_hash, {}, appended, cached.sample_fraction, watermark_column)
+        self._scan(delta, table, list(cached.columns), sample=sample, where=where, params=[cached.watermark])
+        for name, column in delta.columns.items():
+            cached.columns[name].merge_state(column)
+        cached.rows += appended
+        cached.version = version
+        cached.watermark = watermark
+        return cached
+
+    def _scan(self, profile: TableProfile, table: str, names: List[str], sample: Optional[str] = None,
+              where: Optional[str] = None, params: Optional[list] = None):
+        select = ', '.join([_quote(name) for name in names] +
+                           [f'hash({_quote(name)}) AS {_quote(f"__hash_{i}")}' for i, name in enumerate(names)])
+        source = quote_table(table)
+        if where:
+            # DuckDB samples before WHERE, so filter in a subquery and sample its rows
+            source = f'(SELECT * FROM {source} WHERE {where}) AS filtered' if sample else f'{source} WHERE {where}'
+        query = f'SELECT {select} FROM {source}'
+        if sample:
+            query += f' {sample}'
+        reader = self.connection.execute(query, params or []).fetch_record_batch(BATCH_ROWS)
+        for index, name in enumerate(names):
+            arrow_type = reader.schema.field(index).type
+            profile.columns.setdefault(name, ColumnProfile(name, str(arrow_type), _kind(arrow_type)))
+        for batch in reader:
+            for index, name in enumerate(names):
+                profile.columns[name].update(batch.column(index), batch.column(len(names) + index))
+
+
+def render_profile(summary: Dict[str, Any]) -> str:
+    """Render a profile summary as compact JSON for a prompt."""
+    return json.dumps(summary, separators=(',', ':'), default=str)
+
+
+def mask_summary(summary: Dict[str, Any], masks: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """Drop the statistics showing values of the masked columns from a profile summary."""
+    for column in summary['columns']:
+        if masks.get(column['name']):
+            for key in VALUE_STATISTICS:
+                column.pop(key, None)
+            column['masked'] = True
+    return summary
+
+
+def authorized_summary(profiler: TableProfiler, table: str) -> Dict[str, Any]:
+    """Summary of a table's profile, checked and masked like a SELECT on the table."""
+    masks = profiler.authorize(table)
+    return mask_summary(profiler.profile(table).summary(), masks)
+
+
+def _delta_summary(profiler: TableProfiler, table: Dict[str, Any]) -> Dict[str, Any]:
+    masks = profiler.authorize(table['table'])
+    summary = mask_summary(profiler.profile_delta(table['table'], table['watermark_column'],
+                                                  table.get('since'), table.get('until')).summary(), masks)
+    summary['delta'] = {'watermark_column': table['watermark_column'],
+                        'after': table.get('since'), 'up_to': table.get('until')}
+    return summary
+
+
+def with_profiles(data: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the `data_profile` and `previous_report` crew inputs of a request.
+
+    `profile_tables` lists table names, or for incremental runs
+    {"table", "watermark_column", "since", "until"} entries that profile only
+    the rows added after `since`. `previous_report` is the report such a run
+    revises. The inputs are always set so task descriptions can reference them.
+    """
+    inputs['previous_report'] = data.get('previous_report') or "None, there is no earlier report to revise."
+    tables = data.get('profile_tables') or []
+    if not tables:
+        inputs['data_profile'] = "No table profiles were requested."
+        return inputs
+    from GS.crew_ai.tools.policy_gateway import AccessDenied, PolicyUnavailable
+    profiler = get_table_profiler()
+    profiles = []
+    for table in tables:
+        try:
+            if isinstance(table, dict):
+                summary = _delta_summary(profiler, table)
+            else:
+                summary = authorized_summary(profiler, table)
+        except (ValueError, AccessDenied, PolicyUnavailable) as e:
+            # The crew is told the table is unavailable instead of getting its statistics
+            summary = {'table': table['table'] if isinstance(table, dict) else table, 'error': str(e)}
+        profiles.append(render_profile(summary))
+    inputs['data_profile'] = "Profiles of the tables to analyse:\n" + '\n'.join(profiles)
+    return inputs
+
+
+_profiler = None
+
+
+def get_table_profiler() -> TableProfiler:
+    """Return the profiler of the configured DuckDB database."""
+    global _profiler
+    if _profiler is None:
+        _profiler = TableProfiler()
+    return _profiler